@@ -2,8 +2,11 @@ from __future__ import division, absolute_import, print_function, unicode_litera
 
 import sys
 import os
+from . import _compiled
 from ._py3fixes import *
 from ._types import *
+from . import expression
+from .expression import frame, setFrame, fps, setFps
 
 _scene_root = None
 
@@ -24,10 +27,7 @@ def pathRecurse(node, pathlist):
     raise KeyError('Path does not exist')
 
 def node(path):
-    if path == '/':
-        return _scene_root
-    else:
-        return pathRecurse(_scene_root, path.split('/')[1:])
+    return _scene_root.findNode(path)
 
 def new_scene():
     global _scene_root
@@ -39,7 +39,16 @@ def load_scene(path):
 
     We create a restricted environment, execute the python statements and
     return the scene object that is generated. If no scene object is built, then
-    a keyerror is thrown."""
+    a keyerror is thrown.
+
+    Binary scene files (see merlin.binscene) are opened lazily instead, and
+    become the current scene."""
+    global _scene_root
+    from . import binscene
+    if path and os.path.isfile(path) and binscene.isBinaryScene(path):
+        _scene_root = binscene.loadScene(path)
+        return _scene_root
+
     print(type(__builtins__))
     bi = __builtins__
     if not isinstance(bi, dict):
@@ -0,0 +1,57 @@
+from __future__ import division, absolute_import, print_function, unicode_literals
+
+"""Support for the optional compiled build of merlin (see setup.py).
+
+The compiled extension modules are built next to their .py sources, so the
+import system picks them up whenever they exist. Setting the environment
+variable MERLIN_PURE_PYTHON forces the pure Python sources to be imported
+instead, which lets the test suite run against both builds."""
+
+import os
+import sys
+
+modules = ('merlin._types', 'merlin.geo.attribute')
+
+def is_compiled(module):
+    """Return True if module was loaded from a compiled extension module"""
+    return os.path.splitext(module.__file__)[1] not in ('.py', '.pyc', '.pyo')
+
+class _SourceFinder(object):
+    """Meta path finder that imports the compiled modules from source"""
+    def _source(self, fullname, path):
+        if fullname not in modules:
+            return None
+        name = fullname.rpartition('.')[2]
+        for d in path or sys.path:
+            source = os.path.join(d, name + '.py')
+            if os.path.isfile(source):
+                return source
+        return None
+
+    def find_spec(self, fullname, path, target=None):
+        source = self._source(fullname, path)
+        if source is None:
+            return None
+        from importlib.util import spec_from_file_location
+        return spec_from_file_location(fullname, source)
+
+    def find_module(self, fullname, path=None):
+        source = self._source(fullname, path)
+        if source is None:
+            return None
+        self._found = (fullname, source)
+        return self
+
+    def load_module(self, fullname):
+        if fullname in sys.modules:
+            return sys.modules[fullname]
+        import imp
+        name, source = self._found
+        return imp.load_source(name, source)
+
+def force_pure_python():
+    if not any(isinstance(f, _SourceFinder) for f in sys.meta_path):
+        sys.meta_path.insert(0, _SourceFinder())
+
+if os.environ.get('MERLIN_PURE_PYTHON'):
+    force_pure_python()
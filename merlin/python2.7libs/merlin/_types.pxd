@@ -0,0 +1,15 @@
+# Declarations for the compiled build of _types.py (see setup.py). The
+# module itself stays valid pure Python; these only take effect when it is
+# compiled with Cython.
+
+cdef class _VecBase:
+    cdef object __weakref__
+
+cdef class Vec2(_VecBase):
+    cdef public double x, y
+
+cdef class Vec3(_VecBase):
+    cdef public double x, y, z
+
+cdef class Vec4(_VecBase):
+    cdef public double x, y, z, w
@@ -5,18 +5,22 @@ import re
 import abc
 import cython
 import collections
+import copy
 import operator
 import itertools
 import weakref
+import numpy
 
 from ._py3fixes import *
+from . import expression
+from .channel import Channel, Interp
 
 try:
     import builtins
 except ImportError as e:
     import __builtin__ as builtins
 
-@cython.locals(s=collections.Sequence, i=cython.int)
+@cython.locals(i=cython.int)
 def _seq_get(s, i, *args):
     try:
         return s[i]
@@ -35,7 +39,7 @@ class _VecBase(object):
 
     def __init__(self, *args, **kwargs):
         for i, a in enumerate(self.__slots__[:-1]):
-            setattr(self, a, kwargs.get(a, _seq_get(args, i, 0.0)))
+            setattr(self, a, float(kwargs.get(a, _seq_get(args, i, 0.0))))
 
     def __repr__(self):
         values = ', '.join(map(repr, self))
@@ -63,7 +67,7 @@ class _VecBase(object):
         return self
 
     def __mul__(self, other):
-        return self.__class__(map(operator.mul, self, other))
+        return self.__class__(*map(operator.mul, self, other))
 
     def dot(self, other):
         return float(sum(map(operator.mul, self, other)))
@@ -77,42 +81,439 @@ class _VecBase(object):
 
     @cython.locals(i=cython.int, v=cython.double)
     def __setitem__(self, i, v):
-        return setattr(self, self.__slots__[:-1][i], v)
+        setattr(self, self.__slots__[:-1][i], float(v))
 
     def __len__(self):
         return max(0, len(self.__slots__) - 1)
 
-    __delitem__ = None
+    def __iter__(self):
+        for i in range(len(self)):
+            yield self[i]
+
+    def __contains__(self, value):
+        return any(v == value for v in self)
+
+    def index(self, value):
+        for i, v in enumerate(self):
+            if v == value:
+                return i
+        raise ValueError(value)
+
+    def count(self, value):
+        return sum(1 for v in self if v == value)
+
+    def __delitem__(self, i):
+        raise TypeError('Vector components cannot be deleted')
+
     insert = None
 
+# The Vec types are only registered as (rather than derived from)
+# MutableSequence, so that the compiled build can turn them into extension
+# types. Their C fields are declared in _types.pxd. The typed __getitem__
+# and __setitem__ overrides avoid the attribute name lookups of _VecBase.
 
-class Vec2(_VecBase, collections.MutableSequence):
+class Vec2(_VecBase):
     """docstring for Vec2"""
 
     __slots__ = ('x', 'y', '__weakref__')
 
-    cython.declare(x=cython.double, y=cython.double)
     def __init__(self, *args, **kwargs):
         super(Vec2, self).__init__(*args, **kwargs)
 
-class Vec3(_VecBase, collections.MutableSequence):
+    @cython.locals(i=cython.int)
+    def __getitem__(self, i):
+        if i == 0 or i == -2:
+            return self.x
+        elif i == 1 or i == -1:
+            return self.y
+        raise IndexError('Vec2 index out of range')
+
+    @cython.locals(i=cython.int, v=cython.double)
+    def __setitem__(self, i, v):
+        if i == 0 or i == -2:
+            self.x = float(v)
+        elif i == 1 or i == -1:
+            self.y = float(v)
+        else:
+            raise IndexError('Vec2 index out of range')
+
+    def __len__(self):
+        return 2
+
+    def dot(self, other):
+        return float(self.x * other[0] + self.y * other[1])
+
+class Vec3(_VecBase):
     """docstring for Vec3"""
 
     __slots__ = ('x', 'y', 'z', '__weakref__')
 
-    cython.declare(x=cython.double, y=cython.double, z=cython.double)
     def __init__(self, *args, **kwargs):
         super(Vec3, self).__init__(*args, **kwargs)
 
-class Vec4(_VecBase, collections.MutableSequence):
+    @cython.locals(i=cython.int)
+    def __getitem__(self, i):
+        if i == 0 or i == -3:
+            return self.x
+        elif i == 1 or i == -2:
+            return self.y
+        elif i == 2 or i == -1:
+            return self.z
+        raise IndexError('Vec3 index out of range')
+
+    @cython.locals(i=cython.int, v=cython.double)
+    def __setitem__(self, i, v):
+        if i == 0 or i == -3:
+            self.x = float(v)
+        elif i == 1 or i == -2:
+            self.y = float(v)
+        elif i == 2 or i == -1:
+            self.z = float(v)
+        else:
+            raise IndexError('Vec3 index out of range')
+
+    def __len__(self):
+        return 3
+
+    def dot(self, other):
+        return float(self.x * other[0] + self.y * other[1] + self.z * other[2])
+
+class Vec4(_VecBase):
     """docstring for Vec4"""
 
     __slots__ = ('x', 'y', 'z', 'w', '__weakref__')
 
-    cython.declare(x=cython.double, y=cython.double, z=cython.double, w=cython.double)
     def __init__(self, *args, **kwargs):
         super(Vec4, self).__init__(*args, **kwargs)
-        self.w = kwargs.get('w', _seq_get(args, 3, 1.0))
+        self.w = float(kwargs.get('w', _seq_get(args, 3, 1.0)))
+
+    @cython.locals(i=cython.int)
+    def __getitem__(self, i):
+        if i == 0 or i == -4:
+            return self.x
+        elif i == 1 or i == -3:
+            return self.y
+        elif i == 2 or i == -2:
+            return self.z
+        elif i == 3 or i == -1:
+            return self.w
+        raise IndexError('Vec4 index out of range')
+
+    @cython.locals(i=cython.int, v=cython.double)
+    def __setitem__(self, i, v):
+        if i == 0 or i == -4:
+            self.x = float(v)
+        elif i == 1 or i == -3:
+            self.y = float(v)
+        elif i == 2 or i == -2:
+            self.z = float(v)
+        elif i == 3 or i == -1:
+            self.w = float(v)
+        else:
+            raise IndexError('Vec4 index out of range')
+
+    def __len__(self):
+        return 4
+
+    def dot(self, other):
+        return float(self.x * other[0] + self.y * other[1] +
+                     self.z * other[2] + self.w * other[3])
+
+collections.MutableSequence.register(Vec2)
+collections.MutableSequence.register(Vec3)
+collections.MutableSequence.register(Vec4)
+
+def _component(i):
+    def get(self):
+        return float(self._data[self._row, i])
+    def set(self, v):
+        self._data[self._row, i] = float(v)
+    return property(get, set)
+
+class _VecView(object):
+    """A vector bound to one row of a vector array (see _VecArrayBase)
+
+    Views own no data: reading and writing their components reads and
+    writes the array's buffer. Arithmetic returns new scalar vectors, and
+    copy returns the view's value as one."""
+    __slots__ = ('_data', '_row')
+    vectype = None
+
+    def __init__(self, data, row):
+        super(_VecView, self).__init__()
+        self._data = data
+        self._row = row
+
+    def __repr__(self):
+        values = ', '.join(map(repr, self))
+        return "{0.__class__.__name__}({1})".format(self, values)
+
+    def __len__(self):
+        return self._data.shape[1]
+
+    def __iter__(self):
+        return iter(self._data[self._row].tolist())
+
+    def __getitem__(self, i):
+        if i < -len(self) or i >= len(self):
+            raise IndexError('{0} index out of range'.format(self.__class__.__name__))
+        return float(self._data[self._row, i])
+
+    def __setitem__(self, i, v):
+        if i < -len(self) or i >= len(self):
+            raise IndexError('{0} index out of range'.format(self.__class__.__name__))
+        self._data[self._row, i] = float(v)
+
+    def __delitem__(self, i):
+        raise TypeError('Vector components cannot be deleted')
+
+    def __eq__(self, other):
+        return len(self) == len(other) and all(a == b for a, b in zip(self, other))
+
+    def __ne__(self, other):
+        return not self == other
+
+    __hash__ = None
+
+    def copy(self):
+        return self.vectype(*self)
+
+    def __add__(self, other):
+        return self.vectype(*map(operator.add, self, other))
+
+    __radd__ = __add__
+
+    def __sub__(self, other):
+        return self.vectype(*map(operator.sub, self, other))
+
+    def __mul__(self, other):
+        return self.vectype(*map(operator.mul, self, other))
+
+    __rmul__ = __mul__
+
+    def __iadd__(self, other):
+        self._data[self._row] += list(other)
+        return self
+
+    def __isub__(self, other):
+        self._data[self._row] -= list(other)
+        return self
+
+    def __imul__(self, other):
+        self._data[self._row] *= list(other)
+        return self
+
+    def dot(self, other):
+        return float(sum(map(operator.mul, self, other)))
+
+class Vec2View(_VecView):
+    """A view of one Vec2 of a Vec2Array"""
+    __slots__ = ()
+    vectype = Vec2
+    x = _component(0)
+    y = _component(1)
+
+class Vec3View(_VecView):
+    """A view of one Vec3 of a Vec3Array"""
+    __slots__ = ()
+    vectype = Vec3
+    x = _component(0)
+    y = _component(1)
+    z = _component(2)
+
+    def cross(self, other):
+        return Vec3(*numpy.cross(self._data[self._row], list(other)).tolist())
+
+class Vec4View(_VecView):
+    """A view of one Vec4 of a Vec4Array"""
+    __slots__ = ()
+    vectype = Vec4
+    x = _component(0)
+    y = _component(1)
+    z = _component(2)
+    w = _component(3)
+
+collections.MutableSequence.register(Vec2View)
+collections.MutableSequence.register(Vec3View)
+collections.MutableSequence.register(Vec4View)
+
+class _VecArrayBase(object):
+    """Base class for arrays of vectors stored in one (N, k) float64 buffer.
+
+    Arithmetic works on the whole buffer at once and broadcasts against
+    scalars, single vectors (e.g. a Vec3) and other arrays of the same
+    length. Indexing with an integer returns a view of that element (e.g. a
+    Vec3View) and slicing an array sharing the same buffer, so writing to
+    either writes to this array."""
+    __slots__ = ('_data', '__weakref__')
+    vectype = None
+    viewtype = None
+
+    def __init__(self, data=None, length=0):
+        k = len(self.vectype.__slots__) - 1
+        if data is None:
+            data = numpy.zeros((length, k))
+            if self.vectype is Vec4:
+                data[:, 3] = 1.0
+        elif isinstance(data, _VecArrayBase):
+            data = data._data.copy()
+        else:
+            if isinstance(data, (list, tuple)):
+                data = [list(v) if isinstance(v, _VecBase) else v for v in data]
+            data = numpy.array(data, dtype=numpy.float64).reshape(-1, k)
+        if data.ndim != 2 or data.shape[1] != k:
+            raise ValueError('data must have shape (N, {0})'.format(k))
+        self._data = data
+
+    @classmethod
+    def frombuffer(cls, buf):
+        """Wrap a buffer of packed doubles (e.g. an array('d')) without copying"""
+        k = len(cls.vectype.__slots__) - 1
+        self = cls.__new__(cls)
+        self._data = numpy.frombuffer(buf, dtype=numpy.float64).reshape(-1, k)
+        return self
+
+    @classmethod
+    def _wrap(cls, data):
+        self = cls.__new__(cls)
+        self._data = data
+        return self
+
+    @property
+    def data(self):
+        """The underlying (N, k) numpy array"""
+        return self._data
+
+    def __repr__(self):
+        return "{0.__class__.__name__}({1})".format(self, self._data.tolist())
+
+    def __len__(self):
+        return len(self._data)
+
+    def __iter__(self):
+        for i in range(len(self._data)):
+            yield self.viewtype(self._data, i)
+
+    def __getitem__(self, i):
+        if isinstance(i, (int, long, numpy.integer)):
+            if i < 0:
+                i += len(self._data)
+            if i < 0 or i >= len(self._data):
+                raise IndexError('{0} index out of range'.format(self.__class__.__name__))
+            return self.viewtype(self._data, i)
+        return self._wrap(self._data[i])
+
+    def __setitem__(self, i, v):
+        self._data[i] = self._operand(v)
+
+    def _operand(self, other):
+        if isinstance(other, _VecArrayBase):
+            return other._data
+        elif isinstance(other, (_VecBase, _VecView)):
+            if len(other) != self._data.shape[1]:
+                raise ValueError('vector has the wrong number of components')
+            return numpy.array(list(other), dtype=numpy.float64)
+        return other
+
+    def copy(self):
+        return self._wrap(self._data.copy())
+
+    def __neg__(self):
+        return self._wrap(-self._data)
+
+    def __add__(self, other):
+        return self._wrap(self._data + self._operand(other))
+
+    __radd__ = __add__
+
+    def __sub__(self, other):
+        return self._wrap(self._data - self._operand(other))
+
+    def __rsub__(self, other):
+        return self._wrap(self._operand(other) - self._data)
+
+    def __mul__(self, other):
+        return self._wrap(self._data * self._operand(other))
+
+    __rmul__ = __mul__
+
+    def __truediv__(self, other):
+        return self._wrap(self._data / self._operand(other))
+
+    __div__ = __truediv__
+
+    def __iadd__(self, other):
+        self._data += self._operand(other)
+        return self
+
+    def __isub__(self, other):
+        self._data -= self._operand(other)
+        return self
+
+    def __imul__(self, other):
+        self._data *= self._operand(other)
+        return self
+
+    def __itruediv__(self, other):
+        self._data /= self._operand(other)
+        return self
+
+    __idiv__ = __itruediv__
+
+    def dot(self, other):
+        """Return an (N,) array of the dot products with other"""
+        return numpy.einsum('ij,ij->i', self._data,
+                            numpy.broadcast_to(self._operand(other), self._data.shape))
+
+    def length(self):
+        """Return an (N,) array of the vector lengths"""
+        return numpy.sqrt(numpy.einsum('ij,ij->i', self._data, self._data))
+
+    def normalize(self):
+        """Normalize all vectors in place. Zero length vectors are left as is."""
+        lengths = self.length()
+        lengths[lengths == 0.0] = 1.0
+        self._data /= lengths[:, numpy.newaxis]
+        return self
+
+    def normalized(self):
+        return self.copy().normalize()
+
+    def lerp(self, other, t):
+        """Linearly interpolate towards other by t
+
+        t may be a scalar or an (N,) array of per vector blend values."""
+        t = numpy.asarray(t, dtype=numpy.float64)
+        if t.ndim == 1:
+            t = t[:, numpy.newaxis]
+        return self._wrap(self._data + (self._operand(other) - self._data) * t)
+
+    def sum(self):
+        return self.vectype(*self._data.sum(axis=0).tolist())
+
+    def mean(self):
+        return self.vectype(*self._data.mean(axis=0).tolist())
+
+class Vec2Array(_VecArrayBase):
+    """An array of Vec2 values"""
+    __slots__ = ()
+    vectype = Vec2
+    viewtype = Vec2View
+
+class Vec3Array(_VecArrayBase):
+    """An array of Vec3 values"""
+    __slots__ = ()
+    vectype = Vec3
+    viewtype = Vec3View
+
+    def cross(self, other):
+        return self._wrap(numpy.cross(self._data, self._operand(other)))
+
+class Vec4Array(_VecArrayBase):
+    """An array of Vec4 values"""
+    __slots__ = ()
+    vectype = Vec4
+    viewtype = Vec4View
 
 class ParmType(object):
     """Enum for Parameter types"""
@@ -124,17 +525,104 @@ class ParmType(object):
         super(ParmType, self).__init__()
         self.arg = arg
 
+class CookMode(object):
+    """Enum for where a node may be cooked by a parallel scheduler"""
+    MainThread = 0
+    Thread = 1
+    Process = 2
+
 class Parameter(object):
-    """docstring for Parameter"""
+    """docstring for Parameter
+
+    A parameter holds either a plain value, or an expression (see
+    merlin.expression) that computes it. Subclasses set convert to the
+    function used to coerce values to the parameter's type."""
+    convert = None
 
+    def __init__(self, node, default=None, name=None):
+        super(Parameter, self).__init__()
+        self._node = weakref.ref(node)
+        self.name = name
+        self._value = self.default = self.convert(default)
+        self._expression = None
+        self._channel = None
+        # Expressions that read this parameter, keyed by id
+        self._dependents = weakref.WeakValueDictionary()
+
+    def __repr__(self):
+        return '<{0} {1}>'.format(self.__class__.__name__, self.name)
 
-    @abc.abstractmethod
     def eval(self):
-        pass
+        if self._expression is not None:
+            return self.convert(self._expression.eval())
+        if self._channel is not None:
+            return self.convert(self._channel.eval())
+        return self._value
 
-    @abc.abstractproperty
+    @property
     def node(self):
-        pass
+        return self._node()
+
+    @property
+    def value(self):
+        return self._value
+
+    @value.setter
+    def value(self, v):
+        v = self.convert(v)
+        if v != self._value:
+            self._value = v
+            self._changed()
+
+    @property
+    def expression(self):
+        return self._expression
+
+    @expression.setter
+    def expression(self, e):
+        """Set the expression, from a string or an Expression; None removes it"""
+        if e is not None and not isinstance(e, expression.Expression):
+            e = expression.Expression(e, self)
+        if e is not self._expression:
+            if self._expression is not None:
+                self._expression._release()
+            self._expression = e
+            self._changed()
+
+    @property
+    def channel(self):
+        """The animation Channel driving this parameter, or None
+
+        An expression, if set, takes precedence over the channel."""
+        return self._channel
+
+    @channel.setter
+    def channel(self, c):
+        if c is not self._channel:
+            if c is not None and c.parm not in (None, self):
+                raise ValueError('Channel already drives {0!r}'.format(c.parm))
+            if self._channel is not None:
+                self._channel._release()
+                self._channel._parm = None
+            if c is not None:
+                c._parm = weakref.ref(self)
+            self._channel = c
+            self._changed()
+
+    def setKeyframe(self, frame, value, interp=Interp.Linear, inSlope=None, outSlope=None):
+        """Key the parameter, creating its channel if needed"""
+        if self._channel is None:
+            self.channel = Channel()
+        self._channel.setKey(frame, value, interp, inSlope, outSlope)
+
+    def _changed(self):
+        """Dirty the owning node, so it cooks again with the new value, and
+        invalidate the expressions reading this parameter"""
+        node = self.node
+        if node is not None:
+            node.setDirty()
+        for e in list(self._dependents.values()):
+            e.invalidate()
 
     def evalAsString(self):
         return str(self.eval())
@@ -147,15 +635,31 @@ class Parameter(object):
 
 class ParmToggle(Parameter):
     """docstring for Toggle"""
+    convert = bool
 
-    def __init__(self, node, default=False):
-        super(Parameter, self).__init__()
-        self.node = weakref.ref(node)
-        self.value = self.default = bool(default)
-        self.expression = None
+    def __init__(self, node, default=False, name=None):
+        super(ParmToggle, self).__init__(node, default, name)
 
-    def eval(self):
-        return bool(self.expression.eval()) if self.expression else bool(self.value)
+class ParmInt(Parameter):
+    """An integer parameter"""
+    convert = int
+
+    def __init__(self, node, default=0, name=None):
+        super(ParmInt, self).__init__(node, default, name)
+
+class ParmFloat(Parameter):
+    """A floating point parameter"""
+    convert = float
+
+    def __init__(self, node, default=0.0, name=None):
+        super(ParmFloat, self).__init__(node, default, name)
+
+class ParmString(Parameter):
+    """A string parameter"""
+    convert = str
+
+    def __init__(self, node, default='', name=None):
+        super(ParmString, self).__init__(node, default, name)
 
 # TODO: swap out _InputMap with an _InputSequence
 class InputSequence(collections.Sequence):
@@ -175,11 +679,25 @@ class InputSequence(collections.Sequence):
         return self._indexmap.get(index, None)
 
     def __setitem__(self, index, value):
+        """Connect value (a Node, or None to disconnect) to input index
+
+        The owner and everything downstream of it are dirtied."""
         if index < 0 or index >= self._max:
             raise IndexError('InputSequence index out of range')
-        elif value.parent != self._owner.parent:
+        elif value is not None and value.parent is not self._owner.parent:
             raise RuntimeError('Cannot add as an input a Node with a different parent.')
-        self._indexmap[index] = value
+
+        old = self._indexmap.get(index, None)
+        if old is value:
+            return
+        if value is None:
+            del self._indexmap[index]
+        else:
+            self._indexmap[index] = value
+            value._dependents[id(self._owner)] = self._owner
+        if old is not None and not any(v is old for v in self._indexmap.values()):
+            old._dependents.pop(id(self._owner), None)
+        self._owner.setDirty()
 
     def __len__(self):
         return self._max
@@ -319,14 +837,21 @@ class TypedSet(collections.MutableSet):
         self._set.clear()
 
 class NodeSet(TypedSet):
-    """docstring for NodeSet"""
+    """docstring for NodeSet
+
+    A NodeSet also keeps a registry of the names of its nodes: a map from
+    name to node, and from each base name (the name without its numeric
+    suffix) to the highest suffix it has used. This lets uniqueName find a
+    free name in constant time, however many siblings there are."""
     def __init__(self, iterable, parent, *types):
         if not types:
             types = (Node,)
         else:
             types = set(types) | set([Node])
-        super(NodeSet, self).__init__(iterable, *types)
         self._parent = parent
+        self._names = {}
+        self._suffixes = {}
+        super(NodeSet, self).__init__(iterable, *types)
 
     def _from_iterable(self, it):
         return self.__class__(it, self._parent, *self._types)
@@ -334,16 +859,65 @@ class NodeSet(TypedSet):
     def add(self, value):
         if not isinstance(value, self._types):
             raise TypeError('Value "{0!r}" was not of the right type.'.format(value))
+        reparented = value._parent is not self._parent
+        value._unindex()
+        if reparented and value._parent is not None:
+            value._parent._children.discard(value)
         value._parent = self._parent
         value.name = value.name # this will rename "value" to have a unique name within its new parent
         self._set.add(value)
+        self._register(value)
+        value._index()
+        if reparented:
+            value._invalidateWorld()
+            value.setDirty()
+
+    def discard(self, value):
+        if value in self._set:
+            self._unregister(value)
+        self._set.discard(value)
+
+    def pop(self):
+        value = self._set.pop()
+        self._unregister(value)
+        return value
+
+    def clear(self):
+        self._set.clear()
+        self._names.clear()
+        self._suffixes.clear()
+
+    def uniqueName(self, name):
+        """Return name, or name with a new numeric suffix if it is taken"""
+        if name not in self._names:
+            return name
+        base, num = _name_splitter.match(name).group('name', 'num')
+        n = max(self._suffixes.get(base, 0), int(num or 0))
+        while True:
+            n += 1
+            candidate = base + str(n)
+            if candidate not in self._names:
+                return candidate
+
+    def _register(self, node):
+        self._names[node._name] = node
+        base, num = _name_splitter.match(node._name).group('name', 'num')
+        if num is not None and int(num) > self._suffixes.get(base, 0):
+            self._suffixes[base] = int(num)
+
+    def _unregister(self, node):
+        if self._names.get(node._name) is not node:
+            return
+        # The suffix high water mark is kept: lowering it would mean
+        # searching for the next suffix still in use
+        del self._names[node._name]
 
     def destroyall(self):
         '''Run destroy on all contained nodes, then clear self
 
         This is mainly useful for merlin Node types that need to destroy
         their children.'''
-        for elem in self:
+        for elem in list(self):
             elem.destroy()
         self.clear()
 
@@ -391,20 +965,56 @@ class _NodeClassBuilder(abc.ABCMeta, type):
     node_types = dict()
     def __new__(mcls, name, bases, attrs):
         cls = super(_NodeClassBuilder, mcls).__new__(mcls, name, bases, attrs)
-        if name in mcls.node_types:
+        if not any(isinstance(b, _NodeClassBuilder) for b in bases):
+            # _NodeBase itself is not a node type
+            pass
+        elif name in mcls.node_types:
             RuntimeError('Node class "{0!r}" is being redefined. This is not allowed.'.format(name))
         else:
             mcls.node_types[name] = cls
         return cls
 
-_name_splitter = re.compile(r'(?P<name>[a-zA-Z]+)(?P<num>[0-9]+)?')
+# Node gets its metaclass from this base rather than from a __metaclass__
+# attribute, which Python 3 ignores, so node types register on both.
+_NodeBase = _NodeClassBuilder(builtins.str('_NodeBase'), (object,), {})
+
+node_types = _NodeClassBuilder.node_types
+
+def _gather(chunks):
+    """Join a series of point chunks back into a single detail"""
+    result = None
+    for chunk in chunks:
+        if result is None:
+            result = chunk
+        else:
+            result.appendPoints(chunk)
+    return result
+
+# The identity Mat4, created on first use. Mat4 is imported where it is
+# used, so loading the node types does not load the geometry library.
+_identity = None
+
+def worldTransforms(nodes):
+    """Return the world transforms of many nodes as an (N, 4, 4) array,
+    ready for the batched transforms of geo.attribute"""
+    from .geo.attribute import matrixArray
+    return matrixArray([list(node._world()) for node in nodes]).reshape(-1, 4, 4)
+
+_name_splitter = re.compile(r'(?P<name>.*?)(?P<num>[0-9]+)?$')
 
-class Node(object):
+class Node(_NodeBase):
     """docstring for Node"""
-    # __metaclass__ = abc.ABCMeta
-    __metaclass__ = _NodeClassBuilder
 
-    child_types = (Node)
+    child_types = ()
+
+    # Nodes whose cook is thread safe may set this to CookMode.Thread.
+    # CookMode.Process nodes are cooked in a worker process by cookInProcess.
+    cookMode = CookMode.MainThread
+
+    # Point parallel nodes may set this and implement cookChunk, letting
+    # stream push their input through them a chunk of points at a time.
+    streamable = False
+    chunkSize = 1 << 16
 
     def __new__(cls, parent, name=None):
         self = super(Node, cls).__new__(cls)
@@ -413,14 +1023,37 @@ class Node(object):
             raise TypeError()
 
         self._parent = parent
-        self._children = NodeSet([], self, cls.child_types)
+        self._children = NodeSet([], self, *cls.child_types)
         self._position = Vec2(x=0, y=0)
         self._inputs = InputSequence(self, self.numInputs)
         self._parameters = _TypedList(Parameter)
         self._destroyed = False
+        self._dirty = True
+        self._cache = None
+        self._cookargs = None
+        # Nodes with this node as an input, keyed by id
+        self._dependents = weakref.WeakValueDictionary()
+        # Expressions that read this node (see expression.node), keyed by
+        # id, and those that only found it by path (see expression.ch)
+        self._watchers = weakref.WeakValueDictionary()
+        self._pathwatchers = weakref.WeakValueDictionary()
+        self._path = None
+        self._indexed = False
+        # (reader, record) for nodes whose children are still in a binary
+        # scene file; see binscene and _materialize.
+        self._loader = None
+        # The local transform (None for identity) and the cached world
+        # transform; see worldTransform
+        self._transform = None
+        self._worldtransform = None
 
         if cls == Node:
             self._name = '/'
+            # The root of a hierarchy keeps an index of every node under it
+            # by path. Nodes are added when they join the hierarchy (see
+            # NodeSet.add) and are re-keyed when they are renamed or moved.
+            self._pathindex = {}
+            self._index()
         else:
             if name is None:
                 name = type(self).__name__ + str(1)
@@ -430,24 +1063,23 @@ class Node(object):
 
     def __init__(self, *args, **kwrags): raise AttributeError("No public constructor defined")
 
-    def __cmp_key(self):
-        return (self.__class__, self.path, id(self))
-
-    def __hash__(self):
-        return hash(self.__cmp_key())
-
-    def __eq__(self, other):
-        sck = self.__cmp_key()
-        ock = other.__cmp_key()
-        if sck == sck:
-            return True
-        elif sck[1]==ock[1] and (sck[0]!=ock[0] or sck[2]!=ock[2]):
-            # Catch identical nodes being created that are not the same python object
-            raise RuntimeError('Nodes have same path but are not the same Python object!')
-        else:
-            return False
+    # Nodes compare and hash by identity. Since paths are unique within a
+    # hierarchy (the path index enforces this), a path based key would only
+    # break sets of nodes whenever a node or one of its ancestors is renamed.
 
     def destroy(self):
+        self.setDirty()
+        # Disconnect it from the nodes downstream, and from its inputs
+        for node in list(self._dependents.values()):
+            for i, value in enumerate(node.inputs):
+                if value is self:
+                    node.inputs[i] = None
+        for node in self.inputs:
+            if node is not None:
+                node._dependents.pop(id(self), None)
+        self._unindex()
+        if self._parent is not None:
+            self._parent._children.discard(self)
         self._destroyed = True
 
     @property
@@ -458,24 +1090,270 @@ class Node(object):
         """Method to call when a node instance is being cooked
 
         The value(s) it receives is context specific. For instance, in a
-        geometry context, a geometry object would be passed in. The object
-        must be mutated to have any effect.
+        geometry context, a geometry object would be passed in. Whatever
+        cook returns is cached as the node's result until the node is
+        dirtied.
+
+        If an node requires data from its inputs, it must request that they
+        also cook, using inputData. The results of inputs are their cached
+        results and must not be modified: a node that modifies its input
+        should start from inputCopy, which shares geometry copy-on-write so
+        only the attributes the node writes are copied. Use evaluate, not
+        cook, to get the result of a node.
+
+        Streamable nodes cook by gathering the chunks of stream."""
+        if self.streamable:
+            return _gather(self.stream(**kwargs))
+
+    def cookChunk(self, chunk, **kwargs):
+        """Cook one chunk of the first input's points, for streamable nodes
+
+        chunk is a geometry detail holding only some of the points (and
+        point attributes) of the input, which the node may modify and must
+        return. A chunk may also be a whole detail, primitives included, if
+        the input could not be split."""
+        raise NotImplementedError()
 
-        If an node requires data from its inputs, it must request that they also cook."""
-        pass
+    def stream(self, chunkSize=None, **kwargs):
+        """Yield the result of this node as a series of point chunks
+
+        Chains of streamable nodes pass each chunk all the way down before
+        the next one is produced, so only a few chunks are ever held in
+        memory. A node that is not streamable (it needs all of its input at
+        once) is cooked normally and its result split up, as is a node with
+        a cached result already. Source nodes may override this to produce
+        chunks directly, e.g. from a geometry cache file."""
+        chunkSize = chunkSize or self.chunkSize
+        if self.streamable and self.needsToCook(**kwargs):
+            source = self.inputs[0] if len(self.inputs) else None
+            if source is None:
+                raise RuntimeError('{0} has no input to stream from.'.format(self.path))
+            for chunk in source.stream(chunkSize, **kwargs):
+                yield self.cookChunk(chunk, **kwargs)
+            return
+
+        result = self.evaluate(**kwargs)
+        if hasattr(result, 'iterPointChunks'):
+            for chunk in result.iterPointChunks(chunkSize):
+                yield chunk
+        else:
+            yield result
+
+    @property
+    def dirty(self):
+        """True if the node must cook before its result can be used"""
+        return self._dirty
+
+    def setDirty(self):
+        """Mark this node and everything downstream of it as needing to cook
+
+        A dirty node's downstream nodes are always dirty as well, so the
+        walk stops at nodes that are dirty already. Streamable nodes are the
+        exception: streaming through one leaves it dirty (it caches nothing)
+        while its downstream nodes cache their results."""
+        stack = [self]
+        while stack:
+            node = stack.pop()
+            if node._watchers:
+                node._invalidateWatchers()
+            if node._dirty and not node.streamable:
+                continue
+            node._dirty = True
+            node._cache = None
+            stack.extend(node._dependents.values())
+
+    def needsToCook(self, **kwargs):
+        return self._dirty or kwargs != self._cookargs
+
+    def evaluate(self, **kwargs):
+        """Return the result of cooking this node
+
+        A clean node returns the result cached by its last cook, without
+        running cook again. A dirty node, or one evaluated with different
+        keyword arguments than last time, is cooked first."""
+        if self.needsToCook(**kwargs):
+            self._setResult(self.cook(**kwargs), kwargs)
+        return self._cache
+
+    def _setResult(self, result, kwargs):
+        self._cache = result
+        self._cookargs = kwargs
+        self._dirty = False
+
+    @classmethod
+    def cookInProcess(cls, inputs, parms, **kwargs):
+        """Cook function for CookMode.Process nodes
+
+        It is run in a worker process, so it only receives plain data: the
+        results of the node's inputs and the evaluated values of its
+        parameters. Arguments and result must be picklable. The cook method
+        of such a node would normally just call this with its own data."""
+        raise NotImplementedError()
+
+    def inputData(self, index, **kwargs):
+        """Evaluate the node connected to input index
+
+        Returns None if nothing is connected."""
+        node = self.inputs[index]
+        return None if node is None else node.evaluate(**kwargs)
+
+    def inputCopy(self, index, **kwargs):
+        """Evaluate the node connected to input index, returning a copy of
+        its result that this node may modify
+
+        Geometry is shared copy-on-write (see Geometry.share); other results
+        are deep copied. Returns None if nothing is connected."""
+        data = self.inputData(index, **kwargs)
+        if data is None:
+            return None
+        if hasattr(data, 'share'):
+            return data.share()
+        return copy.deepcopy(data)
 
     @property
     def path(self):
-        """The full path to this node in the hierarchy."""
-        return self._get_path()
-
-    def _get_path(self, l=[]):
-        l.append(self.name)
-        if self.parent is None:
-            l.reverse()
-            return os.path.join(os.path.sep, *l)
-        else:
-            return self.parent._get_path(l)
+        """The full path to this node in the hierarchy.
+
+        The path is cached, and the cache is cleared whenever the node or
+        one of its ancestors is renamed or moved."""
+        if self._path is None:
+            if self._parent is None:
+                self._path = self._name if self._name.startswith('/') else '/' + self._name
+            else:
+                parent = self._parent.path
+                self._path = parent + ('' if parent.endswith('/') else '/') + self._name
+        return self._path
+
+    def _root(self):
+        node = self
+        while node._parent is not None:
+            node = node._parent
+        return node
+
+    def _iterSubtree(self):
+        """Yield this node and all its descendants, parents before children"""
+        stack = [self]
+        while stack:
+            node = stack.pop()
+            yield node
+            if node._children:
+                stack.extend(node._children)
+
+    def _index(self):
+        """Add this node and its descendants to the path index of their root"""
+        index = getattr(self._root(), '_pathindex', None)
+        if index is None:
+            return
+        for node in self._iterSubtree():
+            node._path = None
+            path = node.path
+            if index.get(path, node) is not node:
+                raise RuntimeError('Path {0} is already in use.'.format(path))
+            index[path] = node
+            node._indexed = True
+
+    def _unindex(self):
+        """Remove this node and its descendants from the path index, and
+        clear their cached paths"""
+        index = getattr(self._root(), '_pathindex', {})
+        for node in self._iterSubtree():
+            if node._watchers or node._pathwatchers:
+                node._invalidateWatchers(node._pathwatchers)
+                node._invalidateWatchers()
+            if node._indexed:
+                index.pop(node.path, None)
+                node._indexed = False
+        for node in self._iterSubtree():
+            node._path = None
+
+    def _invalidateWatchers(self, watchers=None):
+        if watchers is None:
+            watchers = self._watchers
+        for e in list(watchers.values()):
+            e.invalidate()
+
+    def findNode(self, path):
+        """Return the node at an absolute path in this node's hierarchy
+
+        Lookups go through the path index, so they take constant time
+        regardless of the size of the hierarchy. Raises KeyError if there is
+        no node at path."""
+        if len(path) > 1:
+            path = path.rstrip('/')
+        root = self._root()
+        try:
+            return root._pathindex[path]
+        except (AttributeError, KeyError):
+            pass
+        # The node may be in a part of the hierarchy not loaded yet
+        node = root
+        for name in path.strip('/').split('/'):
+            node._materialize()
+            node = node._children._names.get(name)
+            if node is None:
+                raise KeyError('Path does not exist')
+        return node
+
+    def _materialize(self):
+        """Create this node's children, if they have not been loaded yet"""
+        loader = self._loader
+        if loader is not None:
+            self._loader = None
+            loader[0].loadChildren(self, loader[1])
+
+    @property
+    def transform(self):
+        """The node's transform relative to its parent, as a Mat4"""
+        from .geo.attribute import Mat4
+        return Mat4(self._transform) if self._transform is not None else Mat4()
+
+    @transform.setter
+    def transform(self, m):
+        from .geo.attribute import Mat4
+        self._transform = None if m is None else Mat4(m)
+        self._invalidateWorld()
+
+    @property
+    def worldTransform(self):
+        """The node's transform relative to the root: its own transform
+        followed by the world transform of its parent
+
+        World transforms are cached. Changing the transform of a node, or
+        moving it, only clears the caches of the node and its descendants,
+        so siblings and ancestors keep theirs."""
+        from .geo.attribute import Mat4
+        return Mat4(self._world())
+
+    def _world(self):
+        """The cached world transform; it must not be modified"""
+        global _identity
+        if _identity is None:
+            from .geo.attribute import Mat4
+            _identity = Mat4()
+        chain = []
+        node = self
+        while node is not None and node._worldtransform is None:
+            chain.append(node)
+            node = node._parent
+        world = _identity if node is None else node._worldtransform
+        for node in reversed(chain):
+            if node._transform is not None:
+                world = node._transform if world is _identity else node._transform * world
+            node._worldtransform = world
+        return world
+
+    def _invalidateWorld(self):
+        """Clear the cached world transforms of this node and its descendants
+
+        A node's world transform is only ever cached along with those of
+        its ancestors, so the walk stops at nodes with none cached."""
+        stack = [self]
+        while stack:
+            node = stack.pop()
+            if node._worldtransform is None:
+                continue
+            node._worldtransform = None
+            stack.extend(node._children)
 
     @property
     def name(self):
@@ -483,15 +1361,26 @@ class Node(object):
 
     @name.setter
     def name(self, n):
-        if not isinstance(n, str):
-            if isinstance(n, bytes):
-                n = str(n, encoding='utf8')
-            else:
-                raise TypeError()
+        # Check bytes first: compiled, isinstance(n, str) tests for the
+        # builtin str whatever _py3fixes binds it to
+        if isinstance(n, bytes):
+            n = n.decode('utf8')
+        elif not isinstance(n, basestring):
+            raise TypeError()
         # TODO (eestrada): sanitize input
-        if self.parent is not None:
-            n = self.parent.uniqueName(n)
+        siblings = None if self._parent is None else self._parent._children
+        registered = siblings is not None and self in siblings
+        if registered:
+            siblings._unregister(self)
+        if siblings is not None:
+            n = siblings.uniqueName(n)
+        indexed = self._indexed
+        self._unindex()
         self._name = n
+        if registered:
+            siblings._register(self)
+        if indexed:
+            self._index()
 
     @property
     def parent(self):
@@ -502,11 +1391,12 @@ class Node(object):
         """Returns a set-like object of the Node's children.
 
         For nodes that cannot have children, this should return None."""
+        self._materialize()
         return self._children
 
     def createNode(self, type_name, node_name=None):
         """Create a node of the specified type as a child node and return it"""
-        cls = self.__metaclass__.node_types[type_name]
+        cls = node_types[type_name]
         if not issubclass(cls, self.__class__.child_types):
             raise RuntimeError('Cannot create a node of this type as a child node.')
 
@@ -515,20 +1405,11 @@ class Node(object):
         return child
 
     def uniqueName(self, name):
-        cs = set(map(lambda n: n.name, self.children))
-        if name not in cs:
-            return name
-
-        raise NotImplementedError()
-        def split_suffix_nums(n):
-            nc = n.rstrip('0123456789')
-            nd = n[len(nc):]
-            return (nc, nd) if nc and nd else None
+        """Return a name, based on name, that no child of this node uses
 
-        childset = set(map(lambda o: o.name, self.children))
-
-        if name in childset:
-            pass
+        If name is taken, its numeric suffix is replaced by one higher than
+        any in use for the same base name (so "box" may become "box12")."""
+        return self._children.uniqueName(name)
 
     @property
     def numInputs(self):
@@ -545,6 +1426,13 @@ class Node(object):
         Empty inputs indices will simply return None."""
         return self._inputs
 
+    def parm(self, name):
+        """Return the parameter called name, or None"""
+        for p in self._parameters:
+            if p.name == name:
+                return p
+        return None
+
     @property
     def parameters(self):
         """Return a mutable sequence of all parameters.
@@ -552,6 +1440,8 @@ class Node(object):
         Parameters may be nested if they are of the correct type (e.g. Folder type)."""
         return self._parameters
 
+Node.child_types = (Node,)
+
 class _RootNode(Node):
     """docstring for _RootNode"""
     def __new__(cls):
@@ -592,8 +1482,21 @@ class _Scene(object):
     def loadScene(self):
         if not self.fpath:
             raise ValueError('fpath must be initialized to a value.')
+        from . import binscene
+        if binscene.isBinaryScene(self.fpath):
+            self.root = binscene.loadScene(self.fpath)
+            return
         from . import spellscript
         spellscript.loadScene(self.fpath, self)
 
+    def saveScene(self, fpath=None):
+        """Save the scene as a binary scene file"""
+        from . import binscene
+        fpath = fpath or self.fpath
+        if not fpath:
+            raise ValueError('fpath must be initialized to a value.')
+        binscene.saveScene(self.root, fpath)
+        self.fpath = fpath
+
     def initEmpty(self):
         self.root = _RootNode(self)
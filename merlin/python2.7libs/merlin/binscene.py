@@ -0,0 +1,262 @@
+from __future__ import division, absolute_import, print_function, unicode_literals
+
+"""Binary scene files.
+
+A binary scene stores a node hierarchy as a few flat, fixed size record
+tables, so opening one does not require running any Python statements:
+
+* a header, holding the magic, version and the offset and length of every
+  table,
+* the node table, one record per node in depth first order, so that the
+  descendants of record i are exactly the next size[i] records,
+* the parameter, keyframe and input tables, which node records refer to by
+  offset and count,
+* the string table: an array of offsets into a block of utf-8 text, holding
+  every name, type name, string value and expression.
+
+The tables are read with numpy.frombuffer and never parsed up front. When a
+scene is opened only the root node is created; every other node is created,
+along with its siblings, the first time its parent's children are asked for
+(Node.children, or a Node.findNode/merlin.node lookup that passes through
+it). Opening a huge scene to edit a single subnet therefore only creates
+the nodes on the way to it."""
+
+import io
+import struct
+
+import numpy
+
+from ._py3fixes import *
+from . import _types
+from .channel import Channel
+
+MAGIC = b'MSCN'
+VERSION = 1
+
+_header = struct.Struct(str('<4sI') + str('QQ') * 6)
+
+_node_dtype = numpy.dtype([(str('type'), '<i4'), (str('name'), '<i4'),
+                           (str('parent'), '<i4'), (str('size'), '<i4'),
+                           (str('x'), '<f8'), (str('y'), '<f8'),
+                           (str('parm'), '<i4'), (str('nparms'), '<i4'),
+                           (str('input'), '<i4'), (str('ninputs'), '<i4')])
+
+_parm_dtype = numpy.dtype([(str('name'), '<i4'), (str('kind'), '<i4'),
+                           (str('value'), '<f8'), (str('string'), '<i4'),
+                           (str('expression'), '<i4'),
+                           (str('key'), '<i4'), (str('nkeys'), '<i4')])
+
+_key_dtype = numpy.dtype([(str('frame'), '<f8'), (str('value'), '<f8'),
+                          (str('inslope'), '<f8'), (str('outslope'), '<f8'),
+                          (str('interp'), '<i4')])
+
+# Parameter classes, by their kind in the parameter table. Only append.
+_parm_types = (_types.ParmToggle, _types.ParmInt, _types.ParmFloat, _types.ParmString)
+
+def isBinaryScene(fpath):
+    with io.open(fpath, 'rb') as f:
+        return f.read(len(MAGIC)) == MAGIC
+
+class _StringTable(object):
+    def __init__(self):
+        self._strings = []
+        self._ids = {}
+
+    def add(self, s):
+        if s is None:
+            return -1
+        try:
+            return self._ids[s]
+        except KeyError:
+            i = self._ids[s] = len(self._strings)
+            self._strings.append(s)
+            return i
+
+    def tobytes(self):
+        blob = [s.encode('utf8') for s in self._strings]
+        offsets = numpy.zeros(len(blob) + 1, dtype='<u8')
+        numpy.cumsum([len(b) for b in blob], out=offsets[1:])
+        return offsets.tobytes(), b''.join(blob)
+
+def saveScene(root, fpath):
+    """Write root and everything below it to a binary scene file
+
+    Any part of the hierarchy that has not been loaded yet is loaded first."""
+    strings = _StringTable()
+    records = []
+    parms = []
+    keys = []
+    inputs = []
+
+    stack = [(root, -1)]
+    while stack:
+        node, parent = stack.pop()
+        index = len(records)
+        children = node.children or ()
+        # Reversed, so that children come off the stack in name order
+        stack.extend((c, index) for c in sorted(children, key=lambda c: c.name, reverse=True))
+
+        nodeparms = [p for p in node.parameters if type(p) in _parm_types]
+        record = [strings.add(type(node).__name__), strings.add(node.name), parent, 0,
+                  node.position.x, node.position.y, len(parms), len(nodeparms),
+                  len(inputs), len(node.inputs)]
+        records.append(record)
+        inputs.extend(node.inputs)
+        for p in nodeparms:
+            kind = _parm_types.index(type(p))
+            string = strings.add(p.value) if kind == _parm_types.index(_types.ParmString) else -1
+            value = 0.0 if string != -1 else float(p.value)
+            expression = strings.add(p.expression.source) if p.expression is not None else -1
+            c = p.channel
+            nkeys = c.numKeys if c is not None else 0
+            parms.append((strings.add(p.name), kind, value, string, expression, len(keys), nkeys))
+            if nkeys:
+                keys.extend(zip(c.frames, c.values, c._inslopes, c._outslopes, c.interps))
+
+    # Subtree sizes, accumulated from the deepest records up
+    for record in reversed(records[1:]):
+        records[record[2]][3] += record[3] + 1
+
+    # Inputs are stored as the index of the connected sibling's record
+    recordof = {}
+    stack = [root]
+    index = 0
+    while stack:
+        node = stack.pop()
+        recordof[id(node)] = index
+        index += 1
+        stack.extend(sorted(node.children or (), key=lambda c: c.name, reverse=True))
+    inputs = [-1 if n is None else recordof[id(n)] for n in inputs]
+
+    tables = [numpy.array([tuple(r) for r in records], dtype=_node_dtype).tobytes(),
+              numpy.array(parms, dtype=_parm_dtype).tobytes(),
+              numpy.array(keys, dtype=_key_dtype).tobytes(),
+              numpy.array(inputs, dtype='<i4').tobytes()]
+    tables.extend(strings.tobytes())
+
+    layout = []
+    offset = _header.size
+    for t in tables:
+        # Keep every table 8 byte aligned
+        offset += -offset % 8
+        layout.extend((offset, len(t)))
+        offset += len(t)
+
+    with io.open(fpath, 'wb') as f:
+        f.write(_header.pack(MAGIC, VERSION, *layout))
+        for t in tables:
+            f.write(b'\0' * (-f.tell() % 8))
+            f.write(t)
+
+class SceneReader(object):
+    """The record tables of a binary scene file, read without parsing"""
+    def __init__(self, fpath):
+        super(SceneReader, self).__init__()
+        with io.open(fpath, 'rb') as f:
+            self._data = f.read()
+        if len(self._data) < _header.size:
+            raise ValueError('{0} is not a merlin binary scene'.format(fpath))
+        header = _header.unpack_from(self._data)
+        if header[0] != MAGIC:
+            raise ValueError('{0} is not a merlin binary scene'.format(fpath))
+        if header[1] > VERSION:
+            raise ValueError('{0} has unsupported version {1}'.format(fpath, header[1]))
+        layout = header[2:]
+        tables = []
+        for dtype, i in zip((_node_dtype, _parm_dtype, _key_dtype, '<i4', '<u8', 'u1'),
+                            range(0, 12, 2)):
+            offset, length = layout[i:i+2]
+            count = length // numpy.dtype(dtype).itemsize
+            if count:
+                tables.append(numpy.frombuffer(self._data, dtype, count, offset))
+            else:
+                tables.append(numpy.empty(0, dtype))
+        (self.nodes, self.parms, self.keys, self.inputs,
+         self._stroffsets, self._strblob) = tables
+        self._strings = {}
+
+    @property
+    def numNodes(self):
+        return len(self.nodes)
+
+    def string(self, i):
+        if i < 0:
+            return None
+        try:
+            return self._strings[i]
+        except KeyError:
+            start, end = self._stroffsets[i], self._stroffsets[i+1]
+            s = self._strings[i] = self._strblob[start:end].tobytes().decode('utf8')
+            return s
+
+    def children(self, record):
+        """The record indices of the children of a record"""
+        sizes = self.nodes['size']
+        i = record + 1
+        end = i + sizes[record]
+        while i < end:
+            yield i
+            i += sizes[i] + 1
+
+    def load(self, root=None):
+        """Return the root of the scene, creating its children lazily
+
+        If root is given, the scene's top level nodes are loaded into it
+        instead of a new root."""
+        if root is None:
+            root = _types.Node.__new__(_types.Node, None, '/')
+        self._setup(root, 0)
+        return root
+
+    def loadChildren(self, node, record):
+        """Create the children of record under node (Node._materialize)"""
+        created = []
+        for i in self.children(record):
+            r = self.nodes[i]
+            typename = self.string(r['type'])
+            if typename not in _types.node_types:
+                raise RuntimeError('Unknown node type {0!r}'.format(typename))
+            child = node.createNode(typename, self.string(r['name']))
+            self._setup(child, i)
+            created.append((i, child))
+
+        # Inputs can only be siblings, so they are all among created
+        nodes = dict(created)
+        for i, child in created:
+            r = self.nodes[i]
+            connected = self.inputs[r['input']:r['input'] + r['ninputs']]
+            for index, j in enumerate(connected[:len(child.inputs)]):
+                if j >= 0:
+                    child.inputs[index] = nodes[int(j)]
+
+    def _setup(self, node, record):
+        r = self.nodes[record]
+        node.position.x, node.position.y = float(r['x']), float(r['y'])
+        for p in self.parms[r['parm']:r['parm'] + r['nparms']]:
+            self._setupParm(node, p)
+        if r['size']:
+            node._loader = (self, record)
+
+    def _setupParm(self, node, p):
+        name = self.string(p['name'])
+        cls = _parm_types[p['kind']]
+        parm = node.parm(name)
+        if parm is None:
+            parm = cls(node, name=name)
+            node.parameters.append(parm)
+        if cls is _types.ParmString:
+            parm.value = self.string(p['string'])
+        else:
+            parm.value = p['value']
+        if p['nkeys']:
+            keys = self.keys[p['key']:p['key'] + p['nkeys']]
+            c = Channel(keys['frame'], keys['value'], keys['interp'])
+            c._inslopes = keys['inslope'].copy()
+            c._outslopes = keys['outslope'].copy()
+            parm.channel = c
+        if p['expression'] >= 0:
+            parm.expression = self.string(p['expression'])
+
+def loadScene(fpath, root=None):
+    """Open a binary scene file and return its (lazily loaded) root node"""
+    return SceneReader(fpath).load(root)
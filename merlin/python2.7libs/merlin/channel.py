@@ -0,0 +1,233 @@
+from __future__ import division, absolute_import, print_function, unicode_literals
+
+"""Keyframed animation channels.
+
+A Channel holds its keyframes as parallel numpy arrays sorted by frame:
+the frame, value, in and out slopes, and the interpolation of the segment
+that starts at each key. Finding the segment for a frame is a binary search
+(numpy.searchsorted), and sample evaluates any number of frames in one
+vectorized call, so caching a long shot costs a handful of array operations
+per channel rather than a Python call per frame.
+
+Before the first key and after the last one a channel holds the value of
+that key.
+
+Attached to a Parameter (see Parameter.channel), a channel is evaluated at
+the current frame (expression.frame()), memoizes the result, and is
+invalidated along with the time dependent expressions whenever the frame
+changes, dirtying the parameter's node."""
+
+import weakref
+
+import numpy
+
+from ._py3fixes import *
+from . import expression
+
+class Interp(object):
+    """Enum for the interpolation of the segment following a key"""
+    Constant = 0
+    Linear = 1
+    Bezier = 2  # Hermite segment using the keys' explicit slopes
+    Cubic = 3   # Hermite segment using automatic (Catmull-Rom) slopes
+
+class Channel(object):
+    """An animation curve of keyframes, optionally driving a Parameter"""
+    def __init__(self, frames=(), values=(), interp=Interp.Linear):
+        super(Channel, self).__init__()
+        self._parm = None
+        self._valid = False
+        self._value = None
+        self._frames = numpy.empty(0)
+        self._values = numpy.empty(0)
+        self._inslopes = numpy.empty(0)
+        self._outslopes = numpy.empty(0)
+        self._interps = numpy.empty(0, dtype=numpy.int8)
+        self._slopes = None
+        if len(frames) or len(values):
+            self.setKeys(frames, values, interp)
+
+    def __repr__(self):
+        return '<{0} {1} keys>'.format(self.__class__.__name__, self.numKeys)
+
+    def __len__(self):
+        return len(self._frames)
+
+    @property
+    def numKeys(self):
+        return len(self._frames)
+
+    @property
+    def parm(self):
+        return None if self._parm is None else self._parm()
+
+    # The key arrays must be treated as read only; use setKey(s) to edit.
+    @property
+    def frames(self):
+        return self._frames
+
+    @property
+    def values(self):
+        return self._values
+
+    @property
+    def interps(self):
+        return self._interps
+
+    def setKey(self, frame, value, interp=Interp.Linear, inSlope=None, outSlope=None):
+        """Add a key, or replace the key at the same frame
+
+        Slopes are in value units per frame and only used by Bezier
+        segments. A slope left as None is computed automatically; if only
+        one is given it is used for both sides."""
+        if inSlope is None:
+            inSlope = outSlope
+        if outSlope is None:
+            outSlope = inSlope
+        frame = float(frame)
+        i = int(numpy.searchsorted(self._frames, frame))
+        key = (float(value),
+               numpy.nan if inSlope is None else float(inSlope),
+               numpy.nan if outSlope is None else float(outSlope),
+               interp)
+        if i < len(self._frames) and self._frames[i] == frame:
+            self._values[i], self._inslopes[i], self._outslopes[i], self._interps[i] = key
+        else:
+            self._frames = numpy.insert(self._frames, i, frame)
+            self._values = numpy.insert(self._values, i, key[0])
+            self._inslopes = numpy.insert(self._inslopes, i, key[1])
+            self._outslopes = numpy.insert(self._outslopes, i, key[2])
+            self._interps = numpy.insert(self._interps, i, interp)
+        self._changed()
+
+    def setKeys(self, frames, values, interp=Interp.Linear):
+        """Replace all keys at once, with automatic slopes
+
+        interp is either a single interpolation or one per key."""
+        frames = numpy.array(frames, dtype=numpy.float64).ravel()
+        values = numpy.array(values, dtype=numpy.float64).ravel()
+        if len(frames) != len(values):
+            raise ValueError('frames and values must have the same length')
+        interps = numpy.empty(len(frames), dtype=numpy.int8)
+        interps[:] = interp
+        order = numpy.argsort(frames, kind='mergesort')
+        frames, values, interps = frames[order], values[order], interps[order]
+        if len(frames) > 1 and not numpy.all(numpy.diff(frames)):
+            raise ValueError('frames must be unique')
+        self._frames = frames
+        self._values = values
+        self._inslopes = numpy.full(len(frames), numpy.nan)
+        self._outslopes = numpy.full(len(frames), numpy.nan)
+        self._interps = interps
+        self._changed()
+
+    def removeKey(self, frame):
+        i = int(numpy.searchsorted(self._frames, float(frame)))
+        if i == len(self._frames) or self._frames[i] != float(frame):
+            raise KeyError('No key at frame {0}'.format(frame))
+        self._frames = numpy.delete(self._frames, i)
+        self._values = numpy.delete(self._values, i)
+        self._inslopes = numpy.delete(self._inslopes, i)
+        self._outslopes = numpy.delete(self._outslopes, i)
+        self._interps = numpy.delete(self._interps, i)
+        self._changed()
+
+    def _autoSlopes(self):
+        """Catmull-Rom slopes for every key, one sided at the ends"""
+        f, v = self._frames, self._values
+        slopes = numpy.zeros(len(f))
+        if len(f) > 1:
+            slopes[1:-1] = (v[2:] - v[:-2]) / (f[2:] - f[:-2])
+            slopes[0] = (v[1] - v[0]) / (f[1] - f[0])
+            slopes[-1] = (v[-1] - v[-2]) / (f[-1] - f[-2])
+        return slopes
+
+    def _segmentSlopes(self):
+        """The (out, in) slopes at the start and end of every segment, cached
+        until the keys change"""
+        if self._slopes is None:
+            auto = self._autoSlopes()
+            bezier = self._interps[:-1] == Interp.Bezier
+            out = numpy.where(bezier & ~numpy.isnan(self._outslopes[:-1]),
+                              self._outslopes[:-1], auto[:-1])
+            inn = numpy.where(bezier & ~numpy.isnan(self._inslopes[1:]),
+                              self._inslopes[1:], auto[1:])
+            self._slopes = (out, inn)
+        return self._slopes
+
+    def sample(self, frames):
+        """Evaluate the channel at every frame of an array, returning an array"""
+        frames = numpy.asarray(frames, dtype=numpy.float64)
+        n = len(self._frames)
+        if n == 0:
+            raise ValueError('Channel has no keys')
+        if n == 1:
+            return numpy.full(frames.shape, self._values[0])
+
+        f, v = self._frames, self._values
+        seg = numpy.clip(numpy.searchsorted(f, frames, side='right') - 1, 0, n - 2)
+        f0, f1 = f[seg], f[seg + 1]
+        v0, v1 = v[seg], v[seg + 1]
+        dt = f1 - f0
+        t = numpy.clip((frames - f0) / dt, 0.0, 1.0)
+
+        out, inn = self._segmentSlopes()
+        t2 = t * t
+        t3 = t2 * t
+        hermite = ((2*t3 - 3*t2 + 1) * v0 + (t3 - 2*t2 + t) * dt * out[seg] +
+                   (-2*t3 + 3*t2) * v1 + (t3 - t2) * dt * inn[seg])
+
+        interp = self._interps[seg]
+        result = numpy.where(interp == Interp.Constant, v0,
+                             numpy.where(interp == Interp.Linear, v0 + (v1 - v0) * t,
+                                         hermite))
+        # Hold the end keys outside of the keyed range
+        result = numpy.where(frames >= f[-1], v[-1], result)
+        return numpy.where(frames <= f[0], v[0], result)
+
+    def sampleRange(self, start, end, step=1.0):
+        """Evaluate the channel from start to end inclusive
+
+        Returns a (frames, values) pair of arrays."""
+        count = int(numpy.floor((end - start) / step + 1e-9)) + 1
+        frames = start + step * numpy.arange(max(count, 0))
+        return frames, self.sample(frames)
+
+    def valueAt(self, frame):
+        return float(self.sample(numpy.array([frame]))[0])
+
+    def eval(self):
+        """Return the value at the current frame"""
+        if not self._valid:
+            self._value = self.valueAt(expression.frame())
+            self._valid = True
+            expression._time_dependents[id(self)] = self
+        return self._value
+
+    @property
+    def valid(self):
+        return self._valid
+
+    def _release(self):
+        if expression._time_dependents.get(id(self)) is self:
+            del expression._time_dependents[id(self)]
+
+    def invalidate(self):
+        """Forget the value at the current frame, and dirty whatever depends on it"""
+        if not self._valid:
+            return
+        self._valid = False
+        self._value = None
+        self._release()
+        parm = self.parm
+        if parm is not None:
+            parm._changed()
+
+    def _changed(self):
+        self._slopes = None
+        if self._valid:
+            self.invalidate()
+        else:
+            parm = self.parm
+            if parm is not None:
+                parm._changed()
@@ -0,0 +1,203 @@
+from __future__ import division, absolute_import, print_function, unicode_literals
+
+"""Parameter expressions.
+
+Expressions are small Python expressions, such as "ch('tx') * 2 + sin(F)".
+Each distinct expression string is compiled only once, and the code object
+is shared by every parameter using that string.
+
+An expression remembers the result of its last evaluation, and while
+evaluating records what it read:
+
+* other parameters, through ch(),
+* nodes, through node(),
+* the paths of nodes looked up by ch(),
+* the current time, through the variables F (frame), T (seconds) and FPS.
+
+The memoized result stays valid until one of those changes: a parameter
+value or expression is set, a node returned by node() is dirtied, a node
+looked up by path is renamed, moved or destroyed, or setFrame/setFps is
+called. Reading a parameter with ch() does not depend on the rest of its
+node, so changing its other parameters leaves the expression valid.
+Invalidating an expression in turn dirties the node that owns its
+parameter, so nodes recook only when something their parameters depend on
+changes."""
+
+import math
+import threading
+import types
+import weakref
+
+from ._py3fixes import *
+
+_code_cache = dict()
+
+_time = dict(frame=1.0, fps=24.0)
+_time_dependents = weakref.WeakValueDictionary()
+
+_local = threading.local()
+
+def frame():
+    return _time['frame']
+
+def fps():
+    return _time['fps']
+
+def time():
+    return (_time['frame'] - 1.0) / _time['fps']
+
+def setFrame(f):
+    """Set the current frame, invalidating all time dependent expressions"""
+    f = float(f)
+    if f != _time['frame']:
+        _time['frame'] = f
+        _invalidate_time()
+
+def setFps(f):
+    f = float(f)
+    if f != _time['fps']:
+        _time['fps'] = f
+        _invalidate_time()
+
+def _invalidate_time():
+    expressions = list(_time_dependents.values())
+    _time_dependents.clear()
+    for e in expressions:
+        e.invalidate()
+
+def _current():
+    stack = getattr(_local, 'stack', None)
+    if not stack:
+        raise RuntimeError('ch() and node() can only be used in an expression.')
+    return stack[-1]
+
+def _find_node(path):
+    """The node at path, registering the current expression to be
+    invalidated if a node found by path is renamed, moved or destroyed"""
+    e = _current()
+    parm = e.parm
+    if parm is None or parm.node is None:
+        raise RuntimeError('Expression is not bound to a node.')
+    if path == '.':
+        return parm.node
+    n = parm.node.findNode(path)
+    e._depend(n._pathwatchers)
+    return n
+
+def _node(path):
+    """Return the node at an absolute path (or '.' for the expression's own node)"""
+    n = _find_node(path)
+    _current()._depend(n._watchers)
+    return n
+
+def _ch(path):
+    """Return the value of a parameter
+
+    path is either the name of a parameter on the expression's own node, or
+    the absolute path of a node followed by the parameter name."""
+    if '/' in path:
+        nodepath, name = path.rsplit('/', 1)
+        n = _find_node(nodepath or '/')
+    else:
+        n, name = _find_node('.'), path
+    parm = n.parm(name)
+    if parm is None:
+        raise KeyError('No parameter {0!r} on {1}'.format(name, n.path))
+    _current()._depend(parm._dependents)
+    return parm.eval()
+
+_builtins = dict((k, getattr(math, k)) for k in dir(math) if not k.startswith('_'))
+_builtins.update(abs=abs, min=min, max=max, round=round, len=len,
+                 int=int, float=float, str=str, bool=bool,
+                 ch=_ch, node=_node)
+_builtins.update({'True': True, 'False': False, 'None': None})
+
+_time_names = frozenset(['F', 'T', 'FPS'])
+
+def _names(code):
+    """The global names code uses, including in its lambdas and comprehensions"""
+    names = set(code.co_names)
+    for const in code.co_consts:
+        if isinstance(const, types.CodeType):
+            names |= _names(const)
+    return names
+
+def _compile(source):
+    """Return the cached (code, time dependent) pair for an expression string"""
+    try:
+        return _code_cache[source]
+    except KeyError:
+        code = compile(source, '<expression>', 'eval')
+        # Expressions are only time dependent if they mention a time variable
+        compiled = _code_cache[source] = (code, bool(_time_names & _names(code)))
+        return compiled
+
+class Expression(object):
+    """A compiled, memoizing expression, optionally owned by a Parameter"""
+    def __init__(self, source, parm=None):
+        super(Expression, self).__init__()
+        self.source = str(source)
+        self._code, self.timeDependent = _compile(self.source)
+        self._parm = None if parm is None else weakref.ref(parm)
+        self._valid = False
+        self._value = None
+        self._sources = []
+
+    def __repr__(self):
+        return '{0}({1!r})'.format(self.__class__.__name__, self.source)
+
+    @property
+    def parm(self):
+        return None if self._parm is None else self._parm()
+
+    @property
+    def valid(self):
+        """True if eval will return the memoized result"""
+        return self._valid
+
+    def eval(self):
+        if self._valid:
+            return self._value
+
+        stack = getattr(_local, 'stack', None)
+        if stack is None:
+            stack = _local.stack = []
+        if any(e is self for e in stack):
+            raise RuntimeError('Expression {0!r} depends on itself.'.format(self.source))
+
+        self._release()
+        stack.append(self)
+        try:
+            if self.timeDependent:
+                self._depend(_time_dependents)
+            # The time variables are globals, so lambdas and comprehensions
+            # in the expression see them too
+            scope = dict(__builtins__=_builtins, F=_time['frame'], FPS=_time['fps'], T=time())
+            value = eval(self._code, scope)
+        finally:
+            stack.pop()
+        self._value = value
+        self._valid = True
+        return value
+
+    def _depend(self, dependents):
+        """Register with a mapping of dependents, to be invalidated by it"""
+        dependents[id(self)] = self
+        self._sources.append(dependents)
+
+    def _release(self):
+        for dependents in self._sources:
+            if dependents.get(id(self)) is self:
+                del dependents[id(self)]
+        self._sources = []
+
+    def invalidate(self):
+        """Forget the memoized result, and dirty whatever depends on it"""
+        if not self._valid:
+            return
+        self._valid = False
+        self._value = None
+        self._release()
+        parm = self.parm
+        if parm is not None:
+            parm._changed()
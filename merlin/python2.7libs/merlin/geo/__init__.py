@@ -3,3 +3,18 @@ from __future__ import absolute_import
 from . import prim
 from . import pt
 from . import vert
+from . import detail
+from . import mgeo
+from . import polygon
+from . import bvh
+from . import kdtree
+from . import collide
+from . import spline
+from . import promote
+from . import topology
+from . import volume
+from . import packed
+from . import subdivide
+
+from .detail import Geometry
+from .mgeo import GeometryCache, saveGeometry, loadGeometry
@@ -0,0 +1,7 @@
+# Declarations for the compiled build of attribute.py (see setup.py).
+
+cdef class Mat3:
+    cdef double v[9]
+
+cdef class Mat4:
+    cdef double v[16]
@@ -1,8 +1,18 @@
-
 from array import array
 import cython
 import collections
+import fnmatch
 import itertools
+import math
+
+import numpy
+
+class AttribClass(object):
+    """Enum for the element classes an attribute can be bound to"""
+    Point = 0
+    Vertex = 1
+    Prim = 2
+    Global = 3
 
 class Attribute(collections.Sequence):
     """docstring for Attribute"""
@@ -10,52 +20,543 @@ class Attribute(collections.Sequence):
         self = super(Attribute, cls).__new__(cls)
         return self
 
-class Integer(array, Attribute):
-    """docstring for Integer"""
-    def __new__(cls, values=None, length=None):
+class _Packed(array, Attribute):
+    """Base class for attributes stored as a single packed C array.
+
+    Tuple valued attributes are interleaved, so element i of an attribute
+    with a size of 3 occupies the slots [3*i, 3*i+3)."""
+    code = None
+
+    def __new__(cls, values=None, length=None, size=1, default=None):
+        size = int(size)
+        if default is None:
+            default = (0,) * size
+        elif not isinstance(default, collections.Sequence):
+            default = (default,) * size
+        if len(default) != size:
+            raise ValueError('default must have exactly %d components' % size)
+
         if values:
-            self = super(Integer, cls).__new__(cls, 'l', values)
+            self = super(_Packed, cls).__new__(cls, cls.code, values)
+            if len(self) % size:
+                raise ValueError('number of values is not a multiple of size')
         elif length:
-            r = itertools.repeat(int(), length)
-            self = super(Integer, cls).__new__(cls, 'l', r)
+            r = itertools.chain.from_iterable(itertools.repeat(default, length))
+            self = super(_Packed, cls).__new__(cls, cls.code, r)
+        else:
+            self = super(_Packed, cls).__new__(cls, cls.code)
+        self.size = size
+        self.default = tuple(default)
+        return self
+
+    @property
+    def numElements(self):
+        return len(self) // self.size
+
+    def element(self, i):
+        """Return the value of element i; a scalar if size is 1, else a tuple"""
+        if self.size == 1:
+            return self[i]
+        s = i * self.size
+        return tuple(self[s:s+self.size])
+
+    def setElement(self, i, value):
+        if self.size == 1:
+            self[i] = value
         else:
-            self = super(Integer, cls).__new__(cls, 'l')
+            s = i * self.size
+            self[s:s+self.size] = array(self.code, value)
+
+    def appendElements(self, count, values=None):
+        """Grow by count elements, filled from values or with the default"""
+        if values is None:
+            values = itertools.chain.from_iterable(itertools.repeat(self.default, count))
+        start = len(self)
+        self.extend(values)
+        if len(self) - start != count * self.size:
+            del self[start:]
+            raise ValueError('expected %d values' % (count * self.size))
+
+    def copy(self):
+        return self.__class__(self, None, self.size, self.default)
+
+    def extractElements(self, start, stop):
+        """Return a new attribute holding copies of elements [start, stop)"""
+        s = self.size
+        return self.__class__(self[s*start:s*stop], None, s, self.default)
+
+    def extendElements(self, other):
+        """Append the elements of other, an attribute of the same size"""
+        self.extend(other if other.code == self.code else list(other))
+
+def _extend(attr, values):
+    """Append a numpy array of values to a packed attribute"""
+    data = numpy.ascontiguousarray(values, dtype=numpy.dtype(str(attr.code))).tobytes()
+    if hasattr(attr, 'frombytes'):
+        attr.frombytes(data)
+    else:
+        attr.fromstring(data)
+
+class Integer(_Packed):
+    """An attribute stored as a packed array of C longs"""
+    code = 'l'
+
+class Float(_Packed):
+    """An attribute stored as a packed array of C doubles"""
+    code = 'd'
+
+class Vec(Float):
+    """A Float attribute with three components per element"""
+    def __new__(cls, values=None, length=None, default=None):
+        return super(Vec, cls).__new__(cls, values, length, 3, default)
+
+class Vec4(Float):
+    """A Float attribute with four components per element"""
+    def __new__(cls, values=None, length=None, default=None):
+        return super(Vec4, cls).__new__(cls, values, length, 4, default)
+
+try:
+    _string_types = (basestring,)
+except NameError:
+    _string_types = (str,)
+
+class String(_Packed):
+    """A dictionary encoded string attribute
+
+    The distinct strings are stored once, in a table shared by all
+    elements, and each element is stored as a packed index into the table.
+    Indexing the attribute directly (attr[i]) gives these indices, as it
+    gives the raw slots of other attributes; element() and setElement()
+    deal in strings.
+
+    Matching and grouping work on the table, and so cost one comparison
+    per distinct string, plus a vectorized pass over the indices."""
+    code = 'l'
+
+    def __new__(cls, values=None, length=None, size=1, default=None, table=None):
+        size = int(size)
+        if default is None:
+            default = ('',) * size
+        elif isinstance(default, _string_types):
+            default = (default,) * size
+        if len(default) != size:
+            raise ValueError('default must have exactly %d components' % size)
+        self = super(String, cls).__new__(cls, None, None, size)
+        self.table = []
+        self._lookup = {}
+        for string in table or ():
+            self.intern(string)
+        self.default = tuple(default)
+        self._defaultIndices = tuple(self.intern(string) for string in default)
+        if values:
+            self.appendElements(len(values) // size, values)
+        elif length:
+            self.appendElements(length)
         return self
 
-class Float(Attribute):
-    """docstring for Float"""
-    def __init__(self, f):
-        super(Float, self).__init__()
-        self.arg = arg
-
-class Vec(list, Attribute):
-    """docstring for Vec"""
-    def __init__(self, x, y, z):
-        super(Vec, self).__init__()
-        self.arg = arg
-
-class Vec4(Attribute):
-    """docstring for Vec4"""
-    def __init__(self, x, y, z, w):
-        super(Vec4, self).__init__()
-        self.arg = arg
-
-class String(object):
-    """docstring for String"""
-    def __init__(self, arg):
-        super(String, self).__init__()
-        self.arg = arg
+    def intern(self, string):
+        """Return the table index of string, adding it to the table if needed"""
+        try:
+            return self._lookup[string]
+        except KeyError:
+            self.table.append(string)
+            i = self._lookup[string] = len(self.table) - 1
+            return i
+
+    def find(self, string):
+        """Return the table index of string, or -1 if it is not in the table"""
+        return self._lookup.get(string, -1)
+
+    @property
+    def indices(self):
+        """The table index of every slot, as a numpy array viewing the attribute"""
+        return numpy.frombuffer(self, dtype=self.code) if len(self) else numpy.empty(0, self.code)
+
+    def element(self, i):
+        """Return the string of element i, or a tuple of strings"""
+        if self.size == 1:
+            return self.table[self[i]]
+        s = i * self.size
+        return tuple(self.table[j] for j in self[s:s+self.size])
+
+    def setElement(self, i, value):
+        if self.size == 1:
+            self[i] = self.intern(value)
+        else:
+            s = i * self.size
+            self[s:s+self.size] = array(self.code, [self.intern(v) for v in value])
+
+    def appendElements(self, count, values=None):
+        """Grow by count elements, filled from strings or with the default"""
+        if values is None:
+            values = itertools.repeat(self._defaultIndices, count)
+            self.extend(itertools.chain.from_iterable(values))
+            return
+        values = [self.intern(v) for v in values]
+        if len(values) != count * self.size:
+            raise ValueError('expected %d values' % (count * self.size))
+        self.extend(values)
+
+    def strings(self):
+        """Return the strings of all the slots, as a list"""
+        table = self.table
+        return [table[i] for i in self]
+
+    def copy(self):
+        result = self.__class__(None, None, self.size, self.default, self.table)
+        result.extend(self)
+        return result
+
+    def extractElements(self, start, stop):
+        s = self.size
+        result = self.__class__(None, None, s, self.default, self.table)
+        result.extend(self[s*start:s*stop])
+        return result
+
+    def remap(self, other):
+        """Return a numpy array mapping the table indices of another String
+        attribute to indices in this attribute's table, adding any strings
+        this table is missing"""
+        return numpy.array([self.intern(string) for string in other.table], dtype=self.code)
+
+    def extendElements(self, other):
+        """Append the elements of another String attribute, whatever its table"""
+        if other.table == self.table:
+            self.extend(other)
+        elif len(other):
+            _extend(self, self.remap(other)[other.indices])
+
+    def _matches(self, ids):
+        """The slots whose index is one of ids, as a boolean array of the
+        attribute's elements (elements x size for tuples)"""
+        found = numpy.isin(self.indices, numpy.asarray(ids, dtype=self.code)).ravel()
+        return found if self.size == 1 else found.reshape(-1, self.size)
+
+    def match(self, string):
+        """Return a boolean array of the slots equal to string"""
+        return self._matches([self.find(string)])
+
+    def matchPrefix(self, prefix):
+        """Return a boolean array of the slots starting with prefix"""
+        return self._matches([i for i, s in enumerate(self.table) if s.startswith(prefix)])
+
+    def matchPattern(self, pattern):
+        """Return a boolean array of the slots matching a glob pattern
+        (see fnmatch)"""
+        table = self.table
+        return self._matches([self._lookup[s] for s in fnmatch.filter(table, pattern)])
+
+    def groups(self):
+        """Return a dictionary from each string in use to a sorted numpy
+        array of the elements with that value"""
+        if self.size != 1:
+            raise ValueError('Only attributes of size 1 can be grouped')
+        indices = self.indices
+        order = numpy.argsort(indices, kind='mergesort')
+        ids, starts = numpy.unique(indices[order], return_index=True)
+        bounds = numpy.append(starts, len(order))
+        return dict((self.table[i], order[bounds[k]:bounds[k + 1]]) for k, i in enumerate(ids))
+
+    def compact(self):
+        """Drop the strings no slot refers to from the table"""
+        used = numpy.zeros(len(self.table), dtype=bool)
+        used[self.indices] = True
+        used[list(self._defaultIndices)] = True
+        if used.all():
+            return
+        mapping = numpy.cumsum(used) - 1
+        remapped = mapping[self.indices]
+        self.table = [s for s, u in zip(self.table, used) if u]
+        self._lookup = dict((s, i) for i, s in enumerate(self.table))
+        self._defaultIndices = tuple(self._lookup[s] for s in self.default)
+        del self[:]
+        _extend(self, remapped)
+
+# Matrices are row major and, as in Houdini, transform row vectors: a
+# point p is transformed by p * M, so A * B applies A first, then B. The
+# translation of a Mat4 is its last row.
+
+_axes = {'x': 0, 'y': 1, 'z': 2}
+
+@cython.locals(n=cython.int, i=cython.int, j=cython.int, k=cython.int, s=cython.double)
+def _multiply(a, b, n):
+    """The product of two row major n x n matrices, as a list"""
+    result = [0.0] * (n * n)
+    for i in range(n):
+        for j in range(n):
+            s = 0.0
+            for k in range(n):
+                s += a[i*n+k] * b[k*n+j]
+            result[i*n+j] = s
+    return result
+
+@cython.locals(n=cython.int, i=cython.int, j=cython.int)
+def _transpose(a, n):
+    return [a[j*n+i] for i in range(n) for j in range(n)]
+
+@cython.locals(n=cython.int, i=cython.int, j=cython.int, k=cython.int, pivot=cython.int,
+               f=cython.double)
+def _invert(a, n):
+    """The inverse of a row major n x n matrix, by Gauss-Jordan elimination"""
+    m = [[float(a[i*n+j]) for j in range(n)] + [float(i == j) for j in range(n)]
+         for i in range(n)]
+    for i in range(n):
+        pivot = i
+        for k in range(i + 1, n):
+            if abs(m[k][i]) > abs(m[pivot][i]):
+                pivot = k
+        if abs(m[pivot][i]) < 1e-300:
+            raise ValueError('Matrix is singular')
+        m[i], m[pivot] = m[pivot], m[i]
+        f = 1.0 / m[i][i]
+        m[i] = [v * f for v in m[i]]
+        for k in range(n):
+            if k != i and m[k][i] != 0.0:
+                f = m[k][i]
+                m[k] = [v - f * w for v, w in zip(m[k], m[i])]
+    return [m[i][n+j] for i in range(n) for j in range(n)]
+
+@cython.locals(angle=cython.double, c=cython.double, s=cython.double)
+def _rotation(rotate, order):
+    """A 3x3 rotation (as a list) by Euler angles in degrees, about the
+    axes in order"""
+    result = [1.0, 0.0, 0.0, 0.0, 1.0, 0.0, 0.0, 0.0, 1.0]
+    for axis in order:
+        i = _axes[axis]
+        angle = math.radians(rotate[i])
+        c, s = math.cos(angle), math.sin(angle)
+        j, k = (i + 1) % 3, (i + 2) % 3
+        r = [1.0, 0.0, 0.0, 0.0, 1.0, 0.0, 0.0, 0.0, 1.0]
+        r[j*3+j], r[j*3+k], r[k*3+j], r[k*3+k] = c, s, -s, c
+        result = _multiply(result, r, 3)
+    return result
+
+@cython.locals(e=cython.double, sb=cython.double)
+def _euler(r, order):
+    """The Euler angles in degrees, as (x, y, z), of a 3x3 rotation r
+    applied about the axes in order"""
+    i, j, k = [_axes[axis] for axis in order]
+    # m is the transpose (the column vector form) of r, which is Rk * Rj * Ri
+    m = _transpose(r, 3)
+    e = 1.0 if (j - i) % 3 == 1 else -1.0
+    sb = max(-1.0, min(1.0, -e * m[k*3+i]))
+    angles = [0.0, 0.0, 0.0]
+    angles[j] = math.asin(sb)
+    if abs(sb) < 1.0 - 1e-12:
+        angles[i] = math.atan2(e * m[k*3+j], m[k*3+k])
+        angles[k] = math.atan2(e * m[j*3+i], m[i*3+i])
+    else:
+        # Gimbal lock: only the sum (or difference) of the outer angles counts
+        angles[i] = math.atan2(-e * m[j*3+k], m[j*3+j])
+    return tuple(math.degrees(a) for a in angles)
 
 class Mat3(object):
-    """docstring for Mat3"""
-    cython.declare(v=cython.double[9])
-    def __init__(self, arg):
+    """A 3x3 matrix, stored row major"""
+
+    @cython.locals(i=cython.int)
+    def __init__(self, values=None):
         super(Mat3, self).__init__()
-        self.arg = arg
+        if not cython.compiled:
+            self.v = [0.0] * 9
+        if values is None:
+            values = (1.0, 0.0, 0.0, 0.0, 1.0, 0.0, 0.0, 0.0, 1.0)
+        elif len(values) != 9:
+            raise ValueError('Mat3 requires 9 values')
+        for i in range(9):
+            self.v[i] = float(values[i])
+
+    def __repr__(self):
+        return '{0}({1!r})'.format(self.__class__.__name__, list(self))
+
+    def __len__(self):
+        return 9
+
+    @cython.locals(i=cython.int)
+    def __getitem__(self, i):
+        if i < 0 or i >= 9:
+            raise IndexError('Mat3 index out of range')
+        return self.v[i]
+
+    @cython.locals(i=cython.int, value=cython.double)
+    def __setitem__(self, i, value):
+        if i < 0 or i >= 9:
+            raise IndexError('Mat3 index out of range')
+        self.v[i] = float(value)
+
+    def __eq__(self, other):
+        return isinstance(other, Mat3) and list(self) == list(other)
+
+    def __ne__(self, other):
+        return not self == other
+
+    def __mul__(self, other):
+        # Compiled, either operand may be the Mat3
+        if not (isinstance(self, Mat3) and isinstance(other, Mat3)):
+            return NotImplemented
+        return Mat3(_multiply(self, other, 3))
+
+    def transposed(self):
+        return Mat3(_transpose(self, 3))
+
+    def determinant(self):
+        a = self
+        return (a[0] * (a[4]*a[8] - a[5]*a[7]) - a[1] * (a[3]*a[8] - a[5]*a[6]) +
+                a[2] * (a[3]*a[7] - a[4]*a[6]))
+
+    def inverted(self):
+        """Return the inverse, raising ValueError if the matrix is singular"""
+        return Mat3(_invert(self, 3))
+
+    @classmethod
+    def fromRotates(cls, rotate, order='xyz'):
+        """Build a rotation from Euler angles in degrees, applied about the
+        axes in order"""
+        return cls(_rotation(rotate, order))
+
+    def extractRotates(self, order='xyz'):
+        """The Euler angles in degrees of a pure rotation (see fromRotates)"""
+        return _euler(self, order)
 
 class Mat4(object):
-    """docstring for Mat4"""
-    cython.declare(v=cython.double[16])
-    def __init__(self, arg):
+    """A 4x4 matrix, stored row major"""
+
+    @cython.locals(i=cython.int)
+    def __init__(self, values=None):
         super(Mat4, self).__init__()
-        self.arg = arg
\ No newline at end of file
+        if not cython.compiled:
+            self.v = [0.0] * 16
+        if values is None:
+            values = (1.0, 0.0, 0.0, 0.0, 0.0, 1.0, 0.0, 0.0,
+                      0.0, 0.0, 1.0, 0.0, 0.0, 0.0, 0.0, 1.0)
+        elif len(values) != 16:
+            raise ValueError('Mat4 requires 16 values')
+        for i in range(16):
+            self.v[i] = float(values[i])
+
+    def __repr__(self):
+        return '{0}({1!r})'.format(self.__class__.__name__, list(self))
+
+    def __len__(self):
+        return 16
+
+    @cython.locals(i=cython.int)
+    def __getitem__(self, i):
+        if i < 0 or i >= 16:
+            raise IndexError('Mat4 index out of range')
+        return self.v[i]
+
+    @cython.locals(i=cython.int, value=cython.double)
+    def __setitem__(self, i, value):
+        if i < 0 or i >= 16:
+            raise IndexError('Mat4 index out of range')
+        self.v[i] = float(value)
+
+    def __eq__(self, other):
+        return isinstance(other, Mat4) and list(self) == list(other)
+
+    def __ne__(self, other):
+        return not self == other
+
+    def __mul__(self, other):
+        # Compiled, either operand may be the Mat4
+        if not (isinstance(self, Mat4) and isinstance(other, Mat4)):
+            return NotImplemented
+        return Mat4(_multiply(self, other, 4))
+
+    def transposed(self):
+        return Mat4(_transpose(self, 4))
+
+    def determinant(self):
+        """The determinant, by cofactor expansion along the last column"""
+        a = list(self)
+        total = 0.0
+        for row in range(4):
+            minor = [a[r*4+c] for r in range(4) if r != row for c in range(3)]
+            sign = -1.0 if (row + 3) % 2 else 1.0
+            total += sign * a[row*4+3] * Mat3(minor).determinant()
+        return total
+
+    def inverted(self):
+        """Return the inverse, raising ValueError if the matrix is singular"""
+        return Mat4(_invert(self, 4))
+
+    def mat3(self):
+        """The upper 3x3 (rotation and scale) part"""
+        return Mat3([self[r*4+c] for r in range(3) for c in range(3)])
+
+    @classmethod
+    def fromTRS(cls, translate=(0.0, 0.0, 0.0), rotate=(0.0, 0.0, 0.0),
+                scale=(1.0, 1.0, 1.0), order='xyz'):
+        """Build a transform that scales, then rotates (by Euler angles in
+        degrees about the axes in order), then translates"""
+        r = _rotation(rotate, order)
+        values = []
+        for row in range(3):
+            values.extend([r[row*3+c] * scale[row] for c in range(3)])
+            values.append(0.0)
+        values.extend([float(t) for t in translate])
+        values.append(1.0)
+        return cls(values)
+
+    def extractTranslates(self):
+        return (self[12], self[13], self[14])
+
+    def decompose(self, order='xyz'):
+        """Split an affine transform into (translate, rotate, scale), the
+        inverse of fromTRS (shear is discarded)"""
+        rows = [[self[r*4+c] for c in range(3)] for r in range(3)]
+        scale = [math.sqrt(sum(v * v for v in row)) for row in rows]
+        if self.mat3().determinant() < 0.0:
+            scale[0] = -scale[0]
+        r = []
+        for row, s in zip(rows, scale):
+            r.extend([v / s if s else 0.0 for v in row])
+        return self.extractTranslates(), _euler(r, order), tuple(scale)
+
+# Batched transforms
+def matrixArray(matrices):
+    """Return a Mat4, or a sequence of Mat4s, as a (4, 4) or an (N, 4, 4)
+    float64 array
+
+    (4, 4) and (N, 4, 4) arrays, and (N, 16) arrays of flattened matrices
+    are also accepted."""
+    m = numpy.asarray(matrices, dtype=numpy.float64)
+    if m.shape[-1] == 16:
+        m = m.reshape(m.shape[:-1] + (4, 4))
+    if m.shape[-2:] != (4, 4) or m.ndim > 3:
+        raise ValueError('Expected one or more 4x4 matrices')
+    return m
+
+def _apply(matrices, vectors, block):
+    """vectors times the 3x3 block of one or many matrices (see matrixArray)"""
+    v = numpy.asarray(vectors, dtype=numpy.float64).reshape(-1, 3)
+    if block.ndim == 2:
+        return v.dot(block)
+    return numpy.einsum('ni,nij->nj', v, block)
+
+def transformPositions(matrices, positions):
+    """Transform an (N, 3) array of positions by one Mat4, or by one Mat4
+    per position, in a single call
+
+    Projective matrices divide by the resulting w."""
+    m = matrixArray(matrices)
+    result = _apply(m, positions, m[..., :3, :3]) + m[..., 3, :3]
+    w = _apply(m, positions, m[..., :3, 3:]) + m[..., 3, 3:]
+    if numpy.any(w != 1.0):
+        result /= w
+    return result
+
+def transformVectors(matrices, vectors):
+    """Transform an (N, 3) array of vectors, ignoring translation"""
+    m = matrixArray(matrices)
+    return _apply(m, vectors, m[..., :3, :3])
+
+def transformNormals(matrices, normals):
+    """Transform an (N, 3) array of normals by the inverse transpose of the
+    matrices, keeping them perpendicular to transformed surfaces
+
+    The results are normalized."""
+    m = matrixArray(matrices)
+    result = _apply(m, normals, numpy.swapaxes(numpy.linalg.inv(m[..., :3, :3]), -1, -2))
+    length = numpy.sqrt(numpy.einsum('ij,ij->i', result, result))[:, numpy.newaxis]
+    return result / numpy.where(length > 0.0, length, 1.0)
@@ -0,0 +1,436 @@
+"""Bounding volume hierarchy over the polygons of a detail.
+
+A BVH is built over the triangles of a detail's closed polygons and Mesh
+primitives (see polygon.triangulate) with a binned surface area heuristic, and stored as
+flat numpy arrays: the bounds, children and triangle range of every node.
+Children always have higher node numbers than their parent. The tree
+itself (BoxTree) works on any array of boxes.
+
+Queries are batched. Rather than walking the tree once per ray or point,
+all queries descend together: every step tests the whole front of
+(query, node) pairs against the node bounds in one vectorized operation,
+replacing the pairs that hit an inner node with its two children and
+testing the triangles of the leaves that were hit. The number of Python
+level steps is therefore the depth of the tree, not the number of queries.
+
+Results identify a hit by primitive number, and by the three vertex
+numbers of the triangle that was hit with barycentric coordinates (u, v):
+an attribute value at the hit is (1-u-v)*a0 + u*a1 + v*a2 of the vertex
+(or point) values.
+
+When only point positions change, refit recomputes the node bounds in
+place, keeping the tree's structure; a detail's cached BVH (see
+Geometry.bvh) is refit or rebuilt automatically."""
+
+from __future__ import absolute_import
+
+import collections
+
+import numpy
+
+from .attribute import AttribClass
+from . import polygon
+
+RayHits = collections.namedtuple('RayHits', ['prim', 't', 'vertices', 'u', 'v'])
+ClosestPoints = collections.namedtuple('ClosestPoints',
+                                       ['prim', 'distance', 'position', 'vertices', 'u', 'v'])
+
+def _positions(geometry):
+    P = geometry.attrib(AttribClass.Point, 'P')
+    return numpy.frombuffer(P, dtype=numpy.float64).reshape(-1, 3)
+
+def _dot(a, b):
+    return numpy.einsum('ij,ij->i', a, b)
+
+def _area(lo, hi):
+    d = numpy.maximum(hi - lo, 0.0)
+    return d[..., 0]*d[..., 1] + d[..., 1]*d[..., 2] + d[..., 2]*d[..., 0]
+
+def _ray_triangles(origins, directions, a, b, c, eps=1e-12):
+    """Moller-Trumbore intersection of ray i with triangle i"""
+    e1 = b - a
+    e2 = c - a
+    pvec = numpy.cross(directions, e2)
+    det = _dot(e1, pvec)
+    with numpy.errstate(divide='ignore', invalid='ignore'):
+        inv = 1.0 / det
+        tvec = origins - a
+        u = _dot(tvec, pvec) * inv
+        qvec = numpy.cross(tvec, e1)
+        v = _dot(directions, qvec) * inv
+        t = _dot(e2, qvec) * inv
+    hit = (numpy.abs(det) > eps) & (u >= 0.0) & (v >= 0.0) & (u + v <= 1.0) & (t >= 0.0)
+    return numpy.where(hit, t, numpy.inf), u, v
+
+def _closest_on_triangles(p, a, b, c):
+    """Closest point to p[i] on triangle i, as barycentric (u, v) weights of
+    b and c (Ericson, Real-Time Collision Detection, 5.1.5)"""
+    ab = b - a
+    ac = c - a
+    ap = p - a
+    bp = p - b
+    cp = p - c
+    d1, d2 = _dot(ab, ap), _dot(ac, ap)
+    d3, d4 = _dot(ab, bp), _dot(ac, bp)
+    d5, d6 = _dot(ab, cp), _dot(ac, cp)
+    va = d3*d6 - d5*d4
+    vb = d5*d2 - d1*d6
+    vc = d1*d4 - d3*d2
+    with numpy.errstate(divide='ignore', invalid='ignore'):
+        denom = 1.0 / (va + vb + vc)
+        u, v = vb * denom, vc * denom
+        # Edge BC
+        w = (d4 - d3) / ((d4 - d3) + (d5 - d6))
+        m = (va <= 0) & (d4 - d3 >= 0) & (d5 - d6 >= 0)
+        u, v = numpy.where(m, 1.0 - w, u), numpy.where(m, w, v)
+        # Vertex C
+        m = (d6 >= 0) & (d5 <= d6)
+        u, v = numpy.where(m, 0.0, u), numpy.where(m, 1.0, v)
+        # Edge AC
+        m = (vb <= 0) & (d2 >= 0) & (d6 <= 0)
+        u, v = numpy.where(m, 0.0, u), numpy.where(m, d2 / (d2 - d6), v)
+        # Vertex B
+        m = (d3 >= 0) & (d4 <= d3)
+        u, v = numpy.where(m, 1.0, u), numpy.where(m, 0.0, v)
+        # Edge AB
+        m = (vc <= 0) & (d1 >= 0) & (d3 <= 0)
+        u, v = numpy.where(m, d1 / (d1 - d3), u), numpy.where(m, 0.0, v)
+        # Vertex A
+        m = (d1 <= 0) & (d2 <= 0)
+        u, v = numpy.where(m, 0.0, u), numpy.where(m, 0.0, v)
+    # Degenerate triangles are treated as their first point
+    bad = ~numpy.isfinite(u) | ~numpy.isfinite(v)
+    u, v = numpy.where(bad, 0.0, u), numpy.where(bad, 0.0, v)
+    return a + ab * u[:, None] + ac * v[:, None], u, v
+
+def _first_per_query(queries, keys):
+    """Return the positions of the smallest key for each distinct query"""
+    order = numpy.lexsort((keys, queries))
+    first = numpy.ones(len(order), dtype=bool)
+    first[1:] = queries[order][1:] != queries[order][:-1]
+    return order[first]
+
+class BoxTree(object):
+    """A bounding volume hierarchy over an array of boxes
+
+    This is the tree and batched traversal shared by BVH and the other
+    accelerated queries; items are identified by their index in the lo and
+    hi arrays the tree was built from."""
+    leafSize = 4
+    bins = 16
+
+    def __init__(self, lo, hi):
+        super(BoxTree, self).__init__()
+        self._build(lo, hi)
+
+    def _build(self, lo, hi):
+        centroids = (lo + hi) * 0.5
+        order = numpy.arange(len(lo))
+        left, right, starts, counts, depths = [], [], [], [], []
+
+        def add(start, count, depth):
+            left.append(-1)
+            right.append(-1)
+            starts.append(start)
+            counts.append(count)
+            depths.append(depth)
+            return len(left) - 1
+
+        stack = [add(0, len(order), 0)] if len(order) else []
+        while stack:
+            node = stack.pop()
+            start, count = starts[node], counts[node]
+            if count <= self.leafSize:
+                continue
+            split = self._split(order[start:start+count], lo, hi, centroids)
+            if split is None:
+                continue
+            leftside, rightside = split
+            order[start:start+count] = numpy.concatenate((leftside, rightside))
+            left[node] = add(start, len(leftside), depths[node] + 1)
+            right[node] = add(start + len(leftside), len(rightside), depths[node] + 1)
+            stack.extend((left[node], right[node]))
+
+        self._order = order
+        self._left = numpy.array(left, dtype=numpy.int64)
+        self._right = numpy.array(right, dtype=numpy.int64)
+        self._start = numpy.array(starts, dtype=numpy.int64)
+        self._count = numpy.array(counts, dtype=numpy.int64)
+        self._depth = numpy.array(depths, dtype=numpy.int64)
+        self._lo = numpy.empty((len(left), 3))
+        self._hi = numpy.empty((len(left), 3))
+        self._fitBounds(lo, hi)
+
+    def _split(self, items, lo, hi, centroids):
+        """Binned SAH split of items, or None if a leaf is cheaper"""
+        c = centroids[items]
+        cmin, cmax = c.min(axis=0), c.max(axis=0)
+        axis = int(numpy.argmax(cmax - cmin))
+        extent = cmax[axis] - cmin[axis]
+        if extent <= 0.0:
+            return None
+        bins = ((c[:, axis] - cmin[axis]) * (self.bins / extent)).astype(numpy.int64)
+        bins = numpy.minimum(bins, self.bins - 1)
+
+        # Bounds and counts of every non empty bin
+        order = numpy.argsort(bins, kind='mergesort')
+        sortedbins = bins[order]
+        used, firsts, binned = numpy.unique(sortedbins, return_index=True, return_counts=True)
+        blo = numpy.minimum.reduceat(lo[items[order]], firsts)
+        bhi = numpy.maximum.reduceat(hi[items[order]], firsts)
+
+        # Cost of splitting after each of the used bins but the last
+        llo = numpy.minimum.accumulate(blo)[:-1]
+        lhi = numpy.maximum.accumulate(bhi)[:-1]
+        rlo = numpy.minimum.accumulate(blo[::-1])[::-1][1:]
+        rhi = numpy.maximum.accumulate(bhi[::-1])[::-1][1:]
+        lcount = numpy.cumsum(binned)[:-1]
+        rcount = len(items) - lcount
+        cost = _area(llo, lhi) * lcount + _area(rlo, rhi) * rcount
+        best = int(numpy.argmin(cost))
+        total = _area(lo[items].min(axis=0), hi[items].max(axis=0)) * len(items)
+        if cost[best] >= total and len(items) <= 4 * self.leafSize:
+            return None
+        mask = bins <= used[best]
+        return items[mask], items[~mask]
+
+    def _fitBounds(self, lo, hi):
+        """Compute every node's bounds from the item bounds, deepest first"""
+        leaves = numpy.nonzero(self._left < 0)[0]
+        # The leaves tile the item order, so sorted by start each one ends
+        # where the next begins, as reduceat needs
+        leaves = leaves[numpy.argsort(self._start[leaves])]
+        if len(leaves):
+            self._lo[leaves] = numpy.minimum.reduceat(lo[self._order], self._start[leaves])
+            self._hi[leaves] = numpy.maximum.reduceat(hi[self._order], self._start[leaves])
+        inner = numpy.nonzero(self._left >= 0)[0]
+        for depth in numpy.unique(self._depth[inner])[::-1]:
+            n = inner[self._depth[inner] == depth]
+            l, r = self._left[n], self._right[n]
+            self._lo[n] = numpy.minimum(self._lo[l], self._lo[r])
+            self._hi[n] = numpy.maximum(self._hi[l], self._hi[r])
+
+    @property
+    def numNodes(self):
+        return len(self._left)
+
+    def _leafPairs(self, queries, nodes):
+        """Expand (query, leaf) pairs into (query, item) pairs"""
+        counts = self._count[nodes]
+        q = numpy.repeat(queries, counts)
+        first = numpy.cumsum(counts) - counts
+        k = numpy.arange(len(q)) - numpy.repeat(first, counts)
+        return q, self._order[numpy.repeat(self._start[nodes], counts) + k]
+
+    def _boxDistance(self, points, nodes):
+        d = numpy.maximum(self._lo[nodes] - points, 0.0) + numpy.maximum(points - self._hi[nodes], 0.0)
+        return numpy.sqrt(_dot(d, d))
+
+    def _expand(self, queries, nodes):
+        """Replace (query, inner node) pairs by the pairs of both children"""
+        return (numpy.concatenate((queries, queries)),
+                numpy.concatenate((self._left[nodes], self._right[nodes])))
+
+    def traceRays(self, origins, directions, best, visit):
+        """Run rays down the tree
+
+        visit(rays, items) is called with the (ray, item) pairs of every
+        leaf box a ray hits, and must lower best, the array of the nearest
+        hit distance of every ray, for the items that are hit. Boxes further
+        away than best are skipped."""
+        O, D = origins, directions
+        with numpy.errstate(divide='ignore', invalid='ignore'):
+            inv = 1.0 / D
+        rays = numpy.arange(len(O)) if self.numNodes else numpy.empty(0, numpy.int64)
+        nodes = numpy.zeros(len(rays), dtype=numpy.int64)
+        while len(rays):
+            with numpy.errstate(invalid='ignore'):
+                t0 = (self._lo[nodes] - O[rays]) * inv[rays]
+                t1 = (self._hi[nodes] - O[rays]) * inv[rays]
+            tnear = numpy.nanmax(numpy.minimum(t0, t1), axis=1)
+            tfar = numpy.nanmin(numpy.maximum(t0, t1), axis=1)
+            hit = (tnear <= tfar) & (tfar >= 0.0) & (tnear <= best[rays])
+            rays, nodes = rays[hit], nodes[hit]
+            leaf = self._left[nodes] < 0
+            if leaf.any():
+                visit(*self._leafPairs(rays[leaf], nodes[leaf]))
+            rays, nodes = self._expand(rays[~leaf], nodes[~leaf])
+
+    def descend(self, positions, best, visit):
+        """Run positions down the tree, nearest boxes first
+
+        visit(queries, items) is called with the (position, item) pairs of
+        the leaves reached, and must lower best, the array of the distance
+        found so far for every position. Boxes further away than best (or,
+        once best is negative, boxes not containing the position) are
+        skipped. Each position first descends greedily to its nearest leaf,
+        so that pruning starts from a tight bound."""
+        X = positions
+        n = len(X)
+        if not self.numNodes:
+            return
+        queries = numpy.arange(n)
+        nodes = numpy.zeros(n, dtype=numpy.int64)
+        inner = self._left[nodes] >= 0
+        while inner.any():
+            q = queries[inner]
+            l, r = self._left[nodes[q]], self._right[nodes[q]]
+            nearer = self._boxDistance(X[q], l) <= self._boxDistance(X[q], r)
+            nodes[q] = numpy.where(nearer, l, r)
+            inner = self._left[nodes] >= 0
+        visited = nodes
+        visit(*self._leafPairs(queries, nodes))
+
+        nodes = numpy.zeros(n, dtype=numpy.int64)
+        while len(queries):
+            keep = self._boxDistance(X[queries], nodes) <= numpy.maximum(best[queries], 0.0)
+            queries, nodes = queries[keep], nodes[keep]
+            leaf = self._left[nodes] < 0
+            fresh = leaf & (nodes != visited[queries])
+            if fresh.any():
+                visit(*self._leafPairs(queries[fresh], nodes[fresh]))
+            queries, nodes = self._expand(queries[~leaf], nodes[~leaf])
+
+    def overlap(self, lo, hi):
+        """Return the (box, item) pairs of every query box (lo, hi) and leaf
+        item whose leaf box it overlaps"""
+        found_q, found_i = [], []
+        queries = numpy.arange(len(lo)) if self.numNodes else numpy.empty(0, numpy.int64)
+        nodes = numpy.zeros(len(queries), dtype=numpy.int64)
+        while len(queries):
+            hit = numpy.all((self._lo[nodes] <= hi[queries]) & (self._hi[nodes] >= lo[queries]), axis=1)
+            queries, nodes = queries[hit], nodes[hit]
+            leaf = self._left[nodes] < 0
+            if leaf.any():
+                q, items = self._leafPairs(queries[leaf], nodes[leaf])
+                found_q.append(q)
+                found_i.append(items)
+            queries, nodes = self._expand(queries[~leaf], nodes[~leaf])
+        if not found_q:
+            return numpy.empty(0, numpy.int64), numpy.empty(0, numpy.int64)
+        return numpy.concatenate(found_q), numpy.concatenate(found_i)
+
+class BVH(BoxTree):
+    """A bounding volume hierarchy over the polygons and meshes of a
+    geometry detail"""
+    def __init__(self, geometry):
+        self.geometry = geometry
+        self.topologyId = geometry.topologyId
+        self._vertices, self._prims = polygon.triangulate(geometry)
+        vp = numpy.frombuffer(geometry.vertexPoints, dtype=geometry.vertexPoints.code)
+        self._points = vp[self._vertices] if len(self._vertices) else numpy.empty((0, 3), numpy.int64)
+        self._P = _positions(geometry).copy()
+        super(BVH, self).__init__(*self._triangleBounds())
+
+    def __repr__(self):
+        return '<{0} {1} triangles, {2} nodes>'.format(self.__class__.__name__,
+                                                       len(self._prims), len(self._left))
+
+    @property
+    def numTriangles(self):
+        return len(self._prims)
+
+    def _triangleBounds(self):
+        corners = self._P[self._points]
+        return corners.min(axis=1), corners.max(axis=1)
+
+    def refit(self):
+        """Recompute the bounds from the detail's current point positions
+
+        The tree keeps its structure, so this is only valid while the
+        topology is unchanged, and queries slow down if points move far."""
+        if self.geometry.topologyId != self.topologyId:
+            raise RuntimeError('Geometry topology changed; the BVH must be rebuilt')
+        self._P = _positions(self.geometry).copy()
+        self._fitBounds(*self._triangleBounds())
+
+    def update(self):
+        """Refit if the point positions changed since the last build or refit
+
+        Returns False if the topology changed, meaning a new BVH is needed."""
+        if self.geometry.topologyId != self.topologyId:
+            return False
+        P = _positions(self.geometry)
+        if not numpy.array_equal(P, self._P):
+            self.refit()
+        return True
+
+    def _corners(self, tris):
+        pts = self._points[tris]
+        return self._P[pts[:, 0]], self._P[pts[:, 1]], self._P[pts[:, 2]]
+
+    def _hitPrims(self, tris):
+        """The prim and vertex numbers of triangles, -1 where tris is -1"""
+        prims = numpy.full(len(tris), -1, dtype=numpy.int64)
+        vertices = numpy.full((len(tris), 3), -1, dtype=numpy.int64)
+        hit = tris >= 0
+        prims[hit] = self._prims[tris[hit]]
+        vertices[hit] = self._vertices[tris[hit]]
+        return prims, vertices
+
+    def intersect(self, origins, directions, tmax=numpy.inf):
+        """Find the nearest hit of every ray
+
+        origins and directions are (N, 3) arrays. Rays that miss have a prim
+        of -1 and a t of inf; hit positions are origins + t * directions."""
+        O = numpy.atleast_2d(numpy.asarray(origins, dtype=numpy.float64))
+        D = numpy.atleast_2d(numpy.asarray(directions, dtype=numpy.float64))
+        n = len(O)
+        best = numpy.full(n, float(tmax))
+        tri = numpy.full(n, -1, dtype=numpy.int64)
+        bu, bv = numpy.zeros(n), numpy.zeros(n)
+
+        def visit(q, tris):
+            a, b, c = self._corners(tris)
+            t, u, v = _ray_triangles(O[q], D[q], a, b, c)
+            closer = t < best[q]
+            q, tris, t, u, v = q[closer], tris[closer], t[closer], u[closer], v[closer]
+            first = _first_per_query(q, t)
+            q = q[first]
+            best[q], tri[q], bu[q], bv[q] = t[first], tris[first], u[first], v[first]
+
+        self.traceRays(O, D, best, visit)
+        best[tri < 0] = numpy.inf
+        prims, vertices = self._hitPrims(tri)
+        return RayHits(prims, best, vertices, bu, bv)
+
+    def closest(self, positions, maxDistance=numpy.inf):
+        """Find the closest point on the surface to every position
+
+        Positions further than maxDistance from every polygon get a prim of
+        -1 and a distance of inf."""
+        X = numpy.atleast_2d(numpy.asarray(positions, dtype=numpy.float64))
+        n = len(X)
+        best = numpy.full(n, float(maxDistance))
+        tri = numpy.full(n, -1, dtype=numpy.int64)
+        bu, bv = numpy.zeros(n), numpy.zeros(n)
+        pos = numpy.zeros((n, 3))
+
+        def visit(q, tris):
+            a, b, c = self._corners(tris)
+            p, u, v = _closest_on_triangles(X[q], a, b, c)
+            d = numpy.sqrt(_dot(p - X[q], p - X[q]))
+            closer = d < best[q]
+            q, tris, d, p, u, v = q[closer], tris[closer], d[closer], p[closer], u[closer], v[closer]
+            first = _first_per_query(q, d)
+            q = q[first]
+            best[q], tri[q], pos[q], bu[q], bv[q] = d[first], tris[first], p[first], u[first], v[first]
+
+        self.descend(X, best, visit)
+        prims, vertices = self._hitPrims(tri)
+        return ClosestPoints(prims, numpy.where(tri < 0, numpy.inf, best), pos, vertices, bu, bv)
+
+    def overlapping(self, boxmin, boxmax):
+        """Find the primitives whose triangles' bounds overlap each box
+
+        boxmin and boxmax are (N, 3) arrays. Returns a pair of arrays,
+        (box numbers, prim numbers), with one entry per overlapping pair."""
+        lo = numpy.atleast_2d(numpy.asarray(boxmin, dtype=numpy.float64))
+        hi = numpy.atleast_2d(numpy.asarray(boxmax, dtype=numpy.float64))
+        q, tris = self.overlap(lo, hi)
+        tlo, thi = self._triangleBounds()
+        hit = numpy.all((tlo[tris] <= hi[q]) & (thi[tris] >= lo[q]), axis=1)
+        if not hit.any():
+            return numpy.empty(0, numpy.int64), numpy.empty(0, numpy.int64)
+        pairs = numpy.unique(numpy.column_stack((q[hit], self._prims[tris[hit]])), axis=0)
+        return pairs[:, 0], pairs[:, 1]
@@ -0,0 +1,174 @@
+"""Collision queries against the quadratic primitives of a detail.
+
+Colliders gathers every quadratic primitive (Plane, Sphere, Tube, ...) of
+a detail as a collision proxy, and answers signed distance, closest point
+and ray queries for whole arrays of positions or rays against all of them
+at once.
+
+The broad phase is a BoxTree over the proxies' bounding boxes. Only the
+(query, proxy) pairs it finds are passed to the exact, analytic tests,
+grouped by primitive type so that every test is one vectorized call.
+Infinite planes cannot be bounded, so they are tested against every query,
+first, to give the tree a tight initial bound.
+
+The proxies are treated as a union: the signed distance of a position is
+the smallest signed distance to any proxy, and its closest point is the
+closest point on the surface of that proxy."""
+
+from __future__ import absolute_import
+
+import numpy
+
+from .attribute import AttribClass
+from .bvh import BoxTree, _positions, _first_per_query
+from . import prim
+
+_quadratic_types = tuple(t for t in prim.prim_types if issubclass(t, prim.Quadratic))
+
+def _prim_attrib(geometry, name, prims, default):
+    attr = geometry.findAttrib(AttribClass.Prim, name)
+    if attr is None:
+        return numpy.tile(numpy.asarray(default, dtype=numpy.float64), (len(prims), 1))
+    return numpy.frombuffer(attr, dtype=attr.code).reshape(-1, attr.size)[prims].astype(numpy.float64)
+
+class Colliders(object):
+    """The quadratic primitives of a detail, set up for batched queries"""
+    def __init__(self, geometry):
+        super(Colliders, self).__init__()
+        self.geometry = geometry
+        self.topologyId = geometry.topologyId
+        types = numpy.frombuffer(geometry.primTypes, dtype=geometry.primTypes.code)
+        typeids = [t.typeid for t in _quadratic_types]
+        self.prims = numpy.nonzero(numpy.isin(types, typeids))[0]
+        self._types = types[self.prims]
+
+        self._centroids, self._transforms, self._sizes = self._proxyData()
+
+        self._planes = numpy.nonzero(self._types == prim.Plane.typeid)[0]
+        self._bounded = numpy.nonzero(self._types != prim.Plane.typeid)[0]
+        radius = numpy.empty(len(self.prims))
+        for cls in _quadratic_types:
+            sel = self._types == cls.typeid
+            if sel.any():
+                radius[sel] = cls.boundingRadius(self._sizes[sel])
+        self._lo = self._centroids - radius[:, None]
+        self._hi = self._centroids + radius[:, None]
+        self._tree = BoxTree(self._lo[self._bounded], self._hi[self._bounded])
+
+    def __repr__(self):
+        return '<{0} {1} proxies>'.format(self.__class__.__name__, len(self.prims))
+
+    def _proxyData(self):
+        """The centroids, transforms and sizes of the proxies"""
+        geometry = self.geometry
+        starts = numpy.frombuffer(geometry.primStarts, dtype=geometry.primStarts.code)
+        vp = numpy.frombuffer(geometry.vertexPoints, dtype=geometry.vertexPoints.code)
+        return (_positions(geometry)[vp[starts[self.prims]]],
+                _prim_attrib(geometry, 'transform', self.prims,
+                             prim.Quadratic.identity).reshape(-1, 3, 3),
+                _prim_attrib(geometry, 'size', self.prims, prim.Quadratic.defaultSize))
+
+    def bounds(self):
+        """Return (lo, hi): the bounding box of every proxy, infinite for
+        planes"""
+        return self._lo.copy(), self._hi.copy()
+
+    def isCurrent(self):
+        """True if the detail's proxies are unchanged since this was built"""
+        if self.geometry.topologyId != self.topologyId:
+            return False
+        current = self._proxyData()
+        return all(numpy.array_equal(a, b) for a, b in
+                   zip(current, (self._centroids, self._transforms, self._sizes)))
+
+    def _byType(self, proxies):
+        """Yield (class, selection) for the types present in proxies"""
+        types = self._types[proxies]
+        for typeid in numpy.unique(types):
+            yield prim.prim_types[typeid], numpy.nonzero(types == typeid)[0]
+
+    def signedDistance(self, positions):
+        """Return (distances, prims): the signed distance from every position
+        to the nearest proxy, and that proxy's primitive number (-1 if the
+        detail has no proxies)"""
+        distance, proxy = self._nearest(positions)
+        return distance, self._primNumbers(proxy)
+
+    def closestPoint(self, positions):
+        """Return (positions, distances, prims): the closest point on the
+        surface of the nearest proxy to every position, with the signed
+        distance and primitive number of that proxy"""
+        X = numpy.atleast_2d(numpy.asarray(positions, dtype=numpy.float64))
+        distance, proxy = self._nearest(X)
+        found = proxy >= 0
+        result = numpy.array(X)
+        q = numpy.nonzero(found)[0]
+        for cls, sel in self._byType(proxy[q]):
+            qs, j = q[sel], proxy[q[sel]]
+            c, M = self._centroids[j], self._transforms[j]
+            local = cls._closest(prim.toLocal(X[qs], c, M), self._sizes[j])
+            result[qs] = prim.toWorld(local, c, M)
+        return result, distance, self._primNumbers(proxy)
+
+    def _primNumbers(self, proxy):
+        prims = numpy.full(len(proxy), -1, dtype=numpy.int64)
+        prims[proxy >= 0] = self.prims[proxy[proxy >= 0]]
+        return prims
+
+    def _sdf(self, X, q, proxies):
+        d = numpy.empty(len(q))
+        for cls, sel in self._byType(proxies):
+            j = proxies[sel]
+            local = prim.toLocal(X[q[sel]], self._centroids[j], self._transforms[j])
+            d[sel] = cls._sdf(local, self._sizes[j])
+        return d
+
+    def _nearest(self, positions):
+        X = numpy.atleast_2d(numpy.asarray(positions, dtype=numpy.float64))
+        n = len(X)
+        best = numpy.full(n, numpy.inf)
+        proxy = numpy.full(n, -1, dtype=numpy.int64)
+
+        def visit(q, proxies):
+            d = self._sdf(X, q, proxies)
+            closer = d < best[q]
+            q, proxies, d = q[closer], proxies[closer], d[closer]
+            first = _first_per_query(q, d)
+            q = q[first]
+            best[q], proxy[q] = d[first], proxies[first]
+
+        queries = numpy.arange(n)
+        for plane in self._planes:
+            visit(queries, numpy.full(n, plane, dtype=numpy.int64))
+        self._tree.descend(X, best, lambda q, items: visit(q, self._bounded[items]))
+        return best, proxy
+
+    def intersect(self, origins, directions, tmax=numpy.inf):
+        """Return (t, prims): the distance along every ray to the first proxy
+        it hits, and that proxy's primitive number
+
+        Rays that miss have a t of inf and a prim of -1."""
+        O = numpy.atleast_2d(numpy.asarray(origins, dtype=numpy.float64))
+        D = numpy.atleast_2d(numpy.asarray(directions, dtype=numpy.float64))
+        n = len(O)
+        best = numpy.full(n, float(tmax))
+        proxy = numpy.full(n, -1, dtype=numpy.int64)
+
+        def visit(q, proxies):
+            t = numpy.empty(len(q))
+            for cls, sel in self._byType(proxies):
+                j = proxies[sel]
+                t[sel] = prim.intersectLocal(cls, O[q[sel]], D[q[sel]], self._centroids[j],
+                                             self._transforms[j], self._sizes[j])
+            closer = t < best[q]
+            q, proxies, t = q[closer], proxies[closer], t[closer]
+            first = _first_per_query(q, t)
+            q = q[first]
+            best[q], proxy[q] = t[first], proxies[first]
+
+        rays = numpy.arange(n)
+        for plane in self._planes:
+            visit(rays, numpy.full(n, plane, dtype=numpy.int64))
+        self._tree.traceRays(O, D, best, lambda q, items: visit(q, self._bounded[items]))
+        best[proxy < 0] = numpy.inf
+        return best, self._primNumbers(proxy)
@@ -0,0 +1,654 @@
+"""The Geometry detail: the container for all point, vertex and primitive data.
+
+Rather than allocating a Python object per element, a detail keeps its
+elements as tables of packed arrays (a "struct of arrays" layout):
+
+* Point attributes, including the "P" position attribute, are stored as
+  packed doubles, one attribute array per name.
+* Each vertex stores the index of its point and of its primitive.
+* Each primitive stores a type id and the start of its run of vertices.
+  Primitive n owns the vertices [primStarts[n], primStarts[n+1]), the
+  classic CSR (compressed sparse row) layout.
+
+Point, Vertex and Primitive instances are only index views into these
+tables; they are created on access and may be thrown away freely.
+
+Details can share their arrays copy-on-write (see Geometry.share), so
+attributes read through attrib and findAttrib must not be modified in
+place: writableAttrib returns an attribute that may be."""
+
+from __future__ import absolute_import
+
+import collections
+from array import array
+import itertools
+import weakref
+
+import numpy
+
+from .attribute import AttribClass, Integer, Float, String, _string_types, _extend, matrixArray
+from .pt import Point
+from .vert import Vertex
+from . import prim
+from .bvh import BVH
+from .kdtree import PointTree
+from .collide import Colliders
+from .topology import Adjacency
+from .subdivide import Subdivider
+from .volume import VoxelGrid
+
+class _ElementSequence(collections.Sequence):
+    """A read only sequence of element views of a detail"""
+    def __init__(self, length, factory):
+        super(_ElementSequence, self).__init__()
+        self._length = length
+        self._factory = factory
+
+    def __len__(self):
+        return self._length
+
+    def __getitem__(self, i):
+        if isinstance(i, slice):
+            return tuple(self._factory(n) for n in range(*i.indices(self._length)))
+        if i < 0:
+            i += self._length
+        if i < 0 or i >= self._length:
+            raise IndexError('element index out of range')
+        return self._factory(i)
+
+# The connectivity tables, shared as a whole
+_connectivity = ('_vertexpoints', '_vertexprims', '_primstarts', '_primtypes', '_primclosed')
+
+class _Share(object):
+    """The number of details sharing an array, see Geometry.share"""
+    __slots__ = ('count',)
+
+    def __init__(self):
+        super(_Share, self).__init__()
+        self.count = 1
+
+# Weak references to the details sharing arrays, see _watchShares
+_sharing = set()
+
+def _watchShares(geometry):
+    """Give up a detail's shares once it is garbage collected, so the
+    details it shared with no longer copy on their first write
+
+    A weakref callback rather than __del__, as a detail is often part of a
+    reference cycle (through its cached accelerators) and Python 2 does
+    not collect cycles of objects with __del__."""
+    shared = geometry._shared
+    def release(ref):
+        _sharing.discard(ref)
+        for token in shared.values():
+            token.count -= 1
+        shared.clear()
+    _sharing.add(weakref.ref(geometry, release))
+
+class Geometry(object):
+    """A geometry detail storing its elements as packed attribute tables"""
+    def __init__(self):
+        super(Geometry, self).__init__()
+        self._attribs = ({}, {}, {}, {})
+        self._attribs[AttribClass.Point]['P'] = Float(size=3)
+        self._numpoints = 0
+        self._vertexpoints = Integer()
+        self._vertexprims = Integer()
+        self._primstarts = Integer([0])
+        self._primtypes = Integer()
+        self._primclosed = Integer()
+        # Bumped whenever elements are added, see topologyId
+        self._topologyid = 0
+        # Acceleration structures built from this detail, see bvh
+        self._accel = {}
+        # The VoxelGrid of every MVolume primitive, by primitive number
+        self._volumes = {}
+        # The details referenced by PackedGeometry primitives, see
+        # createPackedPrims
+        self._sources = []
+        # The arrays shared with other details: (attribclass, name) for
+        # attributes, ('volume', prim) for grids and 'topology' for the
+        # connectivity, each with its _Share
+        self._shared = {}
+
+    def __repr__(self):
+        return '<{0} {1} points, {2} prims>'.format(self.__class__.__name__,
+                                                    self.numPoints, self.numPrims)
+
+    # Element counts
+    @property
+    def numPoints(self):
+        return self._numpoints
+
+    @property
+    def numVertices(self):
+        return len(self._vertexpoints)
+
+    @property
+    def numPrims(self):
+        return len(self._primtypes)
+
+    def _numElements(self, attribclass):
+        if attribclass == AttribClass.Point:
+            return self.numPoints
+        elif attribclass == AttribClass.Vertex:
+            return self.numVertices
+        elif attribclass == AttribClass.Prim:
+            return self.numPrims
+        elif attribclass == AttribClass.Global:
+            return 1
+        raise ValueError('Unknown attribute class {0!r}'.format(attribclass))
+
+    @property
+    def topologyId(self):
+        """A number that changes whenever points, vertices or primitives are
+        added, so cached structures can tell whether they are out of date.
+        Moving points does not change it."""
+        return self._topologyid
+
+    # Connectivity tables. These are exposed for code that works on whole
+    # arrays at once; they must be treated as read only.
+    @property
+    def vertexPoints(self):
+        """The point index of every vertex"""
+        return self._vertexpoints
+
+    @property
+    def vertexPrims(self):
+        """The primitive index of every vertex"""
+        return self._vertexprims
+
+    @property
+    def primStarts(self):
+        """The CSR offsets of every primitive's vertices, numPrims + 1 long"""
+        return self._primstarts
+
+    @property
+    def primTypes(self):
+        """The type id (see prim.prim_types) of every primitive"""
+        return self._primtypes
+
+    @property
+    def primClosed(self):
+        return self._primclosed
+
+    # Attributes
+    def attribs(self, attribclass):
+        """Return a read only mapping of name to attribute for a class"""
+        return dict(self._attribs[attribclass])
+
+    def findAttrib(self, attribclass, name):
+        """Return an attribute for reading, or None if there is none"""
+        return self._attribs[attribclass].get(name, None)
+
+    def attrib(self, attribclass, name):
+        try:
+            return self._attribs[attribclass][name]
+        except KeyError:
+            raise KeyError('No such attribute: {0!r}'.format(name))
+
+    def writableAttrib(self, attribclass, name):
+        """Return an attribute that may be modified in place, copying it
+        first if it is shared with another detail"""
+        attr = self.attrib(attribclass, name)
+        if self._unshare((attribclass, name)):
+            attr = self._attribs[attribclass][name] = attr.copy()
+        return attr
+
+    def addAttrib(self, attribclass, name, default):
+        """Add an attribute, filled with default for all existing elements
+
+        The attribute storage type is chosen from the default: ints give an
+        Integer attribute, floats a Float attribute and strings a String
+        attribute. A sequence default gives a tuple valued attribute of the
+        same size."""
+        if name in self._attribs[attribclass]:
+            raise ValueError('Attribute {0!r} already exists'.format(name))
+        if isinstance(default, collections.Sequence) and not isinstance(default, _string_types):
+            sample = default
+        else:
+            sample = (default,)
+        if not sample:
+            raise ValueError('default must have at least one component')
+        if all(isinstance(v, _string_types) for v in sample):
+            cls = String
+        elif all(isinstance(v, int) and not isinstance(v, bool) for v in sample):
+            cls = Integer
+        else:
+            cls = Float
+        attr = cls(length=self._numElements(attribclass), size=len(sample),
+                   default=sample)
+        self._attribs[attribclass][name] = attr
+        return attr
+
+    def destroyAttrib(self, attribclass, name):
+        if attribclass == AttribClass.Point and name == 'P':
+            raise ValueError('The "P" attribute cannot be destroyed')
+        del self._attribs[attribclass][name]
+        self._unshare((attribclass, name))
+
+    def _setAttrib(self, attribclass, name, attr):
+        """Add or replace an attribute with a new one"""
+        self._unshare((attribclass, name))
+        self._attribs[attribclass][name] = attr
+
+    def _growAttribs(self, attribclass, count):
+        for name in list(self._attribs[attribclass]):
+            self.writableAttrib(attribclass, name).appendElements(count)
+
+    # Copy-on-write sharing
+    def share(self):
+        """Return a copy of the detail that shares its arrays with this one
+
+        Sharing is copy-on-write: an attribute (or the connectivity, or a
+        volume grid) is only copied when either detail first modifies it,
+        so a node can hand its cached result downstream and the next node
+        only pays for the attributes it changes. A detail gives up its
+        shares when it is garbage collected."""
+        geo = self.__class__()
+        geo._attribs = tuple(dict(attribs) for attribs in self._attribs)
+        geo._numpoints = self._numpoints
+        for name in _connectivity:
+            setattr(geo, name, getattr(self, name))
+        geo._volumes = dict(self._volumes)
+        geo._sources = list(self._sources)
+        geo._topologyid = self._topologyid
+        keys = [(attribclass, name) for attribclass, attribs in enumerate(self._attribs)
+                for name in attribs]
+        keys.append('topology')
+        keys.extend(('volume', n) for n in self._volumes)
+        if not self._shared:
+            _watchShares(self)
+        _watchShares(geo)
+        for key in keys:
+            token = self._shared.get(key)
+            if token is None:
+                token = self._shared[key] = _Share()
+            token.count += 1
+            geo._shared[key] = token
+        return geo
+
+    def _unshare(self, key):
+        """Stop sharing an array; True if another detail still shares it,
+        and so it must be copied before it is modified"""
+        token = self._shared.pop(key, None)
+        if token is None:
+            return False
+        token.count -= 1
+        return token.count > 0
+
+    def _writableTopology(self):
+        if self._unshare('topology'):
+            for name in _connectivity:
+                setattr(self, name, getattr(self, name).copy())
+
+    # Element access
+    def point(self, i):
+        return Point(self, i)
+
+    def vertex(self, i):
+        return Vertex(self, i)
+
+    def prim(self, i):
+        return prim.prim_types[self._primtypes[i]](self, i)
+
+    @property
+    def points(self):
+        return _ElementSequence(self.numPoints, self.point)
+
+    @property
+    def vertices(self):
+        return _ElementSequence(self.numVertices, self.vertex)
+
+    @property
+    def prims(self):
+        return _ElementSequence(self.numPrims, self.prim)
+
+    # Element creation
+    def createPoint(self, position=(0.0, 0.0, 0.0)):
+        self.createPoints([position])
+        return Point(self, self._numpoints - 1)
+
+    def createPoints(self, positions):
+        """Append a point for every position and return the range of new indices
+
+        positions may be a sequence of 3-tuples, a flat sequence of packed
+        doubles (e.g. an array('d')) three per point, or an (N, 3) numpy
+        array."""
+        P = self.writableAttrib(AttribClass.Point, 'P')
+        start = self._numpoints
+        if isinstance(positions, numpy.ndarray):
+            if positions.ndim > 1 and positions.shape[-1] != 3:
+                raise ValueError('positions must have three components each')
+            _extend(P, positions.reshape(-1))
+        elif len(positions) and not isinstance(positions[0], collections.Sequence):
+            P.extend(positions)
+        else:
+            P.extend(itertools.chain.from_iterable(positions))
+        if len(P) % 3:
+            del P[3*start:]
+            raise ValueError('positions must have three components each')
+        count = len(P) // 3 - start
+        for name in list(self._attribs[AttribClass.Point]):
+            if name != 'P':
+                self.writableAttrib(AttribClass.Point, name).appendElements(count)
+        self._numpoints += count
+        self._topologyid += 1
+        return range(start, start + count)
+
+    def createPrim(self, cls, points, closed=True):
+        """Create a single primitive of class cls with a vertex per point"""
+        start = self.numPrims
+        self.createPrims(cls, [len(points)], points, closed)
+        return self.prim(start)
+
+    def createPolygon(self, points, closed=True):
+        return self.createPrim(prim.Polygon, points, closed)
+
+    def createPrims(self, cls, counts, points, closed=True):
+        """Create many primitives of class cls at once
+
+        counts holds the number of vertices of each new primitive, and
+        points the (flattened) point numbers those vertices refer to, so the
+        new primitives are described in the same CSR form the detail uses.
+        Point views are accepted in place of point numbers. Returns the
+        range of new primitive numbers."""
+        if cls.typeid is None:
+            raise TypeError('{0!r} is not a concrete primitive type'.format(cls))
+        points = Integer([p.number if isinstance(p, Point) else p for p in points])
+        counts = Integer(counts)
+        if sum(counts) != len(points):
+            raise ValueError('counts do not add up to the number of points')
+        if points and (min(points) < 0 or max(points) >= self.numPoints):
+            raise IndexError('point number out of range')
+        if counts and min(counts) < 1:
+            raise ValueError('A primitive cannot be constructed without at least one point.')
+
+        pstart = self.numPrims
+        numprims = len(counts)
+        self._writableTopology()
+        self._vertexpoints.extend(points)
+        self._vertexprims.extend(itertools.chain.from_iterable(
+            itertools.repeat(pstart + i, c) for i, c in enumerate(counts)))
+        self._primstarts.extend(_running_sum(counts, self._primstarts[-1]))
+        self._primtypes.extend(itertools.repeat(cls.typeid, numprims))
+        self._primclosed.extend(itertools.repeat(int(bool(closed)), numprims))
+        self._growAttribs(AttribClass.Vertex, len(points))
+        self._growAttribs(AttribClass.Prim, numprims)
+        self._topologyid += 1
+        return range(pstart, pstart + numprims)
+
+    def _appendPrims(self, cls, counts, points, closed=True):
+        """createPrims for numpy arrays of counts and point numbers, without
+        per element Python work; the arguments are not checked"""
+        pstart, vstart = self.numPrims, self.numVertices
+        counts = numpy.asarray(counts, dtype=numpy.int64)
+        numprims = len(counts)
+        self._writableTopology()
+        _extend(self._vertexpoints, points)
+        _extend(self._vertexprims, numpy.repeat(numpy.arange(pstart, pstart + numprims), counts))
+        _extend(self._primstarts, vstart + numpy.cumsum(counts))
+        _extend(self._primtypes, numpy.full(numprims, cls.typeid))
+        _extend(self._primclosed, numpy.full(numprims, int(bool(closed))))
+        self._growAttribs(AttribClass.Vertex, len(points))
+        self._growAttribs(AttribClass.Prim, numprims)
+        self._topologyid += 1
+        return range(pstart, pstart + numprims)
+
+    # Acceleration structures
+    def bvh(self):
+        """Return a BVH over the detail's polygons
+
+        The BVH is cached on the detail: later calls refit it if points
+        have moved, and rebuild it if the topology has changed."""
+        accel = self._accel.get('bvh')
+        if accel is None or not accel.update():
+            accel = self._accel['bvh'] = BVH(self)
+        return accel
+
+    def pointTree(self):
+        """Return a k-d tree over the detail's points
+
+        The tree is cached on the detail and rebuilt only when the points
+        have changed since it was built."""
+        accel = self._accel.get('pointtree')
+        if accel is None or not accel.isCurrent():
+            accel = self._accel['pointtree'] = PointTree(self)
+        return accel
+
+    def colliders(self):
+        """Return the detail's quadratic primitives set up as collision
+        proxies (see geo.collide), cached until they change"""
+        accel = self._accel.get('colliders')
+        if accel is None or not accel.isCurrent():
+            accel = self._accel['colliders'] = Colliders(self)
+        return accel
+
+    def adjacency(self):
+        """Return the detail's adjacency tables (see geo.topology)
+
+        They are cached on the detail and rebuilt only when its topology
+        changes; attribute changes leave them valid."""
+        accel = self._accel.get('adjacency')
+        if accel is None or not accel.isCurrent():
+            accel = self._accel['adjacency'] = Adjacency(self)
+        return accel
+
+    def subdivider(self):
+        """Return the detail's Catmull-Clark Subdivider (see geo.subdivide)
+
+        Its stencils are cached on the detail and rebuilt only when its
+        topology changes, so a deforming surface is subdivided again at
+        the cost of applying them."""
+        accel = self._accel.get('subdivider')
+        if accel is None or not accel.isCurrent():
+            accel = self._accel['subdivider'] = Subdivider(self)
+        return accel
+
+    def createQuadratic(self, cls, position=(0.0, 0.0, 0.0), size=None, transform=None):
+        """Create a quadratic primitive (and its point) at position
+
+        size and transform set the primitive's "size" and "transform"
+        attributes, which are added if needed (see prim.Quadratic)."""
+        pt = self.createPoint(position)
+        p = self.createPrim(cls, [pt])
+        for name, value, default in (('size', size, cls.defaultSize),
+                                     ('transform', transform, cls.identity)):
+            if value is not None:
+                if self.findAttrib(AttribClass.Prim, name) is None:
+                    self.addAttrib(AttribClass.Prim, name, default)
+                p.setAttribValue(name, [float(v) for v in value])
+        return p
+
+    def createCurves(self, cls, counts, points, order=4, closed=False):
+        """Create many spline curves of class cls at once, as createPrims
+
+        order, if not the default of 4, is set in the "order" attribute."""
+        new = self.createPrims(cls, counts, points, closed)
+        if order != 4:
+            attr = prim._order_attrib(self)
+            for i in new:
+                attr[2*i] = int(order)
+        return new
+
+    def createPatch(self, cls, points, columns, rows, order=(4, 4)):
+        """Create a spline patch of class cls from a grid of columns x rows
+        points, given row by row"""
+        if columns * rows != len(points):
+            raise ValueError('a {0}x{1} patch needs {2} points'.format(columns, rows, columns * rows))
+        p = self.createPrim(cls, points, False)
+        p.gridSize = (columns, rows)
+        if tuple(order) != (4, 4):
+            p.order = order
+        return p
+
+    def createMesh(self, points, columns, rows):
+        """Create a Mesh from a grid of columns x rows points, given row by
+        row"""
+        if columns * rows != len(points):
+            raise ValueError('a {0}x{1} mesh needs {2} points'.format(columns, rows, columns * rows))
+        p = self.createPrim(prim.Mesh, points, False)
+        p.gridSize = (columns, rows)
+        return p
+
+    def createVolume(self, grid=None, position=(0.0, 0.0, 0.0)):
+        """Create an MVolume primitive (and its point) at position, storing
+        grid, or an empty VoxelGrid"""
+        p = self.createPrim(prim.MVolume, [self.createPoint(position)])
+        self._volumes[p.number] = VoxelGrid() if grid is None else grid
+        return p
+
+    def _volumeGrid(self, number):
+        grid = self._volumes.get(number)
+        if grid is None:
+            grid = self._volumes[number] = VoxelGrid()
+        elif self._unshare(('volume', number)):
+            grid = self._volumes[number] = grid.copy()
+        return grid
+
+    def _setVolumeGrid(self, number, grid):
+        self._unshare(('volume', number))
+        self._volumes[number] = grid
+
+    def createPackedPrims(self, source, transforms):
+        """Create a PackedGeometry instance of the detail source for every
+        transform (Mat4s, or an (N, 4, 4) array) at once
+
+        source is kept as a shared, read only copy (see share) referenced by
+        all the instances, which store only a point (the translation), the
+        3x3 part of their transform in the "transform" attribute and the
+        index of source in the "packedsource" attribute. Other primitive
+        attributes of an instance override the source's attributes when it
+        is unpacked (see geo.packed). Returns the range of the new
+        primitive numbers."""
+        M = matrixArray(transforms).reshape(-1, 4, 4)
+        count = len(M)
+        if not count:
+            return range(self.numPrims, self.numPrims)
+        self._sources.append(source.share())
+        pstart = self._numpoints
+        self.createPoints(_packed_doubles(M[:, 3, :3]))
+        new = self._appendPrims(prim.PackedGeometry, numpy.ones(count, dtype=numpy.int64),
+                                numpy.arange(pstart, pstart + count))
+        for name, default, values in (
+                ('transform', prim.Quadratic.identity, M[:, :3, :3].reshape(-1, 9)),
+                ('packedsource', -1, numpy.full((count, 1), len(self._sources) - 1))):
+            if self.findAttrib(AttribClass.Prim, name) is None:
+                self.addAttrib(AttribClass.Prim, name, default)
+            attr = self.writableAttrib(AttribClass.Prim, name)
+            view = numpy.frombuffer(attr, dtype=attr.code).reshape(-1, attr.size)
+            view[new[0]:] = values
+            del view
+        return new
+
+    # Copying and chunking
+    def copy(self):
+        """Return an independent copy of the detail"""
+        geo = self.__class__()
+        geo._attribs = tuple(dict((name, attr.copy()) for name, attr in attribs.items())
+                             for attribs in self._attribs)
+        geo._numpoints = self._numpoints
+        for name in _connectivity:
+            setattr(geo, name, getattr(self, name).copy())
+        geo._volumes = dict((n, grid.copy()) for n, grid in self._volumes.items())
+        geo._sources = list(self._sources)
+        return geo
+
+    def extractPoints(self, start, stop):
+        """Return a new detail holding copies of points [start, stop) and
+        their point attributes, without any primitives"""
+        start, stop, _ = slice(start, stop).indices(self.numPoints)
+        stop = max(start, stop)
+        geo = self.__class__()
+        for name, attr in self._attribs[AttribClass.Point].items():
+            geo._attribs[AttribClass.Point][name] = attr.extractElements(start, stop)
+        for name, attr in self._attribs[AttribClass.Global].items():
+            geo._attribs[AttribClass.Global][name] = attr.copy()
+        geo._numpoints = stop - start
+        return geo
+
+    def appendPoints(self, other):
+        """Append the points of other, with their point attributes
+
+        Attributes only one of the details has are filled with their
+        default. Returns the range of the new point numbers."""
+        count = other.numPoints
+        start = self._numpoints
+        self._appendAttribs(other, AttribClass.Point, start, count)
+        self._mergeGlobals(other)
+        self._numpoints += count
+        self._topologyid += 1
+        return range(start, start + count)
+
+    def merge(self, other):
+        """Append all the points, vertices and primitives of other
+
+        Attributes only one of the details has are filled with their
+        default, and String attributes are remapped to this detail's
+        string tables. Returns the range of the new primitive numbers."""
+        points, vertices, prims = self.numPoints, self.numVertices, self.numPrims
+        for attribclass, start, count in ((AttribClass.Point, points, other.numPoints),
+                                          (AttribClass.Vertex, vertices, other.numVertices),
+                                          (AttribClass.Prim, prims, other.numPrims)):
+            self._appendAttribs(other, attribclass, start, count)
+        self._mergeGlobals(other)
+        self._writableTopology()
+        for mine, theirs, offset in ((self._vertexpoints, other._vertexpoints, points),
+                                     (self._vertexprims, other._vertexprims, prims),
+                                     (self._primstarts, other._primstarts[1:], vertices)):
+            if len(theirs):
+                _extend(mine, numpy.frombuffer(theirs, dtype=mine.code) + offset)
+        self._primtypes.extend(other._primtypes)
+        self._primclosed.extend(other._primclosed)
+        for n, grid in other._volumes.items():
+            self._volumes[prims + n] = grid.copy()
+        if other._sources and other.numPrims:
+            # Renumber the merged instances' sources into this detail's table
+            attr = self.writableAttrib(AttribClass.Prim, 'packedsource')
+            view = numpy.frombuffer(attr, dtype=attr.code)[prims:]
+            view[view >= 0] += len(self._sources)
+            del view
+        self._sources.extend(other._sources)
+        self._numpoints += other.numPoints
+        self._topologyid += 1
+        return range(prims, self.numPrims)
+
+    def _appendAttribs(self, other, attribclass, start, count):
+        """Append the attribute values of count elements of other, to a
+        class of elements of which this detail has start"""
+        mine = self._attribs[attribclass]
+        theirs = other._attribs[attribclass]
+        for name, attr in theirs.items():
+            if name not in mine:
+                mine[name] = attr.__class__(length=start, size=attr.size, default=attr.default)
+        for name in list(mine):
+            attr = self.writableAttrib(attribclass, name)
+            other_attr = theirs.get(name)
+            if (other_attr is not None and other_attr.size == attr.size and
+                    isinstance(other_attr, String) == isinstance(attr, String)):
+                attr.extendElements(other_attr)
+            else:
+                attr.appendElements(count)
+
+    def _mergeGlobals(self, other):
+        for name, attr in other._attribs[AttribClass.Global].items():
+            self._attribs[AttribClass.Global].setdefault(name, attr.copy())
+
+    def iterPointChunks(self, size):
+        """Yield copies of the detail's points, size points at a time
+
+        Primitives refer to points across the whole detail, so a detail
+        with vertices is yielded as a single shared copy instead."""
+        if self.numVertices or self.numPoints <= size:
+            yield self.share()
+            return
+        for start in range(0, self.numPoints, size):
+            yield self.extractPoints(start, start + size)
+
+def _packed_doubles(values):
+    return array('d', numpy.ascontiguousarray(values, dtype=numpy.float64).tobytes())
+
+def _running_sum(values, start):
+    for v in values:
+        start += v
+        yield start
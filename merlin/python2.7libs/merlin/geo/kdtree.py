@@ -0,0 +1,212 @@
+"""K-d tree over the point positions of a detail.
+
+The tree is built by splitting the points at the median of their widest
+axis until at most leafSize points remain, and is stored, like the BVH, as
+flat numpy arrays of node bounds, children and point ranges.
+
+Queries are batched the same way as BVH queries: all query positions
+descend the tree together, one vectorized step per level, pruning nodes
+that are further away than the best results found so far. Nearest
+neighbour queries first descend greedily to the closest leaf of every
+query, so pruning starts with a tight bound.
+
+A detail's tree is cached on it (see Geometry.pointTree) and reused for as
+long as its points do not change."""
+
+from __future__ import absolute_import
+
+import numpy
+
+from .bvh import _positions, _dot
+
+class PointTree(object):
+    """A k-d tree over the point positions of a geometry detail"""
+    leafSize = 16
+
+    def __init__(self, geometry):
+        super(PointTree, self).__init__()
+        self.geometry = geometry
+        self.topologyId = geometry.topologyId
+        self._P = _positions(geometry).copy()
+        self._build()
+
+    def __repr__(self):
+        return '<{0} {1} points, {2} nodes>'.format(self.__class__.__name__,
+                                                    len(self._P), len(self._left))
+
+    def _build(self):
+        P = self._P
+        order = numpy.arange(len(P))
+        left, right, starts, counts, depths = [], [], [], [], []
+
+        def add(start, count, depth):
+            left.append(-1)
+            right.append(-1)
+            starts.append(start)
+            counts.append(count)
+            depths.append(depth)
+            return len(left) - 1
+
+        stack = [add(0, len(P), 0)] if len(P) else []
+        while stack:
+            node = stack.pop()
+            start, count = starts[node], counts[node]
+            if count <= self.leafSize:
+                continue
+            points = order[start:start+count]
+            x = P[points]
+            axis = int(numpy.argmax(x.max(axis=0) - x.min(axis=0)))
+            half = count // 2
+            order[start:start+count] = points[numpy.argpartition(x[:, axis], half)]
+            left[node] = add(start, half, depths[node] + 1)
+            right[node] = add(start + half, count - half, depths[node] + 1)
+            stack.extend((left[node], right[node]))
+
+        self._order = order
+        self._left = numpy.array(left, dtype=numpy.int64)
+        self._right = numpy.array(right, dtype=numpy.int64)
+        self._start = numpy.array(starts, dtype=numpy.int64)
+        self._count = numpy.array(counts, dtype=numpy.int64)
+        depth = numpy.array(depths, dtype=numpy.int64)
+
+        self._lo = numpy.empty((len(left), 3))
+        self._hi = numpy.empty((len(left), 3))
+        leaves = numpy.nonzero(self._left < 0)[0]
+        leaves = leaves[numpy.argsort(self._start[leaves])]
+        if len(leaves):
+            self._lo[leaves] = numpy.minimum.reduceat(P[order], self._start[leaves])
+            self._hi[leaves] = numpy.maximum.reduceat(P[order], self._start[leaves])
+        inner = numpy.nonzero(self._left >= 0)[0]
+        for d in numpy.unique(depth[inner])[::-1]:
+            n = inner[depth[inner] == d]
+            l, r = self._left[n], self._right[n]
+            self._lo[n] = numpy.minimum(self._lo[l], self._lo[r])
+            self._hi[n] = numpy.maximum(self._hi[l], self._hi[r])
+
+    @property
+    def numPoints(self):
+        return len(self._P)
+
+    def isCurrent(self):
+        """True if the detail's points are the ones the tree was built from"""
+        return (self.geometry.topologyId == self.topologyId and
+                numpy.array_equal(_positions(self.geometry), self._P))
+
+    def _boxDistance2(self, points, nodes):
+        d = numpy.maximum(self._lo[nodes] - points, 0.0) + numpy.maximum(points - self._hi[nodes], 0.0)
+        return _dot(d, d)
+
+    def _leafPairs(self, queries, nodes):
+        """Expand (query, leaf) pairs into (query, point) pairs"""
+        counts = self._count[nodes]
+        q = numpy.repeat(queries, counts)
+        first = numpy.cumsum(counts) - counts
+        k = numpy.arange(len(q)) - numpy.repeat(first, counts)
+        return q, self._order[numpy.repeat(self._start[nodes], counts) + k]
+
+    def nearest(self, positions, k=1, maxDistance=numpy.inf):
+        """Find the k nearest points to every position
+
+        Returns (points, distances), two (N, k) arrays sorted by distance.
+        Where fewer than k points are within maxDistance the rest of the row
+        is -1 and inf."""
+        X = numpy.atleast_2d(numpy.asarray(positions, dtype=numpy.float64))
+        n = len(X)
+        best = numpy.full((n, k), float(maxDistance) ** 2)
+        found = numpy.full((n, k), -1, dtype=numpy.int64)
+
+        def visitLeaves(queries, leaves):
+            q, pts = self._leafPairs(queries, leaves)
+            d = X[q] - self._P[pts]
+            d2 = _dot(d, d)
+            closer = d2 < best[q, -1]
+            q, pts, d2 = q[closer], pts[closer], d2[closer]
+            # Merge the candidates into the k best of each query, handling
+            # one candidate per query at a time
+            order = numpy.lexsort((d2, q))
+            q, pts, d2 = q[order], pts[order], d2[order]
+            start = numpy.ones(len(q), dtype=bool)
+            start[1:] = q[1:] != q[:-1]
+            rank = numpy.arange(len(q)) - numpy.maximum.accumulate(
+                numpy.where(start, numpy.arange(len(q)), 0))
+            for r in range(min(k, int(rank.max()) + 1) if len(q) else 0):
+                sel = rank == r
+                qs = q[sel]
+                better = d2[sel] < best[qs, -1]
+                qs, cand, cd = qs[better], pts[sel][better], d2[sel][better]
+                # Insert into the sorted row, dropping the current last entry
+                pos = numpy.sum(best[qs] <= cd[:, None], axis=1)
+                cols = numpy.arange(k)
+                shift = cols[None, :] > pos[:, None]
+                rows = best[qs]
+                ids = found[qs]
+                prev = numpy.concatenate((rows[:, :1], rows[:, :-1]), axis=1)
+                previds = numpy.concatenate((ids[:, :1], ids[:, :-1]), axis=1)
+                rows = numpy.where(shift, prev, rows)
+                ids = numpy.where(shift, previds, ids)
+                at = cols[None, :] == pos[:, None]
+                best[qs] = numpy.where(at, cd[:, None], rows)
+                found[qs] = numpy.where(at, cand[:, None], ids)
+
+        queries = numpy.arange(n) if len(self._left) else numpy.empty(0, numpy.int64)
+        visited = numpy.full(n, -1, dtype=numpy.int64)
+        if len(queries):
+            nodes = numpy.zeros(n, dtype=numpy.int64)
+            inner = self._left[nodes] >= 0
+            while inner.any():
+                q = queries[inner]
+                l, r = self._left[nodes[q]], self._right[nodes[q]]
+                nearer = self._boxDistance2(X[q], l) <= self._boxDistance2(X[q], r)
+                nodes[q] = numpy.where(nearer, l, r)
+                inner = self._left[nodes] >= 0
+            visitLeaves(queries, nodes)
+            visited = nodes
+            nodes = numpy.zeros(n, dtype=numpy.int64)
+
+        while len(queries):
+            keep = self._boxDistance2(X[queries], nodes) < best[queries, -1]
+            queries, nodes = queries[keep], nodes[keep]
+            leaf = self._left[nodes] < 0
+            fresh = leaf & (nodes != visited[queries])
+            if fresh.any():
+                visitLeaves(queries[fresh], nodes[fresh])
+            queries, nodes = queries[~leaf], nodes[~leaf]
+            queries = numpy.concatenate((queries, queries))
+            nodes = numpy.concatenate((self._left[nodes], self._right[nodes]))
+
+        missing = found < 0
+        return found, numpy.where(missing, numpy.inf, numpy.sqrt(best))
+
+    def radius(self, positions, radius):
+        """Find all points within radius of every position
+
+        radius is a single value or one per position. Returns three arrays
+        (query numbers, point numbers, distances) with an entry per point
+        found, sorted by query then distance."""
+        X = numpy.atleast_2d(numpy.asarray(positions, dtype=numpy.float64))
+        r2 = numpy.broadcast_to(numpy.asarray(radius, dtype=numpy.float64), (len(X),)) ** 2
+        found_q, found_p, found_d = [], [], []
+        queries = numpy.arange(len(X)) if len(self._left) else numpy.empty(0, numpy.int64)
+        nodes = numpy.zeros(len(queries), dtype=numpy.int64)
+        while len(queries):
+            keep = self._boxDistance2(X[queries], nodes) <= r2[queries]
+            queries, nodes = queries[keep], nodes[keep]
+            leaf = self._left[nodes] < 0
+            if leaf.any():
+                q, pts = self._leafPairs(queries[leaf], nodes[leaf])
+                d = X[q] - self._P[pts]
+                d2 = _dot(d, d)
+                inside = d2 <= r2[q]
+                found_q.append(q[inside])
+                found_p.append(pts[inside])
+                found_d.append(d2[inside])
+            queries, nodes = queries[~leaf], nodes[~leaf]
+            queries = numpy.concatenate((queries, queries))
+            nodes = numpy.concatenate((self._left[nodes], self._right[nodes]))
+        if not found_q:
+            empty = numpy.empty(0, numpy.int64)
+            return empty, empty.copy(), numpy.empty(0)
+        q, p, d2 = (numpy.concatenate(found_q), numpy.concatenate(found_p),
+                    numpy.concatenate(found_d))
+        order = numpy.lexsort((d2, q))
+        return q[order], p[order], numpy.sqrt(d2[order])
@@ -0,0 +1,323 @@
+""".mgeo geometry cache files.
+
+An .mgeo file stores a Geometry as raw attribute blocks, in the same packed
+layout the detail uses in memory, behind a small header index:
+
+* the magic b'MGEO', a format version and the length of the header,
+* the header: JSON describing the element counts and, for every
+  connectivity table and attribute, its type, tuple size, default, numpy
+  dtype and the offset of its block,
+* the blocks, each aligned to ALIGNMENT bytes. The leaves and tiles of
+  MVolume grids are stored as blocks too, and so are the sources of
+  packed primitives, each as a nested .mgeo image.
+
+GeometryCache memory maps a file and returns blocks as numpy arrays
+viewing the mapping directly: nothing is read or copied until the pages
+are touched, and the operating system's page cache is shared between every
+process reading the same frame. loadGeometry builds an ordinary Geometry
+from a cache, copying only the attributes asked for."""
+
+from __future__ import absolute_import
+
+import io
+import json
+import mmap
+import struct
+
+import numpy
+
+from .attribute import AttribClass, Integer, Float, String
+from .detail import Geometry
+from .volume import VoxelGrid, _pack
+
+MAGIC = b'MGEO'
+VERSION = 1
+ALIGNMENT = 64
+
+_preamble = struct.Struct(str('<4sIQ'))
+
+# The connectivity tables, by their name in the header
+_topology = ('vertexPoints', 'vertexPrims', 'primStarts', 'primTypes', 'primClosed')
+
+_attrib_types = {'Integer': Integer, 'Float': Float, 'String': String}
+
+def _dtype(attr):
+    return numpy.dtype(str(attr.code)).newbyteorder('<')
+
+def _little(data):
+    return numpy.ascontiguousarray(data).astype(data.dtype.newbyteorder('<'), copy=False)
+
+def _block(attr):
+    return numpy.frombuffer(attr, dtype=attr.code).astype(_dtype(attr), copy=False)
+
+def _volume_arrays(grid):
+    """Yield (name, tile level, array) for the arrays of a VoxelGrid"""
+    count = grid.numLeaves
+    yield 'coords', None, grid._coords[:count]
+    yield 'values', None, grid._values[:count]
+    yield 'active', None, grid._active[:count].view(numpy.uint8)
+    for level, (keys, values) in sorted(grid._tiles.items()):
+        yield 'tileKeys', level, keys
+        yield 'tileValues', level, values
+
+def saveGeometry(geometry, fpath):
+    """Write a Geometry to an .mgeo file"""
+    with io.open(fpath, 'wb') as f:
+        _write(geometry, f)
+
+def _write(geometry, f):
+    """Write a Geometry as an .mgeo image to the file f"""
+    entries = []
+    blocks = []
+    offset = 0
+
+    def add(entry, data, entries=entries):
+        entry.update(dtype=data.dtype.str, offset=offset, length=data.nbytes)
+        entries.append(entry)
+        blocks.append(data)
+        return offset + data.nbytes + (-data.nbytes % ALIGNMENT)
+
+    for name in _topology:
+        offset = add(dict(name=name), _block(getattr(geometry, name)))
+    for attribclass in (AttribClass.Point, AttribClass.Vertex, AttribClass.Prim, AttribClass.Global):
+        for name, attr in sorted(geometry.attribs(attribclass).items()):
+            if not isinstance(attr, (Integer, Float, String)):
+                # Only packed attributes have a raw layout
+                continue
+            entry = dict(name=name, attribclass=attribclass, size=attr.size,
+                         default=list(attr.default))
+            if isinstance(attr, String):
+                # The indices are stored raw, and the table in the header
+                entry.update(type='String', table=attr.table)
+            else:
+                entry.update(type='Integer' if isinstance(attr, Integer) else 'Float')
+            offset = add(entry, _block(attr))
+
+    # Volume grids store their leaf and tile arrays as blocks
+    volumes = []
+    for number, grid in sorted(geometry._volumes.items()):
+        volume = dict(prim=number, voxelSize=grid.voxelSize, background=grid.background,
+                      leafSize=grid.leafSize, blocks=[])
+        for name, level, data in _volume_arrays(grid):
+            offset = add(dict(name=name, level=level), _little(data), volume['blocks'])
+        volumes.append(volume)
+
+    # The sources of packed primitives are nested .mgeo images
+    sources = []
+    for source in geometry._sources:
+        image = io.BytesIO()
+        _write(source, image)
+        offset = add(dict(name='source'), numpy.frombuffer(image.getvalue(), numpy.uint8), sources)
+
+    header = json.dumps(dict(numPoints=geometry.numPoints,
+                             numVertices=geometry.numVertices,
+                             numPrims=geometry.numPrims,
+                             topology=entries[:len(_topology)],
+                             attribs=entries[len(_topology):],
+                             volumes=volumes,
+                             sources=sources),
+                        sort_keys=True).encode('utf8')
+    start = _preamble.size + len(header)
+    start += -start % ALIGNMENT
+
+    f.write(_preamble.pack(MAGIC, VERSION, len(header)))
+    f.write(header)
+    f.write(b'\0' * (start - _preamble.size - len(header)))
+    for data in blocks:
+        f.write(data.tobytes())
+        f.write(b'\0' * (-data.nbytes % ALIGNMENT))
+
+class GeometryCache(object):
+    """A memory mapped .mgeo file
+
+    Arrays returned by a cache are read only views of the mapping, and stay
+    valid after the cache is closed. offset is the position of the image in
+    the file, for the nested images of packed sources."""
+    def __init__(self, fpath, offset=0):
+        super(GeometryCache, self).__init__()
+        self.fpath = fpath
+        with io.open(fpath, 'rb') as f:
+            f.seek(offset)
+            preamble = f.read(_preamble.size)
+            if len(preamble) < _preamble.size or preamble[:4] != MAGIC:
+                raise ValueError('{0} is not an .mgeo file'.format(fpath))
+            magic, version, length = _preamble.unpack(preamble)
+            if version > VERSION:
+                raise ValueError('{0} has unsupported version {1}'.format(fpath, version))
+            header = json.loads(f.read(length).decode('utf8'))
+            self._mmap = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        start = _preamble.size + length
+        self._start = offset + start + (-start % ALIGNMENT)
+        self.numPoints = header['numPoints']
+        self.numVertices = header['numVertices']
+        self.numPrims = header['numPrims']
+        self._topology = dict((e['name'], e) for e in header['topology'])
+        self._entries = ({}, {}, {}, {})
+        for e in header['attribs']:
+            self._entries[e['attribclass']][e['name']] = e
+        self._volumes = dict((v['prim'], v) for v in header.get('volumes', ()))
+        self._sources = header.get('sources', [])
+        self._views = {}
+
+    def __repr__(self):
+        return '<{0} {1!r}>'.format(self.__class__.__name__, self.fpath)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    def close(self):
+        """Release the cache's reference to the mapping
+
+        The mapping itself is unmapped once no array views it any more."""
+        self._mmap = None
+        self._views = {}
+
+    def _view(self, key, entry):
+        try:
+            return self._views[key]
+        except KeyError:
+            pass
+        if self._mmap is None:
+            raise ValueError('I/O operation on closed cache')
+        dtype = numpy.dtype(str(entry['dtype']))
+        count = entry['length'] // dtype.itemsize
+        if count:
+            view = numpy.frombuffer(self._mmap, dtype, count, self._start + entry['offset'])
+        else:
+            view = numpy.empty(0, dtype)
+        size = entry.get('size', 1)
+        if size > 1:
+            view = view.reshape(-1, size)
+        self._views[key] = view
+        return view
+
+    def attribNames(self, attribclass):
+        return sorted(self._entries[attribclass])
+
+    def hasAttrib(self, attribclass, name):
+        return name in self._entries[attribclass]
+
+    def attrib(self, attribclass, name):
+        """Return an attribute as a zero copy numpy array
+
+        Tuple valued attributes have a shape of (elements, size)."""
+        try:
+            entry = self._entries[attribclass][name]
+        except KeyError:
+            raise KeyError('No such attribute: {0!r}'.format(name))
+        return self._view((attribclass, name), entry)
+
+    def stringTable(self, attribclass, name):
+        """Return the string table of a String attribute, which attrib
+        returns the table indices of"""
+        return list(self._entries[attribclass][name]['table'])
+
+    def topology(self, name):
+        """Return a connectivity table (e.g. 'primStarts') as a numpy array"""
+        return self._view(name, self._topology[name])
+
+    def volumePrims(self):
+        """The numbers of the primitives with a stored volume grid"""
+        return sorted(self._volumes)
+
+    def volume(self, number):
+        """Return a copy of the VoxelGrid of MVolume primitive number"""
+        entry = self._volumes[number]
+        B = entry['leafSize']
+        arrays = {}
+        for block in entry['blocks']:
+            key = (number, block['name'], block['level'])
+            arrays[block['name'], block['level']] = self._view(key, block)
+        values = arrays['values', None]
+        grid = VoxelGrid(entry['voxelSize'], entry['background'], B, values.dtype.newbyteorder('='))
+        grid._count = len(arrays['coords', None]) // 3
+        grid._coords = arrays['coords', None].reshape(-1, 3).astype(numpy.int64)
+        grid._keys = _pack(grid._coords)
+        grid._values = values.reshape(-1, B, B, B).astype(grid.dtype)
+        grid._active = arrays['active', None].reshape(-1, B, B, B).astype(bool)
+        for (name, level), keys in arrays.items():
+            if name == 'tileKeys':
+                grid._tiles[level] = (keys.astype(numpy.int64),
+                                      arrays['tileValues', level].astype(grid.dtype))
+        return grid
+
+    @property
+    def numSources(self):
+        return len(self._sources)
+
+    def source(self, index):
+        """Return a GeometryCache of the source detail of packed primitives
+        with the given "packedsource" index"""
+        return GeometryCache(self.fpath, self._start + self._sources[index]['offset'])
+
+    @property
+    def positions(self):
+        return self.attrib(AttribClass.Point, 'P')
+
+    def iterPointChunks(self, size):
+        """Yield the cached points, size at a time, as point only details
+
+        Only one chunk's worth of data is read at a time, so a cache can be
+        streamed (see Node.stream) regardless of its size."""
+        entries = self._entries[AttribClass.Point]
+        for start in range(0, self.numPoints, size):
+            geo = Geometry()
+            for name, entry in entries.items():
+                attr = _new_attrib(entry)
+                geo._attribs[AttribClass.Point][name] = _fill(
+                    attr, self.attrib(AttribClass.Point, name)[start:start + size])
+            for name, entry in self._entries[AttribClass.Global].items():
+                attr = _new_attrib(entry)
+                geo._attribs[AttribClass.Global][name] = _fill(
+                    attr, self.attrib(AttribClass.Global, name))
+            geo._numpoints = min(size, self.numPoints - start)
+            yield geo
+
+def _new_attrib(entry):
+    """An empty attribute of the type described by a header entry"""
+    cls = _attrib_types[entry['type']]
+    if cls is String:
+        return cls(size=entry['size'], default=entry['default'], table=entry['table'])
+    return cls(size=entry['size'], default=entry['default'])
+
+def _fill(attr, view):
+    data = numpy.ascontiguousarray(view, dtype=numpy.dtype(str(attr.code))).tobytes()
+    if hasattr(attr, 'frombytes'):
+        attr.frombytes(data)
+    else:
+        attr.fromstring(data)
+    return attr
+
+def loadGeometry(cache, attribs=None):
+    """Build a Geometry from an .mgeo file or GeometryCache
+
+    attribs may be a sequence of (attribclass, name) pairs restricting the
+    attributes that are loaded; "P" and the connectivity are always loaded."""
+    if not isinstance(cache, GeometryCache):
+        with GeometryCache(cache) as c:
+            return loadGeometry(c, attribs)
+    if attribs is not None:
+        attribs = set(tuple(a) for a in attribs)
+
+    geo = Geometry()
+    geo._numpoints = cache.numPoints
+    for name, attrname in zip(_topology, ('_vertexpoints', '_vertexprims', '_primstarts',
+                                          '_primtypes', '_primclosed')):
+        setattr(geo, attrname, _fill(Integer(), cache.topology(name)))
+
+    for attribclass in (AttribClass.Point, AttribClass.Vertex, AttribClass.Prim, AttribClass.Global):
+        for name, entry in cache._entries[attribclass].items():
+            required = attribclass == AttribClass.Point and name == 'P'
+            if not required and attribs is not None and (attribclass, name) not in attribs:
+                continue
+            attr = _new_attrib(entry)
+            geo._attribs[attribclass][name] = _fill(attr, cache.attrib(attribclass, name))
+    for number in cache.volumePrims():
+        geo._volumes[number] = cache.volume(number)
+    for index in range(cache.numSources):
+        with cache.source(index) as source:
+            geo._sources.append(loadGeometry(source))
+    return geo
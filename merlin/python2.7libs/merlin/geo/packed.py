@@ -0,0 +1,198 @@
+"""Packed primitives: instances of shared details.
+
+A PackedGeometry primitive costs a point, a vertex and a few primitive
+attribute values, however large the detail it instances: all instances of
+a source share one read only copy of it (see Geometry.createPackedPrims).
+The functions here work on whole arrays of instances:
+
+* instanceTransforms gathers their (N, 4, 4) transforms,
+* packedBounds gives their world bounding boxes, e.g. to build a BoxTree
+  (see geo.bvh) over millions of instances without unpacking them,
+* unpack expands instances into real geometry, only when it is asked for.
+
+Unpacking transforms "P", the "transform" attribute of primitives (such as
+quadratics and nested packed primitives, which stay packed), the normals
+named in normalAttribs and the vectors named in vectorAttribs. Every other
+primitive attribute of an instance overrides the source attribute of the
+same name and size (point, vertex then primitive), or is added as a
+primitive attribute of the unpacked geometry."""
+
+from __future__ import absolute_import
+
+import numpy
+
+from .attribute import AttribClass, String, _extend
+from .detail import Geometry
+from . import prim
+
+# Attributes transformed as normals and as vectors when unpacking
+normalAttribs = ('N',)
+vectorAttribs = ('v', 'up')
+
+# Primitive attributes describing the instance itself, never overrides
+_instance_attribs = ('transform', 'packedsource')
+
+def _array(a):
+    if not len(a):
+        return numpy.empty(0, dtype=a.code)
+    return numpy.frombuffer(a, dtype=a.code)
+
+def _values(geometry, attribclass, name):
+    attr = geometry.attrib(attribclass, name)
+    return _array(attr).reshape(-1, attr.size)
+
+def _packedPrims(geometry, prims):
+    types = _array(geometry.primTypes)
+    if prims is None:
+        return numpy.nonzero(types == prim.PackedGeometry.typeid)[0]
+    prims = numpy.asarray(prims, dtype=numpy.int64).reshape(-1)
+    if numpy.any(types[prims] != prim.PackedGeometry.typeid):
+        raise TypeError('Not all the primitives are packed')
+    return prims
+
+def _sources(geometry, prims):
+    return _values(geometry, AttribClass.Prim, 'packedsource')[prims, 0]
+
+def instanceTransforms(geometry, prims=None):
+    """Return the (N, 4, 4) transforms of the packed primitives given, all
+    of them by default"""
+    prims = _packedPrims(geometry, prims)
+    starts = _array(geometry.primStarts)
+    vp = _array(geometry.vertexPoints)
+    M = numpy.zeros((len(prims), 4, 4))
+    if len(prims):
+        M[:, :3, :3] = _values(geometry, AttribClass.Prim, 'transform')[prims].reshape(-1, 3, 3)
+        M[:, 3, :3] = _values(geometry, AttribClass.Point, 'P')[vp[starts[prims]]]
+    M[:, 3, 3] = 1.0
+    return M
+
+def _localBounds(source):
+    """The (lo, hi) box of a source's points and nested instances"""
+    lo, hi = numpy.full(3, numpy.inf), numpy.full(3, -numpy.inf)
+    if source.numPoints:
+        P = _values(source, AttribClass.Point, 'P')
+        lo, hi = P.min(axis=0), P.max(axis=0)
+    if source._sources:
+        nlo, nhi = packedBounds(source)
+        if len(nlo):
+            lo, hi = numpy.minimum(lo, nlo.min(axis=0)), numpy.maximum(hi, nhi.max(axis=0))
+    return lo, hi
+
+def packedBounds(geometry, prims=None):
+    """Return (lo, hi), the (N, 3) corners of the world bounding boxes of
+    the packed primitives given, all of them by default
+
+    Instances of empty sources have an empty box, from inf to -inf."""
+    prims = _packedPrims(geometry, prims)
+    M = instanceTransforms(geometry, prims)
+    lo = numpy.full((len(prims), 3), numpy.inf)
+    hi = numpy.full((len(prims), 3), -numpy.inf)
+    sources = _sources(geometry, prims)
+    for s in numpy.unique(sources):
+        slo, shi = _localBounds(geometry._sources[s])
+        if numpy.any(slo > shi):
+            continue
+        sel = numpy.nonzero(sources == s)[0]
+        corners = numpy.where(numpy.array([[i, j, k] for i in (0, 1) for j in (0, 1)
+                                           for k in (0, 1)]) == 1, shi, slo)
+        world = numpy.einsum('ci,nij->ncj', corners, M[sel, :3, :3]) + M[sel, None, 3, :3]
+        lo[sel], hi[sel] = world.min(axis=1), world.max(axis=1)
+    return lo, hi
+
+def _tile(source, count):
+    """A new detail holding count copies of source, one after another"""
+    geo = Geometry()
+    for attribclass in (AttribClass.Point, AttribClass.Vertex, AttribClass.Prim):
+        for name, attr in source.attribs(attribclass).items():
+            tiled = attr.extractElements(0, 0)
+            _extend(tiled, numpy.tile(_array(attr), count))
+            geo._attribs[attribclass][name] = tiled
+    for name, attr in source.attribs(AttribClass.Global).items():
+        geo._attribs[AttribClass.Global][name] = attr.copy()
+    points, vertices, prims = source.numPoints, source.numVertices, source.numPrims
+    copies = numpy.arange(count)
+    geo._numpoints = points * count
+    for name, table, offset, length in (
+            ('_vertexpoints', _array(source.vertexPoints), points, vertices),
+            ('_vertexprims', _array(source.vertexPrims), prims, vertices),
+            ('_primstarts', _array(source.primStarts)[1:], vertices, prims),
+            ('_primtypes', _array(source.primTypes), 0, prims),
+            ('_primclosed', _array(source.primClosed), 0, prims)):
+        values = numpy.tile(table, count) + numpy.repeat(copies * offset, length)
+        _extend(getattr(geo, name), values)
+    for n, grid in source._volumes.items():
+        for i in copies:
+            geo._volumes[i * prims + n] = grid.copy()
+    geo._sources = list(source._sources)
+    return geo
+
+def _transform(geo, M):
+    """Transform the copies of a tiled detail, one per matrix"""
+    count = len(M)
+    A = M[:, :3, :3]
+    if geo.numPoints:
+        P = _values(geo, AttribClass.Point, 'P').reshape(count, -1, 3)
+        P[:] = numpy.einsum('kni,kij->knj', P, A) + M[:, None, 3, :3]
+    inverse = None
+    for attribclass in (AttribClass.Point, AttribClass.Vertex):
+        for name, attr in geo.attribs(attribclass).items():
+            vector = name in vectorAttribs
+            if (not (vector or name in normalAttribs) or attr.size != 3 or attr.code != 'd'
+                    or not len(attr)):
+                continue
+            v = _array(attr).reshape(count, -1, 3)
+            if vector:
+                v[:] = numpy.einsum('kni,kij->knj', v, A)
+            else:
+                if inverse is None:
+                    inverse = numpy.swapaxes(numpy.linalg.inv(A), 1, 2)
+                n = numpy.einsum('kni,kij->knj', v, inverse)
+                length = numpy.sqrt(numpy.sum(n * n, axis=2))[..., None]
+                v[:] = n / numpy.where(length > 0.0, length, 1.0)
+    T = geo.findAttrib(AttribClass.Prim, 'transform')
+    if T is not None and len(T):
+        t = _array(T).reshape(count, -1, 3, 3)
+        t[:] = numpy.einsum('knij,kjl->knil', t, A)
+
+def _override(geo, geometry, prims):
+    """Apply the instance attributes of prims to the copies of a tiled
+    detail, one per primitive"""
+    count = len(prims)
+    for name, attr in geometry.attribs(AttribClass.Prim).items():
+        if name in _instance_attribs:
+            continue
+        values = _array(attr).reshape(-1, attr.size)[prims]
+        target = None
+        for attribclass in (AttribClass.Point, AttribClass.Vertex, AttribClass.Prim):
+            found = geo.findAttrib(attribclass, name)
+            if (found is not None and found.size == attr.size and
+                    isinstance(found, String) == isinstance(attr, String)):
+                target = found
+                break
+        if target is None:
+            if geo.findAttrib(AttribClass.Prim, name) is not None:
+                # A different type or size; the instance cannot override it
+                continue
+            target = geo.addAttrib(AttribClass.Prim, name, attr.default)
+        if isinstance(attr, String):
+            values = target.remap(attr)[values]
+        if len(target):
+            _array(target).reshape(count, -1, attr.size)[:] = values[:, None, :]
+
+def unpack(geometry, prims=None):
+    """Return a new detail holding the transformed geometry of the packed
+    primitives given, all of them by default
+
+    The instances of each source are expanded together, so the result is
+    grouped by source rather than in primitive order."""
+    prims = _packedPrims(geometry, prims)
+    M = instanceTransforms(geometry, prims)
+    sources = _sources(geometry, prims)
+    result = Geometry()
+    for s in numpy.unique(sources):
+        sel = numpy.nonzero(sources == s)[0]
+        geo = _tile(geometry._sources[s], len(sel))
+        _transform(geo, M[sel])
+        _override(geo, geometry, prims[sel])
+        result.merge(geo)
+    return result
@@ -0,0 +1,274 @@
+"""Geometric operations over the polygons of a detail.
+
+Every function works on all the polygons of a detail at once:
+
+* faceNormals, faceAreas and faceCentroids give a value per primitive,
+* pointNormals averages face normals onto points, weighted by area or by
+  the angle of each corner,
+* computeNormals writes either as an "N" attribute,
+* triangulate splits polygons into triangles: a fan for convex polygons
+  and ear clipping for concave ones. The quads of Mesh primitives are
+  split in two.
+
+Normals and areas use Newell's method, summing a term per vertex over the
+CSR runs of the polygons with one numpy reduction whatever the vertex
+counts, so they also behave on non planar polygons. The vertex following
+each vertex depends only on the topology and is cached with the detail's
+adjacency (see Geometry.adjacency), so recomputing normals as a mesh
+deforms only costs the arithmetic on the positions.
+
+Open polygons and polygons with fewer than three vertices have no area and
+a zero normal, and are not triangulated."""
+
+from __future__ import absolute_import
+
+import numpy
+
+from .attribute import AttribClass
+from . import prim
+
+class NormalWeight(object):
+    """Enum for how pointNormals weights the faces around a point"""
+    Uniform = 0
+    Area = 1
+    Angle = 2
+
+def _array(a):
+    if not len(a):
+        return numpy.empty(0, dtype=a.code)
+    return numpy.frombuffer(a, dtype=a.code)
+
+def _positions(geometry):
+    return _array(geometry.attrib(AttribClass.Point, 'P')).reshape(-1, 3)
+
+def _normalize(v):
+    length = numpy.sqrt(numpy.sum(v * v, axis=-1))[..., None]
+    return v / numpy.where(length > 0.0, length, 1.0)
+
+def _faces(geometry):
+    """The vertices of closed polygons of three or more vertices, with the
+    vertex following each of them and the polygons' numbers"""
+    nxt = geometry.adjacency()._nextVertices()
+    starts = _array(geometry.primStarts)
+    types = _array(geometry.primTypes)
+    closed = _array(geometry.primClosed)
+    counts = numpy.diff(starts)
+    faces = (types == prim.Polygon.typeid) & (closed != 0) & (counts >= 3)
+    vertices = numpy.nonzero(numpy.repeat(faces, counts))[0]
+    return vertices, nxt[vertices], numpy.nonzero(faces)[0]
+
+def _newell(geometry):
+    """The Newell vector (twice the vector area) of every primitive"""
+    vertices, nxt, faces = _faces(geometry)
+    result = numpy.zeros((geometry.numPrims, 3))
+    if len(faces):
+        P = _positions(geometry)
+        vp = _array(geometry.vertexPoints)
+        terms = numpy.cross(P[vp[vertices]], P[vp[nxt]])
+        first = numpy.searchsorted(vertices, _array(geometry.primStarts)[faces])
+        result[faces] = numpy.add.reduceat(terms, first, axis=0)
+    return result
+
+def faceNormals(geometry):
+    """Return the (numPrims, 3) unit normals of every primitive"""
+    return _normalize(_newell(geometry))
+
+def faceAreas(geometry):
+    """Return the area of every primitive"""
+    n = _newell(geometry)
+    return 0.5 * numpy.sqrt(numpy.sum(n * n, axis=1))
+
+def faceCentroids(geometry):
+    """Return the (numPrims, 3) average of the vertex positions of every
+    primitive (zero for primitives without vertices)"""
+    starts = _array(geometry.primStarts)
+    counts = numpy.diff(starts)
+    result = numpy.zeros((geometry.numPrims, 3))
+    has = numpy.nonzero(counts > 0)[0]
+    if len(has):
+        P = _positions(geometry)[_array(geometry.vertexPoints)]
+        result[has] = numpy.add.reduceat(P, starts[has], axis=0) / counts[has, None]
+    return result
+
+def pointNormals(geometry, weighting=NormalWeight.Area):
+    """Return the (numPoints, 3) unit normals of every point, averaged from
+    the normals of the polygons using it (zero for points of none)"""
+    vertices, nxt, faces = _faces(geometry)
+    vp = _array(geometry.vertexPoints)
+    vprims = _array(geometry.vertexPrims)
+    newell = _newell(geometry)
+    if weighting == NormalWeight.Area:
+        # The Newell vector is the normal scaled by twice the area
+        contrib = newell[vprims[vertices]]
+    elif weighting == NormalWeight.Uniform:
+        contrib = _normalize(newell)[vprims[vertices]]
+    elif weighting == NormalWeight.Angle:
+        P = _positions(geometry)
+        prev = numpy.empty(len(vp), dtype=numpy.int64)
+        prev[nxt] = vertices
+        a = _normalize(P[vp[prev[vertices]]] - P[vp[vertices]])
+        b = _normalize(P[vp[nxt]] - P[vp[vertices]])
+        angle = numpy.arccos(numpy.clip(numpy.sum(a * b, axis=1), -1.0, 1.0))
+        contrib = _normalize(newell)[vprims[vertices]] * angle[:, None]
+    else:
+        raise ValueError('Unknown weighting {0!r}'.format(weighting))
+    points = vp[vertices]
+    result = numpy.column_stack([numpy.bincount(points, weights=contrib[:, c],
+                                                minlength=geometry.numPoints)
+                                 for c in range(3)]) if len(points) else \
+        numpy.zeros((geometry.numPoints, 3))
+    return _normalize(result)
+
+def computeNormals(geometry, attribclass=AttribClass.Point, weighting=NormalWeight.Area,
+                   name='N'):
+    """Compute point (see pointNormals) or primitive normals into a float
+    attribute of size 3, adding it if needed, and return it"""
+    if attribclass == AttribClass.Point:
+        normals = pointNormals(geometry, weighting)
+    elif attribclass == AttribClass.Prim:
+        normals = faceNormals(geometry)
+    else:
+        raise ValueError('Normals can only be computed for points or primitives')
+    attr = geometry.findAttrib(attribclass, name)
+    if attr is None:
+        attr = geometry.addAttrib(attribclass, name, (0.0, 0.0, 0.0))
+    elif attr.size != 3 or attr.code != 'd':
+        raise TypeError('{0!r} is not a float attribute of size 3'.format(name))
+    else:
+        attr = geometry.writableAttrib(attribclass, name)
+    if len(attr):
+        _array(attr).reshape(-1, 3)[:] = normals
+    return attr
+
+def _basis(normals):
+    """Two unit vectors spanning the plane of each normal, such that
+    (u, v, normal) is right handed"""
+    helper = numpy.zeros_like(normals)
+    helper[numpy.arange(len(normals)), numpy.argmin(numpy.abs(normals), axis=1)] = 1.0
+    u = _normalize(numpy.cross(helper, normals))
+    return u, numpy.cross(normals, u)
+
+def _ears(X, prv, nxt, candidates, i):
+    """Return (convex, ear) flags of the corners i, an (m, k) array, of an
+    (m, n, 2) batch of polygons
+
+    An ear is a convex corner whose triangle holds none of the candidate
+    corners. In a simple polygon only reflex corners can be inside an ear,
+    so those are the candidates."""
+    m, n = X.shape[:2]
+    rows = numpy.arange(m)[:, None]
+    p, c = prv[rows, i], nxt[rows, i]
+    a, b, d = X[rows, p], X[rows, i], X[rows, c]
+    e0, e1 = b - a, d - b
+    convex = (e0[..., 0] * e1[..., 1] - e0[..., 1] * e1[..., 0]) > 0.0
+    a, b, d = a[:, :, None, :], b[:, :, None, :], d[:, :, None, :]
+    q = X[:, None, :, :]
+    inside = (_side(a, b, q) >= 0.0) & (_side(b, d, q) >= 0.0) & (_side(d, a, q) >= 0.0)
+    corners = numpy.arange(n)
+    others = candidates[:, None, :] & (corners != i[..., None]) & \
+        (corners != p[..., None]) & (corners != c[..., None])
+    return convex, convex & ~numpy.any(inside & others, axis=2)
+
+def _earClip(X):
+    """Ear clip an (m, n, 2) batch of counter clockwise polygons, returning
+    (m, n - 2, 3) triangles of corner indices
+
+    Clipping a corner only changes whether its two neighbours are ears, so
+    after finding the ears once each step tests just those two against the
+    reflex corners: O(n**2) work per polygon rather than O(n**3)."""
+    m, n = X.shape[:2]
+    rows = numpy.arange(m)
+    nxt = numpy.tile(numpy.roll(numpy.arange(n), -1), (m, 1))
+    prv = numpy.tile(numpy.roll(numpy.arange(n), 1), (m, 1))
+    active = numpy.ones((m, n), dtype=bool)
+    triangles = numpy.empty((m, n - 2, 3), dtype=numpy.int64)
+    e0, e1 = X - X[rows[:, None], prv], X[rows[:, None], nxt] - X
+    reflex = (e0[..., 0] * e1[..., 1] - e0[..., 1] * e1[..., 0]) <= 0.0
+    ear = _ears(X, prv, nxt, reflex, numpy.tile(numpy.arange(n), (m, 1)))[1]
+    for step in range(n - 3):
+        # Degenerate polygons may have no ear: clip any active corner
+        candidates = numpy.where(ear.any(axis=1)[:, None], ear, active)
+        i = numpy.argmax(candidates, axis=1)
+        p_, n_ = prv[rows, i], nxt[rows, i]
+        triangles[:, step] = numpy.column_stack((p_, i, n_))
+        nxt[rows, p_] = n_
+        prv[rows, n_] = p_
+        active[rows, i] = False
+        reflex[rows, i] = False
+        ear[rows, i] = False
+        neighbours = numpy.column_stack((p_, n_))
+        convex, ears = _ears(X, prv, nxt, reflex, neighbours)
+        reflex[rows[:, None], neighbours] = ~convex
+        ear[rows[:, None], neighbours] = ears
+    i = numpy.argmax(active, axis=1)
+    triangles[:, n - 3] = numpy.column_stack((prv[rows, i], i, nxt[rows, i]))
+    return triangles
+
+def _side(a, b, p):
+    """The signed area of (a, b, p): positive if p is left of a -> b"""
+    return ((b[..., 0] - a[..., 0]) * (p[..., 1] - a[..., 1]) -
+            (b[..., 1] - a[..., 1]) * (p[..., 0] - a[..., 0]))
+
+def _meshTriangles(geometry):
+    """The triangles of the quads of every Mesh, and the Mesh each belongs
+    to, as lists of arrays"""
+    starts = _array(geometry.primStarts)
+    tris, triprims = [], []
+    for p in numpy.nonzero(_array(geometry.primTypes) == prim.Mesh.typeid)[0]:
+        columns, rows = geometry.prim(int(p)).gridSize
+        if columns < 2 or rows < 2:
+            continue
+        grid = numpy.arange(columns * rows).reshape(rows, columns) + starts[p]
+        a, b, c, d = grid[:-1, :-1], grid[:-1, 1:], grid[1:, 1:], grid[1:, :-1]
+        tris.append(numpy.stack((numpy.stack((a, b, c), axis=-1),
+                                 numpy.stack((a, c, d), axis=-1)), axis=2).reshape(-1, 3))
+        triprims.append(numpy.full(len(tris[-1]), p, dtype=numpy.int64))
+    return tris, triprims
+
+def triangulate(geometry):
+    """Split every closed polygon, and the quads of every Mesh, into
+    triangles
+
+    Returns (vertices, prims): the (T, 3) vertex numbers of the triangles,
+    wound like their faces, and the primitive each belongs to. Polygons
+    are processed in batches of equal vertex count; the convex ones of a
+    batch are fanned and the others ear clipped, in a plane perpendicular
+    to their Newell normal. Other primitive types are skipped."""
+    vertices, nxt, faces = _faces(geometry)
+    starts = _array(geometry.primStarts)
+    counts = numpy.diff(starts)[faces]
+    P = _positions(geometry)
+    vp = _array(geometry.vertexPoints)
+    normals = faceNormals(geometry)[faces]
+    tris, triprims = _meshTriangles(geometry)
+    for n in numpy.unique(counts):
+        batch = numpy.nonzero(counts == n)[0]
+        corners = starts[faces[batch]][:, None] + numpy.arange(n)
+        if n == 3:
+            tris.append(corners)
+            triprims.append(faces[batch])
+            continue
+        u, v = _basis(normals[batch])
+        X3 = P[vp[corners]]
+        X = numpy.stack((numpy.einsum('mni,mi->mn', X3, u),
+                         numpy.einsum('mni,mi->mn', X3, v)), axis=-1)
+        e0 = X - numpy.roll(X, 1, axis=1)
+        e1 = numpy.roll(X, -1, axis=1) - X
+        turn = e0[..., 0] * e1[..., 1] - e0[..., 1] * e1[..., 0]
+        convex = numpy.all(turn >= 0.0, axis=1)
+        fan = numpy.column_stack((numpy.zeros(n - 2, dtype=numpy.int64),
+                                  numpy.arange(1, n - 1), numpy.arange(2, n)))
+        local = numpy.empty((len(batch), n - 2, 3), dtype=numpy.int64)
+        local[convex] = fan
+        concave = numpy.nonzero(~convex)[0]
+        if len(concave):
+            local[concave] = _earClip(X[concave])
+        rows = numpy.arange(len(batch))[:, None, None]
+        tris.append(corners[rows, local].reshape(-1, 3))
+        triprims.append(numpy.repeat(faces[batch], n - 2))
+    if not tris:
+        return numpy.empty((0, 3), dtype=numpy.int64), numpy.empty(0, dtype=numpy.int64)
+    vertices = numpy.concatenate(tris).astype(numpy.int64)
+    prims = numpy.concatenate(triprims).astype(numpy.int64)
+    order = numpy.argsort(prims, kind='mergesort')
+    return vertices[order], prims[order]
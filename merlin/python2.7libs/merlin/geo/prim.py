@@ -2,136 +2,662 @@
 types must derive. These are faces, surfaces, volumes and quadratic primitives. Faces include things
 like polygons and Bezier curves. Surfaces include things like NURBS and Bezier patches.
 Volumes include things like native merlin volumes, OpenVDB volumes and metaballs.
-Quadratic primitives include things like circles, spheres and tubes."""
+Quadratic primitives include things like circles, spheres and tubes.
+Packed primitives, which instance another detail, are the one exception.
+
+Primitives are views into a Geometry detail. A detail stores, for every
+primitive, a type id (the index of its class in prim_types) and a range of
+vertices in CSR form, so primitive objects are only created on access."""
+
+from __future__ import absolute_import
+
+import numpy
+
+from .attribute import AttribClass, Mat4
 
 # Base classes
 class Primitive(object):
     """Base class that all primitive geometry types derive from"""
-    def __init__(self, points):
+    __slots__ = ('geometry', 'number')
+    typeid = None
+
+    def __init__(self, geometry, number):
         super(Primitive, self).__init__()
-        if not points:
-            raise ValueError("A primitive cannot be constructed without at least one point.")
-        self.points = points
+        self.geometry = geometry
+        self.number = number
+
+    def __repr__(self):
+        return '<{0.__class__.__name__} {0.number}>'.format(self)
+
+    def __eq__(self, other):
+        return (isinstance(other, Primitive) and self.geometry is other.geometry
+                and self.number == other.number)
+
+    def __ne__(self, other):
+        return not self == other
+
+    def __hash__(self):
+        return hash((id(self.geometry), self.number))
+
+    def _vertexRange(self):
+        starts = self.geometry.primStarts
+        return range(starts[self.number], starts[self.number+1])
+
+    @property
+    def numVertices(self):
+        starts = self.geometry.primStarts
+        return starts[self.number+1] - starts[self.number]
+
+    @property
+    def vertices(self):
+        return tuple(self.geometry.vertex(v) for v in self._vertexRange())
+
+    @property
+    def points(self):
+        vp = self.geometry.vertexPoints
+        return tuple(self.geometry.point(vp[v]) for v in self._vertexRange())
+
+    def attribValue(self, name):
+        return self.geometry.attrib(AttribClass.Prim, name).element(self.number)
+
+    def setAttribValue(self, name, value):
+        self.geometry.writableAttrib(AttribClass.Prim, name).setElement(self.number, value)
 
 class Face(Primitive):
     """docstring for Face"""
-    def __init__(self, points):
-        super(Face, self).__init__()
-        self.arg = arg
+    __slots__ = ()
+
+    @property
+    def closed(self):
+        return bool(self.geometry.primClosed[self.number])
+
+    @closed.setter
+    def closed(self, value):
+        self.geometry._writableTopology()
+        self.geometry.primClosed[self.number] = int(bool(value))
+        # Closing or opening a face adds or removes an edge
+        self.geometry._topologyid += 1
 
 class Surface(Primitive):
-    """docstring for Surface"""
-    def __init__(self, arg):
-        super(Surface, self).__init__()
-        self.arg = arg
+    """Base class for surfaces, whose vertices are a grid of gridSize
+    vertices given row by row"""
+    __slots__ = ()
+
+    @property
+    def gridSize(self):
+        """The (columns, rows) of the vertex grid"""
+        attr = self.geometry.findAttrib(AttribClass.Prim, 'gridSize')
+        return (0, 0) if attr is None else attr.element(self.number)
+
+    @gridSize.setter
+    def gridSize(self, value):
+        if self.geometry.findAttrib(AttribClass.Prim, 'gridSize') is None:
+            attr = self.geometry.addAttrib(AttribClass.Prim, 'gridSize', (0, 0))
+        else:
+            attr = self.geometry.writableAttrib(AttribClass.Prim, 'gridSize')
+        attr.setElement(self.number, [int(v) for v in value])
+        # The faces of a Mesh follow from its grid
+        self.geometry._topologyid += 1
 
 class Volume(Primitive):
     """docstring for Volume"""
-    def __init__(self, arg):
-        super(Volume, self).__init__()
-        self.arg = arg
+    __slots__ = ()
 
 class Quadratic(Primitive):
     """Quadratic primitives are most often used as proxy geometry for collisions
 (since most implicitly define a volume). For the same reason, they are
-used in CSG (Constructuve Solid Geometry) modeling."""
-    def __init__(self, centroid):
-        points = [centroid]
-        super(Quadratic, self).__init__(points)
-        self.centroid = centroid
+used in CSG (Constructuve Solid Geometry) modeling.
+
+A quadratic primitive has a single vertex, whose point is its centroid.
+
+Each type defines its shape in a local frame centred on the centroid, with
+Y as its axis, and scaled by the "size" primitive attribute (see each
+type for the meaning of its components). The "transform" primitive
+attribute, a row major 3x3 rotation, orients the local frame:
+world = local * transform + centroid. Both attributes are optional.
+
+The geometric queries are vectorized over arrays of query positions or
+rays; geo.collide runs them against many proxies at once."""
+    __slots__ = ()
+    identity = (1.0, 0.0, 0.0, 0.0, 1.0, 0.0, 0.0, 0.0, 1.0)
+    defaultSize = (1.0, 1.0, 1.0)
+
+    @property
+    def centroid(self):
+        return self.points[0]
+
+    @property
+    def transform(self):
+        attr = self.geometry.findAttrib(AttribClass.Prim, 'transform')
+        return self.identity if attr is None else attr.element(self.number)
+
+    @property
+    def size(self):
+        attr = self.geometry.findAttrib(AttribClass.Prim, 'size')
+        return self.defaultSize if attr is None else attr.element(self.number)
+
+    def _frame(self, count):
+        c = numpy.tile(self.centroid.position, (count, 1))
+        M = numpy.tile(numpy.reshape(self.transform, (3, 3)), (count, 1, 1))
+        s = numpy.tile(self.size, (count, 1))
+        return c, M, s
+
+    def signedDistance(self, positions):
+        """The signed distance from each position to the surface, negative inside"""
+        X = numpy.atleast_2d(numpy.asarray(positions, dtype=numpy.float64))
+        c, M, s = self._frame(len(X))
+        return self._sdf(toLocal(X, c, M), s)
+
+    def closestPoint(self, positions):
+        """The closest point on the surface to each position"""
+        X = numpy.atleast_2d(numpy.asarray(positions, dtype=numpy.float64))
+        c, M, s = self._frame(len(X))
+        return toWorld(self._closest(toLocal(X, c, M), s), c, M)
+
+    def intersect(self, origins, directions):
+        """The distance along each ray to its first hit, inf if it misses
+
+        Distances are in units of the direction vectors' lengths, so the
+        hits are at origins + t * directions."""
+        O = numpy.atleast_2d(numpy.asarray(origins, dtype=numpy.float64))
+        D = numpy.atleast_2d(numpy.asarray(directions, dtype=numpy.float64))
+        c, M, s = self._frame(len(O))
+        return intersectLocal(self.__class__, O, D, c, M, s)
+
+    @staticmethod
+    def boundingRadius(size):
+        """The radius, around the centroid, enclosing shapes of each size"""
+        raise NotImplementedError()
+
+    # Local frame queries, vectorized over (N, 3) arrays of positions and
+    # sizes. _intersect takes unit directions; by default it sphere traces
+    # _sdf, which only Torus, having no closed form, relies on.
+    @staticmethod
+    def _sdf(p, size):
+        raise NotImplementedError()
+
+    @staticmethod
+    def _closest(p, size):
+        raise NotImplementedError()
+
+    @classmethod
+    def _intersect(cls, o, d, size):
+        return _march(cls._sdf, o, d, size)
 
 # Face types
 class Polygon(Face):
     """An individual Polygon. May be open (i.e. a curve) or closed (i.e. a face)."""
-    def __init__(self, arg):
-        super(Polygon, self).__init__()
-        self.arg = arg
-
-class NURBScurve(Face):
-    """docstring for NURBScurve"""
-    def __init__(self, arg):
-        super(NURBScurve, self).__init__()
-        self.arg = arg
-
-class BezierCurve(Face):
-    """docstring for BezierCurve"""
-    def __init__(self, arg):
-        super(BezierCurve, self).__init__()
-        self.arg = arg
+    __slots__ = ()
+
+class Curve(Face):
+    """Base class for spline curves, whose vertices are control vertices
+
+    See geo.spline for how curves are evaluated."""
+    __slots__ = ()
+
+    @property
+    def order(self):
+        attr = self.geometry.findAttrib(AttribClass.Prim, 'order')
+        return 4 if attr is None else attr.element(self.number)[0]
+
+    @order.setter
+    def order(self, value):
+        attr = _order_attrib(self.geometry)
+        attr[2*self.number] = int(value)
+
+    @property
+    def knots(self):
+        from . import spline
+        return spline.knotVector(self.__class__, self.numVertices, self.order, self.closed)[0]
+
+    def evaluate(self, u):
+        """Return the (positions, tangents) at the normalized parameters u"""
+        from . import spline
+        samples = spline.evaluateCurves(self.geometry, [self.number], u)
+        return spline.CurveSamples(*(a[0] for a in samples))
+
+class NURBScurve(Curve):
+    """A non uniform rational B-spline curve, with uniform knots"""
+    __slots__ = ()
+
+class BezierCurve(Curve):
+    """A curve of rational Bezier segments, each sharing its end CVs"""
+    __slots__ = ()
 
 # Surface types
 class Mesh(Surface):
-    """A Mesh is a square surface composed exclusively of four sided polygon faces."""
-    def __init__(self, arg):
-        super(Mesh, self).__init__()
-        self.arg = arg
-
-class NURBSpatch(Surface):
-    """docstring for NURBSpatch"""
-    def __init__(self, arg):
-        super(NURBSpatch, self).__init__()
-        self.arg = arg
-
-class BezierPatch(object):
-    """docstring for BezierPatch"""
-    def __init__(self, arg):
-        super(BezierPatch, self).__init__()
-        self.arg = arg
-        
+    """A Mesh is a square surface composed exclusively of four sided polygon faces.
+
+    Its faces are the quads between neighbouring vertices of its grid; see
+    geo.subdivide for its subdivision surface."""
+    __slots__ = ()
+
+class Patch(Surface):
+    """Base class for spline patches, whose vertices are a grid of control
+    vertices, in rows along v
+
+    See geo.spline for how patches are evaluated."""
+    __slots__ = ()
+
+    @property
+    def order(self):
+        attr = self.geometry.findAttrib(AttribClass.Prim, 'order')
+        return (4, 4) if attr is None else attr.element(self.number)
+
+    @order.setter
+    def order(self, value):
+        _order_attrib(self.geometry).setElement(self.number, [int(v) for v in value])
+
+    @property
+    def knots(self):
+        """The (u, v) knot vectors"""
+        from . import spline
+        return tuple(spline.knotVector(self.__class__, n, order)[0]
+                     for n, order in zip(self.gridSize, self.order))
+
+    def evaluate(self, u, v):
+        """Return the (positions, du, dv, normals) over the grid of
+        normalized parameters (u, v), each of shape (len(v), len(u), 3)"""
+        from . import spline
+        samples = spline.evaluatePatches(self.geometry, [self.number], u, v)
+        return spline.SurfaceSamples(*(a[0] for a in samples))
+
+class NURBSpatch(Patch):
+    """A non uniform rational B-spline patch, with uniform knots"""
+    __slots__ = ()
+
+class BezierPatch(Patch):
+    """A patch of rational Bezier segments, each sharing its edge CVs"""
+    __slots__ = ()
+
 # Volume types
 class MVolume(Volume):
-    """docstring for MVolume"""
-    def __init__(self, centroid):
-        super(MVolume, self).__init__(centroid)
-        self.arg = arg
+    """A native Merlin volume: a sparse VoxelGrid (see geo.volume) whose
+    origin is the primitive's single point"""
+    __slots__ = ()
+
+    @property
+    def origin(self):
+        return self.points[0]
+
+    @property
+    def grid(self):
+        return self.geometry._volumeGrid(self.number)
+
+    @grid.setter
+    def grid(self, value):
+        self.geometry._setVolumeGrid(self.number, value)
+
+    def _local(self, positions):
+        X = numpy.atleast_2d(numpy.asarray(positions, dtype=numpy.float64))
+        return X - numpy.asarray(self.origin.position, dtype=numpy.float64)
+
+    def sample(self, positions):
+        """Trilinearly sample the volume at world positions"""
+        return self.grid.sample(self._local(positions))
+
+    def gradient(self, positions):
+        return self.grid.gradient(self._local(positions))
 
 # Quadratic types
 class Plane(Quadratic):
-    """Defines a flat Plane. It is always infinite."""
-    def __init__(self, point, direction):
-        super(Plane, self).__init__(point)
-        self.direction = direction
+    """Defines a flat Plane. It is always infinite.
+
+    The plane passes through the centroid with the local Y axis as its
+    normal, and the half space below it is inside. It ignores size."""
+    __slots__ = ()
+
+    @staticmethod
+    def boundingRadius(size):
+        return numpy.full(len(size), numpy.inf)
+
+    @staticmethod
+    def _sdf(p, size):
+        return p[:, 1].copy()
+
+    @staticmethod
+    def _closest(p, size):
+        q = p.copy()
+        q[:, 1] = 0.0
+        return q
+
+    @classmethod
+    def _intersect(cls, o, d, size):
+        with numpy.errstate(divide='ignore', invalid='ignore'):
+            t = -o[:, 1] / d[:, 1]
+        return numpy.where(t >= 0.0, t, numpy.inf)
 
 class Circle(Quadratic):
-    """docstring for Circle"""
-    def __init__(self, point, direction, x, y):
-        super(Circle, self).__init__(point)
-        self.direction = direction
-        self.xradius = x
-        self.yradius = y
+    """A flat disk in the local XZ plane, of radius size[0]
+
+    Having no inside, its signed distance is never negative."""
+    __slots__ = ()
+
+    @staticmethod
+    def boundingRadius(size):
+        return size[:, 0].copy()
+
+    @staticmethod
+    def _closest(p, size):
+        radial = numpy.hypot(p[:, 0], p[:, 2])
+        with numpy.errstate(divide='ignore', invalid='ignore'):
+            scale = numpy.where(radial > 0.0, numpy.minimum(radial, size[:, 0]) / radial, 0.0)
+        return numpy.column_stack((p[:, 0] * scale, numpy.zeros(len(p)), p[:, 2] * scale))
+
+    @classmethod
+    def _sdf(cls, p, size):
+        return _length(p - cls._closest(p, size))
+
+    @classmethod
+    def _intersect(cls, o, d, size):
+        t = Plane._intersect(o, d, size)
+        with numpy.errstate(invalid='ignore'):
+            hit = o + d * t[:, None]
+            inside = numpy.hypot(hit[:, 0], hit[:, 2]) <= size[:, 0]
+        return numpy.where(inside, t, numpy.inf)
 
 class Sphere(Quadratic):
-    """docstring for Sphere"""
-    def __init__(self, arg):
-        super(Sphere, self).__init__()
-        self.arg = arg
+    """A sphere of radius size[0]"""
+    __slots__ = ()
+
+    @staticmethod
+    def boundingRadius(size):
+        return size[:, 0].copy()
+
+    @staticmethod
+    def _sdf(p, size):
+        return _length(p) - size[:, 0]
+
+    @staticmethod
+    def _closest(p, size):
+        return _direction(p, (0.0, 1.0, 0.0)) * size[:, :1]
+
+    @classmethod
+    def _intersect(cls, o, d, size):
+        t0, t1 = _sphereRoots(o, d, size[:, 0])
+        return _first((t0, True), (t1, True))
 
 class Tube(Quadratic):
-    """docstring for Tube"""
-    def __init__(self, arg):
-        super(Tube, self).__init__()
-        self.arg = arg
+    """A capped cylinder along the local Y axis, of radius size[0] and
+    height size[1], centred on the centroid"""
+    __slots__ = ()
+
+    @staticmethod
+    def boundingRadius(size):
+        return numpy.hypot(size[:, 0], size[:, 1] * 0.5)
+
+    @staticmethod
+    def _sdf(p, size):
+        dx = numpy.hypot(p[:, 0], p[:, 2]) - size[:, 0]
+        dy = numpy.abs(p[:, 1]) - size[:, 1] * 0.5
+        return (numpy.minimum(numpy.maximum(dx, dy), 0.0) +
+                numpy.hypot(numpy.maximum(dx, 0.0), numpy.maximum(dy, 0.0)))
+
+    @staticmethod
+    def _closest(p, size):
+        r, h = size[:, 0], size[:, 1] * 0.5
+        radial = numpy.hypot(p[:, 0], p[:, 2])
+        with numpy.errstate(divide='ignore', invalid='ignore'):
+            ux = numpy.where(radial > 0.0, p[:, 0] / radial, 1.0)
+            uz = numpy.where(radial > 0.0, p[:, 2] / radial, 0.0)
+        # The nearest point on the side, and on the nearest cap
+        side = numpy.column_stack((ux * r, numpy.clip(p[:, 1], -h, h), uz * r))
+        cr = numpy.minimum(radial, r)
+        cap = numpy.column_stack((ux * cr, numpy.where(p[:, 1] >= 0.0, h, -h), uz * cr))
+        nearer = _length(side - p) <= _length(cap - p)
+        return numpy.where(nearer[:, None], side, cap)
+
+    @classmethod
+    def _intersect(cls, o, d, size):
+        r, h = size[:, 0], size[:, 1] * 0.5
+        hits = []
+        # The infinite cylinder, cut to the height of the tube
+        for t in _cylinderRoots(o, d, r):
+            with numpy.errstate(invalid='ignore'):
+                hits.append((t, numpy.abs(o[:, 1] + d[:, 1] * t) <= h))
+        # The caps, cut to the radius of the tube
+        for y in (h, -h):
+            with numpy.errstate(divide='ignore', invalid='ignore'):
+                t = (y - o[:, 1]) / d[:, 1]
+                hits.append((t, numpy.hypot(o[:, 0] + d[:, 0] * t, o[:, 2] + d[:, 2] * t) <= r))
+        return _first(*hits)
 
-# TODO: may simply merge Capsule type into Tube type.
 class Capsule(Quadratic):
     """A Capsule is a Tube with two hemispheres at it's ends. It is frequently useful
-for collision proxy geometry."""
-    def __init__(self, arg):
-        super(Capsule, self).__init__()
-        self.arg = arg
+for collision proxy geometry.
+
+    Its axis is a segment of length size[1] along the local Y axis, and its
+    radius is size[0]."""
+    __slots__ = ()
+
+    @staticmethod
+    def boundingRadius(size):
+        return size[:, 0] + size[:, 1] * 0.5
+
+    @staticmethod
+    def _axisPoint(p, size):
+        h = size[:, 1] * 0.5
+        a = numpy.zeros_like(p)
+        a[:, 1] = numpy.clip(p[:, 1], -h, h)
+        return a
+
+    @classmethod
+    def _sdf(cls, p, size):
+        return _length(p - cls._axisPoint(p, size)) - size[:, 0]
+
+    @classmethod
+    def _closest(cls, p, size):
+        a = cls._axisPoint(p, size)
+        return a + _direction(p - a, (1.0, 0.0, 0.0)) * size[:, :1]
+
+    @classmethod
+    def _intersect(cls, o, d, size):
+        r, h = size[:, 0], size[:, 1] * 0.5
+        hits = []
+        # The cylinder between the ends of the axis
+        for t in _cylinderRoots(o, d, r):
+            with numpy.errstate(invalid='ignore'):
+                hits.append((t, numpy.abs(o[:, 1] + d[:, 1] * t) <= h))
+        # The spheres around the ends, beyond the ends
+        for y in (h, -h):
+            end = o.copy()
+            end[:, 1] -= y
+            for t in _sphereRoots(end, d, r):
+                with numpy.errstate(invalid='ignore'):
+                    hits.append((t, (end[:, 1] + d[:, 1] * t) * numpy.sign(y) >= 0.0))
+        return _first(*hits)
 
 class Box(Quadratic):
     """Although a Box shape can easily be created with polygons, it is sometimes
 helpful for a primitive to have the explicit identity of a box. For instance, when
-setting up proxy collision geometry or when doing CSG modeling."""
-    def __init__(self, arg):
-        super(Box, self).__init__()
-        self.arg = arg
+setting up proxy collision geometry or when doing CSG modeling.
+
+    size holds the box's full extents along the local axes."""
+    __slots__ = ()
+
+    @staticmethod
+    def boundingRadius(size):
+        return _length(size) * 0.5
+
+    @staticmethod
+    def _sdf(p, size):
+        q = numpy.abs(p) - size * 0.5
+        return _length(numpy.maximum(q, 0.0)) + numpy.minimum(q.max(axis=1), 0.0)
+
+    @staticmethod
+    def _closest(p, size):
+        half = size * 0.5
+        q = numpy.abs(p) - half
+        outside = numpy.clip(p, -half, half)
+        # Inside, move to the nearest face
+        axis = numpy.argmax(q, axis=1)
+        rows = numpy.arange(len(p))
+        inside = p.copy()
+        inside[rows, axis] = numpy.where(p[rows, axis] >= 0.0, 1.0, -1.0) * half[rows, axis]
+        return numpy.where((q > 0.0).any(axis=1)[:, None], outside, inside)
+
+    @classmethod
+    def _intersect(cls, o, d, size):
+        half = size * 0.5
+        with numpy.errstate(divide='ignore', invalid='ignore'):
+            t0 = (-half - o) / d
+            t1 = (half - o) / d
+        tnear = numpy.nanmax(numpy.minimum(t0, t1), axis=1)
+        tfar = numpy.nanmin(numpy.maximum(t0, t1), axis=1)
+        t = numpy.where(tnear >= 0.0, tnear, tfar)
+        return numpy.where((tnear <= tfar) & (t >= 0.0), t, numpy.inf)
 
 class Torus(Quadratic):
     """Although not generally considered a quadratic primitive, tori can be
-defined by just a parametric equation."""
-    def __init__(self, arg):
-        super(Torus, self).__init__()
-        self.arg = arg
-        
\ No newline at end of file
+defined by just a parametric equation.
+
+    The torus lies in the local XZ plane, with a major radius of size[0]
+    and a minor radius of size[1]. Rays are sphere traced against its
+    signed distance, a quartic having no convenient closed form."""
+    __slots__ = ()
+
+    @staticmethod
+    def boundingRadius(size):
+        return size[:, 0] + size[:, 1]
+
+    @staticmethod
+    def _ringPoint(p, size):
+        radial = numpy.hypot(p[:, 0], p[:, 2])
+        with numpy.errstate(divide='ignore', invalid='ignore'):
+            ux = numpy.where(radial > 0.0, p[:, 0] / radial, 1.0)
+            uz = numpy.where(radial > 0.0, p[:, 2] / radial, 0.0)
+        R = size[:, 0]
+        return numpy.column_stack((ux * R, numpy.zeros(len(p)), uz * R))
+
+    @classmethod
+    def _sdf(cls, p, size):
+        return _length(p - cls._ringPoint(p, size)) - size[:, 1]
+
+    @classmethod
+    def _closest(cls, p, size):
+        c = cls._ringPoint(p, size)
+        return c + _direction(p - c, (0.0, 1.0, 0.0)) * size[:, 1:2]
+
+def _dot(a, b):
+    return numpy.einsum('ij,ij->i', a, b)
+
+def _length(v):
+    return numpy.sqrt(_dot(v, v))
+
+def _sphereRoots(o, d, r):
+    """The two distances along unit rays to a sphere of radius r around the
+    origin, nan for misses"""
+    b = _dot(o, d)
+    disc = b * b - (_dot(o, o) - r * r)
+    with numpy.errstate(invalid='ignore'):
+        root = numpy.sqrt(disc)
+    return -b - root, -b + root
+
+def _cylinderRoots(o, d, r):
+    """The two distances along rays to an infinite cylinder of radius r
+    around the Y axis, nan for misses and rays parallel to it"""
+    a = d[:, 0] ** 2 + d[:, 2] ** 2
+    b = o[:, 0] * d[:, 0] + o[:, 2] * d[:, 2]
+    disc = b * b - a * (o[:, 0] ** 2 + o[:, 2] ** 2 - r * r)
+    with numpy.errstate(divide='ignore', invalid='ignore'):
+        root = numpy.sqrt(disc)
+        return (-b - root) / a, (-b + root) / a
+
+def _first(*hits):
+    """The smallest of (distances, valid) candidates that is valid and not
+    behind the ray, inf if there is none"""
+    t = numpy.inf
+    for distance, valid in hits:
+        with numpy.errstate(invalid='ignore'):
+            t = numpy.where(valid & (distance >= 0.0), numpy.minimum(t, distance), t)
+    return t
+
+def _direction(v, fallback):
+    """Normalize the rows of v, replacing zero rows by fallback"""
+    length = _length(v)
+    with numpy.errstate(divide='ignore', invalid='ignore'):
+        u = v / length[:, None]
+    return numpy.where((length > 0.0)[:, None], u, numpy.asarray(fallback))
+
+def toLocal(positions, centroids, transforms):
+    """Take world positions into the local frames of quadratic primitives"""
+    return numpy.einsum('ni,nki->nk', positions - centroids, transforms)
+
+def toWorld(positions, centroids, transforms):
+    return numpy.einsum('nk,nki->ni', positions, transforms) + centroids
+
+def intersectLocal(cls, origins, directions, centroids, transforms, sizes):
+    """Intersect world space rays with quadratic primitives of type cls"""
+    length = _length(directions)
+    o = toLocal(origins, centroids, transforms)
+    with numpy.errstate(divide='ignore', invalid='ignore'):
+        d = numpy.einsum('ni,nki->nk', directions, transforms) / length[:, None]
+        return cls._intersect(o, d, sizes) / length
+
+def _order_attrib(geometry):
+    """Return the "order" primitive attribute for writing, adding it if
+    needed"""
+    if geometry.findAttrib(AttribClass.Prim, 'order') is None:
+        return geometry.addAttrib(AttribClass.Prim, 'order', (4, 4))
+    return geometry.writableAttrib(AttribClass.Prim, 'order')
+
+def _march(sdf, o, d, size, steps=256, eps=1e-7):
+    """Sphere trace unit rays against a distance function, returning the
+    distance to the first surface crossing (inf for misses)"""
+    t = numpy.zeros(len(o))
+    hit = numpy.zeros(len(o), dtype=bool)
+    active = numpy.ones(len(o), dtype=bool)
+    # Beyond this the ray has left the shape's bounding sphere for good
+    limit = _length(o) + numpy.abs(_dot(o, d)) + numpy.max(size, axis=1) * 4.0
+    for _ in range(steps):
+        i = numpy.nonzero(active)[0]
+        if not len(i):
+            break
+        dist = numpy.abs(sdf(o[i] + d[i] * t[i, None], size[i]))
+        done = dist <= eps * (1.0 + t[i])
+        hit[i[done]] = True
+        t[i] += dist
+        active[i[done | (t[i] > limit[i])]] = False
+    return numpy.where(hit, t, numpy.inf)
+
+# Packed types
+class PackedGeometry(Primitive):
+    """An instance of another detail, its source, shared by every instance
+of it (see Geometry.createPackedPrims and geo.packed).
+
+Like a quadratic primitive it has a single vertex, whose point is its
+translation, and a "transform" attribute holding the rest of its
+transform: world = local * transform + position."""
+    __slots__ = ()
+
+    @property
+    def source(self):
+        """The instanced detail, which must be treated as read only"""
+        return self.geometry._sources[self.attribValue('packedsource')]
+
+    @property
+    def transform(self):
+        """The full transform of the instance, as a Mat4"""
+        from . import packed
+        return Mat4(packed.instanceTransforms(self.geometry, [self.number])[0].ravel())
+
+    @property
+    def bounds(self):
+        """The (lo, hi) corners of the world bounding box of the instance"""
+        from . import packed
+        lo, hi = packed.packedBounds(self.geometry, [self.number])
+        return tuple(lo[0]), tuple(hi[0])
+
+    def unpack(self):
+        """Return a new detail holding the instance's transformed geometry"""
+        from . import packed
+        return packed.unpack(self.geometry, [self.number])
+
+# The position of a class in this tuple is the type id stored in a detail.
+# New primitive types must only ever be appended, never inserted.
+prim_types = (Polygon, NURBScurve, BezierCurve, Mesh, NURBSpatch, BezierPatch,
+              MVolume, Plane, Circle, Sphere, Tube, Capsule, Box, Torus, PackedGeometry)
+
+for _i, _cls in enumerate(prim_types):
+    _cls.typeid = _i
+del _i, _cls
@@ -0,0 +1,258 @@
+"""Moving attribute values between element classes, and interpolating them.
+
+Promotion copies an attribute from one element class to another (points,
+vertices, primitives or the detail) through the connectivity: every vertex
+links its point to its primitive, so a point value reaches each of its
+vertices and primitives, and a primitive value each of its vertices and
+points. Where several source elements reach one destination element their
+values are combined with one of the Reduce methods.
+
+Every combination is a segmented reduction over (source, destination)
+index pairs taken straight from the connectivity arrays: sums and averages
+are bincounts, the other methods reductions over the pairs sorted by
+destination. Nothing loops over elements in Python.
+
+Interpolation evaluates point or vertex attributes at locations on
+primitives, either from the barycentric coordinates of triangle hits (see
+bvh), or from primitive parameters (see primUV)."""
+
+from __future__ import absolute_import
+
+import numpy
+
+from .attribute import AttribClass, Integer, String, _extend, _string_types
+from . import prim
+from . import spline
+
+class Reduce(object):
+    """Enum for the ways promotion combines several values into one"""
+    Average = 0
+    Sum = 1
+    Min = 2
+    Max = 3
+    First = 4
+    Mode = 5
+
+def _values(attr):
+    """An (elements, size) numpy view of a packed attribute"""
+    if not len(attr):
+        return numpy.empty((0, attr.size), dtype=attr.code)
+    return numpy.frombuffer(attr, dtype=attr.code).reshape(-1, attr.size)
+
+def _pairs(geometry, fromclass, toclass):
+    """The (source, destination) element numbers linked by the connectivity"""
+    vp = numpy.frombuffer(geometry.vertexPoints, dtype=geometry.vertexPoints.code)
+    vprims = numpy.frombuffer(geometry.vertexPrims, dtype=geometry.vertexPrims.code)
+    vertices = numpy.arange(len(vp))
+    links = {AttribClass.Point: vp, AttribClass.Vertex: vertices, AttribClass.Prim: vprims}
+    if fromclass == AttribClass.Global:
+        count = geometry._numElements(toclass)
+        return numpy.zeros(count, dtype=numpy.int64), numpy.arange(count)
+    if toclass == AttribClass.Global:
+        count = geometry._numElements(fromclass)
+        return numpy.arange(count), numpy.zeros(count, dtype=numpy.int64)
+    return links[fromclass], links[toclass]
+
+def _groupStarts(dst):
+    """Sort pairs by destination; return (order, run starts, destinations)"""
+    if numpy.all(dst[1:] >= dst[:-1]):
+        # Vertex to primitive pairs, and all pairs to vertices, are sorted
+        order = numpy.arange(len(dst))
+    else:
+        order = numpy.argsort(dst, kind='mergesort')
+    d = dst[order]
+    starts = numpy.nonzero(numpy.concatenate(([True], d[1:] != d[:-1])))[0] if len(d) else d
+    return order, starts, d[starts]
+
+def reduceValues(values, dst, count, method=Reduce.Average, weights=None):
+    """Combine rows of values that share a destination
+
+    values is an (N, size) array and dst the destination (0 <= dst <
+    count) of each row. Returns (result, found): a (count, size) array and
+    a mask of the destinations that received any values (the other rows
+    of result are undefined). weights, one per row, weight Average and
+    Sum."""
+    values = numpy.asarray(values)
+    dst = numpy.asarray(dst, dtype=numpy.int64)
+    n, size = values.shape
+    found = numpy.bincount(dst, minlength=count)[:count] > 0
+    result = numpy.zeros((count, size), dtype=numpy.float64 if method in
+                         (Reduce.Average, Reduce.Sum) else values.dtype)
+
+    if method in (Reduce.Average, Reduce.Sum):
+        w = numpy.ones(n) if weights is None else numpy.asarray(weights, dtype=numpy.float64)
+        for c in range(size):
+            result[:, c] = numpy.bincount(dst, weights=values[:, c] * w, minlength=count)
+        if method == Reduce.Average:
+            total = numpy.bincount(dst, weights=w, minlength=count)
+            result /= numpy.where(total != 0.0, total, 1.0)[:, None]
+    elif method in (Reduce.Min, Reduce.Max, Reduce.First):
+        order, starts, groups = _groupStarts(dst)
+        if len(order):
+            v = values[order]
+            if method == Reduce.First:
+                result[groups] = v[starts]
+            else:
+                ufunc = numpy.minimum if method == Reduce.Min else numpy.maximum
+                result[groups] = ufunc.reduceat(v, starts, axis=0)
+    elif method == Reduce.Mode:
+        # Sort by destination then value, and find the longest run of
+        # equal values of each destination
+        order = numpy.lexsort([values[:, c] for c in reversed(range(size))] + [dst])
+        d, v = dst[order], values[order]
+        if len(order):
+            change = (d[1:] != d[:-1]) | numpy.any(v[1:] != v[:-1], axis=1)
+            runs = numpy.nonzero(numpy.concatenate(([True], change)))[0]
+            lengths = numpy.diff(numpy.append(runs, len(order)))
+            # The longest run of each destination; ties go to the lowest value
+            best = numpy.lexsort((numpy.arange(len(runs)), -lengths, d[runs]))
+            first = numpy.concatenate(([True], d[runs][best][1:] != d[runs][best][:-1]))
+            chosen = runs[best[first]]
+            result[d[chosen]] = values[order[chosen]]
+    else:
+        raise ValueError('Unknown reduce method {0!r}'.format(method))
+    return result, found
+
+def promoteAttrib(geometry, fromclass, toclass, name, method=Reduce.Average,
+                  newName=None, weights=None, deleteOriginal=False):
+    """Copy an attribute to another element class, combining values with
+    method where several elements meet
+
+    The new attribute (called newName, by default name) replaces any
+    attribute of that name in toclass. Elements no source element reaches
+    get the attribute's default. weights, the name of a size 1 attribute
+    of fromclass or an array with a value per element, weights Average
+    and Sum, e.g. for mass weighted averages. Integer attributes round
+    averages to the nearest integer; String attributes can only be
+    promoted with First or Mode. Returns the new attribute."""
+    if fromclass == toclass:
+        raise ValueError('Cannot promote an attribute to its own class')
+    attr = geometry.attrib(fromclass, name)
+    isstring = isinstance(attr, String)
+    if isstring and method not in (Reduce.First, Reduce.Mode):
+        raise TypeError('String attributes can only be promoted with First or Mode')
+    if isinstance(weights, _string_types):
+        weights = _values(geometry.attrib(fromclass, weights))[:, 0]
+
+    src, dst = _pairs(geometry, fromclass, toclass)
+    count = geometry._numElements(toclass)
+    values = _values(attr)[src]
+    if toclass == AttribClass.Vertex or fromclass == AttribClass.Global:
+        # Every destination has exactly one source, in order: a plain gather
+        reduced, found = values, numpy.ones(count, dtype=bool)
+    else:
+        w = None if weights is None else numpy.asarray(weights, dtype=numpy.float64)[src]
+        reduced, found = reduceValues(values, dst, count, method, w)
+
+    if isstring:
+        result = attr.__class__(None, None, attr.size, attr.default, attr.table)
+        full = numpy.tile(numpy.array(result._defaultIndices, dtype=attr.code), (count, 1))
+    else:
+        result = attr.__class__(None, None, attr.size, attr.default)
+        full = numpy.tile(numpy.array(attr.default, dtype=attr.code), (count, 1))
+    if isinstance(attr, Integer) and reduced.dtype.kind == 'f':
+        reduced = numpy.rint(reduced)
+    full[found] = reduced[found]
+    _extend(result, full)
+
+    newName = newName or name
+    if toclass == AttribClass.Point and newName == 'P' and not (attr.size == 3 and attr.code == 'd'):
+        raise ValueError('Only Float attributes of size 3 can be promoted to "P"')
+    geometry._setAttrib(toclass, newName, result)
+    if deleteOriginal:
+        geometry.destroyAttrib(fromclass, name)
+    return result
+
+# Interpolation
+def interpolate(geometry, attribclass, name, vertices, weights):
+    """Return the weighted sums of a point or vertex attribute's values
+
+    vertices and weights are (N, k) arrays: the k vertices contributing
+    to each of N locations and their weights. Point attributes are read
+    through each vertex's point. Returns an (N, size) float array."""
+    if attribclass not in (AttribClass.Point, AttribClass.Vertex):
+        raise ValueError('Only point and vertex attributes can be interpolated')
+    attr = geometry.attrib(attribclass, name)
+    if isinstance(attr, String):
+        raise TypeError('String attributes cannot be interpolated')
+    vertices = numpy.asarray(vertices, dtype=numpy.int64)
+    if attribclass == AttribClass.Point:
+        vp = numpy.frombuffer(geometry.vertexPoints, dtype=geometry.vertexPoints.code)
+        vertices = vp[vertices]
+    values = _values(attr).astype(numpy.float64)
+    return numpy.einsum('nk,nks->ns', numpy.asarray(weights, dtype=numpy.float64), values[vertices])
+
+def interpolateBarycentric(geometry, attribclass, name, vertices, u, v):
+    """Interpolate a point or vertex attribute over triangles
+
+    vertices is an (N, 3) array of vertex triples, and each value is
+    (1-u-v)*a0 + u*a1 + v*a2, matching the hits returned by the BVH."""
+    u = numpy.asarray(u, dtype=numpy.float64)
+    v = numpy.asarray(v, dtype=numpy.float64)
+    return interpolate(geometry, attribclass, name, vertices,
+                       numpy.column_stack((1.0 - u - v, u, v)))
+
+def _polygonWeights(counts, closed, u, v):
+    """The (vertex offsets, weights) within polygons at parameters (u, v)"""
+    offsets = numpy.zeros((len(u), 4), dtype=numpy.int64)
+    weights = numpy.zeros((len(u), 4))
+    tri = closed & (counts == 3)
+    quad = closed & (counts == 4)
+    line = ~closed
+    if numpy.any(closed & ~tri & ~quad):
+        raise ValueError('Closed polygons can only be interpolated if they are triangles or quads')
+    offsets[tri, :3] = (0, 1, 2)
+    weights[tri, :3] = numpy.column_stack((1.0 - u - v, u, v))[tri]
+    offsets[quad] = (0, 1, 2, 3)
+    uq, vq = u[quad], v[quad]
+    weights[quad] = numpy.column_stack(((1 - uq) * (1 - vq), uq * (1 - vq), uq * vq, (1 - uq) * vq))
+    # Open polygons are parameterized uniformly by vertex, from 0 to 1
+    segments = numpy.maximum(counts[line] - 1, 1)
+    x = numpy.clip(u[line], 0.0, 1.0) * segments
+    i = numpy.minimum(numpy.floor(x).astype(numpy.int64), segments - 1)
+    f = x - i
+    offsets[line, 0] = i
+    offsets[line, 1] = numpy.minimum(i + 1, counts[line] - 1)
+    weights[line, 0] = 1.0 - f
+    weights[line, 1] = f
+    return offsets, weights
+
+def primUV(geometry, attribclass, name, prims, u, v=0.0):
+    """Evaluate an attribute at parametric locations on primitives
+
+    prims, u and v hold one query each (u and v may be single values).
+    Point and vertex attributes are interpolated: barycentrically on
+    triangles, bilinearly on quads, linearly along open polygons (which
+    span u in [0, 1]) and with the basis functions of spline curves and
+    patches. Primitive and detail attributes are simply looked up.
+    Returns an (N, size) array."""
+    prims = numpy.asarray(prims, dtype=numpy.int64).ravel()
+    u = numpy.broadcast_to(numpy.asarray(u, dtype=numpy.float64).ravel(), prims.shape)
+    v = numpy.broadcast_to(numpy.asarray(v, dtype=numpy.float64).ravel(), prims.shape)
+    attr = geometry.attrib(attribclass, name)
+    if attribclass == AttribClass.Prim:
+        return _values(attr)[prims]
+    if attribclass == AttribClass.Global:
+        return numpy.tile(_values(attr)[0], (len(prims), 1))
+
+    starts = numpy.frombuffer(geometry.primStarts, dtype=geometry.primStarts.code)
+    types = numpy.frombuffer(geometry.primTypes, dtype=geometry.primTypes.code)[prims]
+    closed = numpy.frombuffer(geometry.primClosed, dtype=geometry.primClosed.code)[prims] != 0
+    counts = (starts[1:] - starts[:-1])[prims]
+    polygon = types == prim.Polygon.typeid
+    splines = numpy.isin(types, [t.typeid for t in prim.prim_types
+                                 if issubclass(t, (prim.Curve, prim.Patch))])
+    if not numpy.all(polygon | splines):
+        raise TypeError('Only polygons and spline primitives can be interpolated')
+
+    result = numpy.empty((len(prims), attr.size))
+    q = numpy.nonzero(polygon)[0]
+    if len(q):
+        offsets, weights = _polygonWeights(counts[q], closed[q], u[q], v[q])
+        vertices = starts[prims[q]][:, None] + offsets
+        result[q] = interpolate(geometry, attribclass, name, vertices, weights)
+    q = numpy.nonzero(splines)[0]
+    if len(q):
+        vertices, weights = spline.basisWeights(geometry, prims[q], u[q], v[q])
+        result[q] = interpolate(geometry, attribclass, name, vertices, weights)
+    return result
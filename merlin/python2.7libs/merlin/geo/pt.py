@@ -1,12 +1,79 @@
+from __future__ import absolute_import
 
+from .attribute import AttribClass
 
 class Point(object):
-	"""docstring for Point"""
-	__slots__ = ('x', 'y', 'z', 'w')
-	def __init__(self, x=0.0, y=0.0, z=0.0, w=1.0):
-		super(Point, self).__init__()
-		self.x = x
-		self.y = y
-		self.z = z
-		self.w = w
-		
\ No newline at end of file
+    """A lightweight view of a single point in a Geometry detail.
+
+    Points own no data themselves; every value is read from and written to
+    the packed attribute arrays of the detail."""
+    __slots__ = ('geometry', 'number')
+    def __init__(self, geometry, number):
+        super(Point, self).__init__()
+        self.geometry = geometry
+        self.number = number
+
+    def __repr__(self):
+        return '<{0.__class__.__name__} {0.number}>'.format(self)
+
+    def __eq__(self, other):
+        return (isinstance(other, Point) and self.geometry is other.geometry
+                and self.number == other.number)
+
+    def __ne__(self, other):
+        return not self == other
+
+    def __hash__(self):
+        return hash((id(self.geometry), self.number))
+
+    def attribValue(self, name):
+        return self.geometry.attrib(AttribClass.Point, name).element(self.number)
+
+    def setAttribValue(self, name, value):
+        self.geometry.writableAttrib(AttribClass.Point, name).setElement(self.number, value)
+
+    @property
+    def position(self):
+        return self.attribValue('P')
+
+    @position.setter
+    def position(self, value):
+        self.setAttribValue('P', value)
+
+    @property
+    def x(self):
+        return self.geometry.attrib(AttribClass.Point, 'P')[3*self.number]
+
+    @x.setter
+    def x(self, v):
+        self.geometry.writableAttrib(AttribClass.Point, 'P')[3*self.number] = v
+
+    @property
+    def y(self):
+        return self.geometry.attrib(AttribClass.Point, 'P')[3*self.number+1]
+
+    @y.setter
+    def y(self, v):
+        self.geometry.writableAttrib(AttribClass.Point, 'P')[3*self.number+1] = v
+
+    @property
+    def z(self):
+        return self.geometry.attrib(AttribClass.Point, 'P')[3*self.number+2]
+
+    @z.setter
+    def z(self, v):
+        self.geometry.writableAttrib(AttribClass.Point, 'P')[3*self.number+2] = v
+
+    @property
+    def w(self):
+        """The homogeneous weight, stored in the optional "Pw" attribute"""
+        pw = self.geometry.findAttrib(AttribClass.Point, 'Pw')
+        return 1.0 if pw is None else pw[self.number]
+
+    @w.setter
+    def w(self, v):
+        if self.geometry.findAttrib(AttribClass.Point, 'Pw') is None:
+            pw = self.geometry.addAttrib(AttribClass.Point, 'Pw', 1.0)
+        else:
+            pw = self.geometry.writableAttrib(AttribClass.Point, 'Pw')
+        pw[self.number] = v
@@ -0,0 +1,453 @@
+"""Evaluation and tessellation of NURBS and Bezier curves and patches.
+
+A spline primitive's vertices are its control vertices (CVs); a point's
+optional "Pw" attribute is its homogeneous weight. Patches store their CVs
+row by row, gridSize[1] rows (along v) of gridSize[0] columns (along u).
+The optional "order" primitive attribute holds the (u, v) order of every
+spline primitive, 4 (cubic) by default; curves only use the first.
+
+Knot vectors are implied by the type, CV count, order and closure:
+
+* NURBS curves and patches use uniform knots, clamped at the ends of open
+  curves and periodic (wrapping the first order-1 CVs) for closed ones.
+* Bezier curves and patches are runs of segments of order CVs, each
+  sharing its last CV with the next segment, so an open Bezier curve has
+  1 + n*(order-1) CVs. A closed one wraps back to its first CV.
+
+Parameters are normalized: every primitive spans [0, 1] in u (and v)
+whatever its knots, and derivatives are taken with respect to those
+normalized parameters.
+
+Evaluation is vectorized over primitives as well as parameters. Primitives
+with the same type, CV count, order and closure share a knot vector, so
+they are evaluated together: the basis functions at the requested
+parameters form a dense (samples, CVs) matrix, and evaluating every
+primitive of the group is a single matrix product. Basis matrices are
+cached per (knot vector, degree, parameters), so resampling the same
+curves every frame, or tessellating them again to the same parameters,
+only repeats that product."""
+
+from __future__ import absolute_import
+
+import collections
+from array import array
+
+import numpy
+
+from .attribute import AttribClass
+from . import prim
+
+CurveSamples = collections.namedtuple('CurveSamples', ['position', 'tangent'])
+SurfaceSamples = collections.namedtuple('SurfaceSamples', ['position', 'du', 'dv', 'normal'])
+
+defaultOrder = (4, 4)
+
+_basis_cache = dict()
+# The cache is cleared whenever it grows beyond this many entries
+basisCacheSize = 512
+
+def knotVector(cls, count, order, closed=False):
+    """Return (knots, degree, cvs) for a spline of class cls with count CVs
+
+    cvs holds, in order, the CV numbers the knots apply to: closed curves
+    repeat their first CVs at the end."""
+    if count < 2:
+        raise ValueError('A spline needs at least two CVs.')
+    order = int(order)
+    if order < 2:
+        raise ValueError('A spline must have an order of at least two.')
+    if issubclass(cls, (prim.BezierCurve, prim.BezierPatch)):
+        cvs = numpy.arange(count + 1 if closed else count) % count
+        segments, extra = divmod(len(cvs) - 1, order - 1)
+        if extra:
+            raise ValueError('A {0} Bezier spline of order {1} cannot have {2} CVs.'.format(
+                'closed' if closed else 'open', order, count))
+        knots = numpy.concatenate(([0.0], numpy.repeat(numpy.arange(segments + 1.0), order - 1),
+                                   [float(segments)]))
+    elif closed:
+        order = min(order, count + 1)
+        cvs = numpy.arange(count + order - 1) % count
+        knots = numpy.arange(len(cvs) + order, dtype=numpy.float64)
+    else:
+        order = min(order, count)
+        knots = numpy.concatenate((numpy.zeros(order - 1), numpy.arange(count - order + 2.0),
+                                   numpy.full(order - 1, count - order + 1.0)))
+        cvs = numpy.arange(count)
+    return knots, order - 1, cvs
+
+def _basis(knots, degree, u):
+    """The basis functions, and their derivatives, of every CV at the
+    normalized parameters u, as two dense (len(u), CVs) matrices"""
+    p = degree
+    count = len(knots) - p - 1
+    lo, hi = knots[p], knots[count]
+    x = lo + numpy.clip(u, 0.0, 1.0) * (hi - lo)
+    span = numpy.clip(numpy.searchsorted(knots, x, side='right') - 1, p, count - 1)
+
+    # Cox-de Boor, building up the p+1 non zero functions of each span
+    m = len(x)
+    N = numpy.zeros((m, p + 1))
+    N[:, 0] = 1.0
+    left = numpy.empty((m, p + 1))
+    right = numpy.empty((m, p + 1))
+    lower = N[:, :1].copy()
+    for j in range(1, p + 1):
+        if j == p:
+            lower = N[:, :p].copy()
+        left[:, j] = x - knots[span + 1 - j]
+        right[:, j] = knots[span + j] - x
+        saved = numpy.zeros(m)
+        for r in range(j):
+            temp = N[:, r] / (right[:, r + 1] + left[:, j - r])
+            N[:, r] = saved + right[:, r + 1] * temp
+            saved = left[:, j - r] * temp
+        N[:, j] = saved
+
+    # N'(i,p) = p * (N(i,p-1) / (k[i+p] - k[i]) - N(i+1,p-1) / (k[i+p+1] - k[i+1]))
+    dN = numpy.zeros((m, p + 1))
+    if p:
+        padded = numpy.zeros((m, p + 2))
+        padded[:, 1:-1] = lower
+        r = numpy.arange(p + 1)
+        i = span[:, None] - p + r
+        for a, b, sign, column in ((knots[i + p], knots[i], 1.0, padded[:, :-1]),
+                                   (knots[i + p + 1], knots[i + 1], -1.0, padded[:, 1:])):
+            width = a - b
+            dN += sign * p * numpy.where(width > 0.0, column / numpy.where(width > 0.0, width, 1.0), 0.0)
+        dN *= hi - lo
+
+    rows = numpy.repeat(numpy.arange(m), p + 1)
+    cols = (span[:, None] - p + numpy.arange(p + 1)).ravel()
+    B = numpy.zeros((m, count))
+    dB = numpy.zeros((m, count))
+    B[rows, cols] = N.ravel()
+    dB[rows, cols] = dN.ravel()
+    return B, dB
+
+def basis(knots, degree, u):
+    """Return the cached (basis, derivative) matrices of a knot vector and
+    degree at the normalized parameters u (see _basis)"""
+    knots = numpy.ascontiguousarray(knots, dtype=numpy.float64)
+    u = numpy.ascontiguousarray(u, dtype=numpy.float64).ravel()
+    key = (knots.tobytes(), int(degree), u.tobytes())
+    cached = _basis_cache.get(key)
+    if cached is None:
+        if len(_basis_cache) >= basisCacheSize:
+            _basis_cache.clear()
+        cached = _basis(knots, int(degree), u)
+        for matrix in cached:
+            matrix.flags.writeable = False
+        _basis_cache[key] = cached
+    return cached
+
+def clearBasisCache():
+    _basis_cache.clear()
+
+def _view(attr):
+    return numpy.frombuffer(attr, dtype=attr.code)
+
+def _prim_data(geometry, prims, cls):
+    """Return the (types, starts, counts, closed, orders, grids) of prims"""
+    starts = _view(geometry.primStarts)
+    types = _view(geometry.primTypes)[prims]
+    if not numpy.all(numpy.isin(types, [t.typeid for t in prim.prim_types if issubclass(t, cls)])):
+        raise TypeError('Only {0} primitives can be evaluated here.'.format(cls.__name__))
+    counts = (starts[1:] - starts[:-1])[prims]
+    closed = _view(geometry.primClosed)[prims] != 0
+    attr = geometry.findAttrib(AttribClass.Prim, 'order')
+    if attr is None:
+        orders = numpy.tile(defaultOrder, (len(prims), 1))
+    else:
+        orders = _view(attr).reshape(-1, attr.size)[prims]
+    attr = geometry.findAttrib(AttribClass.Prim, 'gridSize')
+    if attr is None:
+        grids = numpy.zeros((len(prims), 2), dtype=numpy.int64)
+    else:
+        grids = _view(attr).reshape(-1, attr.size)[prims]
+    return types, starts[prims], counts, closed, orders, grids
+
+def _groups(keys):
+    """Yield (key, indices) for every distinct row of keys"""
+    if not len(keys):
+        return
+    if numpy.all(keys == keys[0]):
+        # The common case of a detail full of similar curves
+        yield keys[0], numpy.arange(len(keys))
+        return
+    unique, inverse = numpy.unique(keys, axis=0, return_inverse=True)
+    order = numpy.argsort(inverse, kind='mergesort')
+    bounds = numpy.searchsorted(inverse[order], numpy.arange(len(unique) + 1))
+    for g, key in enumerate(unique):
+        yield key, order[bounds[g]:bounds[g + 1]]
+
+def _homogeneous(geometry, starts, cvs):
+    """The (prims, CVs, 4) weighted homogeneous CVs of a group of prims"""
+    pts = _view(geometry.vertexPoints)[starts[:, None] + cvs[None, :]]
+    P = numpy.frombuffer(geometry.attrib(AttribClass.Point, 'P'), dtype=numpy.float64).reshape(-1, 3)
+    Pw = geometry.findAttrib(AttribClass.Point, 'Pw')
+    w = numpy.ones(pts.shape) if Pw is None else _view(Pw)[pts]
+    return numpy.concatenate((P[pts] * w[..., None], w[..., None]), axis=-1)
+
+def _apply(B, H, axis):
+    """Contract the basis matrix B with the CV axis of H, leaving the
+    samples in its place"""
+    return numpy.moveaxis(numpy.tensordot(B, H, axes=([1], [axis])), 0, axis)
+
+def _project(Hw, *derivatives):
+    """Positions, and derivatives, from weighted homogeneous values"""
+    w = Hw[..., 3:]
+    position = Hw[..., :3] / w
+    return (position,) + tuple((d[..., :3] - d[..., 3:] * position) / w for d in derivatives)
+
+# Curves
+def _curve_groups(geometry, prims):
+    types, starts, counts, closed, orders, _ = _prim_data(geometry, prims, prim.Curve)
+    keys = numpy.column_stack((types, counts, orders[:, 0], closed))
+    for (typeid, count, order, isclosed), sel in _groups(keys):
+        knots, degree, cvs = knotVector(prim.prim_types[typeid], count, order, bool(isclosed))
+        yield sel, bool(isclosed), knots, degree, _homogeneous(geometry, starts[sel], cvs)
+
+def _eval_curves(H, knots, degree, u):
+    B, dB = basis(knots, degree, u)
+    return _project(_apply(B, H, 1), _apply(dB, H, 1))
+
+def evaluateCurves(geometry, prims, u):
+    """Evaluate curve primitives at the normalized parameters u
+
+    Returns CurveSamples of (len(prims), len(u), 3) positions and tangents
+    (first derivatives)."""
+    prims = numpy.asarray(prims, dtype=numpy.int64).ravel()
+    u = numpy.asarray(u, dtype=numpy.float64).ravel()
+    position = numpy.empty((len(prims), len(u), 3))
+    tangent = numpy.empty((len(prims), len(u), 3))
+    for sel, _, knots, degree, H in _curve_groups(geometry, prims):
+        position[sel], tangent[sel] = _eval_curves(H, knots, degree, u)
+    return CurveSamples(position, tangent)
+
+def _breakpoints(knots, degree):
+    """The distinct knots within the domain, as normalized parameters"""
+    count = len(knots) - degree - 1
+    lo, hi = knots[degree], knots[count]
+    return (numpy.unique(knots[degree:count + 1]) - lo) / (hi - lo)
+
+def _refine(u, error, tolerance):
+    """Split the intervals of u whose error exceeds tolerance"""
+    split = error > tolerance
+    if not split.any():
+        return u, False
+    mids = 0.5 * (u[:-1] + u[1:])[split]
+    return numpy.sort(numpy.concatenate((u, mids))), True
+
+def _initial(knots, degree):
+    u = _breakpoints(knots, degree)
+    # Start from degree samples per span, enough to see most of its shape
+    steps = numpy.linspace(0.0, 1.0, degree + 1)[:-1]
+    return numpy.append((u[:-1, None] + (u[1:] - u[:-1])[:, None] * steps).ravel(), 1.0)
+
+def _curve_params(H, knots, degree, tolerance, maxDepth):
+    """Refine a parameter set shared by a group of curves until no chord
+    deviates from its curve by more than tolerance"""
+    u = _initial(knots, degree)
+    if degree < 2 and numpy.all(H[..., 3] == H[:1, :1, 3]):
+        return u
+    for _ in range(maxDepth):
+        P = _eval_curves(H, knots, degree, u)[0]
+        mids = _eval_curves(H, knots, degree, 0.5 * (u[:-1] + u[1:]))[0]
+        error = numpy.linalg.norm(mids - 0.5 * (P[:, :-1] + P[:, 1:]), axis=-1).max(axis=0)
+        u, refined = _refine(u, error, tolerance)
+        if not refined:
+            break
+    return u
+
+def _packed(positions):
+    return array('d', numpy.ascontiguousarray(positions, dtype=numpy.float64).tobytes())
+
+def _emit_curves(out, prims, positions, closed, source):
+    """Add a polygon per curve to out, dropping the repeated last sample
+    of closed curves"""
+    if closed:
+        positions = positions[:, :-1]
+    n, m = positions.shape[:2]
+    start = out.createPoints(_packed(positions))[0]
+    out.createPrims(prim.Polygon, [m] * n, (start + numpy.arange(n * m)).tolist(), closed)
+    source.append(prims)
+
+def resampleCurves(geometry, samples, prims=None):
+    """Return a new detail with every curve (or each of prims) resampled to
+    polygons of samples points evenly spaced in parameter
+
+    Closed curves give closed polygons of samples points. The detail's
+    "sourceprim" primitive attribute holds the curve each polygon came
+    from."""
+    from .detail import Geometry
+    prims = _spline_prims(geometry, prims, prim.Curve)
+    out = Geometry()
+    source = []
+    for sel, closed, knots, degree, H in _curve_groups(geometry, prims):
+        u = numpy.linspace(0.0, 1.0, samples + 1 if closed else samples)
+        _emit_curves(out, prims[sel], _eval_curves(H, knots, degree, u)[0], closed, source)
+    _set_source(out, source)
+    return out
+
+# Patches
+def _patch_groups(geometry, prims):
+    types, starts, counts, _, orders, grids = _prim_data(geometry, prims, prim.Patch)
+    if numpy.any(grids[:, 0] * grids[:, 1] != counts) or numpy.any(grids < 2):
+        raise ValueError('Patches need a "gridSize" of at least 2x2 matching their CV count.')
+    keys = numpy.column_stack((types, grids, orders))
+    for (typeid, cols, rows, uorder, vorder), sel in _groups(keys):
+        cls = prim.prim_types[typeid]
+        ku, pu, cu = knotVector(cls, cols, uorder)
+        kv, pv, cv = knotVector(cls, rows, vorder)
+        H = _homogeneous(geometry, starts[sel], (cv[:, None] * cols + cu[None, :]).ravel())
+        yield sel, (ku, pu), (kv, pv), H.reshape(len(sel), len(cv), len(cu), 4)
+
+def _eval_patches(H, ubasis, vbasis, u, v, derivatives=True):
+    Bu, dBu = basis(ubasis[0], ubasis[1], u)
+    Bv, dBv = basis(vbasis[0], vbasis[1], v)
+    T = _apply(Bu, H, 2)
+    if not derivatives:
+        return _project(_apply(Bv, T, 1))
+    return _project(_apply(Bv, T, 1), _apply(Bv, _apply(dBu, H, 2), 1), _apply(dBv, T, 1))
+
+def evaluatePatches(geometry, prims, u, v):
+    """Evaluate patch primitives over the grid of normalized parameters
+    (u, v)
+
+    Returns SurfaceSamples of (len(prims), len(v), len(u), 3) arrays: the
+    positions, partial derivatives and unit normals. Like the CVs, samples
+    are in rows along v."""
+    prims = numpy.asarray(prims, dtype=numpy.int64).ravel()
+    u = numpy.asarray(u, dtype=numpy.float64).ravel()
+    v = numpy.asarray(v, dtype=numpy.float64).ravel()
+    shape = (len(prims), len(v), len(u), 3)
+    position, du, dv = numpy.empty(shape), numpy.empty(shape), numpy.empty(shape)
+    for sel, ubasis, vbasis, H in _patch_groups(geometry, prims):
+        position[sel], du[sel], dv[sel] = _eval_patches(H, ubasis, vbasis, u, v)
+    normal = numpy.cross(du, dv)
+    length = numpy.linalg.norm(normal, axis=-1)[..., None]
+    normal /= numpy.where(length > 0.0, length, 1.0)
+    return SurfaceSamples(position, du, dv, normal)
+
+def _patch_params(H, ubasis, vbasis, tolerance, maxDepth):
+    """Refine the u and v parameter sets shared by a group of patches until
+    no grid edge deviates from its patch by more than tolerance"""
+    u = _initial(*ubasis)
+    v = _initial(*vbasis)
+    for _ in range(maxDepth):
+        S = _eval_patches(H, ubasis, vbasis, u, v, False)[0]
+        umids = _eval_patches(H, ubasis, vbasis, 0.5 * (u[:-1] + u[1:]), v, False)[0]
+        vmids = _eval_patches(H, ubasis, vbasis, u, 0.5 * (v[:-1] + v[1:]), False)[0]
+        uerror = numpy.linalg.norm(umids - 0.5 * (S[:, :, :-1] + S[:, :, 1:]), axis=-1)
+        verror = numpy.linalg.norm(vmids - 0.5 * (S[:, :-1] + S[:, 1:]), axis=-1)
+        u, urefined = _refine(u, uerror.max(axis=(0, 1)), tolerance)
+        v, vrefined = _refine(v, verror.max(axis=(0, 2)), tolerance)
+        if not (urefined or vrefined):
+            break
+    return u, v
+
+def _emit_patches(out, prims, positions, source):
+    """Add a grid of quads per patch to out"""
+    n, rows, cols = positions.shape[:3]
+    start = out.createPoints(_packed(positions))[0]
+    r, c = numpy.meshgrid(numpy.arange(rows - 1), numpy.arange(cols - 1), indexing='ij')
+    corner = (r * cols + c).ravel()
+    quad = numpy.column_stack((corner, corner + 1, corner + cols + 1, corner + cols))
+    points = start + (numpy.arange(n)[:, None, None] * rows * cols + quad).ravel()
+    out.createPrims(prim.Polygon, [4] * (n * len(quad)), points.tolist())
+    source.append(numpy.repeat(prims, len(quad)))
+
+# Interpolation
+def _cv_weights(geometry, starts, cvs, count, B):
+    """Fold a basis matrix over the CVs of a group of prims (wrapped CVs
+    repeat earlier ones) into normalized rational weights per vertex"""
+    fold = numpy.zeros((len(cvs), count))
+    fold[numpy.arange(len(cvs)), cvs] = 1.0
+    W = B.dot(fold)
+    Pw = geometry.findAttrib(AttribClass.Point, 'Pw')
+    if Pw is not None:
+        pts = _view(geometry.vertexPoints)[starts[:, None] + numpy.arange(count)]
+        W *= _view(Pw)[pts]
+        W /= W.sum(axis=1)[:, None]
+    return W
+
+def basisWeights(geometry, prims, u, v=None):
+    """Return (vertices, weights) interpolating spline primitives at
+    per query parameters
+
+    prims, u (and, for patches, v) hold one query each. For every query,
+    the rows of the two (queries, K) arrays give the vertices of its
+    primitive and their rational basis weights, which sum to one; rows of
+    primitives with fewer than K CVs are padded with zero weights. An
+    attribute's value at a query is the weighted sum of its vertex (or
+    point) values."""
+    prims = numpy.asarray(prims, dtype=numpy.int64).ravel()
+    u = numpy.broadcast_to(numpy.asarray(u, dtype=numpy.float64).ravel(), prims.shape)
+    v = numpy.broadcast_to(numpy.asarray(0.0 if v is None else v, dtype=numpy.float64).ravel(),
+                           prims.shape)
+    types, starts, counts, closed, orders, grids = _prim_data(geometry, prims, prim.Primitive)
+    curve = numpy.isin(types, [t.typeid for t in prim.prim_types if issubclass(t, prim.Curve)])
+    patch = numpy.isin(types, [t.typeid for t in prim.prim_types if issubclass(t, prim.Patch)])
+    if not numpy.all(curve | patch):
+        raise TypeError('Only spline primitives have basis weights.')
+    width = int(counts.max()) if len(counts) else 0
+    weights = numpy.zeros((len(prims), width))
+    keys = numpy.column_stack((types, counts, orders, closed & curve, grids * patch[:, None]))
+    for key, sel in _groups(keys):
+        typeid, count, uorder, vorder, isclosed, cols, rows = [int(k) for k in key]
+        cls = prim.prim_types[typeid]
+        if issubclass(cls, prim.Curve):
+            knots, degree, cvs = knotVector(cls, count, uorder, bool(isclosed))
+            B = _basis(knots, degree, u[sel])[0]
+        else:
+            if cols * rows != count or min(cols, rows) < 2:
+                raise ValueError('Patches need a "gridSize" of at least 2x2 matching their CV count.')
+            ku, pu, cu = knotVector(cls, cols, uorder)
+            kv, pv, cv = knotVector(cls, rows, vorder)
+            Bu = _basis(ku, pu, u[sel])[0]
+            Bv = _basis(kv, pv, v[sel])[0]
+            B = (Bv[:, :, None] * Bu[:, None, :]).reshape(len(sel), -1)
+            cvs = (cv[:, None] * cols + cu[None, :]).ravel()
+        weights[sel, :count] = _cv_weights(geometry, starts[sel], cvs, count, B)
+    vertices = numpy.minimum(starts[:, None] + numpy.arange(width), starts[:, None] + counts[:, None] - 1)
+    return vertices, weights
+
+# Tessellation
+def _spline_prims(geometry, prims, cls):
+    """The primitives of class cls, among prims if given"""
+    if prims is None:
+        prims = numpy.arange(geometry.numPrims)
+    prims = numpy.asarray(prims, dtype=numpy.int64).ravel()
+    ids = [t.typeid for t in prim.prim_types if issubclass(t, cls)]
+    return prims[numpy.isin(_view(geometry.primTypes)[prims], ids)]
+
+def _set_source(out, source):
+    """Add the "sourceprim" attribute, source holding the source prims of
+    the new polygons in the order they were created"""
+    attr = out.addAttrib(AttribClass.Prim, 'sourceprim', -1)
+    if source:
+        attr[:] = type(attr)(numpy.concatenate(source).tolist())
+
+def tessellate(geometry, tolerance=0.01, prims=None, maxDepth=12):
+    """Return a new detail with every spline primitive (or each of prims)
+    converted to polygons
+
+    Curves become open (or closed) polygons and patches grids of quads,
+    sampled finely enough that no edge strays more than tolerance from
+    the spline. Samples are shared by all the primitives of a group (see
+    the module docstring), so their basis matrices are reused from frame
+    to frame. The "sourceprim" primitive attribute holds the primitive
+    each polygon came from."""
+    from .detail import Geometry
+    out = Geometry()
+    source = []
+    curves = _spline_prims(geometry, prims, prim.Curve)
+    patches = _spline_prims(geometry, prims, prim.Patch)
+    for sel, closed, knots, degree, H in _curve_groups(geometry, curves):
+        u = _curve_params(H, knots, degree, tolerance, maxDepth)
+        _emit_curves(out, curves[sel], _eval_curves(H, knots, degree, u)[0], closed, source)
+    for sel, ubasis, vbasis, H in _patch_groups(geometry, patches):
+        u, v = _patch_params(H, ubasis, vbasis, tolerance, maxDepth)
+        _emit_patches(out, patches[sel], _eval_patches(H, ubasis, vbasis, u, v, False)[0], source)
+    _set_source(out, source)
+    return out
@@ -0,0 +1,273 @@
+"""Catmull-Clark subdivision surfaces.
+
+The cage of a detail's subdivision surface is made of its closed polygons
+and the quads of its Mesh primitives. Every level of Catmull-Clark
+refinement is linear in the values of the level before, so a Subdivider
+turns the topology of each level into Stencils, a sparse matrix with a row
+per refined point, once, and subdividing positions or other attributes is
+then a sparse matrix product per level. The refined topology and stencils
+only depend on the cage's topology: a detail's Subdivider is cached on it
+(see Geometry.subdivider), so a deforming character is subdivided on every
+frame at the cost of applying the stencils.
+
+The stencils of a level are kept relative to the level before rather than
+composed down to the cage: their support stays at a few points per row,
+where composed stencils grow with every level, and applying them in turn
+costs fewer operations.
+
+Refinement follows the usual rules: boundary edges are split at their
+midpoint and boundary points moved along the boundary curve, while corners
+(points of a single face), points on non manifold edges and points of no
+face keep their position. Float point attributes are refined like the
+positions, Float vertex attributes (e.g. uvs) are interpolated linearly
+over every face and primitive attributes are inherited by the faces of a
+primitive. Other attributes and primitives are not carried over."""
+
+from __future__ import absolute_import
+
+import collections
+
+import numpy
+
+from .attribute import AttribClass, Float, _extend
+from .topology import CSR
+from . import prim
+
+# The topology of a subdivision level, and the stencils giving its point
+# and vertex values from those of the level before
+Level = collections.namedtuple('Level', ['numPoints', 'primStarts', 'vertexPoints', 'parents',
+                                         'points', 'vertices'])
+
+class Stencils(CSR):
+    """A sparse matrix giving every refined value as a weighted sum of
+    numSources source values, stored as a CSR of source numbers with their
+    weights"""
+    def __init__(self, starts, items, weights, numSources):
+        super(Stencils, self).__init__(starts, items)
+        self.weights = weights
+        self.numSources = numSources
+
+    def apply(self, values):
+        """Return the refined values from an array with a row per source"""
+        values = numpy.asarray(values, dtype=numpy.float64)
+        if len(values) != self.numSources:
+            raise ValueError('Expected {0} values, got {1}'.format(self.numSources, len(values)))
+        flat = values.reshape(len(values), int(numpy.prod(values.shape[1:])))
+        result = numpy.zeros((len(self), flat.shape[1]))
+        has = numpy.nonzero(self.counts > 0)[0]
+        if len(has):
+            terms = flat[self.items] * self.weights[:, None]
+            result[has] = numpy.add.reduceat(terms, self.starts[has], axis=0)
+        return result.reshape((len(self),) + values.shape[1:])
+
+def _stencils(rows, items, weights, count, numSources):
+    """Stencils from (row, source, weight) entries, summing repeated ones"""
+    rows = numpy.concatenate(rows)
+    items = numpy.concatenate(items)
+    weights = numpy.concatenate(weights)
+    n = max(numSources, 1)
+    keys, inverse = numpy.unique(rows * n + items, return_inverse=True)
+    starts = numpy.zeros(count + 1, dtype=numpy.int64)
+    numpy.cumsum(numpy.bincount(keys // n, minlength=count), out=starts[1:])
+    return Stencils(starts, keys % n, numpy.bincount(inverse, weights=weights), numSources)
+
+def _refine(level):
+    """Catmull-Clark refine a Level, returning the next one
+
+    The refined points are the moved points of the level, then a point per
+    edge and one per face. Every corner of a face gives a quad: its point,
+    the point of the edge leaving it, the face's point and the point of
+    the edge arriving at it."""
+    N, starts, vp = level.numPoints, level.primStarts, level.vertexPoints
+    F, V = len(starts) - 1, len(vp)
+    counts = numpy.diff(starts)
+    fv = numpy.repeat(numpy.arange(F), counts)
+    faces = CSR(starts, numpy.arange(V))
+    vertices = numpy.arange(V)
+    nxt = vertices + 1
+    nxt[starts[1:] - 1] = starts[:-1]
+    prv = vertices - 1
+    prv[starts[:-1]] = starts[1:] - 1
+
+    n = max(N, 1)
+    a, b = vp, vp[nxt]
+    keys, ve = numpy.unique(numpy.minimum(a, b) * n + numpy.maximum(a, b), return_inverse=True)
+    E = len(keys)
+    e0, e1 = keys // n, keys % n
+    efaces = numpy.bincount(ve, minlength=E)
+    smooth = efaces == 2
+    rows, items, weights = [], [], []
+
+    def add(r, i, w):
+        rows.append(r)
+        items.append(i)
+        weights.append(numpy.broadcast_to(w, r.shape).astype(numpy.float64))
+
+    def addFaces(r, f, scale):
+        # scale times the average of the points of faces f, for rows r
+        fi = faces.pairs(f)[1]
+        c = counts[f]
+        add(numpy.repeat(r, c), vp[fi], numpy.repeat(scale / c, c))
+
+    # Points: interior points get (Q + 2R + (n-3)P) / n for the average Q
+    # of their face points and R of their edge midpoints
+    valence = numpy.bincount(numpy.concatenate((e0, e1)), minlength=N)
+    corners = numpy.bincount(vp, minlength=N)
+    hard = ~smooth
+    nonmanifold = numpy.bincount(numpy.concatenate((e0[efaces > 2], e1[efaces > 2])), minlength=N) > 0
+    border = numpy.bincount(numpy.concatenate((e0[hard], e1[hard])), minlength=N)
+    interior = (border == 0) & (valence == corners) & (valence >= 3) & ~nonmanifold
+    boundary = (border == 2) & (corners >= 2) & ~nonmanifold
+    fixed = numpy.nonzero(~interior & ~boundary)[0]
+    add(fixed, fixed, 1.0)
+    p = numpy.nonzero(interior)[0]
+    k = valence[p].astype(numpy.float64)
+    add(p, p, (k - 2.0) / k)
+    ends = numpy.concatenate((e0, e1))
+    others = numpy.concatenate((e1, e0))
+    inner = interior[ends]
+    k = valence[ends[inner]].astype(numpy.float64)
+    add(ends[inner], others[inner], 1.0 / (k * k))
+    corner = numpy.nonzero(interior[vp])[0]
+    k = valence[vp[corner]].astype(numpy.float64)
+    addFaces(vp[corner], fv[corner], 1.0 / (k * k))
+    # Boundary points: 3/4 of the point and 1/8 of each boundary neighbour
+    p = numpy.nonzero(boundary)[0]
+    add(p, p, 0.75)
+    onborder = numpy.concatenate((hard, hard)) & boundary[ends]
+    add(ends[onborder], others[onborder], 0.125)
+
+    # Edges: the average of their ends and face points, or their midpoint
+    edges = numpy.arange(E)
+    for end in (e0, e1):
+        add(N + edges, end, numpy.where(smooth, 0.25, 0.5))
+    halfedges = numpy.nonzero(smooth[ve])[0]
+    addFaces(N + ve[halfedges], fv[halfedges], 0.25)
+
+    # Faces: the average of their points
+    addFaces(N + E + numpy.arange(F), numpy.arange(F), 1.0)
+    points = _stencils(rows, items, weights, N + E + F, N)
+
+    # Vertex values are interpolated linearly over each face
+    r = 4 * vertices
+    faceavg = faces.pairs(fv)[1]
+    vertexStencils = _stencils(
+        (r, r + 1, r + 1, r + 3, r + 3, numpy.repeat(r + 2, counts[fv])),
+        (vertices, vertices, nxt, prv, vertices, faceavg),
+        (numpy.ones(V), numpy.full(V, 0.5), numpy.full(V, 0.5), numpy.full(V, 0.5),
+         numpy.full(V, 0.5), numpy.repeat(1.0 / counts[fv], counts[fv])),
+        4 * V, V)
+
+    quads = numpy.column_stack((vp, N + ve, N + E + fv, N + ve[prv])).ravel()
+    return Level(N + E + F, numpy.arange(0, 4 * V + 1, 4, dtype=numpy.int64), quads,
+                 level.parents[fv], points, vertexStencils)
+
+def _array(a):
+    if not len(a):
+        return numpy.empty(0, dtype=a.code)
+    return numpy.frombuffer(a, dtype=a.code)
+
+class Subdivider(object):
+    """The cached subdivision levels of a geometry detail"""
+    def __init__(self, geometry):
+        super(Subdivider, self).__init__()
+        self.geometry = geometry
+        self.topologyId = geometry.topologyId
+        self._cageVertices, cage = self._cage()
+        self._levels = [cage]
+
+    def __repr__(self):
+        return '<{0} {1} faces, {2} levels>'.format(self.__class__.__name__,
+                                                    len(self._levels[0].parents),
+                                                    len(self._levels) - 1)
+
+    def isCurrent(self):
+        """True if the detail's topology is unchanged since this was built"""
+        return self.geometry.topologyId == self.topologyId
+
+    def _cage(self):
+        """The detail vertices making up the faces of the cage, in
+        primitive order, and the cage's Level"""
+        geometry = self.geometry
+        starts = _array(geometry.primStarts).astype(numpy.int64)
+        types = _array(geometry.primTypes)
+        closed = _array(geometry.primClosed)
+        counts = numpy.diff(starts)
+        polygons = (types == prim.Polygon.typeid) & (closed != 0) & (counts >= 3)
+        faces = [numpy.nonzero(numpy.repeat(polygons, counts))[0].reshape(-1, 1)]
+        fcounts = [counts[polygons]]
+        parents = [numpy.nonzero(polygons)[0]]
+        for p in numpy.nonzero(types == prim.Mesh.typeid)[0]:
+            columns, rows = geometry.prim(int(p)).gridSize
+            if columns < 2 or rows < 2:
+                continue
+            grid = numpy.arange(columns * rows).reshape(rows, columns) + starts[p]
+            quads = numpy.stack((grid[:-1, :-1], grid[:-1, 1:], grid[1:, 1:], grid[1:, :-1]),
+                                axis=-1).reshape(-1, 4)
+            faces.append(quads.reshape(-1, 1))
+            fcounts.append(numpy.full(len(quads), 4, dtype=numpy.int64))
+            parents.append(numpy.full(len(quads), p, dtype=numpy.int64))
+        faces = numpy.concatenate(faces).ravel()
+        fcounts = numpy.concatenate(fcounts)
+        parents = numpy.concatenate(parents)
+        # Keep the faces in primitive order
+        order = numpy.argsort(parents, kind='mergesort')
+        fstarts = numpy.concatenate(([0], numpy.cumsum(fcounts)))
+        faces = CSR(fstarts, faces).pairs(order)[1]
+        fcounts, parents = fcounts[order], parents[order]
+        vp = _array(geometry.vertexPoints).astype(numpy.int64)[faces]
+        fstarts = numpy.concatenate(([0], numpy.cumsum(fcounts))).astype(numpy.int64)
+        return faces, Level(geometry.numPoints, fstarts, vp, parents, None, None)
+
+    def level(self, n):
+        """Return the Level of n subdivisions, refining the levels up to it
+        the first time it is asked for"""
+        while len(self._levels) <= n:
+            self._levels.append(_refine(self._levels[-1]))
+        return self._levels[n]
+
+    def refine(self, values, levels=1, attribclass=AttribClass.Point):
+        """Return point (or vertex) values subdivided levels times
+
+        values has a row per point (or vertex) of the detail."""
+        values = numpy.asarray(values, dtype=numpy.float64)
+        if attribclass == AttribClass.Vertex:
+            values = values[self._cageVertices]
+        elif attribclass != AttribClass.Point:
+            raise ValueError('Only point and vertex values can be refined')
+        for n in range(1, levels + 1):
+            level = self.level(n)
+            stencils = level.points if attribclass == AttribClass.Point else level.vertices
+            values = stencils.apply(values)
+        return values
+
+    def subdivide(self, levels=1):
+        """Return a new detail holding the subdivision surface, as quads,
+        after levels subdivisions"""
+        from .detail import Geometry
+        geometry = self.geometry
+        level = self.level(levels)
+        result = Geometry()
+        result._numpoints = level.numPoints
+        result._appendPrims(prim.Polygon, numpy.diff(level.primStarts), level.vertexPoints)
+        # The attributes are made at their full size
+        for attribclass in (AttribClass.Point, AttribClass.Vertex):
+            for name, attr in geometry.attribs(attribclass).items():
+                if not isinstance(attr, Float):
+                    continue
+                values = _array(attr).reshape(-1, attr.size)
+                refined = attr.extractElements(0, 0)
+                _extend(refined, self.refine(values, levels, attribclass))
+                result._attribs[attribclass][name] = refined
+        for name, attr in geometry.attribs(AttribClass.Prim).items():
+            inherited = attr.extractElements(0, 0)
+            _extend(inherited, _array(attr).reshape(-1, attr.size)[level.parents])
+            result._attribs[AttribClass.Prim][name] = inherited
+        for name, attr in geometry.attribs(AttribClass.Global).items():
+            result._attribs[AttribClass.Global][name] = attr.copy()
+        return result
+
+def subdivide(geometry, levels=1):
+    """Return the Catmull-Clark subdivision surface of a detail after
+    levels subdivisions (see Subdivider.subdivide)"""
+    return geometry.subdivider().subdivide(levels)
@@ -0,0 +1,232 @@
+"""Adjacency queries over the connectivity of a detail.
+
+A detail only stores the forward connectivity: the point of every vertex
+and the run of vertices of every primitive. Adjacency derives the reverse
+and neighbour relations from it, each as a CSR table (see CSR) built with
+a sort of the connectivity arrays the first time it is asked for:
+
+* pointVertices and pointPrims: the vertices and primitives using each
+  point,
+* edges: the distinct point pairs joined by consecutive vertices of
+  polygons, with edgePrims (the polygons sharing each edge) and
+  vertexEdges (the edge leaving each vertex),
+* pointNeighbours: the points joined to each point by an edge,
+* primNeighbours: the polygons sharing an edge with each polygon,
+* halfEdges: next, previous and twin half-edges of a manifold mesh, a
+  half-edge being identified with the vertex it leaves from.
+
+A detail's Adjacency is cached on it (see Geometry.adjacency) and only
+rebuilt when its topology changes; moving points or changing attributes
+leaves it valid."""
+
+from __future__ import absolute_import
+
+import collections
+
+import numpy
+
+from . import prim
+
+HalfEdges = collections.namedtuple('HalfEdges', ['next', 'prev', 'twin'])
+
+class CSR(object):
+    """A table of rows of variable length, stored as the concatenated
+    items of all rows and the start of every row"""
+    def __init__(self, starts, items):
+        super(CSR, self).__init__()
+        self.starts = starts
+        self.items = items
+
+    def __repr__(self):
+        return '<{0} {1} rows, {2} items>'.format(self.__class__.__name__, len(self), len(self.items))
+
+    def __len__(self):
+        return len(self.starts) - 1
+
+    def __getitem__(self, row):
+        return self.items[self.starts[row]:self.starts[row + 1]]
+
+    @property
+    def counts(self):
+        return numpy.diff(self.starts)
+
+    def pairs(self, rows=None):
+        """Return (rows, items) arrays with an entry per item of the rows
+        given (all rows by default)"""
+        if rows is None:
+            counts = self.counts
+            return numpy.repeat(numpy.arange(len(self)), counts), self.items
+        rows = numpy.asarray(rows, dtype=numpy.int64)
+        counts = self.counts[rows]
+        first = numpy.cumsum(counts) - counts
+        k = numpy.arange(counts.sum()) - numpy.repeat(first, counts)
+        return numpy.repeat(rows, counts), self.items[numpy.repeat(self.starts[rows], counts) + k]
+
+def _csr(rows, items, count, unique=False):
+    """Group items by row into a CSR of count rows, optionally dropping
+    repeated items within a row"""
+    rows = numpy.asarray(rows, dtype=numpy.int64)
+    items = numpy.asarray(items, dtype=numpy.int64)
+    order = numpy.lexsort((items, rows)) if unique else numpy.argsort(rows, kind='mergesort')
+    rows, items = rows[order], items[order]
+    if unique and len(rows):
+        keep = numpy.concatenate(([True], (rows[1:] != rows[:-1]) | (items[1:] != items[:-1])))
+        rows, items = rows[keep], items[keep]
+    starts = numpy.zeros(count + 1, dtype=numpy.int64)
+    numpy.cumsum(numpy.bincount(rows, minlength=count), out=starts[1:])
+    return CSR(starts, items)
+
+class Adjacency(object):
+    """Lazily built adjacency tables of a geometry detail"""
+    def __init__(self, geometry):
+        super(Adjacency, self).__init__()
+        self.geometry = geometry
+        self.topologyId = geometry.topologyId
+        self._tables = {}
+        view = lambda a: numpy.frombuffer(a, dtype=a.code) if len(a) else numpy.empty(0, numpy.int64)
+        self._vp = view(geometry.vertexPoints).astype(numpy.int64)
+        self._vprims = view(geometry.vertexPrims).astype(numpy.int64)
+        self._starts = view(geometry.primStarts).astype(numpy.int64)
+        self._types = view(geometry.primTypes)
+        self._closed = view(geometry.primClosed) != 0
+        self.numPoints = geometry.numPoints
+        self.numPrims = geometry.numPrims
+
+    def __repr__(self):
+        return '<{0} {1} points, {2} prims>'.format(self.__class__.__name__,
+                                                    self.numPoints, self.numPrims)
+
+    def isCurrent(self):
+        """True if the detail's topology is unchanged since this was built"""
+        return self.geometry.topologyId == self.topologyId
+
+    def _table(self, name, build):
+        table = self._tables.get(name)
+        if table is None:
+            table = self._tables[name] = build()
+        return table
+
+    @property
+    def pointVertices(self):
+        return self._table('pointVertices', lambda: _csr(
+            self._vp, numpy.arange(len(self._vp)), self.numPoints))
+
+    @property
+    def pointPrims(self):
+        return self._table('pointPrims', lambda: _csr(
+            self._vp, self._vprims, self.numPoints, unique=True))
+
+    def _nextVertices(self):
+        """The vertex following each vertex around its polygon, or -1 for
+        the last vertex of open polygons and vertices of other prims"""
+        def build():
+            vertices = numpy.arange(len(self._vp))
+            nxt = vertices + 1
+            used = numpy.nonzero(numpy.diff(self._starts) > 0)[0]
+            ends = self._starts[used + 1] - 1
+            nxt[ends] = numpy.where(self._closed[used], self._starts[used], -1)
+            polygon = self._types == prim.Polygon.typeid
+            nxt[~polygon[self._vprims]] = -1
+            # Single vertex polygons have no edges
+            nxt[nxt == vertices] = -1
+            return nxt
+        return self._table('next', build)
+
+    def _buildEdges(self):
+        nxt = self._nextVertices()
+        halfedges = numpy.nonzero(nxt >= 0)[0]
+        a, b = self._vp[halfedges], self._vp[nxt[halfedges]]
+        keys = numpy.minimum(a, b) * max(self.numPoints, 1) + numpy.maximum(a, b)
+        unique, inverse = numpy.unique(keys, return_inverse=True)
+        n = max(self.numPoints, 1)
+        self._tables['edges'] = numpy.column_stack((unique // n, unique % n))
+        vertexEdges = numpy.full(len(self._vp), -1, dtype=numpy.int64)
+        vertexEdges[halfedges] = inverse
+        self._tables['vertexEdges'] = vertexEdges
+
+    @property
+    def edges(self):
+        """The (E, 2) point numbers of every distinct edge, lowest first"""
+        if 'edges' not in self._tables:
+            self._buildEdges()
+        return self._tables['edges']
+
+    @property
+    def vertexEdges(self):
+        """The edge leaving every vertex, -1 where there is none"""
+        if 'vertexEdges' not in self._tables:
+            self._buildEdges()
+        return self._tables['vertexEdges']
+
+    @property
+    def edgePrims(self):
+        def build():
+            ve = self.vertexEdges
+            halfedges = numpy.nonzero(ve >= 0)[0]
+            return _csr(ve[halfedges], self._vprims[halfedges], len(self.edges), unique=True)
+        return self._table('edgePrims', build)
+
+    @property
+    def pointNeighbours(self):
+        def build():
+            e = self.edges
+            return _csr(numpy.concatenate((e[:, 0], e[:, 1])),
+                        numpy.concatenate((e[:, 1], e[:, 0])), self.numPoints, unique=True)
+        return self._table('pointNeighbours', build)
+
+    @property
+    def primNeighbours(self):
+        """The polygons sharing at least one edge with each primitive"""
+        def build():
+            edges, prims = self.edgePrims.pairs()
+            # Pair every prim of an edge with every other prim of that edge
+            others = self.edgePrims.pairs(edges)[1]
+            owners = numpy.repeat(prims, self.edgePrims.counts[edges])
+            keep = owners != others
+            return _csr(owners[keep], others[keep], self.numPrims, unique=True)
+        return self._table('primNeighbours', build)
+
+    def halfEdges(self):
+        """Return the HalfEdges of a manifold polygon mesh
+
+        Half-edge h runs from vertex h to next[h] around its polygon;
+        prev[h] is the half-edge before it and twin[h] the opposite
+        half-edge of the neighbouring polygon, -1 on boundaries (and for
+        vertices with no edge). Raises ValueError if an edge is shared by
+        more than two polygons or by two with the same orientation."""
+        def build():
+            nxt = self._nextVertices()
+            halfedges = numpy.nonzero(nxt >= 0)[0]
+            prev = numpy.full(len(nxt), -1, dtype=numpy.int64)
+            prev[nxt[halfedges]] = halfedges
+            n = max(self.numPoints, 1)
+            a, b = self._vp[halfedges], self._vp[nxt[halfedges]]
+            keys = a * n + b
+            order = numpy.argsort(keys, kind='mergesort')
+            sorted_keys = keys[order]
+            if numpy.any(sorted_keys[1:] == sorted_keys[:-1]):
+                raise ValueError('The mesh is not manifold, or not consistently oriented')
+            opposite = b * n + a
+            at = numpy.minimum(numpy.searchsorted(sorted_keys, opposite), max(len(order) - 1, 0))
+            twin = numpy.full(len(nxt), -1, dtype=numpy.int64)
+            if len(order):
+                found = sorted_keys[at] == opposite
+                twin[halfedges[found]] = halfedges[order[at[found]]]
+            return HalfEdges(nxt, prev, twin)
+        return self._table('halfEdges', build)
+
+    def neighbourAverage(self, values):
+        """Return the average of the values of every point's neighbours
+
+        values has a row per point; points without neighbours keep their
+        own value. One step of Laplacian smoothing is a blend towards this."""
+        values = numpy.asarray(values, dtype=numpy.float64)
+        flat = values.reshape(len(values), -1)
+        rows, items = self.pointNeighbours.pairs()
+        counts = self.pointNeighbours.counts
+        result = numpy.array(flat)
+        has = counts > 0
+        for c in range(flat.shape[1]):
+            total = numpy.bincount(rows, weights=flat[items, c], minlength=len(flat))
+            result[has, c] = total[has] / counts[has]
+        return result.reshape(values.shape)
@@ -1,11 +1,42 @@
+from __future__ import absolute_import
 
-import weakref
+from .attribute import AttribClass
 
 class Vertex(object):
-    """A Vertex is associated with only one point and one primitive."""
-    def __init__(self, point, primitive):
+    """A Vertex is associated with only one point and one primitive.
+
+    Like Point, a Vertex is only an index into its Geometry detail. The
+    point and primitive it belongs to are looked up in the detail's
+    connectivity arrays, so no reference cycles are created."""
+    __slots__ = ('geometry', 'number')
+    def __init__(self, geometry, number):
         super(Vertex, self).__init__()
-        self.point = point
-        # self.primitive should be made a weak reference since
-        # primitives also reference their vertices   
-        self.primitive = primitive
\ No newline at end of file
+        self.geometry = geometry
+        self.number = number
+
+    def __repr__(self):
+        return '<{0.__class__.__name__} {0.number}>'.format(self)
+
+    def __eq__(self, other):
+        return (isinstance(other, Vertex) and self.geometry is other.geometry
+                and self.number == other.number)
+
+    def __ne__(self, other):
+        return not self == other
+
+    def __hash__(self):
+        return hash((id(self.geometry), self.number))
+
+    @property
+    def point(self):
+        return self.geometry.point(self.geometry.vertexPoints[self.number])
+
+    @property
+    def primitive(self):
+        return self.geometry.prim(self.geometry.vertexPrims[self.number])
+
+    def attribValue(self, name):
+        return self.geometry.attrib(AttribClass.Vertex, name).element(self.number)
+
+    def setAttribValue(self, name, value):
+        self.geometry.writableAttrib(AttribClass.Vertex, name).setElement(self.number, value)
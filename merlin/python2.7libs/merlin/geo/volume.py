@@ -0,0 +1,414 @@
+"""Sparse voxel grids, the storage of native Merlin volumes (MVolume).
+
+A VoxelGrid only stores the regions of space that hold data. Voxels are
+grouped in cubic leaf blocks of leafSize voxels a side, allocated when a
+voxel in them is first written and stored as one dense numpy array of
+values and one of active flags, indexed by leaf number. A table of the
+leaves' packed coordinates, kept sorted, finds the leaf of any number of
+voxels with a single binary search.
+
+Regions of constant value need no leaf: tiles store one value for a cube
+of leafSize * 2**level voxels. Voxels in neither a leaf nor a tile read as
+the grid's background value. A narrow band signed distance grid, for
+example, only has leaves near the surface, large tiles holding the inside
+value and a background of the outside value.
+
+Voxel (i, j, k) is centred at (i, j, k) * voxelSize in the grid's own
+space; an MVolume places that space's origin at its point. Queries
+(getValues, sample, gradient) and edits take whole arrays of voxels or
+positions at once.
+
+sdfFromColliders, sdfFromPoints and densityFromPoints build grids from the
+quadratic primitives or the points of a detail."""
+
+from __future__ import absolute_import
+
+import collections
+import math
+
+import numpy
+
+from .attribute import AttribClass
+
+Leaf = collections.namedtuple('Leaf', ['origin', 'values', 'active'])
+
+# Packed coordinates use 21 bits per axis
+_bits = 21
+_offset = 1 << (_bits - 1)
+
+# The offsets of the 8 corners of a cell
+_corners = numpy.array([[i, j, k] for i in (0, 1) for j in (0, 1) for k in (0, 1)],
+                       dtype=numpy.int64)
+
+def _pack(coords):
+    c = numpy.asarray(coords, dtype=numpy.int64).reshape(-1, 3) + _offset
+    if len(c) and (c.min() < 0 or c.max() >= 1 << _bits):
+        raise ValueError('Voxel coordinates out of range')
+    return (c[:, 0] << (2 * _bits)) | (c[:, 1] << _bits) | c[:, 2]
+
+def _unpack(keys):
+    mask = (1 << _bits) - 1
+    return numpy.column_stack((keys >> (2 * _bits), (keys >> _bits) & mask, keys & mask)) - _offset
+
+def _lookup(sorted_keys, slots, keys):
+    """The slot of every key in a sorted table, -1 where it is missing"""
+    result = numpy.full(len(keys), -1, dtype=numpy.int64)
+    if len(sorted_keys) and len(keys):
+        at = numpy.minimum(numpy.searchsorted(sorted_keys, keys), len(sorted_keys) - 1)
+        found = sorted_keys[at] == keys
+        result[found] = slots[at[found]]
+    return result
+
+class VoxelGrid(object):
+    """A sparse grid of voxels stored in dense leaf blocks"""
+    def __init__(self, voxelSize=1.0, background=0.0, leafSize=8, dtype=numpy.float32):
+        super(VoxelGrid, self).__init__()
+        if voxelSize <= 0.0:
+            raise ValueError('voxelSize must be positive')
+        if leafSize < 1:
+            raise ValueError('leafSize must be at least 1')
+        self.voxelSize = float(voxelSize)
+        self.background = float(background)
+        self.leafSize = int(leafSize)
+        self.dtype = numpy.dtype(dtype)
+        B = self.leafSize
+        self._count = 0
+        self._coords = numpy.empty((0, 3), dtype=numpy.int64)
+        self._keys = numpy.empty(0, dtype=numpy.int64)
+        self._values = numpy.empty((0, B, B, B), dtype=self.dtype)
+        self._active = numpy.empty((0, B, B, B), dtype=bool)
+        # The leaf keys, sorted, and the leaf number of each; see _find
+        self._sorted = None
+        # Level -> (sorted keys, values) of the tiles of that level
+        self._tiles = {}
+
+    def __repr__(self):
+        return '<{0} {1} leaves, {2} active voxels>'.format(
+            self.__class__.__name__, self.numLeaves, self.activeVoxelCount)
+
+    @property
+    def numLeaves(self):
+        return self._count
+
+    @property
+    def numTiles(self):
+        return sum(len(keys) for keys, values in self._tiles.values())
+
+    @property
+    def activeVoxelCount(self):
+        return int(numpy.count_nonzero(self._active[:self._count]))
+
+    @property
+    def nbytes(self):
+        """The memory used by the grid's arrays"""
+        count = self._count
+        return (self._values[:count].nbytes + self._active[:count].nbytes +
+                self._coords[:count].nbytes + self._keys[:count].nbytes +
+                sum(k.nbytes + v.nbytes for k, v in self._tiles.values()))
+
+    def copy(self):
+        grid = self.__class__(self.voxelSize, self.background, self.leafSize, self.dtype)
+        count = self._count
+        grid._count = count
+        grid._coords = self._coords[:count].copy()
+        grid._keys = self._keys[:count].copy()
+        grid._values = self._values[:count].copy()
+        grid._active = self._active[:count].copy()
+        grid._tiles = dict((level, (k.copy(), v.copy())) for level, (k, v) in self._tiles.items())
+        return grid
+
+    # Leaf table
+    def _find(self, coords):
+        """The leaf number of every leaf coordinate, -1 where there is none"""
+        if self._sorted is None:
+            keys = self._keys[:self._count]
+            order = numpy.argsort(keys)
+            self._sorted = (keys[order], order)
+        return _lookup(self._sorted[0], self._sorted[1], _pack(coords))
+
+    def _reserve(self, count):
+        capacity = len(self._keys)
+        if count <= capacity:
+            return
+        capacity = max(count, capacity * 2, 8)
+        for name in ('_coords', '_keys', '_values', '_active'):
+            old = getattr(self, name)
+            new = numpy.empty((capacity,) + old.shape[1:], dtype=old.dtype)
+            new[:self._count] = old[:self._count]
+            setattr(self, name, new)
+
+    def _touch(self, coords):
+        """The leaf number of every leaf coordinate, allocating missing
+        leaves filled with the value they had (background or tile)"""
+        coords = numpy.asarray(coords, dtype=numpy.int64).reshape(-1, 3)
+        leaves = self._find(coords)
+        missing = leaves < 0
+        if missing.any():
+            keys, first = numpy.unique(_pack(coords[missing]), return_index=True)
+            new = coords[missing][first]
+            start, count = self._count, self._count + len(new)
+            self._reserve(count)
+            self._coords[start:count] = new
+            self._keys[start:count] = keys
+            fill = self._tileValues(new * self.leafSize)
+            self._values[start:count] = fill[:, None, None, None]
+            self._active[start:count] = False
+            self._count = count
+            self._sorted = None
+            leaves[missing] = self._find(coords[missing])
+        return leaves
+
+    def _split(self, ijk):
+        ijk = numpy.asarray(ijk, dtype=numpy.int64).reshape(-1, 3)
+        coords = ijk // self.leafSize
+        return coords, ijk - coords * self.leafSize
+
+    # Tiles
+    def _tileValues(self, ijk):
+        """The tile (or background) value of every voxel"""
+        result = numpy.full(len(ijk), self.background, dtype=self.dtype)
+        found = numpy.zeros(len(ijk), dtype=bool)
+        for level in sorted(self._tiles):
+            keys, values = self._tiles[level]
+            todo = numpy.nonzero(~found)[0]
+            if not len(todo):
+                break
+            tile = _lookup(keys, numpy.arange(len(keys)),
+                           _pack(ijk[todo] // (self.leafSize << level)))
+            hit = tile >= 0
+            result[todo[hit]] = values[tile[hit]]
+            found[todo[hit]] = True
+        return result
+
+    def setTiles(self, level, coords, value):
+        """Fill cubes of leafSize * 2**level voxels with a constant value
+
+        coords are the tiles' coordinates in units of their own size. Leaves
+        inside the tiles keep their values; a leaf takes precedence over a
+        tile, and a finer tile over a coarser one."""
+        new = _pack(coords)
+        values = numpy.full(len(new), value, dtype=self.dtype)
+        if level in self._tiles:
+            keys, old = self._tiles[level]
+            new = numpy.concatenate((new, keys))
+            values = numpy.concatenate((values, old))
+        keys, first = numpy.unique(new, return_index=True)
+        self._tiles[level] = (keys, values[first])
+
+    def iterTiles(self):
+        """Yield (level, coords, values) for every level of tiles"""
+        for level in sorted(self._tiles):
+            keys, values = self._tiles[level]
+            yield level, _unpack(keys), values
+
+    # Voxel access
+    def getValues(self, ijk):
+        """Return the value of every voxel of an (N, 3) array of indices"""
+        coords, local = self._split(ijk)
+        result = self._tileValues(coords * self.leafSize)
+        leaves = self._find(coords)
+        has = numpy.nonzero(leaves >= 0)[0]
+        l = local[has]
+        result[has] = self._values[leaves[has], l[:, 0], l[:, 1], l[:, 2]]
+        return result
+
+    def isActive(self, ijk):
+        coords, local = self._split(ijk)
+        leaves = self._find(coords)
+        result = numpy.zeros(len(leaves), dtype=bool)
+        has = numpy.nonzero(leaves >= 0)[0]
+        l = local[has]
+        result[has] = self._active[leaves[has], l[:, 0], l[:, 1], l[:, 2]]
+        return result
+
+    def setValues(self, ijk, values, active=True):
+        """Set the values of voxels, allocating their leaves as needed"""
+        coords, local = self._split(ijk)
+        leaves = self._touch(coords)
+        index = (leaves, local[:, 0], local[:, 1], local[:, 2])
+        self._values[index] = values
+        self._active[index] = active
+
+    def addValues(self, ijk, values):
+        """Add to the values of voxels and activate them; repeated voxels
+        accumulate every value"""
+        coords, local = self._split(ijk)
+        leaves = self._touch(coords)
+        index = (leaves, local[:, 0], local[:, 1], local[:, 2])
+        numpy.add.at(self._values, index, values)
+        self._active[index] = True
+
+    def setActive(self, ijk, active=True):
+        coords, local = self._split(ijk)
+        if active:
+            leaves = self._touch(coords)
+        else:
+            leaves = self._find(coords)
+            coords, local, leaves = coords[leaves >= 0], local[leaves >= 0], leaves[leaves >= 0]
+        self._active[leaves, local[:, 0], local[:, 1], local[:, 2]] = active
+
+    def setLeaves(self, coords, values, active):
+        """Set whole leaves at once from (N, B, B, B) arrays of values and
+        active flags, B being the leaf size"""
+        leaves = self._touch(coords)
+        self._values[leaves] = values
+        self._active[leaves] = active
+
+    # Iteration
+    def iterLeaves(self):
+        """Yield a Leaf for every leaf block: the index of its first voxel,
+        and views of its values and active flags"""
+        for n in range(self._count):
+            yield Leaf(self._coords[n] * self.leafSize, self._values[n], self._active[n])
+
+    def activeVoxels(self):
+        """Return (ijk, values): the indices and values of all active voxels"""
+        leaves, i, j, k = numpy.nonzero(self._active[:self._count])
+        ijk = self._coords[leaves] * self.leafSize + numpy.column_stack((i, j, k))
+        return ijk, self._values[leaves, i, j, k]
+
+    def prune(self, tolerance=0.0):
+        """Remove the leaves with no active voxels and a constant value,
+        within tolerance
+
+        A removed leaf whose value differs from the tile (or background)
+        value beneath it is kept as a level 0 tile, so no voxel changes
+        value. Returns the number of leaves removed."""
+        count = self._count
+        flat = self._values[:count].reshape(count, -1)
+        empty = ~self._active[:count].reshape(count, -1).any(axis=1)
+        lo, hi = flat.min(axis=1), flat.max(axis=1)
+        constant = empty & (hi - lo <= tolerance)
+        beneath = self._tileValues(self._coords[:count] * self.leafSize)
+        tiles = constant & (numpy.abs(lo - beneath) > tolerance)
+        for value in numpy.unique(lo[tiles]):
+            self.setTiles(0, self._coords[:count][tiles & (lo == value)], value)
+        keep = numpy.nonzero(~constant)[0]
+        for name in ('_coords', '_keys', '_values', '_active'):
+            setattr(self, name, getattr(self, name)[keep])
+        self._count = len(keep)
+        self._sorted = None
+        return count - len(keep)
+
+    # Sampling
+    def sample(self, positions):
+        """Trilinearly interpolate the grid at an (N, 3) array of positions
+        in the grid's space"""
+        X = numpy.atleast_2d(numpy.asarray(positions, dtype=numpy.float64)) / self.voxelSize
+        i0 = numpy.floor(X).astype(numpy.int64)
+        f = X - i0
+        corners = (i0[:, None, :] + _corners[None]).reshape(-1, 3)
+        values = self.getValues(corners).reshape(-1, 8).astype(numpy.float64)
+        weights = numpy.prod(numpy.where(_corners[None] == 1, f[:, None, :], 1.0 - f[:, None, :]),
+                             axis=2)
+        return numpy.sum(values * weights, axis=1)
+
+    def gradient(self, positions):
+        """Return the (N, 3) gradient of the sampled values, by central
+        differences one voxel apart"""
+        X = numpy.atleast_2d(numpy.asarray(positions, dtype=numpy.float64))
+        h = self.voxelSize
+        offsets = numpy.concatenate((numpy.eye(3), -numpy.eye(3))) * h
+        values = self.sample((X[:, None, :] + offsets[None]).reshape(-1, 3)).reshape(-1, 6)
+        return (values[:, :3] - values[:, 3:]) / (2.0 * h)
+
+def _narrowBand(grid, sdf, lo, hi, bandWidth, chunk=1024):
+    """Fill grid with the signed distances of sdf within bandWidth voxels
+    of its surface, inside the world box lo, hi
+
+    Tiles are refined from a coarse level down to leaves, keeping those
+    that may hold a voxel within the band; this assumes sdf never
+    overestimates distances. Tiles found wholly inside are kept as tiles of
+    the inside value."""
+    B, h = grid.leafSize, grid.voxelSize
+    band = bandWidth * h
+    ilo = numpy.floor(numpy.asarray(lo, dtype=numpy.float64) / h).astype(numpy.int64) - bandWidth
+    ihi = numpy.ceil(numpy.asarray(hi, dtype=numpy.float64) / h).astype(numpy.int64) + bandWidth
+    extent = max(int((ihi - ilo).max()) + 1, 1)
+    level = max(0, int(math.ceil(math.log(float(extent) / B, 2)))) if extent > B else 0
+    size = B << level
+    ranges = [numpy.arange(a // size, b // size + 1) for a, b in zip(ilo, ihi)]
+    coords = numpy.stack(numpy.meshgrid(*ranges, indexing='ij'), axis=-1).reshape(-1, 3)
+    while True:
+        size = B << level
+        radius = (size - 1) * 0.5 * math.sqrt(3.0) * h
+        d = numpy.empty(len(coords))
+        for start in range(0, len(coords), chunk * B ** 3):
+            c = coords[start:start + chunk * B ** 3]
+            d[start:start + len(c)] = sdf((c * size + (size - 1) * 0.5) * h)
+        inside = d < -(band + radius)
+        if inside.any():
+            grid.setTiles(level, coords[inside], -band)
+        coords = coords[numpy.abs(d) <= band + radius]
+        if level == 0:
+            break
+        coords = (coords[:, None, :] * 2 + _corners[None]).reshape(-1, 3)
+        level -= 1
+
+    local = numpy.indices((B, B, B)).reshape(3, -1).T
+    for start in range(0, len(coords), chunk):
+        c = coords[start:start + chunk]
+        ijk = (c[:, None, :] * B + local[None]).reshape(-1, 3)
+        d = numpy.clip(sdf(ijk * h), -band, band).reshape(-1, B, B, B)
+        grid.setLeaves(c, d, numpy.abs(d) < band)
+    return grid
+
+def sdfFromColliders(geometry, voxelSize, bandWidth=3, bounds=None, leafSize=8):
+    """Build a narrow band signed distance grid of the union of a detail's
+    quadratic primitives (see geo.collide)
+
+    Voxels within bandWidth voxels of a surface are active; the background
+    is the outside distance at the edge of the band. bounds, a (lo, hi)
+    pair of corners, limits the grid and is required if there are planes."""
+    colliders = geometry.colliders()
+    grid = VoxelGrid(voxelSize, bandWidth * float(voxelSize), leafSize)
+    if not len(colliders.prims):
+        return grid
+    lo, hi = colliders.bounds()
+    lo, hi = lo.min(axis=0), hi.max(axis=0)
+    if bounds is not None:
+        lo = numpy.maximum(lo, bounds[0])
+        hi = numpy.minimum(hi, bounds[1])
+    if not numpy.all(numpy.isfinite(lo) & numpy.isfinite(hi)):
+        raise ValueError('Planes are unbounded: bounds must be given')
+    if numpy.any(lo > hi):
+        return grid
+    return _narrowBand(grid, lambda X: colliders.signedDistance(X)[0], lo, hi, bandWidth)
+
+def _pointPositions(geometry):
+    P = geometry.attrib(AttribClass.Point, 'P')
+    return numpy.frombuffer(P, dtype=numpy.float64).reshape(-1, 3)
+
+def sdfFromPoints(geometry, voxelSize, radius, bandWidth=3, leafSize=8):
+    """Build a narrow band signed distance grid of the union of spheres of
+    radius around a detail's points"""
+    grid = VoxelGrid(voxelSize, bandWidth * float(voxelSize), leafSize)
+    if not geometry.numPoints:
+        return grid
+    P = _pointPositions(geometry)
+    tree = geometry.pointTree()
+    sdf = lambda X: tree.nearest(X)[1][:, 0] - radius
+    return _narrowBand(grid, sdf, P.min(axis=0) - radius, P.max(axis=0) + radius, bandWidth)
+
+def densityFromPoints(geometry, voxelSize, weight=None, leafSize=8):
+    """Build a density grid by splatting a detail's points into the voxels
+    around them with trilinear weights
+
+    Each point adds 1, or the value of the float point attribute named by
+    weight, per unit volume."""
+    grid = VoxelGrid(voxelSize, 0.0, leafSize)
+    if not geometry.numPoints:
+        return grid
+    X = _pointPositions(geometry) / grid.voxelSize
+    amount = numpy.ones(len(X))
+    if weight is not None:
+        attr = geometry.attrib(AttribClass.Point, weight)
+        amount = numpy.frombuffer(attr, dtype=attr.code).reshape(-1, attr.size)[:, 0]
+    amount = amount / grid.voxelSize ** 3
+    i0 = numpy.floor(X).astype(numpy.int64)
+    f = X - i0
+    weights = numpy.prod(numpy.where(_corners[None] == 1, f[:, None, :], 1.0 - f[:, None, :]),
+                         axis=2)
+    grid.addValues((i0[:, None, :] + _corners[None]).reshape(-1, 3),
+                   (weights * amount[:, None]).ravel())
+    return grid
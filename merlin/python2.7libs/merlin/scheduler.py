@@ -0,0 +1,219 @@
+from __future__ import division, absolute_import, print_function, unicode_literals
+
+"""Parallel cooking of node networks.
+
+A CookScheduler cooks everything upstream of a node that needs to cook,
+in dependency order, dispatching nodes to worker threads or processes as
+soon as all of their inputs are cooked. Independent branches therefore
+cook concurrently, and a wide network takes roughly the time of its
+critical path rather than the sum of all of its nodes.
+
+Where a node is cooked depends on its cookMode:
+
+* CookMode.MainThread nodes (the default) are cooked by the thread that
+  called CookScheduler.cook, since their cook may not be thread safe.
+* CookMode.Thread nodes are cooked in a pool of worker threads.
+* CookMode.Process nodes have their cookInProcess classmethod run in a
+  pool of worker processes, given their input results and parameter
+  values.
+
+The results end up in the normal per node caches, so a later
+Node.evaluate of any cooked node does not cook again."""
+
+import threading
+import multiprocessing
+import multiprocessing.pool
+
+try:
+    import cPickle as pickle
+except ImportError as e:
+    import pickle
+try:
+    import queue
+except ImportError as e:
+    import Queue as queue
+
+from ._py3fixes import *
+from ._types import CookMode
+
+class CookError(RuntimeError):
+    """Raised by CookScheduler.cook when a node fails to cook"""
+    def __init__(self, node, error):
+        super(CookError, self).__init__('Error cooking {0}: {1!r}'.format(node.path, error))
+        self.node = node
+        self.error = error
+
+class CookCancelled(RuntimeError):
+    """Raised by CookScheduler.cook when the cook is cancelled"""
+    pass
+
+def _cook_node(node, kwargs):
+    try:
+        return True, node.evaluate(**kwargs)
+    except Exception as e:
+        return False, e
+
+def _cook_in_process(payload):
+    # The arguments and the result are pickled here rather than by the
+    # pool, so that failing to pickle them is reported like any other
+    # error: a pool only runs apply_async callbacks on success, and Python
+    # 2 has no error_callback.
+    try:
+        cls, inputs, parms, kwargs = pickle.loads(payload)
+        result = cls.cookInProcess(inputs, parms, **kwargs)
+        return True, pickle.dumps(result, pickle.HIGHEST_PROTOCOL)
+    except Exception as e:
+        return False, e
+
+class CookScheduler(object):
+    """Cook node networks with a pool of worker threads and processes
+
+    threads and processes are the pool sizes, defaulting to the number of
+    CPUs. Pools are only started when a node needs them, and are kept for
+    later cooks until close is called."""
+    def __init__(self, threads=None, processes=None):
+        super(CookScheduler, self).__init__()
+        self.threads = threads or multiprocessing.cpu_count()
+        self.processes = processes or multiprocessing.cpu_count()
+        self._threadpool = None
+        self._processpool = None
+        self._cancel = threading.Event()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    def close(self):
+        for pool in (self._threadpool, self._processpool):
+            if pool is not None:
+                pool.close()
+                pool.join()
+        self._threadpool = self._processpool = None
+
+    def cancel(self):
+        """Stop a running cook from any thread
+
+        No more nodes are dispatched; nodes already cooking are allowed to
+        finish, then cook raises CookCancelled."""
+        self._cancel.set()
+
+    def plan(self, node, **kwargs):
+        """Return the nodes upstream of (and including) node that need to
+        cook, in an order where every node comes after its inputs"""
+        order = []
+        state = {}
+        stack = [(node, False)]
+        while stack:
+            n, expanded = stack.pop()
+            key = id(n)
+            if expanded:
+                state[key] = True
+                order.append(n)
+                continue
+            if key in state:
+                if state[key] is False:
+                    raise RuntimeError('Cycle in node inputs at {0}'.format(n.path))
+                continue
+            if not n.needsToCook(**kwargs):
+                continue
+            state[key] = False
+            stack.append((n, True))
+            for i in n.inputs:
+                if i is not None and state.get(id(i)) is not True:
+                    if state.get(id(i)) is False:
+                        raise RuntimeError('Cycle in node inputs at {0}'.format(i.path))
+                    stack.append((i, False))
+        return order
+
+    def cook(self, node, **kwargs):
+        """Cook node and everything it depends on, then return its result"""
+        self._cancel.clear()
+        order = self.plan(node, **kwargs)
+        planned = set(id(n) for n in order)
+
+        waiting = {}
+        downstream = {}
+        for n in order:
+            deps = set(id(i) for i in n.inputs if i is not None and id(i) in planned)
+            waiting[id(n)] = len(deps)
+            for d in deps:
+                downstream.setdefault(d, []).append(n)
+
+        ready = [n for n in order if not waiting[id(n)]]
+        # Nodes cooking in the pools, by id; each is put on done with its
+        # (ok, value) result when it finishes
+        inflight = {}
+        done = queue.Queue()
+        error = None
+
+        while ready or inflight:
+            finished = []
+            if error is None and not self._cancel.is_set():
+                # Keep the pools busy, then cook a main thread node (if any)
+                # while they work.
+                for n in list(ready):
+                    if n.cookMode != CookMode.MainThread and self._hasCapacity(n, inflight):
+                        ready.remove(n)
+                        inflight[id(n)] = n
+                        self._dispatch(n, kwargs, done)
+                main = [n for n in ready if n.cookMode == CookMode.MainThread]
+                if main:
+                    ready.remove(main[0])
+                    finished.append((main[0], _cook_node(main[0], kwargs)))
+            elif not inflight:
+                break
+
+            if not finished:
+                # Wait for a pool to finish a node
+                finished.append(done.get())
+            while True:
+                try:
+                    finished.append(done.get_nowait())
+                except queue.Empty:
+                    break
+
+            for n, (ok, value) in finished:
+                inflight.pop(id(n), None)
+                if not ok:
+                    if error is None:
+                        error = CookError(n, value)
+                    continue
+                if n.cookMode == CookMode.Process:
+                    n._setResult(pickle.loads(value), kwargs)
+                for d in downstream.get(id(n), ()):
+                    waiting[id(d)] -= 1
+                    if not waiting[id(d)]:
+                        ready.append(d)
+
+        if error is not None:
+            raise error
+        if self._cancel.is_set():
+            raise CookCancelled('Cook of {0} was cancelled'.format(node.path))
+        return node.evaluate(**kwargs)
+
+    def _hasCapacity(self, node, inflight):
+        process = node.cookMode == CookMode.Process
+        busy = sum(1 for n in inflight.values() if (n.cookMode == CookMode.Process) == process)
+        return busy < (self.processes if process else self.threads)
+
+    def _dispatch(self, node, kwargs, done):
+        """Start cooking node in a pool, putting (node, (ok, value)) on the
+        done queue when it finishes"""
+        callback = lambda result: done.put((node, result))
+        if node.cookMode == CookMode.Process:
+            if self._processpool is None:
+                self._processpool = multiprocessing.Pool(self.processes)
+            inputs = [node.inputData(i, **kwargs) for i in range(len(node.inputs))]
+            parms = [p.eval() for p in node.parameters]
+            try:
+                payload = pickle.dumps((type(node), inputs, parms, kwargs), pickle.HIGHEST_PROTOCOL)
+            except Exception as e:
+                callback((False, e))
+                return
+            self._processpool.apply_async(_cook_in_process, (payload,), callback=callback)
+        else:
+            if self._threadpool is None:
+                self._threadpool = multiprocessing.pool.ThreadPool(self.threads)
+            self._threadpool.apply_async(_cook_node, (node, kwargs), callback=callback)
@@ -15,6 +15,9 @@ if which python2 >/dev/null ; then
 	echoerr "Running python test suite with ${py2v}..."
 	echoerr
 	python2 $(dirname "$0")/testsuite.py "$@"
+	echoerr "Running python test suite with ${py2v}, pure Python modules only..."
+	echoerr
+	python2 $(dirname "$0")/testsuite.py --pure "$@"
 else
 	echoerr "Python2 could not be found."
 fi
@@ -24,6 +27,9 @@ if which python3 >/dev/null ; then
 	echoerr "Running python test suite with ${py3v}..."
 	echoerr
 	python3 $(dirname "$0")/testsuite.py "$@"
+	echoerr "Running python test suite with ${py3v}, pure Python modules only..."
+	echoerr
+	python3 $(dirname "$0")/testsuite.py --pure "$@"
 else
 	echoerr "Python3 could not be found."
 fi
@@ -0,0 +1,31 @@
+#! /usr/bin/env python
+"""Build the optional compiled extensions of merlin.
+
+Some merlin modules are written in Cython's pure Python mode: they are
+plain Python, annotated with the cython shadow module and paired with a
+.pxd file of C declarations. Compiling them is optional. Run
+
+    python setup.py build_ext --inplace
+
+to build the extension modules next to their sources, where the import
+system picks them up in preference to the .py files. Deleting the built
+files (or setting MERLIN_PURE_PYTHON=1) falls back to pure Python."""
+
+import os
+from distutils.core import setup
+from Cython.Build import cythonize
+
+libs = os.path.join('merlin', 'python2.7libs')
+
+compiled_modules = [
+    os.path.join(libs, 'merlin', '_types.py'),
+    os.path.join(libs, 'merlin', 'geo', 'attribute.py'),
+]
+
+if __name__ == "__main__":
+    setup(
+        name='merlin',
+        package_dir={'': libs},
+        ext_modules=cythonize(compiled_modules,
+                              compiler_directives={'language_level': 2}),
+    )
@@ -0,0 +1,14 @@
+"""Unit tests for merlin, discovered by testsuite.py
+
+Importing the package puts the merlin libraries of the running Python
+version on sys.path, so the tests run from a plain checkout."""
+
+import os
+import sys
+
+_root = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+_libs = os.path.join(_root, 'merlin', 'python{0}.{1}libs'.format(*sys.version_info[:2]))
+if not os.path.isdir(_libs):
+    _libs = os.path.join(_root, 'merlin', 'python2.7libs')
+if _libs not in sys.path:
+    sys.path.insert(0, _libs)
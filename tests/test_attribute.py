@@ -0,0 +1,110 @@
+from __future__ import division, absolute_import, print_function
+
+import unittest
+
+from merlin.geo import Geometry
+from merlin.geo.attribute import AttribClass, String
+
+def _string(values, size=1, default=None, table=None):
+    return String(values, size=size, default=default, table=table)
+
+class TestString(unittest.TestCase):
+    def test_intern(self):
+        attr = _string(['b', 'a', 'b'], default='x')
+        self.assertEqual(attr.table, ['x', 'b', 'a'])
+        self.assertEqual(list(attr), [1, 2, 1])
+        self.assertEqual(attr.intern('a'), 2)
+        self.assertEqual(attr.intern('c'), 3)
+        self.assertEqual(attr.find('c'), 3)
+        self.assertEqual(attr.find('d'), -1)
+        self.assertEqual(attr.strings(), ['b', 'a', 'b'])
+        attr.appendElements(2)
+        self.assertEqual(attr.strings(), ['b', 'a', 'b', 'x', 'x'])
+        attr.setElement(0, 'c')
+        self.assertEqual(attr.element(0), 'c')
+        self.assertEqual(len(attr.table), 4)
+
+    def test_tuples(self):
+        attr = _string(['a', 'b', 'b', 'c'], size=2)
+        self.assertEqual(attr.numElements, 2)
+        self.assertEqual(attr.element(1), ('b', 'c'))
+        attr.setElement(0, ('c', 'c'))
+        self.assertEqual(attr.element(0), ('c', 'c'))
+        self.assertEqual(attr.match('c').tolist(), [[True, True], [False, True]])
+        self.assertRaises(ValueError, attr.groups)
+
+    def test_match(self):
+        attr = _string(['arm_l', 'arm_r', 'leg_l', 'head', 'arm_l'])
+        self.assertEqual(attr.match('arm_l').tolist(), [True, False, False, False, True])
+        self.assertEqual(attr.match('tail').tolist(), [False] * 5)
+        self.assertEqual(attr.matchPrefix('arm').tolist(), [True, True, False, False, True])
+        self.assertEqual(attr.matchPattern('*_l').tolist(), [True, False, True, False, True])
+        self.assertEqual(attr.matchPattern('[ah]*').tolist(), [True, True, False, True, True])
+        self.assertEqual(len(_string([]).match('a')), 0)
+
+    def test_groups(self):
+        attr = _string(['b', 'a', 'b', 'c', 'a', 'b'], table=['unused'])
+        groups = attr.groups()
+        self.assertEqual(sorted(groups), ['a', 'b', 'c'])
+        self.assertEqual(groups['a'].tolist(), [1, 4])
+        self.assertEqual(groups['b'].tolist(), [0, 2, 5])
+        self.assertEqual(groups['c'].tolist(), [3])
+
+    def test_remap(self):
+        a = _string(['x', 'y'])
+        b = _string(['z', 'y', 'w'])
+        mapping = a.remap(b)
+        self.assertEqual([a.table[i] for i in mapping], b.table)
+        self.assertEqual(a.table[:3], ['', 'x', 'y'])
+        a.extendElements(b)
+        self.assertEqual(a.strings(), ['x', 'y', 'z', 'y', 'w'])
+        # Same tables are appended as they are
+        c = a.copy()
+        c.extendElements(a)
+        self.assertEqual(c.strings(), a.strings() * 2)
+        self.assertEqual(c.table, a.table)
+
+    def test_extract(self):
+        attr = _string(['a', 'b', 'c'])
+        part = attr.extractElements(1, 3)
+        self.assertEqual(part.strings(), ['b', 'c'])
+        self.assertEqual(part.table, attr.table)
+
+    def test_compact(self):
+        attr = _string(['a', 'b', 'c', 'b'], default='d')
+        attr.setElement(0, 'b')
+        attr.setElement(2, 'b')
+        attr.compact()
+        self.assertEqual(attr.table, ['d', 'b'])
+        self.assertEqual(attr.strings(), ['b', 'b', 'b', 'b'])
+        self.assertEqual(attr.match('b').tolist(), [True] * 4)
+        # The default stays in the table
+        attr.appendElements(1)
+        self.assertEqual(attr.strings()[-1], 'd')
+        self.assertEqual(attr.intern('a'), 2)
+
+class TestMerge(unittest.TestCase):
+    def detail(self, names, default='none'):
+        geo = Geometry()
+        geo.createPoints([(i, 0, 0) for i in range(len(names))])
+        attr = geo.addAttrib(AttribClass.Point, 'name', default)
+        for i, name in enumerate(names):
+            attr.setElement(i, name)
+        return geo
+
+    def test_string_tables(self):
+        a = self.detail(['left', 'right'])
+        b = self.detail(['top', 'left', 'bottom'], default='other')
+        b.addAttrib(AttribClass.Point, 'id', 3)
+        a.merge(b)
+        names = a.attrib(AttribClass.Point, 'name')
+        self.assertEqual(names.strings(), ['left', 'right', 'top', 'left', 'bottom'])
+        self.assertEqual(names.match('left').tolist(), [True, False, False, True, False])
+        self.assertEqual(names.default, ('none',))
+        # Attributes only b has are filled with their default
+        self.assertEqual(list(a.attrib(AttribClass.Point, 'id')), [3] * 5)
+        # The other detail is unchanged
+        self.assertEqual(b.attrib(AttribClass.Point, 'name').table[0], 'other')
+
+if __name__ == '__main__':
+    unittest.main()
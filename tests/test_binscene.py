@@ -0,0 +1,57 @@
+from __future__ import division, absolute_import, print_function
+
+import os
+import shutil
+import tempfile
+import unittest
+
+from merlin import _types, binscene
+from merlin._types import Node, ParmFloat
+
+class SceneNode(Node):
+    @property
+    def numInputs(self):
+        return 1
+
+    def cook(self, **kwargs):
+        return self.parm('value').eval()
+
+class TestNodeTypes(unittest.TestCase):
+    def test_registered(self):
+        self.assertIsInstance(Node, _types._NodeClassBuilder)
+        self.assertIs(_types.node_types['Node'], Node)
+        self.assertIs(_types.node_types['SceneNode'], SceneNode)
+        self.assertNotIn('_NodeBase', _types.node_types)
+
+    def test_createNode(self):
+        root = Node.__new__(Node, None)
+        self.assertIs(type(root.createNode('SceneNode', 'a')), SceneNode)
+        self.assertRaises(KeyError, root.createNode, 'NoSuchNode')
+
+class TestBinaryScene(unittest.TestCase):
+    def setUp(self):
+        self.tmp = tempfile.mkdtemp()
+        self.path = os.path.join(self.tmp, 'scene.mscn')
+
+    def tearDown(self):
+        shutil.rmtree(self.tmp)
+
+    def test_roundtrip(self):
+        root = Node.__new__(Node, None)
+        a = root.createNode('SceneNode', 'a')
+        a.parameters.append(ParmFloat(a, 2.0, 'value'))
+        b = root.createNode('SceneNode', 'b')
+        b.parameters.append(ParmFloat(b, 3.0, 'value'))
+        b.inputs[0] = a
+        binscene.saveScene(root, self.path)
+
+        self.assertTrue(binscene.isBinaryScene(self.path))
+        loaded = binscene.loadScene(self.path)
+        children = dict((n.name, n) for n in loaded.children)
+        self.assertEqual(sorted(children), ['a', 'b'])
+        self.assertIs(type(children['b']), SceneNode)
+        self.assertIs(children['b'].inputs[0], children['a'])
+        self.assertEqual(children['b'].parm('value').eval(), 3.0)
+
+if __name__ == '__main__':
+    unittest.main()
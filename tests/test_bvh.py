@@ -0,0 +1,54 @@
+from __future__ import division, absolute_import, print_function
+
+import unittest
+
+import numpy
+
+from merlin.geo import Geometry, polygon
+from merlin.geo.attribute import AttribClass
+
+def _grid(geo, columns, rows, z=0.0):
+    points = geo.createPoints([(x, y, z) for y in range(rows) for x in range(columns)])
+    return geo.createMesh(list(points), columns, rows)
+
+class TestMeshTriangles(unittest.TestCase):
+    def test_triangulate(self):
+        geo = Geometry()
+        geo.createPoints([(0, 0, 5), (1, 0, 5), (0, 1, 5)])
+        geo.createPolygon([0, 1, 2])
+        mesh = _grid(geo, 3, 3)
+        vertices, prims = polygon.triangulate(geo)
+        self.assertEqual(list(prims), [0] + [mesh.number] * 8)
+        # Every mesh triangle faces +z, like the quads of the grid
+        vp = numpy.frombuffer(geo.vertexPoints, dtype=geo.vertexPoints.code)
+        P = numpy.frombuffer(geo.attrib(AttribClass.Point, 'P')).reshape(-1, 3)
+        corners = P[vp[vertices[1:]]]
+        normals = numpy.cross(corners[:, 1] - corners[:, 0], corners[:, 2] - corners[:, 0])
+        self.assertTrue(numpy.allclose(normals, [0, 0, 1]))
+
+    def test_degenerate(self):
+        geo = Geometry()
+        _grid(geo, 1, 3)
+        self.assertEqual(len(polygon.triangulate(geo)[0]), 0)
+
+class TestBVH(unittest.TestCase):
+    def test_mesh_hit(self):
+        geo = Geometry()
+        mesh = _grid(geo, 3, 3)
+        hits = geo.bvh().intersect([(0.5, 0.5, 1.0), (1.5, 1.25, 1.0), (5.0, 5.0, 1.0)],
+                                   [(0.0, 0.0, -1.0)] * 3)
+        self.assertEqual(list(hits.prim), [mesh.number, mesh.number, -1])
+        self.assertTrue(numpy.allclose(hits.t[:2], 1.0))
+
+    def test_mesh_closest(self):
+        geo = Geometry()
+        geo.createPoints([(0, 0, 5), (1, 0, 5), (0, 1, 5)])
+        geo.createPolygon([0, 1, 2])
+        mesh = _grid(geo, 3, 3)
+        found = geo.bvh().closest([(1.0, 1.0, 0.5), (0.2, 0.2, 4.0)])
+        self.assertEqual(list(found.prim), [mesh.number, 0])
+        self.assertTrue(numpy.allclose(found.position[0], (1.0, 1.0, 0.0)))
+        self.assertTrue(numpy.allclose(found.distance, (0.5, 1.0)))
+
+if __name__ == '__main__':
+    unittest.main()
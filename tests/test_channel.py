@@ -0,0 +1,143 @@
+from __future__ import division, absolute_import, print_function
+
+import unittest
+
+import numpy
+
+from merlin._types import Node, ParmFloat
+from merlin.channel import Channel, Interp
+from merlin import expression
+
+class ChannelNode(Node):
+    def cook(self, **kwargs):
+        return self.parm('v').eval()
+
+class TestSample(unittest.TestCase):
+    frames = numpy.linspace(-3.0, 25.0, 57)
+
+    def channel(self, interp):
+        return Channel([1, 5, 10, 20], [0.0, 4.0, 2.0, 6.0], interp)
+
+    def check(self, c):
+        values = c.sample(self.frames)
+        self.assertEqual(values.shape, self.frames.shape)
+        self.assertTrue(numpy.allclose(values, [c.valueAt(f) for f in self.frames]))
+        # Every segment passes through its keys, and the end keys hold
+        self.assertTrue(numpy.allclose(c.sample(c.frames), c.values))
+        self.assertTrue(numpy.allclose(c.sample([-100.0, 0.0, 20.0, 21.0, 1e6]),
+                                       [0.0, 0.0, 6.0, 6.0, 6.0]))
+        return c
+
+    def test_constant(self):
+        c = self.check(self.channel(Interp.Constant))
+        self.assertEqual(c.sample([1.0, 4.9, 5.0, 9.9]).tolist(), [0.0, 0.0, 4.0, 4.0])
+
+    def test_linear(self):
+        c = self.check(self.channel(Interp.Linear))
+        self.assertEqual(c.sample([3.0, 7.5, 15.0]).tolist(), [2.0, 3.0, 4.0])
+
+    def test_cubic(self):
+        c = self.check(self.channel(Interp.Cubic))
+        # The first segment starts along the line through its keys
+        self.assertAlmostEqual(c.valueAt(1.001), 0.001, places=5)
+
+    def test_bezier(self):
+        c = self.check(self.channel(Interp.Bezier))
+        c.setKey(1, 0.0, Interp.Bezier, outSlope=0.0)
+        c.setKey(5, 4.0, Interp.Bezier, inSlope=0.0)
+        # Flat ends make a symmetric ease in and out
+        self.assertAlmostEqual(c.valueAt(3.0), 2.0)
+        self.assertTrue(c.valueAt(2.0) < 1.0)
+        self.check(c)
+
+    def test_mixed(self):
+        self.check(Channel([1, 5, 10, 20], [0.0, 4.0, 2.0, 6.0],
+                           [Interp.Bezier, Interp.Constant, Interp.Cubic, Interp.Linear]))
+
+    def test_single_key(self):
+        c = Channel([4], [2.5])
+        self.assertEqual(c.sample([0.0, 4.0, 9.0]).tolist(), [2.5, 2.5, 2.5])
+        self.assertRaises(ValueError, Channel().sample, [1.0])
+
+    def test_sample_range(self):
+        c = self.channel(Interp.Linear)
+        frames, values = c.sampleRange(1, 5, 0.5)
+        self.assertEqual(frames.tolist(), [1.0 + 0.5 * i for i in range(9)])
+        self.assertEqual(values.tolist(), [0.5 * i for i in range(9)])
+
+class TestKeys(unittest.TestCase):
+    def test_set_key(self):
+        c = Channel()
+        c.setKey(10, 1.0)
+        c.setKey(2, 3.0)
+        c.setKey(10, 5.0, Interp.Constant)
+        self.assertEqual(c.numKeys, 2)
+        self.assertEqual(c.frames.tolist(), [2.0, 10.0])
+        self.assertEqual(c.values.tolist(), [3.0, 5.0])
+        self.assertEqual(c.interps.tolist(), [Interp.Linear, Interp.Constant])
+        c.removeKey(2)
+        self.assertEqual(c.frames.tolist(), [10.0])
+        self.assertRaises(KeyError, c.removeKey, 2)
+
+    def test_set_keys(self):
+        c = Channel([3, 1, 2], [30.0, 10.0, 20.0])
+        self.assertEqual(c.frames.tolist(), [1.0, 2.0, 3.0])
+        self.assertEqual(c.values.tolist(), [10.0, 20.0, 30.0])
+        self.assertRaises(ValueError, c.setKeys, [1, 2, 1], [0.0, 1.0, 2.0])
+        self.assertRaises(ValueError, c.setKeys, [1, 2], [0.0])
+        # A rejected edit leaves the keys alone
+        self.assertEqual(c.frames.tolist(), [1.0, 2.0, 3.0])
+
+    def test_slopes_updated(self):
+        c = Channel([1, 2, 3], [0.0, 1.0, 0.0], Interp.Cubic)
+        before = c.valueAt(1.5)
+        c.setKey(3, 2.0, Interp.Cubic)
+        self.assertNotAlmostEqual(c.valueAt(1.5), before)
+
+class TestParameter(unittest.TestCase):
+    def setUp(self):
+        self.frame = expression.frame()
+        self.root = Node.__new__(Node, None)
+        self.node = self.root.createNode('ChannelNode', 'a')
+        self.parm = ParmFloat(self.node, 0.0, 'v')
+        self.node.parameters.append(self.parm)
+
+    def tearDown(self):
+        expression.setFrame(self.frame)
+
+    def test_frame_change(self):
+        expression.setFrame(1)
+        self.parm.setKeyframe(1, 0.0)
+        self.parm.setKeyframe(11, 10.0)
+        channel = self.parm.channel
+        self.assertIs(channel.parm, self.parm)
+        self.assertEqual(self.node.evaluate(), 0.0)
+        self.assertTrue(channel.valid)
+        self.assertFalse(self.node.dirty)
+        expression.setFrame(4)
+        self.assertFalse(channel.valid)
+        self.assertTrue(self.node.dirty)
+        self.assertEqual(self.node.evaluate(), 3.0)
+        # Editing a key dirties the node too
+        self.parm.setKeyframe(11, 20.0)
+        self.assertTrue(self.node.dirty)
+        self.assertEqual(self.node.evaluate(), 6.0)
+
+    def test_expression_precedence(self):
+        self.parm.channel = Channel([1, 11], [0.0, 10.0])
+        self.parm.expression = '42'
+        self.assertEqual(self.parm.eval(), 42.0)
+        self.parm.expression = None
+        self.assertEqual(self.parm.eval(), self.parm.channel.valueAt(expression.frame()))
+
+    def test_shared_channel(self):
+        self.parm.channel = c = Channel([1], [1.0])
+        other = ParmFloat(self.node, 0.0, 'w')
+        self.assertRaises(ValueError, setattr, other, 'channel', c)
+        self.parm.channel = None
+        self.assertIsNone(c.parm)
+        other.channel = c
+        self.assertIs(c.parm, other)
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,127 @@
+from __future__ import division, absolute_import, print_function
+
+import unittest
+
+from merlin._types import Node, ParmFloat
+
+class CookCountNode(Node):
+    """Adds its "value" parameter to the sum of its inputs, counting cooks"""
+    @property
+    def numInputs(self):
+        return 2
+
+    def cook(self, **kwargs):
+        self.cooks = getattr(self, 'cooks', 0) + 1
+        total = self.parm('value').eval() + kwargs.get('offset', 0.0)
+        for i in range(self.numInputs):
+            data = self.inputData(i, **kwargs)
+            if data is not None:
+                total += data
+        return total
+
+def _node(parent, name, value):
+    node = parent.createNode('CookCountNode', name)
+    node.parameters.append(ParmFloat(node, value, 'value'))
+    return node
+
+class TestCook(unittest.TestCase):
+    def setUp(self):
+        # a -> b -> c, a -> e, and d on its own
+        self.root = Node.__new__(Node, None)
+        self.a = _node(self.root, 'a', 1.0)
+        self.b = _node(self.root, 'b', 10.0)
+        self.c = _node(self.root, 'c', 100.0)
+        self.d = _node(self.root, 'd', 1000.0)
+        self.e = _node(self.root, 'e', 10000.0)
+        self.b.inputs[0] = self.a
+        self.c.inputs[0] = self.b
+        self.e.inputs[0] = self.a
+        self.nodes = (self.a, self.b, self.c, self.d, self.e)
+        for node in self.nodes:
+            node.evaluate()
+        self.reset()
+
+    def reset(self):
+        for node in self.nodes:
+            node.cooks = 0
+
+    def cooks(self):
+        for node in self.nodes:
+            node.evaluate()
+        return dict((node.name, node.cooks) for node in self.nodes)
+
+    def test_clean_evaluate_does_not_cook(self):
+        self.assertEqual(self.c.evaluate(), 111.0)
+        self.assertEqual(self.cooks(), dict(a=0, b=0, c=0, d=0, e=0))
+        self.assertFalse(any(node.dirty for node in self.nodes))
+
+    def test_new_arguments_cook(self):
+        self.assertEqual(self.b.evaluate(offset=1.0), 13.0)
+        self.assertEqual(self.a.cooks, 1)
+        self.assertEqual(self.b.cooks, 1)
+        self.b.evaluate(offset=1.0)
+        self.assertEqual(self.b.cooks, 1)
+
+    def test_parameter_change(self):
+        self.b.parm('value').value = 20.0
+        self.assertEqual([n.dirty for n in self.nodes], [False, True, True, False, False])
+        self.assertEqual(self.cooks(), dict(a=0, b=1, c=1, d=0, e=0))
+        self.assertEqual(self.c.evaluate(), 121.0)
+
+    def test_unchanged_parameter_does_not_dirty(self):
+        self.b.parm('value').value = 10.0
+        self.assertEqual(self.cooks(), dict(a=0, b=0, c=0, d=0, e=0))
+
+    def test_upstream_change(self):
+        self.a.parm('value').value = 2.0
+        self.assertEqual(self.cooks(), dict(a=1, b=1, c=1, d=0, e=1))
+
+    def test_rewire(self):
+        self.c.inputs[0] = self.d
+        self.assertEqual([n.dirty for n in self.nodes], [False, False, True, False, False])
+        self.assertEqual(self.cooks(), dict(a=0, b=0, c=1, d=0, e=0))
+        self.assertEqual(self.c.evaluate(), 1100.0)
+        # c no longer depends on b
+        self.b.parm('value').value = 20.0
+        self.assertEqual(self.cooks(), dict(a=0, b=1, c=1, d=0, e=0))
+        self.d.parm('value').value = 2000.0
+        self.assertEqual(self.cooks(), dict(a=0, b=1, c=2, d=1, e=0))
+
+    def test_disconnect(self):
+        self.c.inputs[0] = None
+        self.assertEqual(self.cooks(), dict(a=0, b=0, c=1, d=0, e=0))
+        self.assertEqual(self.c.evaluate(), 100.0)
+        self.a.parm('value').value = 2.0
+        self.assertEqual(self.cooks(), dict(a=1, b=1, c=1, d=0, e=1))
+
+    def test_same_input_twice(self):
+        self.c.inputs[1] = self.b
+        self.c.inputs[0] = None
+        # Still connected through input 1
+        self.b.parm('value').value = 20.0
+        self.assertTrue(self.c.dirty)
+
+    def test_reparent(self):
+        other = self.root.createNode('CookCountNode', 'other')
+        other.children.add(self.b)
+        self.assertEqual([n.dirty for n in self.nodes], [False, True, True, False, False])
+
+    def test_destroy(self):
+        self.a.destroy()
+        self.assertEqual([n.dirty for n in self.nodes], [True, True, True, False, True])
+        self.assertIsNone(self.b.inputs[0])
+        self.assertIsNone(self.e.inputs[0])
+        self.assertEqual(self.c.evaluate(), 110.0)
+        self.assertEqual(self.e.evaluate(), 10000.0)
+        self.assertEqual((self.a.cooks, self.b.cooks, self.e.cooks), (0, 1, 1))
+
+    def test_destroy_downstream(self):
+        self.b.destroy()
+        self.assertIsNone(self.c.inputs[0])
+        self.assertNotIn(id(self.b), self.a._dependents)
+        self.assertEqual(self.c.evaluate(), 100.0)
+        self.a.parm('value').value = 2.0
+        self.assertFalse(self.c.dirty)
+
+if __name__ == '__main__':
+    unittest.main()
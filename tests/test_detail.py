@@ -0,0 +1,106 @@
+from __future__ import division, absolute_import, print_function
+
+import gc
+import unittest
+from array import array
+
+import numpy
+
+from merlin.geo import Geometry
+from merlin.geo.attribute import AttribClass
+
+class TestCreatePoints(unittest.TestCase):
+    def positions(self, geo):
+        return list(geo.attrib(AttribClass.Point, 'P'))
+
+    def test_tuples(self):
+        geo = Geometry()
+        self.assertEqual(list(geo.createPoints([(0, 1, 2), (3, 4, 5)])), [0, 1])
+        self.assertEqual(self.positions(geo), [0, 1, 2, 3, 4, 5])
+
+    def test_flat(self):
+        geo = Geometry()
+        self.assertEqual(list(geo.createPoints(array('d', range(6)))), [0, 1])
+        self.assertEqual(self.positions(geo), [0, 1, 2, 3, 4, 5])
+
+    def test_ndarray(self):
+        geo = Geometry()
+        geo.createPoint((9, 9, 9))
+        new = geo.createPoints(numpy.arange(12.0).reshape(4, 3))
+        self.assertEqual(list(new), [1, 2, 3, 4])
+        self.assertEqual(self.positions(geo)[3:], list(range(12)))
+
+    def test_empty(self):
+        geo = Geometry()
+        self.assertEqual(list(geo.createPoints([])), [])
+        self.assertEqual(list(geo.createPoints(numpy.zeros((0, 3)))), [])
+        self.assertEqual(geo.numPoints, 0)
+
+    def test_bad_size(self):
+        geo = Geometry()
+        self.assertRaises(ValueError, geo.createPoints, numpy.zeros((2, 2)))
+        self.assertRaises(ValueError, geo.createPoints, numpy.zeros(4))
+        self.assertEqual(geo.numPoints, 0)
+
+class TestShare(unittest.TestCase):
+    def setUp(self):
+        self.geo = geo = Geometry()
+        geo.createPoints([(0, 0, 0), (1, 0, 0), (0, 1, 0)])
+        geo.createPolygon([0, 1, 2])
+        geo.addAttrib(AttribClass.Point, 'v', 1.0)
+        geo.addAttrib(AttribClass.Prim, 'id', 7)
+
+    def test_attribs(self):
+        copy = self.geo.share()
+        v = copy.writableAttrib(AttribClass.Point, 'v')
+        v.setElement(0, 5.0)
+        self.assertEqual(list(self.geo.attrib(AttribClass.Point, 'v')), [1.0, 1.0, 1.0])
+        self.assertEqual(list(copy.attrib(AttribClass.Point, 'v')), [5.0, 1.0, 1.0])
+        # Attributes neither detail changed are still shared
+        for attribclass, name in ((AttribClass.Point, 'P'), (AttribClass.Prim, 'id')):
+            self.assertIs(copy.attrib(attribclass, name), self.geo.attrib(attribclass, name))
+        # Once copied, the attribute is no longer shared
+        self.assertIs(copy.writableAttrib(AttribClass.Point, 'v'), v)
+        original = self.geo.attrib(AttribClass.Point, 'v')
+        self.assertIs(self.geo.writableAttrib(AttribClass.Point, 'v'), original)
+
+    def test_topology(self):
+        copy = self.geo.share()
+        copy.createPoint((1, 1, 0))
+        copy.createPolygon([1, 3, 2])
+        self.assertEqual((self.geo.numPoints, self.geo.numVertices, self.geo.numPrims), (3, 3, 1))
+        self.assertEqual((copy.numPoints, copy.numVertices, copy.numPrims), (4, 6, 2))
+        self.assertEqual(list(self.geo.vertexPoints), [0, 1, 2])
+        self.assertEqual(list(copy.vertexPoints), [0, 1, 2, 1, 3, 2])
+        self.assertEqual(list(self.geo.attrib(AttribClass.Prim, 'id')), [7])
+        self.assertEqual(list(copy.attrib(AttribClass.Prim, 'id')), [7, 7])
+
+    def test_volume(self):
+        p = self.geo.createVolume()
+        p.grid.setValues([[0, 0, 0]], [1.0])
+        copy = self.geo.share()
+        self.assertIs(copy._volumes[p.number], self.geo._volumes[p.number])
+        copy.prim(p.number).grid.setValues([[0, 0, 0]], [2.0])
+        self.assertEqual(p.grid.getValues([[0, 0, 0]]).tolist(), [1.0])
+        self.assertEqual(copy.prim(p.number).grid.getValues([[0, 0, 0]]).tolist(), [2.0])
+
+    def test_release(self):
+        original = self.geo.attrib(AttribClass.Point, 'v')
+        copy = self.geo.share()
+        # A cached accelerator makes a reference cycle
+        copy.adjacency()
+        del copy
+        gc.collect()
+        self.assertIs(self.geo.writableAttrib(AttribClass.Point, 'v'), original)
+        vertexPoints = self.geo.vertexPoints
+        self.geo.createPolygon([2, 1, 0])
+        self.assertIs(self.geo.vertexPoints, vertexPoints)
+        # Details sharing with the collected one still share with each other
+        a, b = self.geo.share(), self.geo.share()
+        del a
+        gc.collect()
+        self.assertIsNot(self.geo.writableAttrib(AttribClass.Prim, 'id'),
+                         b.attrib(AttribClass.Prim, 'id'))
+
+if __name__ == '__main__':
+    unittest.main()
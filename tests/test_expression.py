@@ -0,0 +1,85 @@
+from __future__ import division, absolute_import, print_function
+
+import unittest
+
+from merlin._types import Node, ParmFloat
+from merlin import expression
+
+class ExpressionNode(Node):
+    def cook(self, **kwargs):
+        return self.parm('v').eval()
+
+def _node(parent, name):
+    node = parent.createNode('ExpressionNode', name)
+    for parm in ('v', 'other'):
+        node.parameters.append(ParmFloat(node, 1.0, parm))
+    return node
+
+class TestExpressionDependencies(unittest.TestCase):
+    def setUp(self):
+        self.root = Node.__new__(Node, None)
+        self.a = _node(self.root, 'a')
+        self.b = _node(self.root, 'b')
+        self.b.parm('v').value = 3.0
+
+    def expression(self, source):
+        parm = self.a.parm('v')
+        parm.expression = source
+        self.assertEqual(parm.eval(), 6.0)
+        return parm.expression
+
+    def test_ch_memoized(self):
+        e = self.expression("ch('/b/v') * 2")
+        self.assertTrue(e.valid)
+        self.b.parm('other').value = 5.0
+        self.assertTrue(e.valid)
+        self.b.setDirty()
+        self.assertTrue(e.valid)
+
+    def test_ch_parameter_change(self):
+        e = self.expression("ch('/b/v') * 2")
+        self.a.evaluate()
+        self.b.parm('v').value = 4.0
+        self.assertFalse(e.valid)
+        self.assertTrue(self.a.dirty)
+        self.assertEqual(self.a.evaluate(), 8.0)
+
+    def test_ch_path_change(self):
+        e = self.expression("ch('/b/v') * 2")
+        self.b.name = 'c'
+        self.assertFalse(e.valid)
+        self.assertRaises(KeyError, self.a.parm('v').eval)
+
+    def test_ch_own_node(self):
+        self.a.parm('other').value = 3.0
+        e = self.expression("ch('other') * 2")
+        self.a.setDirty()
+        self.assertTrue(e.valid)
+        self.a.parm('other').value = 4.0
+        self.assertFalse(e.valid)
+
+    def test_node_dirty(self):
+        e = self.expression("node('/b').parm('v').eval() * 2")
+        self.b.parm('other').value = 5.0
+        self.assertFalse(e.valid)
+
+    def test_time(self):
+        e = self.expression("6.0 + 0 * F")
+        expression.setFrame(expression.frame() + 1)
+        self.assertFalse(e.valid)
+
+    def test_time_nested(self):
+        # Time variables are seen, and tracked, inside nested scopes
+        for source in ("(lambda: F)() * 0 + 6.0", "[F * i for i in (0, 1, 2)][0] + 6.0",
+                       "max(T * 0 for i in (1, 2)) + 6.0", "(lambda x: 6.0 + 0 * FPS)(1)"):
+            e = self.expression(source)
+            self.assertTrue(e.timeDependent)
+            expression.setFrame(expression.frame() + 1)
+            self.assertFalse(e.valid)
+        frame = expression.frame()
+        e = expression.Expression("[F + i for i in (0, 1)]")
+        self.assertEqual(e.eval(), [frame, frame + 1])
+        self.assertFalse(expression.Expression("(lambda f: f * 2)(3)").timeDependent)
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,98 @@
+from __future__ import division, absolute_import, print_function
+
+import unittest
+
+import numpy
+
+from merlin.geo import Geometry
+from merlin.geo.attribute import AttribClass
+
+def _detail(P):
+    geo = Geometry()
+    if len(P):
+        geo.createPoints(numpy.asarray(P, dtype=numpy.float64))
+    return geo
+
+def _brute(P, X):
+    """Distances from every query to every point"""
+    return numpy.sqrt(((X[:, None, :] - P[None, :, :]) ** 2).sum(axis=-1))
+
+class TestNearest(unittest.TestCase):
+    def setUp(self):
+        rng = numpy.random.RandomState(7)
+        self.P = rng.uniform(-1.0, 1.0, (300, 3))
+        self.X = rng.uniform(-1.5, 1.5, (50, 3))
+        self.geo = _detail(self.P)
+
+    def test_brute_force(self):
+        for k in (1, 5):
+            points, distances = self.geo.pointTree().nearest(self.X, k)
+            D = _brute(self.P, self.X)
+            expected = numpy.argsort(D, axis=1)[:, :k]
+            self.assertEqual(points.tolist(), expected.tolist())
+            self.assertTrue(numpy.allclose(distances, numpy.sort(D, axis=1)[:, :k]))
+
+    def test_max_distance(self):
+        points, distances = self.geo.pointTree().nearest(self.X, 4, maxDistance=0.2)
+        D = _brute(self.P, self.X)
+        within = numpy.sum(D <= 0.2, axis=1)
+        self.assertEqual(numpy.sum(points >= 0, axis=1).tolist(),
+                         numpy.minimum(within, 4).tolist())
+        self.assertTrue(numpy.all(numpy.isinf(distances[points < 0])))
+
+    def test_more_than_points(self):
+        geo = _detail(self.P[:3])
+        points, distances = geo.pointTree().nearest(self.X[:2], 5)
+        self.assertEqual(points.shape, (2, 5))
+        self.assertEqual(sorted(points[0, :3].tolist()), [0, 1, 2])
+        self.assertEqual(points[:, 3:].tolist(), [[-1, -1], [-1, -1]])
+        self.assertTrue(numpy.all(numpy.isinf(distances[:, 3:])))
+
+    def test_duplicates(self):
+        P = numpy.repeat(self.P[:40], 3, axis=0)
+        geo = _detail(P)
+        points, distances = geo.pointTree().nearest(self.X, 3)
+        D = _brute(P, self.X)
+        self.assertTrue(numpy.allclose(distances, numpy.sort(D, axis=1)[:, :3]))
+        # The three copies of the nearest point
+        self.assertEqual((points // 3).tolist(), numpy.repeat(points[:, :1] // 3, 3, axis=1).tolist())
+        self.assertEqual(len(set(points[0].tolist())), 3)
+
+    def test_empty(self):
+        tree = _detail([]).pointTree()
+        points, distances = tree.nearest(self.X[:2], 2)
+        self.assertEqual(points.tolist(), [[-1, -1], [-1, -1]])
+        q, p, d = tree.radius(self.X[:2], 1.0)
+        self.assertEqual((len(q), len(p), len(d)), (0, 0, 0))
+
+class TestRadius(unittest.TestCase):
+    def test_brute_force(self):
+        rng = numpy.random.RandomState(11)
+        P = rng.uniform(-1.0, 1.0, (500, 3))
+        X = rng.uniform(-1.0, 1.0, (40, 3))
+        radius = rng.uniform(0.0, 0.5, 40)
+        q, p, d = _detail(P).pointTree().radius(X, radius)
+        D = _brute(P, X)
+        eq, ep = numpy.nonzero(D <= radius[:, None])
+        self.assertEqual(sorted(zip(q.tolist(), p.tolist())), sorted(zip(eq.tolist(), ep.tolist())))
+        self.assertTrue(numpy.allclose(d, D[q, p]))
+        # Sorted by query, then distance
+        self.assertTrue(numpy.all(numpy.diff(q) >= 0))
+        same = q[1:] == q[:-1]
+        self.assertTrue(numpy.all(numpy.diff(d)[same] >= 0))
+
+class TestCache(unittest.TestCase):
+    def test_reuse_and_rebuild(self):
+        geo = _detail([(0, 0, 0), (1, 0, 0), (5, 0, 0)])
+        tree = geo.pointTree()
+        self.assertIs(geo.pointTree(), tree)
+        P = geo.writableAttrib(AttribClass.Point, 'P')
+        P[6] = -1.0
+        rebuilt = geo.pointTree()
+        self.assertIsNot(rebuilt, tree)
+        self.assertEqual(rebuilt.nearest([(-1.2, 0, 0)])[0].tolist(), [[2]])
+        geo.createPoint((-2, 0, 0))
+        self.assertEqual(geo.pointTree().nearest([(-1.9, 0, 0)])[0].tolist(), [[3]])
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,133 @@
+from __future__ import division, absolute_import, print_function
+
+import io
+import os
+import shutil
+import struct
+import tempfile
+import unittest
+
+import numpy
+
+from merlin.geo import Geometry, mgeo
+from merlin.geo.attribute import AttribClass
+from merlin.geo.volume import VoxelGrid
+
+def _values(geo, attribclass, name):
+    attr = geo.attrib(attribclass, name)
+    return [attr.element(i) for i in range(attr.numElements)]
+
+class TestMGeo(unittest.TestCase):
+    def setUp(self):
+        self.tmp = tempfile.mkdtemp()
+        self.path = os.path.join(self.tmp, 'geo.mgeo')
+
+    def tearDown(self):
+        shutil.rmtree(self.tmp)
+
+    def roundtrip(self, geo, attribs=None):
+        mgeo.saveGeometry(geo, self.path)
+        return mgeo.loadGeometry(self.path, attribs)
+
+    def assertTopology(self, a, b):
+        self.assertEqual((a.numPoints, a.numVertices, a.numPrims),
+                         (b.numPoints, b.numVertices, b.numPrims))
+        for name in mgeo._topology:
+            self.assertEqual(list(getattr(a, name)), list(getattr(b, name)))
+
+    def polygons(self):
+        geo = Geometry()
+        geo.createPoints([(0, 0, 0), (1, 0, 0), (1, 1, 0), (0, 1, 0), (2, 0, 0)])
+        geo.createPolygon([0, 1, 2, 3])
+        geo.createPolygon([1, 4, 2])
+        return geo
+
+    def test_empty(self):
+        geo = self.roundtrip(Geometry())
+        self.assertTopology(geo, Geometry())
+        self.assertEqual(list(geo.attrib(AttribClass.Point, 'P')), [])
+
+    def test_attributes(self):
+        geo = self.polygons()
+        geo.addAttrib(AttribClass.Point, 'id', 7)
+        geo.writableAttrib(AttribClass.Point, 'id').setElement(2, 3)
+        geo.addAttrib(AttribClass.Vertex, 'uv', (0.5, 0.25))
+        geo.addAttrib(AttribClass.Prim, 'name', 'a')
+        geo.writableAttrib(AttribClass.Prim, 'name').setElement(1, 'b')
+        geo.addAttrib(AttribClass.Global, 'scale', 2.0)
+        loaded = self.roundtrip(geo)
+        self.assertTopology(loaded, geo)
+        for attribclass, name in ((AttribClass.Point, 'P'), (AttribClass.Point, 'id'),
+                                  (AttribClass.Vertex, 'uv'), (AttribClass.Prim, 'name'),
+                                  (AttribClass.Global, 'scale')):
+            self.assertEqual(_values(loaded, attribclass, name), _values(geo, attribclass, name))
+        self.assertEqual(_values(loaded, AttribClass.Prim, 'name'), ['a', 'b'])
+        self.assertEqual(loaded.attrib(AttribClass.Prim, 'name').default, ('a',))
+
+    def test_attribs_filter(self):
+        geo = self.polygons()
+        geo.addAttrib(AttribClass.Point, 'id', 7)
+        geo.addAttrib(AttribClass.Prim, 'name', 'a')
+        loaded = self.roundtrip(geo, [(AttribClass.Prim, 'name')])
+        self.assertTopology(loaded, geo)
+        self.assertEqual(sorted(loaded.attribs(AttribClass.Point)), ['P'])
+        self.assertEqual(sorted(loaded.attribs(AttribClass.Prim)), ['name'])
+
+    def test_volume(self):
+        grid = VoxelGrid(0.5, -1.0, 4)
+        ijk = numpy.array([[0, 0, 0], [1, 2, 3], [9, 0, -5]])
+        grid.setValues(ijk, numpy.array([1.0, 2.0, 3.0]))
+        grid.setTiles(1, [[3, 3, 3]], 4.0)
+        geo = Geometry()
+        number = geo.createVolume(grid, (1, 2, 3)).number
+        loaded = self.roundtrip(geo)
+        copy = loaded._volumes[number]
+        self.assertEqual((copy.voxelSize, copy.background, copy.leafSize),
+                         (0.5, -1.0, 4))
+        self.assertEqual(copy.dtype, grid.dtype)
+        self.assertEqual(copy.numLeaves, grid.numLeaves)
+        self.assertEqual(copy.numTiles, grid.numTiles)
+        probe = numpy.vstack((ijk, [[24, 25, 26], [2, 2, 2], [100, 0, 0]]))
+        self.assertEqual(list(copy.getValues(probe)), list(grid.getValues(probe)))
+        self.assertEqual(list(copy.isActive(probe)), list(grid.isActive(probe)))
+
+    def test_packed(self):
+        source = self.polygons()
+        source.addAttrib(AttribClass.Point, 'id', 7)
+        geo = Geometry()
+        M = numpy.tile(numpy.eye(4), (2, 1, 1))
+        M[1, 3, :3] = (5, 0, 0)
+        geo.createPackedPrims(source, M)
+        loaded = self.roundtrip(geo)
+        self.assertTopology(loaded, geo)
+        self.assertEqual(len(loaded._sources), 1)
+        self.assertTopology(loaded._sources[0], source)
+        self.assertEqual(_values(loaded._sources[0], AttribClass.Point, 'id'),
+                         _values(source, AttribClass.Point, 'id'))
+        for name in ('transform', 'packedsource'):
+            self.assertEqual(_values(loaded, AttribClass.Prim, name),
+                             _values(geo, AttribClass.Prim, name))
+
+        with mgeo.GeometryCache(self.path) as cache:
+            self.assertEqual(cache.numSources, 1)
+            with cache.source(0) as nested:
+                self.assertEqual(nested.numPrims, 2)
+                self.assertEqual(nested.positions.tolist(),
+                                 numpy.frombuffer(source.attrib(AttribClass.Point, 'P'))
+                                 .reshape(-1, 3).tolist())
+
+    def test_newer_version(self):
+        mgeo.saveGeometry(self.polygons(), self.path)
+        with io.open(self.path, 'r+b') as f:
+            f.seek(4)
+            f.write(struct.pack(str('<I'), mgeo.VERSION + 1))
+        self.assertRaises(ValueError, mgeo.GeometryCache, self.path)
+        self.assertRaises(ValueError, mgeo.loadGeometry, self.path)
+
+    def test_not_mgeo(self):
+        with io.open(self.path, 'wb') as f:
+            f.write(b'not a cache')
+        self.assertRaises(ValueError, mgeo.GeometryCache, self.path)
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,110 @@
+from __future__ import division, absolute_import, print_function
+
+import time
+import unittest
+
+from merlin._types import Node
+
+class NamedNode(Node):
+    pass
+
+class TestNames(unittest.TestCase):
+    def setUp(self):
+        self.root = Node.__new__(Node, None)
+
+    def create(self, name=None):
+        return self.root.createNode('NamedNode', name)
+
+    def names(self):
+        return sorted(n.name for n in self.root.children)
+
+    def test_suffixes(self):
+        self.assertEqual([self.create('box').name for _ in range(3)], ['box', 'box1', 'box2'])
+        self.assertEqual(self.create('box7').name, 'box7')
+        # New suffixes continue after the highest one
+        self.assertEqual(self.create('box').name, 'box8')
+        self.assertEqual(self.create('box7').name, 'box9')
+        self.assertEqual(self.create('sphere2').name, 'sphere2')
+        self.assertEqual(self.create().name, 'NamedNode1')
+        self.assertEqual(self.create().name, 'NamedNode2')
+
+    def test_rename(self):
+        a, b = self.create('a'), self.create('b')
+        a.name = 'a'
+        self.assertEqual(a.name, 'a')
+        b.name = 'a'
+        self.assertEqual(b.name, 'a1')
+        a.name = 'c'
+        self.assertEqual(self.names(), ['a1', 'c'])
+        # The freed name can be used again
+        self.assertEqual(self.create('a').name, 'a')
+        self.assertIs(self.root.findNode('/a1'), b)
+
+    def test_destroy(self):
+        nodes = [self.create('box') for _ in range(3)]
+        nodes[0].destroy()
+        self.assertEqual(self.names(), ['box1', 'box2'])
+        self.assertEqual(self.create('box').name, 'box')
+        nodes[2].destroy()
+        # Suffixes are not reused
+        self.assertEqual(self.create('box').name, 'box3')
+
+    def test_destroy_high_suffix(self):
+        self.create('box')
+        node = self.create('box5000000')
+        start = time.time()
+        node.destroy()
+        self.assertLess(time.time() - start, 0.1)
+        self.assertEqual(self.names(), ['box'])
+
+class TestPaths(unittest.TestCase):
+    def setUp(self):
+        # /a/b/c and /d
+        self.root = Node.__new__(Node, None)
+        self.a = self.root.createNode('NamedNode', 'a')
+        self.b = self.a.createNode('NamedNode', 'b')
+        self.c = self.b.createNode('NamedNode', 'c')
+        self.d = self.root.createNode('NamedNode', 'd')
+
+    def checkIndex(self, *missing):
+        """Check the path index matches the hierarchy, and that the paths
+        given are not found"""
+        self.assertEqual(self.root._pathindex,
+                         dict((node.path, node) for node in self.root._iterSubtree()))
+        for path in missing:
+            self.assertRaises(KeyError, self.root.findNode, path)
+
+    def test_find(self):
+        self.assertIs(self.root.findNode('/a/b/c'), self.c)
+        self.assertIs(self.d.findNode('/a/b/'), self.b)
+        self.assertIs(self.c.findNode('/'), self.root)
+        self.checkIndex('/b', '/a/c', '/a/b/c/d')
+
+    def test_ancestor_rename(self):
+        self.a.name = 'x'
+        self.assertEqual(self.c.path, '/x/b/c')
+        self.assertIs(self.root.findNode('/x/b/c'), self.c)
+        self.checkIndex('/a', '/a/b', '/a/b/c')
+        # The old path can be used again
+        a = self.root.createNode('NamedNode', 'a')
+        self.assertIs(self.root.findNode('/a'), a)
+        self.checkIndex('/a/b')
+
+    def test_reparent(self):
+        self.d.children.add(self.b)
+        self.assertIs(self.b.parent, self.d)
+        self.assertEqual(self.c.path, '/d/b/c')
+        self.assertIs(self.root.findNode('/d/b/c'), self.c)
+        self.assertEqual(list(self.a.children), [])
+        self.checkIndex('/a/b', '/a/b/c')
+
+    def test_destroy(self):
+        self.b.destroy()
+        self.assertEqual(list(self.a.children), [])
+        self.checkIndex('/a/b', '/a/b/c')
+        b = self.a.createNode('NamedNode', 'b')
+        self.assertIs(self.root.findNode('/a/b'), b)
+        self.checkIndex('/a/b/c')
+
+if __name__ == '__main__':
+    unittest.main()
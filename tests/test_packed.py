@@ -0,0 +1,116 @@
+from __future__ import division, absolute_import, print_function
+
+import unittest
+
+import numpy
+
+from merlin.geo import Geometry, prim
+from merlin.geo.attribute import AttribClass
+from merlin.geo.packed import instanceTransforms, packedBounds, unpack
+
+def _matrix(A=numpy.eye(3), t=(0, 0, 0)):
+    M = numpy.eye(4)
+    M[:3, :3] = A
+    M[3, :3] = t
+    return M
+
+def _values(geo, attribclass, name):
+    attr = geo.attrib(attribclass, name)
+    return numpy.array([attr.element(i) for i in range(len(attr) // attr.size)]).reshape(-1, attr.size)
+
+# A quarter turn about z, taking x to y
+_turn = [[0, 1, 0], [-1, 0, 0], [0, 0, 1]]
+
+class TestPacked(unittest.TestCase):
+    def setUp(self):
+        self.source = source = Geometry()
+        source.createPoints([(0, 0, 0), (1, 0, 0), (0, 1, 0)])
+        source.createPolygon([0, 1, 2])
+        source.addAttrib(AttribClass.Point, 'N', (1.0, 0.0, 0.0))
+        source.addAttrib(AttribClass.Point, 'Cd', (1.0, 1.0, 1.0))
+        source.addAttrib(AttribClass.Prim, 'name', 'tri')
+        self.M = numpy.array([_matrix(t=(10, 0, 0)), _matrix(2 * numpy.eye(3), (0, 5, 0)),
+                              _matrix(_turn)])
+        self.geo = Geometry()
+        self.prims = self.geo.createPackedPrims(self.source, self.M)
+
+    def test_create(self):
+        self.assertEqual(list(self.prims), [0, 1, 2])
+        self.assertEqual((self.geo.numPoints, self.geo.numPrims), (3, 3))
+        self.assertTrue(all(isinstance(p, prim.PackedGeometry) for p in self.geo.prims))
+        self.assertTrue(numpy.allclose(instanceTransforms(self.geo), self.M))
+        self.assertTrue(numpy.allclose(instanceTransforms(self.geo, [2, 0]), self.M[[2, 0]]))
+        more = self.geo.createPackedPrims(self.source, self.M[:1])
+        self.assertEqual(list(more), [3])
+        self.assertEqual(list(self.geo.createPackedPrims(self.source, numpy.empty((0, 4, 4)))), [])
+        self.geo.createPolygon([0, 1, 2])
+        self.assertRaises(TypeError, instanceTransforms, self.geo, [4])
+
+    def test_bounds(self):
+        lo, hi = packedBounds(self.geo)
+        self.assertTrue(numpy.allclose(lo, [(10, 0, 0), (0, 5, 0), (-1, 0, 0)]))
+        self.assertTrue(numpy.allclose(hi, [(11, 1, 0), (2, 7, 0), (0, 1, 0)]))
+        empty = Geometry()
+        empty.createPackedPrims(Geometry(), self.M[:1])
+        lo, hi = packedBounds(empty)
+        self.assertTrue(numpy.all(lo > hi))
+
+    def test_unpack(self):
+        result = unpack(self.geo)
+        self.assertEqual((result.numPoints, result.numPrims), (9, 3))
+        P = numpy.frombuffer(result.attrib(AttribClass.Point, 'P')).reshape(-1, 3)
+        expected = [(10, 0, 0), (11, 0, 0), (10, 1, 0), (0, 5, 0), (2, 5, 0), (0, 7, 0),
+                    (0, 0, 0), (0, 1, 0), (-1, 0, 0)]
+        self.assertTrue(numpy.allclose(P, expected))
+        # Normals are transformed and renormalized
+        N = _values(result, AttribClass.Point, 'N')
+        self.assertTrue(numpy.allclose(N, [(1, 0, 0)] * 6 + [(0, 1, 0)] * 3))
+        self.assertEqual([result.attrib(AttribClass.Prim, 'name').element(i) for i in range(3)],
+                         ['tri'] * 3)
+        # The source is untouched
+        self.assertEqual(list(self.source.attrib(AttribClass.Point, 'P'))[3:6], [1.0, 0.0, 0.0])
+        single = self.geo.prim(1).unpack()
+        self.assertEqual(single.numPrims, 1)
+        self.assertTrue(numpy.allclose(
+            numpy.frombuffer(single.attrib(AttribClass.Point, 'P')).reshape(-1, 3), expected[3:6]))
+
+    def test_overrides(self):
+        geo = self.geo
+        cd = geo.addAttrib(AttribClass.Prim, 'Cd', (0.0, 0.0, 0.0))
+        cd.setElement(1, (1.0, 0.0, 0.0))
+        name = geo.addAttrib(AttribClass.Prim, 'name', '')
+        name.setElement(0, 'first')
+        name.setElement(2, 'third')
+        geo.addAttrib(AttribClass.Prim, 'piece', 0).setElement(2, 4)
+        result = unpack(geo)
+        # Point attributes of the source are overridden for the whole copy
+        Cd = _values(result, AttribClass.Point, 'Cd')
+        self.assertTrue(numpy.allclose(Cd, [(0, 0, 0)] * 3 + [(1, 0, 0)] * 3 + [(0, 0, 0)] * 3))
+        self.assertEqual([result.attrib(AttribClass.Prim, 'name').element(i) for i in range(3)],
+                         ['first', '', 'third'])
+        # Attributes the source does not have are added to the primitives
+        self.assertEqual(_values(result, AttribClass.Prim, 'piece')[:, 0].tolist(), [0, 0, 4])
+        self.assertIsNone(result.findAttrib(AttribClass.Prim, 'packedsource'))
+
+    def test_nested(self):
+        # Two instances of the triangle, packed again twice
+        middle = Geometry()
+        middle.createPackedPrims(self.source, [_matrix(), _matrix(t=(0, 0, 3))])
+        top = Geometry()
+        top.createPackedPrims(middle, [_matrix(t=(5, 0, 0)), _matrix(_turn)])
+        lo, hi = packedBounds(top)
+        self.assertTrue(numpy.allclose(lo, [(5, 0, 0), (-1, 0, 0)]))
+        self.assertTrue(numpy.allclose(hi, [(6, 1, 3), (0, 1, 3)]))
+        # Nested instances stay packed, with their transforms composed
+        once = unpack(top)
+        self.assertEqual(once.numPrims, 4)
+        self.assertTrue(numpy.allclose(instanceTransforms(once), [
+            _matrix(t=(5, 0, 0)), _matrix(t=(5, 0, 3)), _matrix(_turn), _matrix(_turn, (0, 0, 3))]))
+        twice = unpack(once)
+        self.assertEqual((twice.numPoints, twice.numPrims), (12, 4))
+        P = numpy.frombuffer(twice.attrib(AttribClass.Point, 'P')).reshape(-1, 3)
+        self.assertTrue(numpy.allclose(P.min(axis=0), (-1, 0, 0)))
+        self.assertTrue(numpy.allclose(P.max(axis=0), (6, 1, 3)))
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,106 @@
+from __future__ import division, absolute_import, print_function
+
+import math
+import unittest
+
+import numpy
+
+from merlin.geo import Geometry
+from merlin.geo.attribute import AttribClass
+from merlin.geo.polygon import (NormalWeight, faceNormals, faceAreas, faceCentroids,
+                                pointNormals, triangulate)
+
+def _normalize(v):
+    v = numpy.asarray(v, dtype=numpy.float64)
+    return v / numpy.linalg.norm(v)
+
+def _star(n, z=0.0):
+    """A concave polygon of n corners, alternating between two radii"""
+    t = numpy.linspace(0.0, 2.0 * math.pi, n, endpoint=False)
+    r = numpy.where(numpy.arange(n) % 2, 0.5, 1.0)
+    return numpy.column_stack((r * numpy.cos(t), r * numpy.sin(t), numpy.full(n, z)))
+
+class TestFaces(unittest.TestCase):
+    def setUp(self):
+        self.geo = geo = Geometry()
+        geo.createPoints([(0, 0, 0), (2, 0, 0), (2, 1, 0), (0, 1, 0), (0, 0, 3), (5, 5, 5)])
+        geo.createPolygon([0, 1, 2, 3])
+        geo.createPolygon([0, 4, 1])
+        geo.createPolygon([0, 1, 2], closed=False)
+
+    def test_normals(self):
+        self.assertTrue(numpy.allclose(faceNormals(self.geo), [(0, 0, 1), (0, 1, 0), (0, 0, 0)]))
+
+    def test_areas(self):
+        self.assertTrue(numpy.allclose(faceAreas(self.geo), [2.0, 3.0, 0.0]))
+
+    def test_centroids(self):
+        self.assertTrue(numpy.allclose(faceCentroids(self.geo),
+                                       [(1, 0.5, 0), (2 / 3, 0, 1), (4 / 3, 1 / 3, 0)]))
+
+class TestPointNormals(unittest.TestCase):
+    def setUp(self):
+        # Two triangles meeting at point 0: one of area 1.5 facing +z with
+        # a right angle there, one of area 0.5 facing -y with 45 degrees
+        self.geo = geo = Geometry()
+        geo.createPoints([(0, 0, 0), (1, 0, 0), (0, 3, 0), (1, 0, -1), (7, 7, 7)])
+        geo.createPolygon([0, 1, 2])
+        geo.createPolygon([0, 3, 1])
+
+    def check(self, weighting, expected):
+        N = pointNormals(self.geo, weighting)
+        self.assertTrue(numpy.allclose(N[0], _normalize(expected)))
+        self.assertTrue(numpy.allclose(N[2], (0, 0, 1)))
+        self.assertTrue(numpy.allclose(N[3], (0, -1, 0)))
+        self.assertTrue(numpy.allclose(N[4], (0, 0, 0)))
+
+    def test_uniform(self):
+        self.check(NormalWeight.Uniform, (0, -1, 1))
+
+    def test_area(self):
+        self.check(NormalWeight.Area, (0, -0.5, 1.5))
+
+    def test_angle(self):
+        self.check(NormalWeight.Angle, (0, -math.pi / 4, math.pi / 2))
+
+    def test_unknown(self):
+        self.assertRaises(ValueError, pointNormals, self.geo, 42)
+
+class TestTriangulate(unittest.TestCase):
+    def check(self, geo):
+        """Check the triangles cover every polygon exactly, wound like it"""
+        vertices, prims = triangulate(geo)
+        P = numpy.frombuffer(geo.attrib(AttribClass.Point, 'P')).reshape(-1, 3)
+        vp = numpy.frombuffer(geo.vertexPoints, dtype=geo.vertexPoints.code)
+        T = P[vp[vertices]]
+        cross = 0.5 * numpy.cross(T[:, 1] - T[:, 0], T[:, 2] - T[:, 0])
+        areas = numpy.einsum('ti,ti->t', cross, faceNormals(geo)[prims])
+        self.assertTrue(numpy.all(areas > 0.0))
+        self.assertTrue(numpy.allclose(numpy.bincount(prims, weights=areas, minlength=geo.numPrims),
+                                       faceAreas(geo)))
+        return vertices, prims
+
+    def test_concave(self):
+        geo = Geometry()
+        # An L shape, the same shape wound the other way, and a star in
+        # the xz plane, all with six corners
+        geo.createPoints([(0, 0, 0), (2, 0, 0), (2, 1, 0), (1, 1, 0), (1, 2, 0), (0, 2, 0)])
+        geo.createPoints(_star(6)[:, [0, 2, 1]])
+        geo.createPolygon(range(6))
+        geo.createPolygon(range(5, -1, -1))
+        geo.createPolygon(range(6, 12))
+        geo.createPolygon([0, 1, 2])
+        vertices, prims = self.check(geo)
+        self.assertEqual(numpy.bincount(prims).tolist(), [4, 4, 4, 1])
+
+    def test_large(self):
+        geo = Geometry()
+        geo.createPoints(_star(400))
+        geo.createPoints(_star(400, z=1.0)[::-1])
+        geo.createPolygon(range(400))
+        geo.createPolygon(range(400, 800))
+        vertices, prims = self.check(geo)
+        self.assertEqual(len(vertices), 2 * 398)
+
+if __name__ == '__main__':
+    unittest.main()
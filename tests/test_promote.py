@@ -0,0 +1,134 @@
+from __future__ import division, absolute_import, print_function
+
+import unittest
+
+import numpy
+
+from merlin.geo import Geometry, prim
+from merlin.geo.attribute import AttribClass
+from merlin.geo.promote import (Reduce, promoteAttrib, reduceValues, interpolateBarycentric,
+                                primUV)
+
+def _set(attr, values):
+    for i, value in enumerate(values):
+        attr.setElement(i, value)
+    return attr
+
+def _list(attr):
+    return [attr.element(i) for i in range(attr.numElements)]
+
+class TestPromote(unittest.TestCase):
+    def setUp(self):
+        # A triangle and a quad sharing the edge 1-2; point 5 is unused
+        self.geo = geo = Geometry()
+        geo.createPoints([(0, 0, 0), (1, 0, 0), (0, 1, 0), (2, 0, 0), (2, 1, 0), (9, 9, 9)])
+        geo.createPolygon([0, 1, 2])
+        geo.createPolygon([1, 3, 4, 2])
+        _set(geo.addAttrib(AttribClass.Point, 'v', 0.0), [1, 2, 3, 4, 5, 6])
+
+    def promote(self, method, **kwargs):
+        return _list(promoteAttrib(self.geo, AttribClass.Point, AttribClass.Prim, 'v',
+                                   method, **kwargs))
+
+    def test_methods(self):
+        self.assertEqual(self.promote(Reduce.Average), [2.0, 3.5])
+        self.assertEqual(self.promote(Reduce.Sum), [6.0, 14.0])
+        self.assertEqual(self.promote(Reduce.Min), [1.0, 2.0])
+        self.assertEqual(self.promote(Reduce.Max), [3.0, 5.0])
+        self.assertEqual(self.promote(Reduce.First), [1.0, 2.0])
+        _set(self.geo.writableAttrib(AttribClass.Point, 'v'), [7, 3, 3, 5, 5, 0])
+        # The most common value, ties going to the lowest
+        self.assertEqual(self.promote(Reduce.Mode), [3.0, 3.0])
+        self.assertRaises(ValueError, self.promote, 42)
+
+    def test_weights(self):
+        _set(self.geo.addAttrib(AttribClass.Point, 'mass', 1.0), [1, 1, 2, 0, 0, 5])
+        self.assertEqual(self.promote(Reduce.Average, weights='mass'), [9.0 / 4.0, 8.0 / 3.0])
+        self.assertEqual(self.promote(Reduce.Sum, weights=[0, 1, 0, 1, 0, 0]), [2.0, 6.0])
+
+    def test_new_name(self):
+        promoteAttrib(self.geo, AttribClass.Point, AttribClass.Prim, 'v', newName='avg',
+                      deleteOriginal=True)
+        self.assertIsNone(self.geo.findAttrib(AttribClass.Point, 'v'))
+        self.assertEqual(_list(self.geo.attrib(AttribClass.Prim, 'avg')), [2.0, 3.5])
+        self.assertRaises(ValueError, promoteAttrib, self.geo, AttribClass.Prim,
+                          AttribClass.Prim, 'avg')
+
+    def test_to_points(self):
+        _set(self.geo.addAttrib(AttribClass.Prim, 'w', -1.0), [10, 20])
+        result = promoteAttrib(self.geo, AttribClass.Prim, AttribClass.Point, 'w')
+        # The unused point gets the default
+        self.assertEqual(_list(result), [10, 15, 15, 20, 20, -1])
+
+    def test_vertex_and_global(self):
+        result = promoteAttrib(self.geo, AttribClass.Point, AttribClass.Vertex, 'v')
+        self.assertEqual(_list(result), [1, 2, 3, 2, 4, 5, 3])
+        result = promoteAttrib(self.geo, AttribClass.Point, AttribClass.Global, 'v', Reduce.Max)
+        self.assertEqual(_list(result), [6])
+        result = promoteAttrib(self.geo, AttribClass.Global, AttribClass.Prim, 'v')
+        self.assertEqual(_list(result), [6, 6])
+
+    def test_integer_rounding(self):
+        _set(self.geo.addAttrib(AttribClass.Point, 'id', 0), [1, 2, 2, 0, 1, 0])
+        result = promoteAttrib(self.geo, AttribClass.Point, AttribClass.Prim, 'id')
+        self.assertEqual(_list(result), [2, 1])
+        self.assertEqual(result.code, self.geo.attrib(AttribClass.Point, 'id').code)
+
+    def test_strings(self):
+        _set(self.geo.addAttrib(AttribClass.Point, 'name', ''), ['a', 'b', 'c', 'c', 'd', 'e'])
+        first = promoteAttrib(self.geo, AttribClass.Point, AttribClass.Prim, 'name',
+                              Reduce.First, newName='first')
+        mode = promoteAttrib(self.geo, AttribClass.Point, AttribClass.Prim, 'name',
+                             Reduce.Mode, newName='mode')
+        self.assertEqual(_list(first), ['a', 'b'])
+        self.assertEqual(_list(mode), ['a', 'c'])
+        self.assertRaises(TypeError, promoteAttrib, self.geo, AttribClass.Point,
+                          AttribClass.Prim, 'name', Reduce.Average)
+
+    def test_reduce_values(self):
+        result, found = reduceValues(numpy.array([[1.0], [3.0], [5.0]]), [2, 2, 0], 4)
+        self.assertEqual(found.tolist(), [True, False, True, False])
+        self.assertEqual(result[found, 0].tolist(), [5.0, 2.0])
+
+class TestInterpolate(unittest.TestCase):
+    def setUp(self):
+        self.geo = geo = Geometry()
+        geo.createPoints([(0, 0, 0), (1, 0, 0), (0, 1, 0), (2, 0, 0), (2, 1, 0)])
+        geo.createPolygon([0, 1, 2])
+        geo.createPolygon([1, 3, 4, 2])
+        geo.createPolygon([0, 1, 3], closed=False)
+        _set(geo.addAttrib(AttribClass.Point, 'v', 0.0), [1, 2, 3, 4, 5])
+        uv = geo.addAttrib(AttribClass.Vertex, 'uv', (0.0, 0.0))
+        _set(uv, [(0, 0), (1, 0), (0, 1), (0, 0), (1, 0), (1, 1), (0, 1), (0, 0), (0, 0), (0, 0)])
+
+    def test_barycentric(self):
+        result = interpolateBarycentric(self.geo, AttribClass.Point, 'v',
+                                        [[0, 1, 2], [0, 1, 2]], [0.25, 0.0], [0.5, 1.0])
+        self.assertTrue(numpy.allclose(result[:, 0], [0.25 + 0.5 + 1.5, 3.0]))
+
+    def test_prim_uv(self):
+        result = primUV(self.geo, AttribClass.Point, 'v', [0, 1, 1, 2, 2, 2],
+                        [0.5, 0.5, 1.0, 0.0, 0.25, 1.0], [0.5, 0.5, 0.0, 0, 0, 0])
+        # Barycentric, bilinear, and linear by vertex along the open polygon
+        self.assertTrue(numpy.allclose(result[:, 0], [2.5, 3.5, 4.0, 1.0, 1.5, 4.0]))
+        uv = primUV(self.geo, AttribClass.Vertex, 'uv', [1, 1], [0.25, 0.75], [0.5, 1.0])
+        self.assertTrue(numpy.allclose(uv, [(0.25, 0.5), (0.75, 1.0)]))
+        self.assertEqual(primUV(self.geo, AttribClass.Point, 'P', [1], 0.0).tolist(), [[1, 0, 0]])
+
+    def test_prim_and_spline(self):
+        geo = self.geo
+        _set(geo.addAttrib(AttribClass.Prim, 'id', 0), [4, 5, 6])
+        self.assertEqual(primUV(geo, AttribClass.Prim, 'id', [2, 0], 0.5).tolist(), [[6], [4]])
+        curve = geo.createCurves(prim.BezierCurve, [4], [0, 1, 3, 4])[0]
+        result = primUV(geo, AttribClass.Point, 'v', [curve], 0.5)
+        self.assertTrue(numpy.allclose(result, [(1 + 3 * 2 + 3 * 4 + 5) / 8.0]))
+
+    def test_unsupported(self):
+        geo = self.geo
+        geo.createPolygon([0, 1, 3, 4, 2])
+        self.assertRaises(ValueError, primUV, geo, AttribClass.Point, 'v', [3], 0.5, 0.5)
+        geo.createQuadratic(prim.Sphere)
+        self.assertRaises(TypeError, primUV, geo, AttribClass.Point, 'v', [4], 0.5)
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,60 @@
+from __future__ import division, absolute_import, print_function
+
+import unittest
+
+import numpy
+
+from merlin.geo import Geometry, prim
+
+class TestIntersect(unittest.TestCase):
+    def setUp(self):
+        self.geo = Geometry()
+
+    def check(self, p, origins, directions, expected):
+        t = p.intersect(origins, directions)
+        self.assertTrue(numpy.allclose(t, expected), (t, expected))
+
+    def test_tube(self):
+        p = self.geo.createQuadratic(prim.Tube, (1, 0, 0), size=(0.5, 2.0, 1.0))
+        self.check(p,
+                   [(-2, 0, 0), (-2, 0.9, 0), (-2, 1.5, 0), (1, 5, 0), (1.2, 5, 0),
+                    (1.6, 5, 0), (1, 0, 0), (1, 0, 0), (0, 5, 0)],
+                   [(1, 0, 0), (2, 0, 0), (1, 0, 0), (0, -1, 0), (0, -1, 0),
+                    (0, -1, 0), (0, 1, 0), (1, 0, 0), (1, -4, 0)],
+                   [2.5, 1.25, numpy.inf, 4.0, 4.0, numpy.inf, 1.0, 0.5, 1.0])
+
+    def test_capsule(self):
+        p = self.geo.createQuadratic(prim.Capsule, (0, 0, 0), size=(0.5, 2.0, 1.0))
+        self.check(p,
+                   [(-2, 0, 0), (0, 5, 0), (0.3, -5, 0), (-2, 1.2, 0), (0, 0, 0), (0, 0, 0),
+                    (-2, 1.6, 0)],
+                   [(1, 0, 0), (0, -1, 0), (0, 1, 0), (1, 0, 0), (0, 1, 0), (1, 0, 0),
+                    (1, 0, 0)],
+                   [1.5, 3.5, 5.0 - 1.0 - 0.4, 2.0 - numpy.sqrt(0.21), 1.5, 0.5, numpy.inf])
+
+    def test_transformed(self):
+        # A tube lying along X
+        p = self.geo.createQuadratic(prim.Tube, (0, 0, 0), size=(1.0, 4.0, 1.0),
+                                     transform=(0, 1, 0, -1, 0, 0, 0, 0, 1))
+        self.check(p, [(5, 0, 0), (1.5, 5, 0), (2.5, 5, 0)],
+                   [(-1, 0, 0), (0, -1, 0), (0, -1, 0)], [3.0, 4.0, numpy.inf])
+
+    def test_matches_sphere_tracing(self):
+        rng = numpy.random.RandomState(3)
+        O = rng.uniform(-3.0, 3.0, (500, 3))
+        D = rng.normal(size=(500, 3))
+        D /= numpy.sqrt(numpy.sum(D * D, axis=1))[:, None]
+        size = numpy.tile((0.7, 1.5, 1.0), (len(O), 1))
+        for cls in (prim.Sphere, prim.Tube, prim.Capsule):
+            analytic = cls._intersect(O, D, size)
+            traced = prim._march(cls._sdf, O, D, size)
+            hit = numpy.isfinite(analytic)
+            self.assertTrue(hit.any() and not hit.all())
+            self.assertTrue(numpy.array_equal(hit, numpy.isfinite(traced)), cls)
+            self.assertTrue(numpy.allclose(analytic[hit], traced[hit], atol=1e-5), cls)
+            # Hits are on the surface
+            X = O[hit] + D[hit] * analytic[hit, None]
+            self.assertTrue(numpy.allclose(cls._sdf(X, size[hit]), 0.0, atol=1e-9), cls)
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,156 @@
+from __future__ import division, absolute_import, print_function
+
+import os
+import threading
+import unittest
+
+from merlin._types import Node, CookMode, ParmFloat
+from merlin.scheduler import CookScheduler, CookError, CookCancelled
+
+_lock = threading.Lock()
+
+class ScheduledNode(Node):
+    """Sums its "value" parameter and its inputs, logging its cooks"""
+    cookMode = CookMode.Thread
+    log = []
+
+    @property
+    def numInputs(self):
+        return 2
+
+    def cook(self, **kwargs):
+        with _lock:
+            self.log.append(self.name)
+        if self.name.startswith('fail'):
+            raise ValueError('failed')
+        if self.name.startswith('cancel'):
+            self.scheduler.cancel()
+        total = self.parm('value').eval()
+        for i in range(self.numInputs):
+            data = self.inputData(i, **kwargs)
+            if data is not None:
+                total += data
+        return total
+
+class ScheduledMainNode(ScheduledNode):
+    cookMode = CookMode.MainThread
+
+class ScheduledProcessNode(ScheduledNode):
+    cookMode = CookMode.Process
+
+    def cook(self, **kwargs):
+        raise AssertionError('Process nodes are cooked with cookInProcess')
+
+    @classmethod
+    def cookInProcess(cls, inputs, parms, **kwargs):
+        return sum(i for i in inputs if i is not None) + parms[0], os.getpid()
+
+class ScheduledLockNode(ScheduledProcessNode):
+    @classmethod
+    def cookInProcess(cls, inputs, parms, **kwargs):
+        # A result that cannot be sent back
+        return threading.Lock()
+
+class TestScheduler(unittest.TestCase):
+    def setUp(self):
+        del ScheduledNode.log[:]
+        self.root = Node.__new__(Node, None)
+        self.scheduler = CookScheduler(threads=4, processes=2)
+
+    def tearDown(self):
+        self.scheduler.close()
+
+    def node(self, name, value=1.0, inputs=(), type_name='ScheduledNode'):
+        node = self.root.createNode(type_name, name)
+        node.parameters.append(ParmFloat(node, value, 'value'))
+        node.scheduler = self.scheduler
+        for i, n in enumerate(inputs):
+            node.inputs[i] = n
+        return node
+
+    def test_dependency_order(self):
+        # Two diamonds of thread and main thread nodes
+        a = self.node('a', 1.0)
+        b = self.node('b', 2.0, [a])
+        c = self.node('c', 3.0, [a], 'ScheduledMainNode')
+        d = self.node('d', 4.0, [b, c])
+        e = self.node('e', 5.0, [d])
+        f = self.node('f', 6.0, [d, e], 'ScheduledMainNode')
+        self.assertEqual(self.scheduler.cook(f), 33.0)
+        log = ScheduledNode.log
+        self.assertEqual(sorted(log), ['a', 'b', 'c', 'd', 'e', 'f'])
+        for node in (b, c, d, e, f):
+            for i in node.inputs:
+                if i is not None:
+                    self.assertLess(log.index(i.name), log.index(node.name))
+        # Results are cached: nothing cooks again
+        self.assertEqual(f.evaluate(), 33.0)
+        self.scheduler.cook(f)
+        self.assertEqual(len(log), 6)
+
+    def test_plan(self):
+        a = self.node('a')
+        b = self.node('b', inputs=[a])
+        c = self.node('c', inputs=[b, a])
+        self.assertEqual(self.scheduler.plan(c), [a, b, c])
+        a.evaluate()
+        self.assertEqual(self.scheduler.plan(c), [b, c])
+
+    def test_cycle(self):
+        a = self.node('a')
+        b = self.node('b', inputs=[a])
+        c = self.node('c', inputs=[b])
+        a.inputs[0] = c
+        self.assertRaises(RuntimeError, self.scheduler.plan, c)
+        self.assertRaises(RuntimeError, self.scheduler.cook, c)
+        self.assertEqual(ScheduledNode.log, [])
+
+    def test_error(self):
+        a = self.node('a')
+        bad = self.node('fail', inputs=[a])
+        other = self.node('other')
+        c = self.node('c', inputs=[bad, other])
+        try:
+            self.scheduler.cook(c)
+        except CookError as e:
+            self.assertIs(e.node, bad)
+            self.assertIsInstance(e.error, ValueError)
+        else:
+            self.fail('CookError not raised')
+        self.assertNotIn('c', ScheduledNode.log)
+        self.assertTrue(c.dirty)
+        self.assertFalse(a.dirty)
+
+    def test_cancel(self):
+        a = self.node('cancel', type_name='ScheduledMainNode')
+        b = self.node('b', inputs=[a])
+        c = self.node('c', inputs=[b])
+        self.assertRaises(CookCancelled, self.scheduler.cook, c)
+        self.assertEqual(ScheduledNode.log, ['cancel'])
+        self.assertTrue(c.dirty)
+        # A new cook starts afresh
+        a.name = 'a'
+        self.assertEqual(self.scheduler.cook(c), 3.0)
+
+    def test_process(self):
+        a = self.node('a', 1.0)
+        p = self.node('p', 2.0, [a], 'ScheduledProcessNode')
+        q = self.node('q', 3.0, [], 'ScheduledProcessNode')
+        value, pid = self.scheduler.cook(p)
+        self.assertEqual(value, 3.0)
+        self.assertNotEqual(pid, os.getpid())
+        self.assertFalse(p.dirty)
+        self.assertEqual(p.evaluate(), (value, pid))
+        self.assertEqual(self.scheduler.cook(q)[0], 3.0)
+
+    def test_process_pickling(self):
+        # Failing to pickle the arguments or the result is a cook error
+        p = self.node('p', 2.0, [], 'ScheduledLockNode')
+        self.assertRaises(CookError, self.scheduler.cook, p)
+        q = self.node('q', 2.0, [], 'ScheduledProcessNode')
+        self.assertRaises(CookError, self.scheduler.cook, q, lock=threading.Lock())
+        self.assertTrue(p.dirty and q.dirty)
+        self.assertEqual(self.scheduler.cook(q)[0], 2.0)
+
+if __name__ == '__main__':
+    unittest.main()
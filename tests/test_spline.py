@@ -0,0 +1,180 @@
+from __future__ import division, absolute_import, print_function
+
+import unittest
+
+import numpy
+
+from merlin.geo import Geometry, prim, spline
+from merlin.geo.attribute import AttribClass
+
+def _positions(geo):
+    return numpy.frombuffer(geo.attrib(AttribClass.Point, 'P')).reshape(-1, 3)
+
+_arc = [(0, 0, 0), (1, 2, 0), (3, 2, 1), (4, 0, 0)]
+
+class TestKnots(unittest.TestCase):
+    def test_open(self):
+        knots, degree, cvs = spline.knotVector(prim.NURBScurve, 5, 4)
+        self.assertEqual(list(knots), [0, 0, 0, 0, 1, 2, 2, 2, 2])
+        self.assertEqual((degree, list(cvs)), (3, [0, 1, 2, 3, 4]))
+        # The order is limited by the CV count
+        knots, degree, cvs = spline.knotVector(prim.NURBScurve, 3, 4)
+        self.assertEqual((list(knots), degree), ([0, 0, 0, 1, 1, 1], 2))
+
+    def test_closed(self):
+        knots, degree, cvs = spline.knotVector(prim.NURBScurve, 4, 4, True)
+        self.assertEqual(list(cvs), [0, 1, 2, 3, 0, 1, 2])
+        self.assertEqual(list(knots), list(range(11)))
+        self.assertEqual(degree, 3)
+
+    def test_bezier(self):
+        knots, degree, cvs = spline.knotVector(prim.BezierCurve, 7, 4)
+        self.assertEqual(list(knots), [0, 0, 0, 0, 1, 1, 1, 2, 2, 2, 2])
+        self.assertEqual(list(cvs), list(range(7)))
+        knots, degree, cvs = spline.knotVector(prim.BezierCurve, 6, 4, True)
+        self.assertEqual(list(knots), [0, 0, 0, 0, 1, 1, 1, 2, 2, 2, 2])
+        self.assertEqual(list(cvs), [0, 1, 2, 3, 4, 5, 0])
+        self.assertRaises(ValueError, spline.knotVector, prim.BezierCurve, 6, 4)
+        self.assertRaises(ValueError, spline.knotVector, prim.BezierCurve, 7, 4, True)
+
+    def test_invalid(self):
+        self.assertRaises(ValueError, spline.knotVector, prim.NURBScurve, 1, 4)
+        self.assertRaises(ValueError, spline.knotVector, prim.NURBScurve, 4, 1)
+
+class TestBasis(unittest.TestCase):
+    vectors = [(prim.NURBScurve, 5, 4, False), (prim.NURBScurve, 6, 3, True),
+               (prim.NURBScurve, 4, 2, False), (prim.BezierCurve, 7, 4, False),
+               (prim.BezierCurve, 6, 3, True)]
+
+    def test_partition_of_unity(self):
+        u = numpy.linspace(0.0, 1.0, 37)
+        for args in self.vectors:
+            knots, degree, cvs = spline.knotVector(*args)
+            B, dB = spline._basis(knots, degree, u)
+            self.assertEqual(B.shape, (len(u), len(cvs)))
+            self.assertTrue(numpy.all(B >= -1e-12), args)
+            self.assertTrue(numpy.allclose(B.sum(axis=1), 1.0), args)
+            self.assertTrue(numpy.allclose(dB.sum(axis=1), 0.0), args)
+
+    def test_clamped_ends(self):
+        knots, degree, cvs = spline.knotVector(prim.NURBScurve, 5, 4)
+        B = spline._basis(knots, degree, [0.0, 1.0])[0]
+        self.assertTrue(numpy.allclose(B, [[1, 0, 0, 0, 0], [0, 0, 0, 0, 1]]))
+
+    def test_derivatives(self):
+        # Away from the breakpoints, where Bezier joints are only C0
+        h = 1e-6
+        u = numpy.linspace(0.013, 0.987, 30)
+        for args in self.vectors:
+            knots, degree, cvs = spline.knotVector(*args)
+            dB = spline._basis(knots, degree, u)[1]
+            fd = (spline._basis(knots, degree, u + h)[0] -
+                  spline._basis(knots, degree, u - h)[0]) / (2 * h)
+            self.assertTrue(numpy.allclose(dB, fd, atol=1e-5), args)
+
+    def test_cached(self):
+        knots, degree, cvs = spline.knotVector(prim.NURBScurve, 5, 4)
+        B = spline.basis(knots, degree, [0.25, 0.5])
+        self.assertIs(spline.basis(knots, degree, [0.25, 0.5]), B)
+        self.assertFalse(B[0].flags.writeable)
+
+class TestEvaluate(unittest.TestCase):
+    def bezier(self, geo, points=_arc):
+        start = geo.createPoints(points)[0]
+        return geo.createCurves(prim.BezierCurve, [len(points)],
+                                list(range(start, start + len(points))))[0]
+
+    def test_bezier_midpoint(self):
+        geo = Geometry()
+        p = self.bezier(geo)
+        P = numpy.array(_arc, dtype=float)
+        samples = spline.evaluateCurves(geo, [p], [0.0, 0.5, 1.0])
+        self.assertTrue(numpy.allclose(samples.position[0, 1],
+                                       (P[0] + 3 * P[1] + 3 * P[2] + P[3]) / 8))
+        self.assertTrue(numpy.allclose(samples.tangent[0, 1],
+                                       0.75 * (P[2] + P[3] - P[0] - P[1])))
+        self.assertTrue(numpy.allclose(samples.position[0, [0, 2]], P[[0, 3]]))
+        self.assertTrue(numpy.allclose(samples.tangent[0, 0], 3 * (P[1] - P[0])))
+
+    def test_closed_periodic(self):
+        geo = Geometry()
+        geo.createPoints([(1, 0, 0), (0, 0, 1), (-1, 0, 0), (0, 0, -1), (0.5, 1, 0.5)])
+        p = geo.createCurves(prim.NURBScurve, [5], list(range(5)), closed=True)[0]
+        samples = spline.evaluateCurves(geo, [p], [0.0, 1.0])
+        self.assertTrue(numpy.allclose(samples.position[0, 0], samples.position[0, 1]))
+        self.assertTrue(numpy.allclose(samples.tangent[0, 0], samples.tangent[0, 1]))
+
+    def test_basis_weights(self):
+        geo = Geometry()
+        curve = self.bezier(geo)
+        points = [(x, y, 0.1 * x * y) for y in range(4) for x in range(4)]
+        start = geo.createPoints(points)[0]
+        patch = geo.createPatch(prim.BezierPatch, list(range(start, start + 16)), 4, 4)
+        geo.addAttrib(AttribClass.Point, 'Pw', 1.0)
+        Pw = geo.writableAttrib(AttribClass.Point, 'Pw')
+        Pw.setElement(1, 2.0)
+        Pw.setElement(start + 5, 3.0)
+
+        vertices, weights = spline.basisWeights(geo, [curve, curve],
+                                                [0.5, 0.2])
+        self.assertEqual(weights.shape, (2, 4))
+        self.assertTrue(numpy.allclose(weights.sum(axis=1), 1.0))
+        vp = numpy.frombuffer(geo.vertexPoints, dtype=geo.vertexPoints.code)
+        P = _positions(geo)
+        found = numpy.einsum('qk,qki->qi', weights, P[vp[vertices]])
+        expected = spline.evaluateCurves(geo, [curve], [0.5, 0.2]).position[0]
+        self.assertTrue(numpy.allclose(found, expected))
+
+        u, v = numpy.array([0.3, 0.9]), numpy.array([0.6, 0.1])
+        vertices, weights = spline.basisWeights(geo, [patch.number] * 2, u, v)
+        self.assertEqual(weights.shape, (2, 16))
+        self.assertTrue(numpy.allclose(weights.sum(axis=1), 1.0))
+        found = numpy.einsum('qk,qki->qi', weights, P[vp[vertices]])
+        surface = spline.evaluatePatches(geo, [patch.number], u, v).position[0]
+        self.assertTrue(numpy.allclose(found, [surface[0, 0], surface[1, 1]]))
+
+class TestTessellate(unittest.TestCase):
+    def deviation(self, out, dense):
+        """The largest distance from the midpoint of an output edge to the
+        densely sampled curve"""
+        P = _positions(out)
+        mids = 0.5 * (P[:-1] + P[1:])
+        d = numpy.sqrt(((mids[:, None, :] - dense[None, :, :]) ** 2).sum(axis=-1))
+        return d.min(axis=1).max()
+
+    def test_curve(self):
+        geo = Geometry()
+        geo.createPoints(_arc)
+        p = geo.createCurves(prim.BezierCurve, [4], [0, 1, 2, 3])[0]
+        dense = spline.evaluateCurves(geo, [p], numpy.linspace(0, 1, 4001)).position[0]
+        counts = []
+        for tolerance in (0.1, 0.01, 0.001):
+            out = spline.tessellate(geo, tolerance)
+            self.assertEqual(out.numPrims, 1)
+            self.assertEqual(list(out.attrib(AttribClass.Prim, 'sourceprim')), [p])
+            self.assertLessEqual(self.deviation(out, dense), tolerance * 1.01)
+            P = _positions(out)
+            self.assertTrue(numpy.allclose(P[[0, -1]], numpy.array(_arc, dtype=float)[[0, 3]]))
+            counts.append(out.numPoints)
+        self.assertTrue(counts[0] < counts[1] < counts[2], counts)
+
+    def test_linear(self):
+        geo = Geometry()
+        geo.createPoints([(0, 0, 0), (1, 0, 0), (1, 1, 0)])
+        geo.createCurves(prim.NURBScurve, [3], [0, 1, 2], order=2)
+        out = spline.tessellate(geo, 1e-6)
+        # Polylines need no more than their CVs
+        self.assertTrue(numpy.allclose(_positions(out), [(0, 0, 0), (1, 0, 0), (1, 1, 0)]))
+
+    def test_closed(self):
+        geo = Geometry()
+        geo.createPoints([(1, 0, 0), (0, 0, 1), (-1, 0, 0), (0, 0, -1)])
+        geo.createCurves(prim.NURBScurve, [4], [0, 1, 2, 3], closed=True)
+        out = spline.tessellate(geo, 0.01)
+        self.assertTrue(out.prim(0).closed)
+        P = _positions(out)
+        self.assertFalse(numpy.allclose(P[0], P[-1]))
+        self.assertEqual(out.numVertices, out.numPoints)
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,115 @@
+from __future__ import division, absolute_import, print_function
+
+import unittest
+
+import numpy
+
+from merlin._types import Node
+from merlin.geo import Geometry
+from merlin.geo.attribute import AttribClass
+
+def _values(geo):
+    return list(geo.attrib(AttribClass.Point, 'v'))
+
+class StreamSourceNode(Node):
+    """Ten points, with their number in "v" """
+    def cook(self, **kwargs):
+        self.cooks = getattr(self, 'cooks', 0) + 1
+        geo = Geometry()
+        geo.createPoints([(i, 0, 0) for i in range(10)])
+        v = geo.addAttrib(AttribClass.Point, 'v', 0.0)
+        for i in range(10):
+            v.setElement(i, float(i))
+        if kwargs.get('prims'):
+            geo.createPolygon([0, 1, 2])
+        return geo
+
+class StreamAddNode(Node):
+    """Adds one to "v", a chunk at a time, recording the chunk sizes"""
+    streamable = True
+    chunkSize = 4
+
+    @property
+    def numInputs(self):
+        return 1
+
+    def cookChunk(self, chunk, **kwargs):
+        self.chunks.append(chunk.numPoints)
+        v = chunk.writableAttrib(AttribClass.Point, 'v')
+        numpy.frombuffer(v, dtype=v.code)[:] += 1.0
+        return chunk
+
+class StreamWholeNode(Node):
+    """Adds ten to "v", needing all of its input at once"""
+    @property
+    def numInputs(self):
+        return 1
+
+    def cook(self, **kwargs):
+        geo = self.inputCopy(0, **kwargs)
+        self.sizes.append(geo.numPoints)
+        v = geo.writableAttrib(AttribClass.Point, 'v')
+        numpy.frombuffer(v, dtype=v.code)[:] += 10.0
+        return geo
+
+class TestStream(unittest.TestCase):
+    def setUp(self):
+        self.root = Node.__new__(Node, None)
+        self.source = self.root.createNode('StreamSourceNode', 'source')
+
+    def chain(self, *types):
+        nodes, previous = [], self.source
+        for cls in types:
+            node = self.root.createNode(cls, None)
+            node.chunks, node.sizes = [], []
+            node.inputs[0] = previous
+            nodes.append(node)
+            previous = node
+        return nodes
+
+    def test_streamable_chain(self):
+        a, b = self.chain('StreamAddNode', 'StreamAddNode')
+        chunks = list(b.stream(3))
+        self.assertEqual([chunk.numPoints for chunk in chunks], [3, 3, 3, 1])
+        self.assertEqual(a.chunks, [3, 3, 3, 1])
+        self.assertEqual(b.chunks, [3, 3, 3, 1])
+        self.assertEqual(sum((_values(chunk) for chunk in chunks), []),
+                         [i + 2.0 for i in range(10)])
+        # Streaming caches nothing in the streamable nodes
+        self.assertTrue(a.dirty and b.dirty)
+        self.assertFalse(self.source.dirty)
+        self.assertEqual(_values(self.source.evaluate()), [float(i) for i in range(10)])
+
+    def test_evaluate_gathers(self):
+        a, b = self.chain('StreamAddNode', 'StreamAddNode')
+        result = b.evaluate()
+        self.assertEqual(b.chunks, [4, 4, 2])
+        self.assertEqual(result.numPoints, 10)
+        self.assertEqual(_values(result), [i + 2.0 for i in range(10)])
+        self.assertEqual(self.source.cooks, 1)
+
+    def test_not_streamable_in_middle(self):
+        a, whole, b = self.chain('StreamAddNode', 'StreamWholeNode', 'StreamAddNode')
+        chunks = list(b.stream(3))
+        # The whole node gathers its input, and is split up again after it
+        self.assertEqual(a.chunks, [4, 4, 2])
+        self.assertEqual(whole.sizes, [10])
+        self.assertEqual(b.chunks, [3, 3, 3, 1])
+        self.assertEqual(sum((_values(chunk) for chunk in chunks), []),
+                         [i + 12.0 for i in range(10)])
+        self.assertFalse(whole.dirty)
+
+    def test_primitives(self):
+        a, = self.chain('StreamAddNode')
+        chunks = list(a.stream(3, prims=True))
+        # A detail with primitives cannot be split
+        self.assertEqual(a.chunks, [10])
+        self.assertEqual(chunks[0].numPrims, 1)
+
+    def test_no_input(self):
+        a, = self.chain('StreamAddNode')
+        a.inputs[0] = None
+        self.assertRaises(RuntimeError, list, a.stream())
+
+if __name__ == '__main__':
+    unittest.main()
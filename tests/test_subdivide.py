@@ -0,0 +1,125 @@
+from __future__ import division, absolute_import, print_function
+
+import unittest
+
+import numpy
+
+from merlin.geo import Geometry, subdivide
+from merlin.geo.attribute import AttribClass
+
+def _cube():
+    geo = Geometry()
+    geo.createPoints([(x, y, z) for z in (-1, 1) for y in (-1, 1) for x in (-1, 1)])
+    for face in ([0, 2, 3, 1], [4, 5, 7, 6], [0, 1, 5, 4],
+                 [2, 6, 7, 3], [0, 4, 6, 2], [1, 3, 7, 5]):
+        geo.createPolygon(face)
+    return geo
+
+def _grid(columns=3, rows=3):
+    geo = Geometry()
+    points = geo.createPoints([(x, y, 0) for y in range(rows) for x in range(columns)])
+    geo.createMesh(list(points), columns, rows)
+    return geo
+
+def _positions(geo):
+    return numpy.frombuffer(geo.attrib(AttribClass.Point, 'P')).reshape(-1, 3)
+
+def _rowSums(stencils):
+    return numpy.add.reduceat(stencils.weights, stencils.starts[:-1])
+
+class TestStencils(unittest.TestCase):
+    def test_rows_sum_to_one(self):
+        for geo in (_cube(), _grid(4, 3)):
+            subdivider = geo.subdivider()
+            for n in (1, 2):
+                level = subdivider.level(n)
+                for stencils in (level.points, level.vertices):
+                    self.assertTrue(numpy.all(stencils.counts > 0))
+                    self.assertTrue(numpy.allclose(_rowSums(stencils), 1.0))
+                    self.assertTrue(numpy.all(stencils.weights > 0.0))
+
+    def test_level_sizes(self):
+        level = _cube().subdivider().level(1)
+        self.assertEqual(level.numPoints, 8 + 12 + 6)
+        self.assertEqual(len(level.primStarts) - 1, 24)
+        self.assertEqual(level.points.numSources, 8)
+        self.assertEqual(level.vertices.numSources, 24)
+
+    def test_wrong_count(self):
+        level = _cube().subdivider().level(1)
+        self.assertRaises(ValueError, level.points.apply, numpy.zeros((7, 3)))
+
+    def test_grid_size_change(self):
+        geo = _grid(3, 2)
+        level = geo.subdivider().level(1)
+        self.assertEqual(level.numPoints, 6 + 7 + 2)
+        geo.prim(0).gridSize = (2, 3)
+        level = geo.subdivider().level(1)
+        P = geo.subdivider().refine(_positions(geo))
+        # Now rows of two points: the quads are (0, 1, 3, 2) and (2, 3, 5, 4)
+        self.assertEqual(level.numPoints, 6 + 7 + 2)
+        self.assertEqual(sorted(level.vertexPoints[:4]), [0, 6, 7, 13])
+        Q = _positions(geo)
+        self.assertTrue(numpy.allclose(P[-2:], [Q[[0, 1, 3, 2]].mean(axis=0),
+                                                 Q[[2, 3, 5, 4]].mean(axis=0)]))
+
+class TestRules(unittest.TestCase):
+    def test_cube(self):
+        P = _cube().subdivider().refine(_positions(_cube()))
+        # Corners are (Q + 2R + (n-3)P) / n of valence 3
+        self.assertTrue(numpy.allclose(numpy.abs(P[:8]), 5.0 / 9.0))
+        self.assertTrue(numpy.allclose(numpy.sign(P[:8]), numpy.sign(_positions(_cube()))))
+        # Edge points average their ends and the two face points
+        edges = P[8:20]
+        self.assertTrue(numpy.allclose(numpy.sort(numpy.abs(edges), axis=1), [0.0, 0.75, 0.75]))
+        # Face points are the face centroids
+        faces = P[20:]
+        self.assertTrue(numpy.allclose(numpy.sort(numpy.abs(faces), axis=1), [0.0, 0.0, 1.0]))
+
+    def test_open_grid(self):
+        geo = _grid()
+        subdivider = geo.subdivider()
+        P = subdivider.refine(_positions(geo))
+        # A regular flat grid is reproduced: corners fixed, boundary points
+        # on the boundary, and every new point at a grid midpoint
+        self.assertTrue(numpy.allclose(P[:9], _positions(geo)))
+        self.assertTrue(numpy.allclose(P[:, 2], 0.0))
+        self.assertTrue(numpy.allclose(P * 2.0, numpy.round(P * 2.0)))
+        self.assertEqual(len(numpy.unique(numpy.round(P * 2.0), axis=0)), 25)
+
+    def test_interior_boundary_corner(self):
+        geo = _grid()
+        subdivider = geo.subdivider()
+        for point, expected in ((4, 9.0 / 16.0), (1, 0.75), (0, 1.0)):
+            z = numpy.zeros(9)
+            z[point] = 1.0
+            refined = subdivider.refine(z)
+            self.assertAlmostEqual(refined[point], expected)
+        # Boundary edges are split at their midpoint
+        z = numpy.zeros(9)
+        z[[0, 1]] = 1.0
+        refined = subdivider.refine(z)
+        level = subdivider.level(1)
+        rows = numpy.nonzero(numpy.abs(refined[9:] - 1.0) < 1e-12)[0] + 9
+        self.assertEqual(len(rows), 1)
+        self.assertEqual(sorted(level.points.pairs([rows[0]])[1]), [0, 1])
+
+    def test_vertex_attribute(self):
+        geo = _grid(4, 3)
+        geo.addAttrib(AttribClass.Vertex, 'uv', (0.0, 0.0))
+        uv = geo.writableAttrib(AttribClass.Vertex, 'uv')
+        vp = numpy.frombuffer(geo.vertexPoints, dtype=geo.vertexPoints.code)
+        values = _positions(geo)[vp, :2] / (3.0, 2.0)
+        numpy.frombuffer(uv).reshape(-1, 2)[:] = values
+        del uv
+        geo.addAttrib(AttribClass.Prim, 'id', 7)
+        result = subdivide.subdivide(geo, 2)
+        self.assertEqual(result.numPrims, 6 * 16)
+        refined = numpy.frombuffer(result.attrib(AttribClass.Vertex, 'uv')).reshape(-1, 2)
+        rvp = numpy.frombuffer(result.vertexPoints, dtype=result.vertexPoints.code)
+        # On a flat regular grid the uvs follow the positions exactly
+        self.assertTrue(numpy.allclose(refined, _positions(result)[rvp, :2] / (3.0, 2.0)))
+        self.assertEqual(set(result.attrib(AttribClass.Prim, 'id')), set([7]))
+
+if __name__ == '__main__':
+    unittest.main()
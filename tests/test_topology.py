@@ -0,0 +1,82 @@
+from __future__ import division, absolute_import, print_function
+
+import unittest
+
+from merlin.geo import Geometry
+from merlin.geo.attribute import AttribClass
+
+def _rows(csr):
+    return [csr[i].tolist() for i in range(len(csr))]
+
+class TestAdjacency(unittest.TestCase):
+    def setUp(self):
+        # A triangle and a quad sharing the edge 1-2, and an open polygon
+        # touching the quad at point 4
+        self.geo = geo = Geometry()
+        geo.createPoints([(0, 0, 0), (1, 0, 0), (0, 1, 0), (2, 0, 0), (2, 1, 0), (3, 1, 0)])
+        geo.createPolygon([0, 1, 2])
+        geo.createPolygon([1, 3, 4, 2])
+        geo.createPolygon([4, 5], closed=False)
+        self.adj = geo.adjacency()
+
+    def test_points(self):
+        self.assertEqual(_rows(self.adj.pointVertices), [[0], [1, 3], [2, 6], [4], [5, 7], [8]])
+        self.assertEqual(_rows(self.adj.pointPrims), [[0], [0, 1], [0, 1], [1], [1, 2], [2]])
+        self.assertEqual(_rows(self.adj.pointNeighbours),
+                         [[1, 2], [0, 2, 3], [0, 1, 4], [1, 4], [2, 3, 5], [4]])
+
+    def test_edges(self):
+        self.assertEqual(self.adj.edges.tolist(),
+                         [[0, 1], [0, 2], [1, 2], [1, 3], [2, 4], [3, 4], [4, 5]])
+        self.assertEqual(self.adj.vertexEdges.tolist(), [0, 2, 1, 3, 5, 4, 2, 6, -1])
+        self.assertEqual(_rows(self.adj.edgePrims), [[0], [0], [0, 1], [1], [1], [1], [2]])
+
+    def test_prim_neighbours(self):
+        # Sharing a point alone does not make prims neighbours
+        self.assertEqual(_rows(self.adj.primNeighbours), [[1], [0], []])
+
+    def test_half_edges(self):
+        half = self.adj.halfEdges()
+        self.assertEqual(half.next.tolist(), [1, 2, 0, 4, 5, 6, 3, 8, -1])
+        self.assertEqual(half.prev.tolist(), [2, 0, 1, 6, 3, 4, 5, -1, 7])
+        self.assertEqual(half.twin.tolist(), [-1, 6, -1, -1, -1, -1, 1, -1, -1])
+
+    def test_non_manifold(self):
+        self.geo.createPolygon([1, 2, 5])
+        self.assertRaises(ValueError, self.geo.adjacency().halfEdges)
+        # A flipped polygon is not consistently oriented
+        geo = Geometry()
+        geo.createPoints([(0, 0, 0), (1, 0, 0), (0, 1, 0), (1, 1, 0)])
+        geo.createPolygon([0, 1, 2])
+        geo.createPolygon([1, 2, 3])
+        self.assertRaises(ValueError, geo.adjacency().halfEdges)
+
+class TestAdjacencyCache(unittest.TestCase):
+    def test_cached(self):
+        geo = Geometry()
+        geo.createPoints([(0, 0, 0), (1, 0, 0), (0, 1, 0), (1, 1, 0)])
+        geo.createPolygon([0, 1, 2])
+        adj = geo.adjacency()
+        self.assertIs(geo.adjacency(), adj)
+        # Attribute changes leave the tables valid
+        geo.addAttrib(AttribClass.Point, 'v', 0.0).setElement(0, 1.0)
+        geo.attrib(AttribClass.Point, 'P').setElement(3, (2.0, 2.0, 0.0))
+        self.assertIs(geo.adjacency(), adj)
+        geo.createPolygon([1, 3, 2])
+        self.assertFalse(adj.isCurrent())
+        rebuilt = geo.adjacency()
+        self.assertIsNot(rebuilt, adj)
+        self.assertEqual(_rows(rebuilt.primNeighbours), [[1], [0]])
+
+    def test_closed(self):
+        geo = Geometry()
+        geo.createPoints([(0, 0, 0), (1, 0, 0), (0, 1, 0)])
+        p = geo.createPolygon([0, 1, 2])
+        self.assertEqual(geo.adjacency().edges.tolist(), [[0, 1], [0, 2], [1, 2]])
+        p.closed = False
+        self.assertEqual(geo.adjacency().edges.tolist(), [[0, 1], [1, 2]])
+        p.closed = True
+        self.assertEqual(len(geo.adjacency().edges), 3)
+
+if __name__ == '__main__':
+    unittest.main()
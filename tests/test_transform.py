@@ -0,0 +1,103 @@
+from __future__ import division, absolute_import, print_function
+
+import math
+import unittest
+
+import numpy
+
+from merlin._types import Node, worldTransforms
+from merlin.geo.attribute import (Mat3, Mat4, transformPositions, transformVectors,
+                                  transformNormals)
+
+class TransformNode(Node):
+    pass
+
+def _row(matrix, v):
+    """The row vector v times a Mat3 or Mat4, through Mat products"""
+    if isinstance(matrix, Mat4):
+        return (Mat4.fromTRS(translate=v) * matrix).extractTranslates()
+    return tuple(list(Mat3(list(v) + [0.0] * 6) * matrix)[:3])
+
+class TestWorldTransforms(unittest.TestCase):
+    def setUp(self):
+        # /a/b/c and /a/s
+        self.root = Node.__new__(Node, None)
+        self.a = self.root.createNode('TransformNode', 'a')
+        self.b = self.a.createNode('TransformNode', 'b')
+        self.c = self.b.createNode('TransformNode', 'c')
+        self.s = self.a.createNode('TransformNode', 's')
+        self.a.transform = Mat4.fromTRS(translate=(1, 2, 3))
+        self.b.transform = Mat4.fromTRS(rotate=(0, 0, 90))
+        self.c.transform = Mat4.fromTRS(translate=(1, 0, 0), scale=(2, 2, 2))
+        self.s.transform = Mat4.fromTRS(translate=(0, 5, 0))
+        self.nodes = (self.a, self.b, self.c, self.s)
+
+    def assertMatrix(self, m, expected):
+        self.assertTrue(numpy.allclose(list(m), list(expected)))
+
+    def test_world(self):
+        self.assertMatrix(self.c.worldTransform,
+                          self.c.transform * self.b.transform * self.a.transform)
+        self.assertMatrix(self.s.worldTransform, self.s.transform * self.a.transform)
+        self.assertEqual(self.root.worldTransform, Mat4())
+        self.assertTrue(numpy.allclose(_row(self.c.worldTransform, (0, 0, 0)), (1, 3, 3)))
+        batch = worldTransforms(self.nodes)
+        self.assertEqual(batch.shape, (4, 4, 4))
+        for m, node in zip(batch, self.nodes):
+            self.assertMatrix(m.ravel(), node.worldTransform)
+
+    def test_invalidate_descendants(self):
+        cached = [node._world() for node in self.nodes]
+        self.b.transform = Mat4.fromTRS(rotate=(0, 0, -90))
+        # Only b and its descendants are recomputed
+        self.assertEqual([node._worldtransform is None for node in self.nodes],
+                         [False, True, True, False])
+        self.assertIs(self.a._world(), cached[0])
+        self.assertIs(self.s._world(), cached[3])
+        self.assertMatrix(self.c.worldTransform,
+                          self.c.transform * self.b.transform * self.a.transform)
+        self.assertIsNot(self.c._world(), cached[2])
+
+    def test_reparent(self):
+        [node._world() for node in self.nodes]
+        self.s.children.add(self.c)
+        self.assertEqual([node._worldtransform is None for node in self.nodes],
+                         [False, False, True, False])
+        self.assertMatrix(self.c.worldTransform,
+                          self.c.transform * self.s.transform * self.a.transform)
+
+    def test_identity(self):
+        node = self.root.createNode('TransformNode', 'plain')
+        self.assertEqual(node.transform, Mat4())
+        self.assertEqual(node.worldTransform, Mat4())
+        self.s.transform = None
+        self.assertMatrix(self.s.worldTransform, self.a.transform)
+
+class TestBatched(unittest.TestCase):
+    def setUp(self):
+        self.points = [(1.0, 2.0, 3.0), (-4.0, 0.5, 0.0), (0.0, 0.0, 0.0)]
+        self.matrices = [Mat4.fromTRS((1, 2, 3), (10, 20, 30), (1, 2, 3)),
+                         Mat4.fromTRS((0, -1, 0), (90, 0, 0), (0.5, 0.5, 0.5)),
+                         Mat4.fromTRS((4, 4, 4), (0, 45, 0), (1, 1, 2))]
+
+    def test_positions(self):
+        m = self.matrices[0]
+        expected = [_row(m, p) for p in self.points]
+        self.assertTrue(numpy.allclose(transformPositions(m, self.points), expected))
+        expected = [_row(m, p) for m, p in zip(self.matrices, self.points)]
+        self.assertTrue(numpy.allclose(transformPositions(self.matrices, self.points), expected))
+
+    def test_vectors(self):
+        expected = [_row(m.mat3(), v) for m, v in zip(self.matrices, self.points)]
+        self.assertTrue(numpy.allclose(transformVectors(self.matrices, self.points), expected))
+
+    def test_normals(self):
+        expected = []
+        for m, n in zip(self.matrices, self.points):
+            v = _row(m.mat3().inverted().transposed(), n)
+            length = math.sqrt(sum(x * x for x in v))
+            expected.append([x / length if length else 0.0 for x in v])
+        self.assertTrue(numpy.allclose(transformNormals(self.matrices, self.points), expected))
+
+if __name__ == '__main__':
+    unittest.main()
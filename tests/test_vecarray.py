@@ -0,0 +1,62 @@
+from __future__ import division, absolute_import, print_function
+
+import unittest
+from array import array
+
+import numpy
+
+from merlin._types import Vec3, Vec4, Vec3Array, Vec4Array, Vec3View
+
+class TestVecArrayViews(unittest.TestCase):
+    def setUp(self):
+        self.arr = Vec3Array([(1, 2, 3), (4, 5, 6)])
+
+    def test_index_is_view(self):
+        v = self.arr[0]
+        self.assertIsInstance(v, Vec3View)
+        v.x = 99
+        self.arr[1][2] = -1
+        self.assertEqual(self.arr.data.tolist(), [[99, 2, 3], [4, 5, -1]])
+
+    def test_negative_index(self):
+        self.assertEqual(list(self.arr[-1]), [4, 5, 6])
+        self.assertRaises(IndexError, lambda: self.arr[2])
+        self.assertRaises(IndexError, lambda: self.arr[0][3])
+
+    def test_iteration_views(self):
+        for v in self.arr:
+            v.y = 0
+        self.assertEqual(self.arr.data[:, 1].tolist(), [0, 0])
+
+    def test_view_of_buffer(self):
+        buf = array('d', [0.0] * 6)
+        Vec3Array.frombuffer(buf)[1].z = 7
+        self.assertEqual(buf[5], 7.0)
+
+    def test_copy_detaches(self):
+        v = self.arr[0].copy()
+        self.assertIsInstance(v, Vec3)
+        v.x = 99
+        self.assertEqual(self.arr[0].x, 1.0)
+
+    def test_arithmetic(self):
+        v = self.arr[0]
+        self.assertEqual(list(v + Vec3(1, 1, 1)), [2, 3, 4])
+        self.assertEqual(v.dot(self.arr[1]), 32.0)
+        self.assertEqual(list(v.cross(self.arr[1])), [-3, 6, -3])
+        v += (1, 1, 1)
+        self.assertEqual(self.arr.data[0].tolist(), [2, 3, 4])
+        self.assertEqual(self.arr[1], Vec3(4, 5, 6))
+
+    def test_assign_view(self):
+        self.arr[0] = self.arr[1]
+        self.assertEqual(self.arr.data[0].tolist(), [4, 5, 6])
+
+    def test_vec4(self):
+        arr = Vec4Array(length=2)
+        self.assertEqual(arr[0].w, 1.0)
+        arr[0].w = 0.5
+        self.assertEqual(arr.data[0].tolist(), [0, 0, 0, 0.5])
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,133 @@
+"""Vector and matrix tests, run against whichever build is imported, and
+a parity test comparing the compiled and pure Python builds (see setup.py)"""
+
+from __future__ import division, absolute_import, print_function
+
+import os
+import subprocess
+import sys
+import unittest
+
+from merlin._types import Vec2, Vec3, Vec4
+from merlin.geo.attribute import Mat3, Mat4
+
+def results():
+    """The results of the vector and matrix operations under test, as a
+    dict of name to plain values"""
+    out = {}
+    a, b = Vec3(1, 2, 3), Vec3(-4, 0.5, 2)
+    out['vec3_add'] = list(a + b)
+    out['vec3_mul'] = list(a * b)
+    out['vec3_dot'] = a.dot(b)
+    c = Vec3(*a)
+    c += b
+    c *= a
+    out['vec3_inplace'] = list(c)
+    out['vec3_index'] = [a[0], a[1], a[2], a[-1], a[-3]]
+    a[1] = 7
+    out['vec3_setitem'] = list(a)
+    out['vec2'] = list(Vec2(1, 2) + Vec2(3, 4)) + [Vec2(1, 2).dot(Vec2(3, 4)), Vec2(5, 6)[-1]]
+    v4 = Vec4(1, 2, 3)
+    out['vec4'] = list(v4) + [Vec4(1, 2, 3, 4).dot(Vec4(1, 1, 1, 1)), len(v4)]
+    out['vec_kwargs'] = list(Vec3(y=2))
+    out['vec_contains'] = [2.0 in Vec3(1, 2, 3), Vec3(1, 2, 2).count(2.0), Vec3(1, 2, 3).index(3.0)]
+
+    m = Mat3.fromRotates((30, 45, 60))
+    n = Mat3([2, 0, 1, 0, 3, 0, 1, 0, 4])
+    out['mat3_compose'] = list(m * n)
+    out['mat3_det'] = n.determinant()
+    out['mat3_invert'] = list(n.inverted())
+    out['mat3_transpose'] = list(n.transposed())
+    out['mat3_rotates'] = list(m.extractRotates())
+    out['mat3_index'] = [n[0], n[2], n[8]]
+    t = Mat4.fromTRS((1, 2, 3), (10, 20, 30), (2, 3, 4))
+    u = Mat4.fromTRS((-1, 0, 5), (0, 90, 0), (1, 1, 1), order='zyx')
+    out['mat4_compose'] = list(t * u)
+    out['mat4_det'] = t.determinant()
+    out['mat4_invert'] = list(t.inverted())
+    out['mat4_decompose'] = [list(x) for x in t.decompose()]
+    out['mat4_mat3'] = list(t.mat3())
+    t[3] = 0.5
+    out['mat4_setitem'] = [t[3], t[15]]
+    return out
+
+def _close(a, b, tol=1e-9):
+    if isinstance(a, (list, tuple)):
+        return len(a) == len(b) and all(_close(x, y, tol) for x, y in zip(a, b))
+    if isinstance(a, bool) or isinstance(a, int):
+        return a == b
+    return abs(a - b) <= tol * max(1.0, abs(a), abs(b))
+
+class TestVec(unittest.TestCase):
+    def test_arithmetic(self):
+        r = results()
+        self.assertEqual(r['vec3_add'], [-3, 2.5, 5])
+        self.assertEqual(r['vec3_mul'], [-4, 1, 6])
+        self.assertEqual(r['vec3_dot'], 3.0)
+        self.assertEqual(r['vec3_inplace'], [-3, 5, 15])
+        self.assertEqual(r['vec2'], [4, 6, 11, 6])
+        self.assertEqual(r['vec4'], [1, 2, 3, 1, 10, 4])
+        self.assertEqual(r['vec_kwargs'], [0, 2, 0])
+        self.assertEqual(r['vec_contains'], [True, 2, 2])
+
+    def test_indexing(self):
+        r = results()
+        self.assertEqual(r['vec3_index'], [1, 2, 3, 3, 1])
+        self.assertEqual(r['vec3_setitem'], [1, 7, 3])
+        self.assertRaises(IndexError, lambda: Vec3()[3])
+        self.assertRaises(IndexError, lambda: Vec2()[-3])
+        self.assertRaises(IndexError, Vec4().__setitem__, 4, 1.0)
+
+class TestMat(unittest.TestCase):
+    def test_mat3(self):
+        r = results()
+        n = Mat3([2, 0, 1, 0, 3, 0, 1, 0, 4])
+        self.assertAlmostEqual(r['mat3_det'], 21.0)
+        self.assertTrue(_close(list(n * n.inverted()), list(Mat3())))
+        self.assertEqual(r['mat3_transpose'], [2, 0, 1, 0, 3, 0, 1, 0, 4])
+        self.assertTrue(_close(r['mat3_rotates'], [30, 45, 60]))
+        self.assertEqual(r['mat3_index'], [2, 1, 4])
+        self.assertRaises(IndexError, lambda: n[9])
+        self.assertRaises(ValueError, Mat3, [1, 2])
+        self.assertRaises(ValueError, Mat3([1, 2, 3, 2, 4, 6, 0, 0, 1]).inverted)
+
+    def test_mat4(self):
+        r = results()
+        t = Mat4.fromTRS((1, 2, 3), (10, 20, 30), (2, 3, 4))
+        self.assertTrue(_close(list(t * t.inverted()), list(Mat4())))
+        self.assertAlmostEqual(r['mat4_det'], 24.0)
+        self.assertTrue(_close(r['mat4_decompose'], [[1, 2, 3], [10, 20, 30], [2, 3, 4]]))
+        self.assertEqual(r['mat4_setitem'], [0.5, 1.0])
+        # Row vectors: translation is applied last
+        self.assertEqual(list((Mat4.fromTRS(scale=(2, 2, 2)) *
+                               Mat4.fromTRS(translate=(1, 0, 0))).extractTranslates()), [1, 0, 0])
+        self.assertEqual(Mat4(), Mat4(list(Mat4())))
+
+class TestParity(unittest.TestCase):
+    """The compiled build (if it was built) and the pure Python build give
+    the same results"""
+    def run_build(self, pure):
+        env = dict(os.environ)
+        env.pop('MERLIN_PURE_PYTHON', None)
+        if pure:
+            env['MERLIN_PURE_PYTHON'] = '1'
+        env['PYTHONPATH'] = os.pathsep.join(p for p in sys.path if p)
+        script = ('import tests, merlin._types, merlin.geo.attribute as attribute\n'
+                  'from merlin._compiled import is_compiled\n'
+                  'from tests.test_vecmath import results\n'
+                  'print(repr((is_compiled(merlin._types), is_compiled(attribute), '
+                  'sorted(results().items()))))\n')
+        root = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+        output = subprocess.check_output([sys.executable, '-c', script], env=env, cwd=root)
+        return eval(output.decode('ascii'))
+
+    def test_parity(self):
+        compiled = self.run_build(False)
+        pure = self.run_build(True)
+        self.assertEqual(pure[:2], (False, False))
+        self.assertEqual([k for k, v in compiled[2]], [k for k, v in pure[2]])
+        for (name, a), (_, b) in zip(compiled[2], pure[2]):
+            self.assertTrue(_close(a, b), '{0}: {1!r} != {2!r}'.format(name, a, b))
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,118 @@
+from __future__ import division, absolute_import, print_function
+
+import unittest
+
+import numpy
+
+from merlin.geo import Geometry, prim
+from merlin.geo.attribute import AttribClass
+from merlin.geo.volume import VoxelGrid, sdfFromColliders, densityFromPoints
+
+class TestVoxelGrid(unittest.TestCase):
+    def test_values(self):
+        grid = VoxelGrid(background=-1.0, leafSize=4)
+        grid.setValues([[1, 2, 3], [-5, 0, 9]], [4.0, 6.0])
+        self.assertEqual(grid.numLeaves, 2)
+        self.assertEqual(grid.activeVoxelCount, 2)
+        # Unwritten voxels of new leaves keep the background value
+        self.assertEqual(grid.getValues([[1, 2, 3], [-5, 0, 9], [0, 0, 0], [100, 0, 0]]).tolist(),
+                         [4.0, 6.0, -1.0, -1.0])
+        self.assertEqual(grid.isActive([[1, 2, 3], [0, 0, 0], [100, 0, 0]]).tolist(),
+                         [True, False, False])
+        grid.addValues([[1, 2, 3], [1, 2, 3]], [1.0, 2.0])
+        self.assertEqual(grid.getValues([[1, 2, 3]]).tolist(), [7.0])
+        self.assertRaises(ValueError, VoxelGrid, 0.0)
+
+    def test_sample(self):
+        # A linear ramp along x is reproduced exactly inside the leaves
+        grid = VoxelGrid(voxelSize=0.5, leafSize=4)
+        ijk = numpy.indices((8, 8, 8)).reshape(3, -1).T
+        grid.setValues(ijk, ijk[:, 0] * 0.5 + ijk[:, 1])
+        positions = [(1.3, 0.5, 1.0), (2.2, 1.75, 0.6)]
+        expected = [1.3 + 1.0, 2.2 + 3.5]
+        self.assertTrue(numpy.allclose(grid.sample(positions), expected))
+        self.assertTrue(numpy.allclose(grid.gradient(positions), [(1, 2, 0), (1, 2, 0)]))
+
+    def test_tile_precedence(self):
+        grid = VoxelGrid(background=-1.0, leafSize=4)
+        grid.setTiles(1, [[0, 0, 0]], 2.0)
+        grid.setTiles(0, [[0, 0, 0]], 3.0)
+        grid.setValues([[5, 1, 1]], 7.0, active=False)
+        self.assertEqual(grid.numTiles, 2)
+        # Leaves over finer tiles over coarser tiles over the background;
+        # a new leaf starts from the tile value beneath it
+        values = grid.getValues([[1, 1, 1], [5, 1, 1], [6, 1, 1], [1, 5, 1], [9, 1, 1]])
+        self.assertEqual(values.tolist(), [3.0, 7.0, 2.0, 2.0, -1.0])
+
+    def test_prune(self):
+        grid = VoxelGrid(background=1.0, leafSize=2)
+        ones = numpy.ones((4, 2, 2, 2))
+        values = ones * numpy.array([1.0, 1.0, 4.0, 2.0])[:, None, None, None]
+        values[3, 0, 0, 0] = 2.05
+        active = numpy.zeros((4, 2, 2, 2), dtype=bool)
+        active[1, 1, 1, 1] = True
+        grid.setLeaves([[0, 0, 0], [1, 0, 0], [2, 0, 0], [3, 0, 0]], values, active)
+        # Background and value-4 leaves go; the active and the varying ones stay
+        self.assertEqual(grid.prune(), 2)
+        self.assertEqual(sorted(l.origin.tolist() for l in grid.iterLeaves()),
+                         [[2, 0, 0], [6, 0, 0]])
+        self.assertEqual(grid.numTiles, 1)
+        self.assertEqual(grid.getValues([[0, 0, 0], [4, 1, 1]]).tolist(), [1.0, 4.0])
+        self.assertEqual(grid.prune(tolerance=0.1), 1)
+        # A leaf constant within tolerance becomes a tile of its lowest value
+        self.assertEqual(grid.getValues([[6, 0, 0], [7, 1, 1]]).tolist(), [2.0, 2.0])
+
+    def test_inside_tile(self):
+        grid = VoxelGrid(leafSize=4)
+        grid.setTiles(1, [[0, 0, 0]], 5.0)
+        grid.setLeaves([[0, 0, 0], [1, 0, 0]], numpy.array([0.0, 5.0])[:, None, None, None] *
+                       numpy.ones((2, 4, 4, 4)), False)
+        ijk = [[1, 1, 1], [5, 1, 1], [9, 1, 1]]
+        before = grid.getValues(ijk).tolist()
+        self.assertEqual(before, [0.0, 5.0, 0.0])
+        self.assertEqual(grid.prune(), 2)
+        self.assertEqual(grid.numLeaves, 0)
+        self.assertEqual(grid.getValues(ijk).tolist(), before)
+        # Only the leaf that differed from its tile became a tile
+        self.assertEqual([(level, c.tolist()) for level, c, v in grid.iterTiles()],
+                         [(0, [[0, 0, 0]]), (1, [[0, 0, 0]])])
+
+class TestBuild(unittest.TestCase):
+    def test_sdf_from_colliders(self):
+        geo = Geometry()
+        geo.createQuadratic(prim.Sphere, (0, 0, 0), size=(2.0, 2.0, 2.0))
+        grid = sdfFromColliders(geo, 0.25, bandWidth=2, leafSize=4)
+        self.assertEqual(grid.background, 0.5)
+        ijk, values = grid.activeVoxels()
+        self.assertTrue(len(values))
+        distances = numpy.linalg.norm(ijk * 0.25, axis=1) - 2.0
+        self.assertTrue(numpy.allclose(values, distances, atol=1e-6))
+        self.assertTrue(numpy.all(numpy.abs(values) < 0.5))
+        # Deep inside reads the inside distance, far outside the background
+        self.assertEqual(grid.getValues([[0, 0, 0], [40, 0, 0]]).tolist(), [-0.5, 0.5])
+        self.assertTrue(numpy.allclose(grid.sample([(2.1, 0, 0), (0, -1.9, 0)]), [0.1, -0.1],
+                                       atol=0.01))
+
+    def test_sdf_planes(self):
+        geo = Geometry()
+        geo.createQuadratic(prim.Plane)
+        self.assertRaises(ValueError, sdfFromColliders, geo, 0.5)
+        grid = sdfFromColliders(geo, 0.5, bounds=((-1, -1, -1), (1, 1, 1)), leafSize=4)
+        self.assertTrue(grid.activeVoxelCount > 0)
+        self.assertEqual(sdfFromColliders(Geometry(), 0.5).numLeaves, 0)
+
+    def test_density_from_points(self):
+        geo = Geometry()
+        geo.createPoints([(0, 0, 0), (0.3, 0.2, 0.9), (-1.5, 2.25, 0.1)])
+        grid = densityFromPoints(geo, 0.5, leafSize=4)
+        ijk, values = grid.activeVoxels()
+        # Every point adds one unit in total, spread over its cell's corners
+        self.assertAlmostEqual(values.sum() * 0.5 ** 3, 3.0, places=5)
+        self.assertEqual(grid.getValues([[0, 0, 0]]).tolist(), [8.0])
+        mass = geo.addAttrib(AttribClass.Point, 'mass', 1.0)
+        mass.setElement(2, 3.0)
+        grid = densityFromPoints(geo, 0.5, weight='mass', leafSize=4)
+        self.assertAlmostEqual(grid.activeVoxels()[1].sum() * 0.5 ** 3, 5.0, places=5)
+
+if __name__ == '__main__':
+    unittest.main()
@@ -19,6 +19,9 @@ def parse_args(args=sys.argv):
                         'This is usually unnecesary; the test suite will print '
                         'information when a test fails, which is usually '
                         'all we care about.')
+    parser.add_argument('-p', '--pure', action='store_true', help='Run the '
+                        'tests against the pure Python modules, even if the '
+                        'compiled build (see setup.py) is present.')
 
     return parser.parse_args(args[1:])
 
@@ -31,12 +34,16 @@ def main(args=sys.argv):
     else:
         raise ValueError('"args" argument to main must be mapping or sequence')
 
+    if kwds.get('pure'):
+        os.environ['MERLIN_PURE_PYTHON'] = '1'
+
     abspath = os.path.abspath(__file__)
     dirname = os.path.dirname(abspath)
 
     suite = unittest.defaultTestLoader.discover(dirname)
 
-    unittest.TextTestRunner(verbosity=kwds['verbose']).run(suite)
+    result = unittest.TextTestRunner(verbosity=kwds['verbose']).run(suite)
+    return 0 if result.wasSuccessful() else 1
 
 if __name__ == "__main__":
     retval = main(sys.argv)